@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Compare two benchmark reports written by benchmarks.run.
+
+    python -m benchmarks.compare old.json new.json [--threshold 10]
+
+Metrics ending in ``_ms``, ``_mb`` or ``_s`` are lower-is-better; those
+ending in ``_per_s`` are higher-is-better. Exits 1 when any of them moves
+the wrong way by more than the threshold percentage.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from typing import Any, Iterator, Optional
+
+
+def _flatten(node: Any, prefix: str = "") -> Iterator[tuple[str, float]]:
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from _flatten(value, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        yield prefix, float(node)
+
+
+def _direction(metric: str) -> Optional[int]:
+    """+1 if higher is better, -1 if lower is better, None if informational."""
+    leaf = metric.rsplit(".", 1)[-1]
+    if leaf.endswith("_per_s"):
+        return 1
+    if leaf.endswith(("_ms", "_mb", "_s")):
+        return -1
+    return None
+
+
+def compare(old: dict, new: dict, threshold_pct: float) -> tuple[list[str], list[str]]:
+    old_metrics = dict(_flatten(old.get("results", {})))
+    new_metrics = dict(_flatten(new.get("results", {})))
+    lines: list[str] = []
+    regressions: list[str] = []
+    for metric in sorted(old_metrics.keys() & new_metrics.keys()):
+        before, after = old_metrics[metric], new_metrics[metric]
+        if before == 0:
+            continue
+        change = (after - before) / abs(before) * 100
+        direction = _direction(metric)
+        marker = ""
+        if direction is not None and change * direction < -threshold_pct:
+            marker = "  << REGRESSION"
+            regressions.append(metric)
+        lines.append(f"{metric:60s} {before:12.2f} → {after:12.2f}  {change:+7.1f}%{marker}")
+    return lines, regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="benchmarks.compare")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    if old.get("params") != new.get("params"):
+        print("warning: reports were produced with different params", file=sys.stderr)
+
+    print(f"{old.get('commit', '?')} → {new.get('commit', '?')}")
+    lines, regressions = compare(old, new, args.threshold)
+    print("\n".join(lines))
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Deterministic synthetic documents and queries for the benchmark suite."""
+from __future__ import annotations
+
+import random
+
+_TOPICS: dict[str, list[str]] = {
+    "auth": [
+        "Access tokens are short-lived JWTs and refresh tokens rotate on every use.",
+        "The login endpoint rate limits failed password attempts per account and per IP.",
+        "OAuth callbacks validate the state parameter before exchanging the code.",
+        "Sessions are invalidated server-side when a user changes their password.",
+    ],
+    "database": [
+        "Every foreign key column gets a B-tree index before the table goes to production.",
+        "Migrations are additive first and destructive only after the code stops reading the column.",
+        "Long-running reports use a read replica so the primary keeps serving writes.",
+        "Connection pooling sits in front of Postgres to cap concurrent backends.",
+    ],
+    "api": [
+        "Public API endpoints are versioned in the path and never change shape in place.",
+        "Errors return a stable machine-readable code alongside the human message.",
+        "Idempotency keys make POST retries safe for payment and order endpoints.",
+        "Pagination uses opaque cursors instead of offsets for large collections.",
+    ],
+    "performance": [
+        "Hot read paths are cached with explicit invalidation on write.",
+        "Latency budgets are set per endpoint and tracked at the p95 and p99.",
+        "Batching network calls reduces round-trips more than micro-optimising code.",
+        "Profiling runs before optimisation so effort goes to the measured bottleneck.",
+    ],
+    "deployment": [
+        "Releases roll out behind feature flags and canary a small share of traffic first.",
+        "Docker images are built once in CI and promoted unchanged between environments.",
+        "Rollbacks are a single command and are rehearsed before they are needed.",
+        "Health checks gate traffic until the service has warmed its caches.",
+    ],
+    "testing": [
+        "Integration tests run against a disposable database loaded with the real migrations.",
+        "Flaky tests are quarantined and fixed within the week, never silently retried.",
+        "Fixtures build the minimum state each test needs instead of sharing a global dataset.",
+        "Coverage is tracked on changed lines rather than as a global percentage.",
+    ],
+}
+
+QUERIES: list[str] = [
+    "how should I rotate refresh tokens?",
+    "what is the right way to validate OAuth callbacks?",
+    "how do I index foreign keys in postgres?",
+    "how should database migrations be rolled out safely?",
+    "how do I version a public API?",
+    "what error format should the API return?",
+    "how can I reduce latency on hot read paths?",
+    "should I batch network calls?",
+    "how do we roll back a bad deployment?",
+    "how are docker images promoted between environments?",
+    "how should integration tests use the database?",
+    "what do we do about flaky tests?",
+]
+
+
+def make_documents(count: int, paragraphs: int = 12, seed: int = 7) -> list[dict]:
+    """Markdown documents mixing two or three topics each, ~1 KB per paragraph."""
+    rng = random.Random(seed)
+    categories = sorted(_TOPICS)
+    docs: list[dict] = []
+    for i in range(count):
+        topics = rng.sample(categories, k=rng.choice([2, 3]))
+        lines = [f"# Engineering notes {i}: {' / '.join(topics)}", ""]
+        for p in range(paragraphs):
+            topic = topics[p % len(topics)]
+            sentences = rng.sample(_TOPICS[topic], k=3) * 2
+            lines.append(f"## {topic.title()} section {p}")
+            lines.append(" ".join(sentences))
+            lines.append("")
+        docs.append({
+            "filename": f"notes_{i:04d}_architecture.md",
+            "content": "\n".join(lines),
+            "file_type": "md",
+            "doc_category": "architecture",
+        })
+    return docs
@@ -0,0 +1,382 @@
+"""Local stand-ins for OpenAI, Together and the Supabase gateway.
+
+One threaded HTTP server answers:
+
+- ``POST /v1/embeddings``        deterministic hashed bag-of-words vectors
+- ``POST /v1/chat/completions``  classifier JSON or agent extraction arrays
+- ``/rest/v1/*``                 proxied to a real PostgREST (see pg_fixture)
+- ``/storage/v1/*``              in-memory object storage for the bucket API,
+                                  including resumable (TUS) uploads
+- ``GET /_fake/stats``           connections accepted and requests by kind, for
+                                  a fake running in another process
+
+Every upstream answer is delayed by a configurable latency so benchmarks
+model network time without depending on it; a new connection can be delayed
+too, standing in for the handshake that keep-alive saves. Embeddings are a signed
+feature hash of the lowercased tokens, so texts sharing words are close in
+cosine space and retrieval results are meaningful, not random.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import math
+import re
+import struct
+import threading
+import time
+import urllib.error
+import urllib.request
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+
+EMBEDDING_DIMS = 1536
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]+")
+
+_CATEGORY_KEYWORDS: dict[str, list[str]] = {
+    "auth": ["auth", "login", "jwt", "token", "session", "oauth", "password"],
+    "payment": ["payment", "stripe", "billing", "invoice", "checkout"],
+    "api": ["api", "endpoint", "rest", "graphql", "rate"],
+    "database": ["database", "sql", "postgres", "index", "query", "migration"],
+    "frontend": ["frontend", "react", "css", "ui", "component"],
+    "security": ["security", "encryption", "xss", "csrf", "secret"],
+    "deployment": ["deploy", "docker", "kubernetes", "ci", "release"],
+    "testing": ["test", "pytest", "mock", "fixture", "coverage"],
+    "performance": ["performance", "latency", "cache", "throughput", "slow"],
+}
+
+
+def fake_embedding(text: str, dims: int = EMBEDDING_DIMS) -> list[float]:
+    vec = [0.0] * dims
+    for token in _TOKEN_RE.findall(text.lower()):
+        digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+        slot = int.from_bytes(digest[:4], "little") % dims
+        sign = 1.0 if digest[4] & 1 else -1.0
+        vec[slot] += sign
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+def _classify(text: str) -> str:
+    lowered = text.lower()
+    best, best_hits = "other", 0
+    for category, words in _CATEGORY_KEYWORDS.items():
+        hits = sum(lowered.count(w) for w in words)
+        if hits > best_hits:
+            best, best_hits = category, hits
+    return best
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _extraction_items(prompt: str, n: int = 4) -> list[dict]:
+    sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", prompt) if len(s.strip()) > 40]
+    if not sentences:
+        sentences = [prompt[:200]]
+    step = max(1, len(sentences) // n)
+    items = []
+    for sentence in sentences[::step][:n]:
+        items.append({
+            "content": sentence[:240],
+            "category": _classify(sentence),
+            "type": "pattern",
+            "when_to_use": "When the same constraints apply.",
+            "when_not_to_use": "When the constraints differ.",
+            "reasoning": "Derived from the source document.",
+        })
+    return items
+
+
+class _ObjectStore:
+    """Objects by key. With keep_data off only sizes are kept, so large-file
+    benchmarks do not count the fake's own copy of the upload."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.objects: dict[str, tuple[bytes, str]] = {}
+        self.sizes: dict[str, int] = {}
+        self.keep_data = True
+        # upload id -> [key, length, content_type, received bytes, offset]
+        self._uploads: dict[str, list[Any]] = {}
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        with self._lock:
+            self.sizes[key] = len(data)
+            self.objects[key] = (data if self.keep_data else b"", content_type)
+
+    def begin_upload(self, key: str, length: int, content_type: str) -> str:
+        upload_id = hashlib.blake2b(f"{key}:{time.time_ns()}".encode(), digest_size=8).hexdigest()
+        with self._lock:
+            self._uploads[upload_id] = [key, length, content_type, bytearray(), 0]
+        return upload_id
+
+    def append(self, upload_id: str, offset: int, data: bytes) -> Optional[int]:
+        """Add a piece at `offset`; returns the new offset, None if it does not line up."""
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            if upload is None or upload[4] != offset:
+                return None
+            if self.keep_data:
+                upload[3] += data
+            upload[4] += len(data)
+            key, length, content_type, received, done = upload
+        if done >= length:
+            with self._lock:
+                self._uploads.pop(upload_id, None)
+                self.sizes[key] = done
+                self.objects[key] = (bytes(received) if self.keep_data else b"", content_type)
+        return done
+
+    def get(self, key: str) -> Optional[tuple[bytes, str]]:
+        with self._lock:
+            return self.objects.get(key)
+
+
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 drops connects from a burst of concurrent
+    # clients, which then retry after a second and swamp every latency
+    request_queue_size = 256
+    daemon_threads = True
+
+
+class FakeUpstreams:
+    """Start with ``.start()``; ``.url`` is the base for every stand-in."""
+
+    def __init__(
+        self,
+        embed_latency_ms: float = 30.0,
+        llm_latency_ms: float = 200.0,
+        connect_latency_ms: float = 0.0,
+        postgrest_url: Optional[str] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.embed_latency_ms = embed_latency_ms
+        self.llm_latency_ms = llm_latency_ms
+        self.connect_latency_ms = connect_latency_ms
+        self.postgrest_url = postgrest_url.rstrip("/") if postgrest_url else None
+        self.store = _ObjectStore()
+        self.request_counts: dict[str, int] = {}
+        # TCP connections accepted; with keep-alive, fewer than requests
+        self.connections = 0
+        self._counts_lock = threading.Lock()
+        self._server = _Server((host, port), self._make_handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeUpstreams":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, kind: str) -> None:
+        with self._counts_lock:
+            self.request_counts[kind] = self.request_counts.get(kind, 0) + 1
+
+    def _make_handler(self) -> type[BaseHTTPRequestHandler]:
+        upstreams = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def setup(self) -> None:
+                super().setup()
+                with upstreams._counts_lock:
+                    upstreams.connections += 1
+                # Stands in for the TCP + TLS handshake a real API costs
+                time.sleep(upstreams.connect_latency_ms / 1000)
+
+            def _body(self) -> bytes:
+                length = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(length) if length else b""
+
+            def _send(self, status: int, body: bytes, content_type: str = "application/json",
+                      extra: Optional[dict[str, str]] = None) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (extra or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _json(self, status: int, payload: Any) -> None:
+                self._send(status, json.dumps(payload).encode())
+
+            def _dispatch(self) -> None:
+                path = self.path.split("?", 1)[0]
+                if path.endswith("/embeddings") and self.command == "POST":
+                    return self._embeddings()
+                if path.endswith("/chat/completions") and self.command == "POST":
+                    return self._chat()
+                if path.startswith("/rest/v1"):
+                    return self._proxy_rest()
+                if path.startswith("/storage/v1"):
+                    return self._storage(path[len("/storage/v1"):])
+                if path == "/_fake/stats":
+                    with upstreams._counts_lock:
+                        return self._json(200, {
+                            "connections": upstreams.connections,
+                            "requests": dict(upstreams.request_counts),
+                        })
+                self._json(404, {"error": f"no fake for {self.command} {path}"})
+
+            do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = do_HEAD = _dispatch
+
+            def _embeddings(self) -> None:
+                upstreams._count("embeddings")
+                body = json.loads(self._body() or b"{}")
+                inputs = body.get("input", [])
+                if isinstance(inputs, str):
+                    inputs = [inputs]
+                dims = int(body.get("dimensions") or EMBEDDING_DIMS)
+                time.sleep(upstreams.embed_latency_ms / 1000)
+                data = []
+                for i, text in enumerate(inputs):
+                    vec = fake_embedding(str(text))[:dims]
+                    if body.get("encoding_format") == "base64":
+                        embedding: Any = base64.b64encode(struct.pack(f"<{len(vec)}f", *vec)).decode()
+                    else:
+                        embedding = vec
+                    data.append({"object": "embedding", "index": i, "embedding": embedding})
+                tokens = sum(_approx_tokens(str(t)) for t in inputs)
+                self._json(200, {
+                    "object": "list",
+                    "data": data,
+                    "model": body.get("model", "fake-embedding"),
+                    "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+                })
+
+            def _chat(self) -> None:
+                upstreams._count("chat")
+                body = json.loads(self._body() or b"{}")
+                prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+                time.sleep(upstreams.llm_latency_ms / 1000)
+                if "Classify this query" in prompt:
+                    query = prompt.split('Classify this query: "', 1)[-1].split('"', 1)[0]
+                    content = json.dumps({
+                        "query_type": "pattern",
+                        "category": _classify(query),
+                        "scope": "general",
+                        "confidence": 0.8,
+                    })
+                else:
+                    content = json.dumps(_extraction_items(prompt))
+                prompt_tokens = _approx_tokens(prompt)
+                completion_tokens = _approx_tokens(content)
+                self._json(200, {
+                    "id": "fake-chat",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": body.get("model", "fake-llm"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                })
+
+            def _proxy_rest(self) -> None:
+                upstreams._count("rest")
+                if upstreams.postgrest_url is None:
+                    return self._json(503, {"message": "no PostgREST configured"})
+                target = upstreams.postgrest_url + self.path[len("/rest/v1"):]
+                body = self._body() if self.command in ("POST", "PATCH", "PUT", "DELETE") else None
+                # PostgREST runs without a JWT secret here, so auth headers are dropped
+                headers = {
+                    k: v for k, v in self.headers.items()
+                    if k.lower() not in ("host", "authorization", "apikey", "content-length", "connection")
+                }
+                req = urllib.request.Request(target, data=body, method=self.command, headers=headers)
+                try:
+                    with urllib.request.urlopen(req) as resp:
+                        status, payload, resp_headers = resp.status, resp.read(), resp.headers
+                except urllib.error.HTTPError as exc:
+                    status, payload, resp_headers = exc.code, exc.read(), exc.headers
+                passthrough = {
+                    k: v for k, v in resp_headers.items()
+                    if k.lower() in ("content-range", "preference-applied", "location")
+                }
+                self._send(status, payload, resp_headers.get("Content-Type", "application/json"), passthrough)
+
+            def _storage(self, path: str) -> None:
+                upstreams._count("storage")
+                if path.startswith("/bucket/"):
+                    bucket = path[len("/bucket/"):]
+                    return self._json(200, {"id": bucket, "name": bucket, "public": False})
+                if path.startswith("/upload/resumable"):
+                    return self._resumable(path[len("/upload/resumable"):].lstrip("/"))
+                if not path.startswith("/object/"):
+                    return self._json(404, {"error": "unknown storage path"})
+                key = path[len("/object/"):]
+                for prefix in ("authenticated/", "public/"):
+                    if key.startswith(prefix):
+                        key = key[len(prefix):]
+                if self.command in ("POST", "PUT"):
+                    data, content_type = self._upload_payload()
+                    upstreams.store.put(key, data, content_type)
+                    return self._json(200, {"Key": key})
+                found = upstreams.store.get(key)
+                if found is None:
+                    return self._json(404, {"error": "not_found", "message": key})
+                data, content_type = found
+                self._send(200, data, content_type)
+
+            def _resumable(self, upload_id: str) -> None:
+                if self.command == "POST" and not upload_id:
+                    meta = {}
+                    for item in (self.headers.get("Upload-Metadata") or "").split(","):
+                        name, _, value = item.strip().partition(" ")
+                        meta[name] = base64.b64decode(value).decode() if value else ""
+                    key = f"{meta.get('bucketName', '')}/{meta.get('objectName', '')}"
+                    content_type = meta.get("contentType", "application/octet-stream")
+                    new_id = upstreams.store.begin_upload(key, int(self.headers.get("Upload-Length") or 0), content_type)
+                    return self._send(201, b"", extra={
+                        "Location": f"{upstreams.url}/storage/v1/upload/resumable/{new_id}",
+                        "Tus-Resumable": "1.0.0",
+                    })
+                if self.command == "PATCH" and upload_id:
+                    offset = upstreams.store.append(
+                        upload_id, int(self.headers.get("Upload-Offset") or 0), self._body(),
+                    )
+                    if offset is None:
+                        return self._json(409, {"error": "offset mismatch"})
+                    return self._send(204, b"", extra={"Upload-Offset": str(offset), "Tus-Resumable": "1.0.0"})
+                self._json(404, {"error": "unknown resumable upload"})
+
+            def _upload_payload(self) -> tuple[bytes, str]:
+                raw = self._body()
+                content_type = self.headers.get("Content-Type", "application/octet-stream")
+                if not content_type.startswith("multipart/"):
+                    return raw, content_type
+                message = BytesParser(policy=HTTP).parsebytes(
+                    f"Content-Type: {content_type}\r\n\r\n".encode() + raw
+                )
+                for part in message.iter_parts():
+                    if part.get_filename() is not None or part.get_param("name", header="content-disposition") == "file":
+                        return part.get_payload(decode=True) or b"", part.get_content_type()
+                return raw, content_type
+
+        return Handler
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Search kernel benchmark: exact brute-force search across corpus sizes.
+
+    python -m benchmarks.kernel --out benchmarks/results/kernel-$(git rev-parse --short HEAD).json
+    python -m benchmarks.compare <old>.json <new>.json
+
+No Postgres needed. For each corpus size, a random unit-vector corpus with
+a category and a confidence per row is written as a utils.search_kernel shard,
+then reopened memory-mapped, as the search cache keeps partitions. Each
+size reports:
+
+- save_s / open_ms: writing the shard and reopening it;
+- single: one query, k=20, embedding-version mask (the cache's chunk search);
+- filtered: the same with a category and minimum-confidence mask (the
+  cache's principle search), about 1 row in 12 eligible;
+- batch: --batch queries scored in one product, per-query latency;
+- full_sort: the previous in-memory path for comparison (score every row,
+  argsort all of them, walk to the first k eligible);
+- recall_at_k: kernel rows against a float64 full sort (should be 1.0).
+
+The RPC it stands in for is measured by `benchmarks.run --suites profiles`.
+At 1536 dimensions the largest default size needs about 2.5 GB of memory
+while the corpus is generated.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _BACKEND_DIR)
+
+import numpy as np
+
+from benchmarks.run import _latency_stats
+from utils.search_kernel import Shard, normalize
+
+CATEGORIES = ["auth", "api", "database", "frontend", "backend", "security"]
+K = 20
+
+
+def _corpus(n: int, dims: int, seed: int) -> Shard:
+    """Clustered unit vectors (so queries have real neighbours), built a
+    block at a time to keep peak memory near the float32 matrix itself."""
+    rng = np.random.default_rng(seed)
+    centers = normalize(rng.standard_normal((64, dims)))
+    matrix = np.empty((n, dims), dtype=np.float32)
+    for start in range(0, n, 10000):
+        size = min(10000, n - start)
+        block = centers[rng.integers(0, len(centers), size)] + 0.5 / np.sqrt(dims) * rng.standard_normal(
+            (size, dims), dtype=np.float32)
+        matrix[start:start + size] = normalize(block)
+    columns = {
+        "embedding_version": np.where(rng.random(n) < 0.98, "1", "0"),
+        "category": np.array(CATEGORIES)[rng.integers(0, len(CATEGORIES), n)],
+        "confidence_score": rng.uniform(0.3, 0.95, n).astype(np.float32),
+    }
+    return Shard(np.array([f"row-{i}" for i in range(n)]), matrix, columns)
+
+
+def _time(fn, runs: int) -> list[float]:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def _full_sort(shard: Shard, query: np.ndarray, mask: np.ndarray) -> list[int]:
+    scores = np.asarray(shard.matrix) @ query
+    out = []
+    for i in np.argsort(-scores, kind="stable"):
+        if mask[i]:
+            out.append(int(i))
+            if len(out) == K:
+                break
+    return out
+
+
+def bench_size(n: int, dims: int, runs: int, batch: int, directory: str) -> dict[str, Any]:
+    built = _corpus(n, dims, seed=n)
+    started = time.perf_counter()
+    built.save(os.path.join(directory, f"n{n}"))
+    save_s = time.perf_counter() - started
+    del built
+
+    started = time.perf_counter()
+    shard = Shard.open(os.path.join(directory, f"n{n}"))
+    open_ms = (time.perf_counter() - started) * 1000
+
+    rng = np.random.default_rng(1)
+    queries = normalize(np.asarray(shard.matrix[rng.integers(0, n, runs + batch)])
+                        + 0.05 * rng.standard_normal((runs + batch, dims)))
+    version = shard.mask(equal={"embedding_version": "1"})
+    filtered = shard.mask(equal={"embedding_version": "1", "category": "auth"}, at_least={"confidence_score": 0.5})
+
+    first = _time(lambda: shard.search(queries[0], K, version), 1)[0]  # pages the matrix in
+    single = iter(queries)
+    single_ms = _time(lambda: shard.search(next(single), K, version), runs)
+    masked = iter(queries)
+    filtered_ms = _time(lambda: shard.search(next(masked), K, filtered), runs)
+    batch_ms = _time(lambda: shard.search(queries[:batch], K, version), max(runs // 4, 1))
+    full = iter(queries)
+    full_sort_ms = _time(lambda: _full_sort(shard, next(full), version), max(runs // 4, 1))
+
+    matrix64 = np.asarray(shard.matrix, dtype=np.float64)
+    hits = total = 0
+    for query in queries[:10]:
+        exact = set(np.flatnonzero(version)[np.argsort(-(matrix64[version] @ query))[:K]].tolist())
+        found = {int(id_.split("-")[1]) for id_, _ in shard.search(query, K, version)[0]}
+        hits += len(exact & found)
+        total += len(exact)
+    del matrix64
+
+    per_query = [ms / batch for ms in batch_ms]
+    return {
+        "rows": n,
+        "matrix_mb": round(n * dims * 4 / 2**20, 1),
+        "save_s": round(save_s, 2),
+        "open_ms": round(open_ms, 2),
+        "first_query_ms": round(first, 2),
+        "single": _latency_stats(single_ms),
+        "filtered": _latency_stats(filtered_ms),
+        "batch": {**_latency_stats(per_query),
+                  "queries_per_s": round(1000 / (sum(per_query) / len(per_query)), 1)},
+        "full_sort": _latency_stats(full_sort_ms),
+        "recall_at_k": round(hits / total, 4),
+    }
+
+
+def run(sizes: list[int], dims: int, runs: int, batch: int) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix="cf-kernel-") as directory:
+        return {f"n{n}": bench_size(n, dims, runs, batch, directory) for n in sizes}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="benchmarks.kernel", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=os.path.join(_BACKEND_DIR, "benchmarks", "results", "kernel-latest.json"))
+    parser.add_argument("--sizes", default="1000,10000,50000,200000", help="Comma-separated corpus sizes")
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--runs", type=int, default=50, help="Queries timed per measurement")
+    parser.add_argument("--batch", type=int, default=16, help="Queries per batched search")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    results = {"kernel": run(sizes, args.dims, args.runs, args.batch)}
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=_BACKEND_DIR, text=True).strip()
+    except Exception:
+        commit = "unknown"
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "params": {"sizes": sizes, "dims": args.dims, "runs": args.runs, "batch": args.batch, "k": K},
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
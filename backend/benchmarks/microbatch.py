@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Embedding micro-batcher under load: requests sent and latency per window.
+
+    python -m benchmarks.microbatch --out benchmarks/results/microbatch-$(git rev-parse --short HEAD).json
+    python -m benchmarks.compare <old>.json <new>.json
+
+No Postgres needed: only the OpenAI embeddings stand-in in benchmarks.fakes
+is used, served from a child process as in benchmarks.pool. Queries arrive
+at --rate per second (Poisson) for --duration-s. Each one embeds
+--texts-per-query texts concurrently through generate_embedding, the shape
+of orchestrate_query's fan-out (the query, storage 2's category searches,
+the synthesizer's candidates). One run per --windows value;
+EMBEDDING_BATCH_WINDOW_MS=0 is the unbatched baseline. Each reports:
+
+- requests: embedding requests the fake answered, and texts_per_request;
+- embed: latency of one generate_embedding call;
+- query: latency of one query's whole fan-out;
+- request_reduction: requests saved against the window=0 run.
+
+The fake answers every request after --embed-latency-ms whatever its size,
+so the latency cost of larger requests is not modelled.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+from typing import Any
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _BACKEND_DIR)
+
+from benchmarks.pool import _serve
+from benchmarks.run import _latency_stats
+
+_TOPICS = ["auth", "database", "api", "frontend", "caching", "security", "testing", "deployment"]
+
+
+def _requests(url: str) -> int:
+    with urllib.request.urlopen(f"{url}/_fake/stats") as resp:
+        return json.load(resp)["requests"].get("embeddings", 0)
+
+
+async def _run_window(window_ms: float, url: str, rate: float, duration_s: float, texts: int) -> dict[str, Any]:
+    from utils import config
+    from utils.embeddings import EmbeddingVersion, embedding_batch_stats, generate_embedding
+
+    config.EMBEDDING_BATCH_WINDOW_MS = window_ms
+    version = EmbeddingVersion("1", "text-embedding-3-small")
+    rng = random.Random(7)
+    embed_ms: list[float] = []
+    query_ms: list[float] = []
+
+    async def embed(text: str) -> None:
+        started = time.perf_counter()
+        await generate_embedding(text, version=version)
+        embed_ms.append((time.perf_counter() - started) * 1000)
+
+    async def query(n: int) -> None:
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            embed(f"query {n}: how do we handle {rng.choice(_TOPICS)}? ({i})") for i in range(texts)
+        ])
+        query_ms.append((time.perf_counter() - started) * 1000)
+
+    await generate_embedding("warm up", version=version)  # connection and client setup
+    before, stats_before = _requests(url), embedding_batch_stats()
+    tasks = []
+    started = time.perf_counter()
+    n = 0
+    while time.perf_counter() - started < duration_s:
+        tasks.append(asyncio.ensure_future(query(n)))
+        n += 1
+        await asyncio.sleep(rng.expovariate(rate))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    requests = _requests(url) - before
+    stats = embedding_batch_stats()
+    return {
+        "window_ms": window_ms,
+        "queries": n,
+        "texts": len(embed_ms),
+        "requests": requests,
+        "texts_per_request": round(len(embed_ms) / requests, 2) if requests else 0.0,
+        "full_batches": stats["full"] - stats_before["full"],
+        "queries_per_s": round(n / elapsed, 1),
+        "embed": _latency_stats(embed_ms),
+        "query": _latency_stats(query_ms),
+    }
+
+
+async def _run_windows(windows: list[float], url: str, rate: float, duration_s: float, texts: int) -> dict[str, Any]:
+    # One loop for every window: the shared client is bound to the loop it was first used on
+    return {f"window_{w:g}ms": await _run_window(w, url, rate, duration_s, texts) for w in windows}
+
+
+def run(windows: list[float], rate: float, duration_s: float, texts: int, embed_latency_ms: float) -> dict[str, Any]:
+    parent, child = multiprocessing.Pipe()
+    latencies_ms = {"embed_latency_ms": embed_latency_ms, "llm_latency_ms": 0.0}
+    server = multiprocessing.Process(target=_serve, args=(child, latencies_ms), daemon=True)
+    server.start()
+    url = parent.recv()
+    os.environ.update({"OPENAI_API_KEY": "bench-openai-key", "OPENAI_BASE_URL": f"{url}/v1"})
+    try:
+        results = asyncio.run(_run_windows(windows, url, rate, duration_s, texts))
+    finally:
+        parent.send("stop")
+        server.join(timeout=10)
+    baseline = results.get("window_0ms")
+    if baseline and baseline["requests"]:
+        for result in results.values():
+            result["request_reduction"] = round(1 - result["requests"] / baseline["requests"], 3)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="benchmarks.microbatch", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=os.path.join(_BACKEND_DIR, "benchmarks", "results", "microbatch-latest.json"))
+    parser.add_argument("--windows", default="0,2,5,10", help="Comma-separated EMBEDDING_BATCH_WINDOW_MS values")
+    parser.add_argument("--rate", type=float, default=50.0, help="Queries started per second")
+    parser.add_argument("--duration-s", type=float, default=5.0)
+    parser.add_argument("--texts-per-query", type=int, default=6)
+    parser.add_argument("--embed-latency-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    windows = [float(w) for w in args.windows.split(",") if w]
+    results = {"microbatch": run(windows, args.rate, args.duration_s, args.texts_per_query, args.embed_latency_ms)}
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=_BACKEND_DIR, text=True).strip()
+    except Exception:
+        commit = "unknown"
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "params": {
+            "windows": windows,
+            "rate": args.rate,
+            "duration_s": args.duration_s,
+            "texts_per_query": args.texts_per_query,
+            "embed_latency_ms": args.embed_latency_ms,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""HTTP pool load benchmark: per-caller clients against the shared transport.
+
+    python -m benchmarks.pool --out benchmarks/results/pool-$(git rev-parse --short HEAD).json
+    python -m benchmarks.compare <old>.json <new>.json
+
+No Postgres needed: only the OpenAI and Together stand-ins in
+benchmarks.fakes are used, served from a child process so the fake does not
+compete with the client for the GIL. Each round fires one burst shaped like the
+learning engine's fan-out (agent chat calls on Together, classification
+and embedding calls on OpenAI) at once, pauses, and repeats.
+
+- separate: one default AsyncOpenAI per caller (embeddings, classifier,
+  Together), as before utils.clients, each with openai's default pool.
+- shared: utils.clients' one client per provider on the metered transport.
+
+connections_opened is counted by the fake server (GET /_fake/stats), so both
+modes are measured the same way; shared also reports the transport's own pool stats.
+The fakes speak plain HTTP/1.1, so HTTP/2 is not exercised here.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+from typing import Any
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _BACKEND_DIR)
+
+from benchmarks.fakes import FakeUpstreams
+from benchmarks.run import _latency_stats
+
+AGENT_SHARE = 0.6
+CLASSIFY_SHARE = 0.2
+_PROMPT = "Extract reusable patterns. Refresh tokens rotate on every use and the old one is revoked at once."
+
+
+async def _burst(clients: dict[str, Any], size: int, latencies: list[float]) -> None:
+    n_agent = round(size * AGENT_SHARE)
+    n_classify = round(size * CLASSIFY_SHARE)
+
+    async def timed(call) -> None:
+        started = time.perf_counter()
+        await call
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    def chat(client):
+        return client.chat.completions.create(
+            model="bench", messages=[{"role": "user", "content": _PROMPT}], max_tokens=200,
+        )
+
+    calls = [timed(chat(clients["together"])) for _ in range(n_agent)]
+    calls += [timed(chat(clients["classify"])) for _ in range(n_classify)]
+    calls += [
+        timed(clients["embeddings"].embeddings.create(model="text-embedding-3-small", input=[_PROMPT] * 8))
+        for _ in range(size - n_agent - n_classify)
+    ]
+    await asyncio.gather(*calls)
+
+
+def _serve(conn, latencies_ms: dict[str, float]) -> None:
+    upstreams = FakeUpstreams(**latencies_ms).start()
+    conn.send(upstreams.url)
+    conn.recv()  # block until the parent is done
+    upstreams.stop()
+
+
+def _connections(url: str) -> int:
+    with urllib.request.urlopen(f"{url}/_fake/stats") as resp:
+        return json.load(resp)["connections"]
+
+
+async def _run_mode(mode: str, url: str, rounds: int, burst: int, pause_s: float) -> dict[str, Any]:
+    from openai import AsyncOpenAI
+
+    from utils import clients as shared
+
+    base_url = f"{url}/v1"
+    if mode == "separate":
+        clients = {
+            name: AsyncOpenAI(api_key="bench-key", base_url=base_url)
+            for name in ("embeddings", "classify", "together")
+        }
+    else:
+        openai_client = shared.get_openai_client()
+        clients = {"embeddings": openai_client, "classify": openai_client, "together": shared.get_together_client()}
+
+    opened_before = _connections(url)
+    latencies: list[float] = []
+    started = time.perf_counter()
+    for _ in range(rounds):
+        await _burst(clients, burst, latencies)
+        await asyncio.sleep(pause_s)
+    elapsed = time.perf_counter() - started - rounds * pause_s
+
+    result: dict[str, Any] = {
+        "requests": len(latencies),
+        "requests_per_s": round(len(latencies) / elapsed, 1),
+        **_latency_stats(latencies),
+        "connections_opened": _connections(url) - opened_before,
+    }
+    if mode == "shared":
+        result["pools"] = shared.pool_stats()
+    for client in {id(c): c for c in clients.values()}.values():
+        await client.close()
+    return result
+
+
+def run(rounds: int, burst: int, latencies_ms: dict[str, float], pause_s: float) -> dict[str, Any]:
+    """latencies_ms: embed_latency_ms, llm_latency_ms and connect_latency_ms for the fake."""
+    parent, child = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=_serve, args=(child, latencies_ms), daemon=True)
+    server.start()
+    url = parent.recv()
+    os.environ.update({
+        "OPENAI_API_KEY": "bench-openai-key",
+        "OPENAI_BASE_URL": f"{url}/v1",
+        "TOGETHER_API_KEY": "bench-together-key",
+        "TOGETHER_BASE_URL": f"{url}/v1",
+    })
+    try:
+        results = {mode: asyncio.run(_run_mode(mode, url, rounds, burst, pause_s))
+                   for mode in ("separate", "shared")}
+    finally:
+        parent.send("stop")
+        server.join(timeout=10)
+    results["connections_saved"] = results["separate"]["connections_opened"] - results["shared"]["connections_opened"]
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="benchmarks.pool", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=os.path.join(_BACKEND_DIR, "benchmarks", "results", "pool-latest.json"))
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--burst", type=int, default=96, help="Concurrent requests per round")
+    parser.add_argument("--llm-latency-ms", type=float, default=500.0)
+    parser.add_argument("--embed-latency-ms", type=float, default=50.0)
+    parser.add_argument("--connect-latency-ms", type=float, default=100.0,
+                        help="Delay on every new connection, standing in for the TLS handshake")
+    parser.add_argument("--pause-s", type=float, default=0.2, help="Idle time between rounds")
+    args = parser.parse_args()
+
+    latencies_ms = {
+        "embed_latency_ms": args.embed_latency_ms,
+        "llm_latency_ms": args.llm_latency_ms,
+        "connect_latency_ms": args.connect_latency_ms,
+    }
+    results = {"pool": run(args.rounds, args.burst, latencies_ms, args.pause_s)}
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=_BACKEND_DIR, text=True).strip()
+    except Exception:
+        commit = "unknown"
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "params": {
+            "rounds": args.rounds,
+            "burst": args.burst,
+            **latencies_ms,
+            "pause_s": args.pause_s,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,558 @@
+#!/usr/bin/env python3
+"""Offline benchmark runner.
+
+    docker compose -f benchmarks/docker-compose.yml up -d
+    python -m benchmarks.run --out benchmarks/results/$(git rev-parse --short HEAD).json
+    python -m benchmarks.compare benchmarks/results/<old>.json benchmarks/results/<new>.json
+
+Supabase, OpenAI and Together are replaced by benchmarks.fakes (deterministic
+answers after a fixed latency) in front of a local Postgres + pgvector loaded
+with the real migrations, so numbers are reproducible and comparable between
+commits. Suites run in pipeline order: ingest → learning → query, then
+profiles compares full-vector and compact two-stage search and contention
+measures concurrent principle confidence updates. large_file (opt-in) measures
+peak heap for streamed against in-memory processing of one large file.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _BACKEND_DIR)
+
+from benchmarks.corpus import QUERIES, make_documents
+from benchmarks.fakes import FakeUpstreams
+from benchmarks.pg_fixture import DEFAULT_DATABASE_URL, DEFAULT_POSTGREST_URL, reset_database
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 2)
+
+
+def _latency_stats(latencies_ms: list[float]) -> dict[str, float]:
+    return {
+        "p50_ms": _percentile(latencies_ms, 50),
+        "p95_ms": _percentile(latencies_ms, 95),
+        "p99_ms": _percentile(latencies_ms, 99),
+        "max_ms": round(max(latencies_ms), 2) if latencies_ms else 0.0,
+        "mean_ms": round(sum(latencies_ms) / len(latencies_ms), 2) if latencies_ms else 0.0,
+    }
+
+
+def _max_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+
+async def _measure(
+    name: str,
+    upstreams: FakeUpstreams,
+    fn: Callable[[], Awaitable[dict[str, Any]]],
+    trace_memory: bool,
+) -> dict[str, Any]:
+    before = dict(upstreams.request_counts)
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    result = await fn()
+    result["wall_s"] = round(time.perf_counter() - started, 3)
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["heap_peak_mb"] = round(peak / (1024 * 1024), 2)
+    result["rss_peak_mb"] = _max_rss_mb()
+    result["upstream_requests"] = {
+        kind: count - before.get(kind, 0)
+        for kind, count in upstreams.request_counts.items()
+        if count - before.get(kind, 0)
+    }
+    print(f"  {name}: {json.dumps(result)}", file=sys.stderr)
+    return result
+
+
+async def bench_ingest(project_id: str, docs: list[dict]) -> dict[str, Any]:
+    from mcp_server.tools import handle_upload_document
+
+    latencies: list[float] = []
+    chunks = 0
+    total_bytes = 0
+    started = time.perf_counter()
+    for doc in docs:
+        t0 = time.perf_counter()
+        result = await handle_upload_document({"project_id": project_id, **doc})
+        latencies.append((time.perf_counter() - t0) * 1000)
+        if not result.get("success"):
+            raise RuntimeError(f"upload failed: {result.get('error')}")
+        chunks += result["data"]["chunk_count"]
+        total_bytes += len(doc["content"].encode())
+    elapsed = time.perf_counter() - started
+    return {
+        "documents": len(docs),
+        "chunks": chunks,
+        "docs_per_s": round(len(docs) / elapsed, 2),
+        "chunks_per_s": round(chunks / elapsed, 2),
+        "mb_per_s": round(total_bytes / elapsed / (1024 * 1024), 3),
+        "per_document": _latency_stats(latencies),
+    }
+
+
+async def bench_learning(project_id: str) -> dict[str, Any]:
+    from learning_engine.engine import run_learning_engine
+    from utils.supabase_client import create_analysis_job, get_documents
+
+    documents = await get_documents(project_id)
+    for doc in documents:
+        await create_analysis_job(doc["id"])
+
+    started = time.perf_counter()
+    result = await run_learning_engine(project_id=project_id)
+    elapsed = time.perf_counter() - started
+    if result.get("error"):
+        raise RuntimeError(f"learning engine failed: {result['error']}")
+    return {
+        "documents": result.get("processed", 0),
+        "principles_created": result.get("total_created", 0),
+        "principles_updated": result.get("total_updated", 0),
+        "principles_failed": result.get("total_failed", 0),
+        "docs_per_s": round(result.get("processed", 0) / elapsed, 3),
+    }
+
+
+async def bench_query(project_id: str, repeats: int, concurrency: int) -> dict[str, Any]:
+    from orchestrator.orchestrator import orchestrate_queries, orchestrate_query
+
+    latencies: list[float] = []
+    stage_totals: dict[str, float] = {}
+    for _ in range(repeats):
+        for query in QUERIES:
+            t0 = time.perf_counter()
+            result = await orchestrate_query(query=query, project_id=project_id)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if result.get("error"):
+                raise RuntimeError(f"query failed: {result['error']}")
+            for stage, ms in result["meta"].get("timings_ms", {}).items():
+                stage_totals[stage] = stage_totals.get(stage, 0.0) + ms
+
+    batch = (QUERIES * (concurrency // len(QUERIES) + 1))[:concurrency]
+    started = time.perf_counter()
+    await asyncio.gather(*[orchestrate_query(query=q, project_id=project_id) for q in batch])
+    concurrent_elapsed = time.perf_counter() - started
+
+    # contextflow_query_batch: per-query cost as the batch grows
+    batched: dict[str, Any] = {}
+    for size in (1, 4, 16):
+        queries = [{"query": q, "project_id": project_id} for q in (QUERIES * (size // len(QUERIES) + 1))[:size]]
+        started = time.perf_counter()
+        result = await orchestrate_queries(queries)
+        elapsed = time.perf_counter() - started
+        if result.get("error"):
+            raise RuntimeError(f"batch failed: {result['error']}")
+        batched[f"size{size}"] = {
+            "batch_ms": round(elapsed * 1000, 2),
+            "per_query_ms": round(elapsed * 1000 / size, 2),
+            "queries_per_s": round(size / elapsed, 2),
+        }
+
+    n = len(latencies)
+    return {
+        "queries": n,
+        "sequential": _latency_stats(latencies),
+        "stage_mean_ms": {stage: round(total / n, 2) for stage, total in stage_totals.items()},
+        "concurrency": concurrency,
+        "concurrent_queries_per_s": round(concurrency / concurrent_elapsed, 2),
+        "batch": batched,
+    }
+
+
+async def bench_profiles(project_id: str, database_url: str, limit: int = 10) -> dict[str, Any]:
+    """Full float32 search vs the compact halfvec two-stage search.
+
+    Recall is the overlap of the two-stage top-k with the full-vector top-k.
+    The fake embeddings are feature hashes, not Matryoshka vectors, so recall
+    here is a floor; latency and sizes carry over to real data. The full
+    ivfflat index exists only under vector-1536 (migration 015), so it is
+    built for the run and dropped again; each profile's footprint is its
+    columns plus the indexes it keeps, per row.
+    """
+    import asyncpg
+
+    from utils.config import MVP_USER_ID
+    from utils.embeddings import generate_embedding
+    from utils.supabase_client import get_client
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        await conn.execute("SELECT apply_embedding_profile('vector-1536')")
+        client = get_client()
+        latencies: dict[str, list[float]] = {"full": [], "two_stage": []}
+        overlaps: list[float] = []
+        for query in QUERIES:
+            embedding = await generate_embedding(query)
+            params = {
+                "query_text": query,
+                "query_embedding": embedding,
+                "user_id_filter": MVP_USER_ID,
+                "project_id_filter": project_id,
+                "match_count": limit,
+            }
+            ids: dict[str, set[str]] = {}
+            for label, rpc in (("full", "hybrid_search_document_chunks"),
+                               ("two_stage", "hybrid_search_document_chunks_2stage")):
+                t0 = time.perf_counter()
+                rows = client.rpc(rpc, params).execute().data or []
+                latencies[label].append((time.perf_counter() - t0) * 1000)
+                ids[label] = {row["id"] for row in rows}
+            if ids["full"]:
+                overlaps.append(len(ids["full"] & ids["two_stage"]) / len(ids["full"]))
+
+        sizes = dict(await conn.fetchrow("""
+            SELECT
+                count(*) AS rows,
+                avg(pg_column_size(embedding))::float AS full_bytes_per_row,
+                avg(pg_column_size(embedding_compact))::float AS compact_bytes_per_row,
+                pg_relation_size('idx_document_chunks_embedding') AS full_index_bytes,
+                pg_relation_size('idx_document_chunks_embedding_compact') AS compact_index_bytes
+            FROM document_chunks
+        """))
+    finally:
+        await conn.execute("SELECT apply_embedding_profile('halfvec-256')")
+        await conn.close()
+
+    rows = max(sizes.pop("rows"), 1)
+    full_bytes, compact_bytes = sizes["full_bytes_per_row"] or 0, sizes["compact_bytes_per_row"] or 0
+    sizes["vector_1536_bytes_per_row"] = full_bytes + sizes["full_index_bytes"] / rows
+    sizes["halfvec_256_bytes_per_row"] = full_bytes + compact_bytes + sizes["compact_index_bytes"] / rows
+    return {
+        "full": _latency_stats(latencies["full"]),
+        "two_stage": _latency_stats(latencies["two_stage"]),
+        f"recall_at_{limit}": round(sum(overlaps) / len(overlaps), 3) if overlaps else 0.0,
+        **{key: round(value or 0, 1) for key, value in sizes.items()},
+    }
+
+
+async def bench_providers(local_model: str, docs: list[dict]) -> dict[str, Any]:
+    """Remote embeddings (the fake OpenAI, so --embed-latency-ms models the
+    network) against the local CPU backend on the same texts."""
+    from file_processing.chunker import chunk_text
+    from utils.config import EMBEDDING_MODEL
+    from utils.embeddings import EmbeddingVersion, generate_embedding, generate_embeddings_batch
+
+    texts = [c["content"] for doc in docs for c in chunk_text(doc["content"])]
+    results: dict[str, Any] = {"texts": len(texts)}
+    for label, model in (("remote", EMBEDDING_MODEL), ("local", f"local:{local_model}")):
+        version = EmbeddingVersion(f"bench-{label}", model)
+        try:
+            t0 = time.perf_counter()
+            await generate_embedding("warm up", version=version)
+            warmup_ms = (time.perf_counter() - t0) * 1000
+        except Exception as exc:
+            results[label] = {"skipped": str(exc)}
+            continue
+
+        latencies: list[float] = []
+        for query in QUERIES:
+            t0 = time.perf_counter()
+            await generate_embedding(query, version=version)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+        t0 = time.perf_counter()
+        await generate_embeddings_batch(texts, version=version)
+        elapsed = time.perf_counter() - t0
+        results[label] = {
+            "model": model,
+            "warmup_ms": round(warmup_ms, 2),
+            "single": _latency_stats(latencies),
+            "batch_texts_per_s": round(len(texts) / elapsed, 2),
+        }
+    return results
+
+
+async def bench_contention(concurrency: int, rounds: int = 5) -> dict[str, Any]:
+    """Concurrent confidence updates of one principle, as synthesize_and_store
+    produces when several extractions match it: the previous read-modify-write
+    against the bump_principle RPC. lost_updates counts increments that a
+    concurrent writer overwrote."""
+    from utils.config import MVP_USER_ID
+    from utils.supabase_client import (
+        _run, bump_principle, create_principle, get_client, update_principle_confidence,
+    )
+
+    client = get_client()
+
+    async def read_modify_write(principle_id: str, project_id: str) -> None:
+        row = (await _run(client.table("principles").select("*").eq("id", principle_id).execute)).data[0]
+        await update_principle_confidence(
+            principle_id=principle_id,
+            score=min(float(row["confidence_score"]) + 0.01, 0.95),
+            times_applied=int(row["times_applied"]) + 1,
+            times_failed=0,
+        )
+        source_projects = row.get("source_projects") or []
+        if project_id not in source_projects:
+            await _run(client.table("principles").update(
+                {"source_projects": source_projects + [project_id]}
+            ).eq("id", principle_id).execute)
+
+    async def atomic(principle_id: str, project_id: str) -> None:
+        await bump_principle(principle_id, delta=0.01, cap=0.95, project_id=project_id)
+
+    results: dict[str, Any] = {"concurrency": concurrency, "rounds": rounds}
+    for label, update in (("read_modify_write", read_modify_write), ("bump_principle", atomic)):
+        principle = await create_principle({
+            "user_id": MVP_USER_ID,
+            "content": f"contention benchmark principle ({label})",
+            "type": "pattern",
+            "category": "other",
+            "source": "user_derived",
+            "confidence_score": 0.5,
+            "times_applied": 0,
+            "source_projects": [],
+        })
+        projects = [str(uuid.uuid4()) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for _ in range(rounds):
+            await asyncio.gather(*[update(principle["id"], p) for p in projects])
+        elapsed = time.perf_counter() - started
+        row = (await _run(client.table("principles").select("*").eq("id", principle["id"]).execute)).data[0]
+        await _run(client.table("principles").delete().eq("id", principle["id"]).execute)
+        expected = concurrency * rounds
+        results[label] = {
+            "updates_per_s": round(expected / elapsed, 2),
+            "lost_updates": expected - int(row["times_applied"]),
+            "missing_source_projects": len(set(projects) - set(row.get("source_projects") or [])),
+        }
+    return results
+
+
+async def _heap_peak_mb(fn: Callable[[], Any]) -> tuple[Any, float]:
+    """Run fn (sync or async) and return (result, Python heap peak in MB
+    above the level it started at)."""
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    try:
+        result = fn()
+        if asyncio.iscoroutine(result):
+            result = await result
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+    return result, round((peak - base) / (1024 * 1024), 2)
+
+
+async def bench_large_file(project_id: str, size_mb: int, upstreams: FakeUpstreams) -> dict[str, Any]:
+    """Peak Python heap for one large text file, streamed against in memory.
+
+    streamed: upload_stream (resumable pieces) plus extract, clean and chunk
+    as generators, i.e. contextflow_upload_document with ``path``.
+    in_memory: what the inline ``content`` mode did with the same file:
+    decode, encode for upload, clean_extracted_text and chunk_text.
+    Chunks are counted, not embedded or stored: that part is batched and
+    bounded the same way in both and is covered by the ingest suite. The
+    fake storage keeps only object sizes during the run.
+    """
+    import tempfile
+
+    from file_processing.chunker import chunk_text
+    from file_processing.extractor import CONTENT_TYPES, clean_extracted_text
+    from file_processing.streaming import iter_document_chunks
+    from utils.supabase_client import upload_stream
+
+    target = size_mb * 1024 * 1024
+    docs = make_documents(50, paragraphs=12)
+    with tempfile.NamedTemporaryFile("wb", suffix=".md", delete=False) as f:
+        path = f.name
+        written = 0
+        while written < target:
+            for doc in docs:
+                block = (doc["content"] + "\n\n").encode()
+                f.write(block)
+                written += len(block)
+    upstreams.store.keep_data = False
+    try:
+        async def streamed() -> int:
+            with open(path, "rb") as stream:
+                await upload_stream("documents", f"{project_id}/large.md", stream, written, CONTENT_TYPES["md"])
+                stream.seek(0)
+                return await asyncio.to_thread(lambda: sum(1 for _ in iter_document_chunks(stream, "md", {})))
+
+        def in_memory() -> int:
+            with open(path, "rb") as stream:
+                content = stream.read().decode("utf-8")
+            content_bytes = content.encode("utf-8")
+            chunks = chunk_text(clean_extracted_text(content))
+            del content_bytes
+            return len(chunks)
+
+        t0 = time.perf_counter()
+        streamed_chunks, streamed_peak = await _heap_peak_mb(streamed)
+        streamed_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        in_memory_chunks, in_memory_peak = await _heap_peak_mb(in_memory)
+        in_memory_s = time.perf_counter() - t0
+    finally:
+        upstreams.store.keep_data = True
+        os.unlink(path)
+
+    return {
+        "file_mb": round(written / (1024 * 1024), 1),
+        "chunks": streamed_chunks,
+        "chunks_match": streamed_chunks == in_memory_chunks,
+        "streamed_heap_peak_mb": streamed_peak,
+        "streamed_s": round(streamed_s, 2),
+        "streamed_mb_per_s": round(written / streamed_s / (1024 * 1024), 2),
+        "in_memory_heap_peak_mb": in_memory_peak,
+        "in_memory_s": round(in_memory_s, 2),
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=_BACKEND_DIR, text=True,
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+async def _run_suites(args: argparse.Namespace, upstreams: FakeUpstreams) -> dict[str, Any]:
+    # Imported only after the environment points at the fakes
+    from utils.config import MVP_USER_ID
+    from utils.embeddings import update_principle_embeddings
+    from utils.supabase_client import create_project
+
+    async def seed_embeddings() -> dict[str, Any]:
+        return {"rows": await update_principle_embeddings()}
+
+    results: dict[str, Any] = {}
+    results["seed_embeddings"] = await _measure(
+        "seed_embeddings", upstreams, seed_embeddings, args.trace_memory,
+    )
+
+    project = await create_project(MVP_USER_ID, {"name": "bench", "status": "active"})
+    docs = make_documents(args.documents, paragraphs=args.paragraphs)
+
+    if "ingest" in args.suites:
+        results["ingest"] = await _measure(
+            "ingest", upstreams, lambda: bench_ingest(project["id"], docs), args.trace_memory,
+        )
+    if "learning" in args.suites:
+        results["learning"] = await _measure(
+            "learning", upstreams, lambda: bench_learning(project["id"]), args.trace_memory,
+        )
+    if "query" in args.suites:
+        results["query"] = await _measure(
+            "query", upstreams,
+            lambda: bench_query(project["id"], args.query_repeats, args.concurrency),
+            args.trace_memory,
+        )
+    if "profiles" in args.suites:
+        results["profiles"] = await _measure(
+            "profiles", upstreams,
+            lambda: bench_profiles(project["id"], args.database_url),
+            args.trace_memory,
+        )
+    if "contention" in args.suites:
+        results["contention"] = await _measure(
+            "contention", upstreams, lambda: bench_contention(args.concurrency), args.trace_memory,
+        )
+    if "large_file" in args.suites:
+        results["large_file"] = await _measure(
+            "large_file", upstreams,
+            lambda: bench_large_file(project["id"], args.large_file_mb, upstreams),
+            args.trace_memory,
+        )
+    if "providers" in args.suites:
+        results["providers"] = await _measure(
+            "providers", upstreams, lambda: bench_providers(args.local_model, docs), args.trace_memory,
+        )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="benchmarks.run", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=os.path.join(_BACKEND_DIR, "benchmarks", "results", "latest.json"))
+    parser.add_argument("--database-url", default=os.environ.get("BENCH_DATABASE_URL", DEFAULT_DATABASE_URL))
+    parser.add_argument("--postgrest-url", default=os.environ.get("BENCH_POSTGREST_URL", DEFAULT_POSTGREST_URL))
+    parser.add_argument("--embed-latency-ms", type=float, default=30.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=12)
+    parser.add_argument("--query-repeats", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--suites", nargs="+", default=["ingest", "learning", "query", "profiles", "contention"],
+                        choices=["ingest", "learning", "query", "profiles", "contention", "large_file", "providers"])
+    parser.add_argument("--large-file-mb", type=int, default=200,
+                        help="Size of the generated file for the large_file suite")
+    parser.add_argument("--local-model", default="sentence-transformers/all-MiniLM-L6-v2",
+                        help="sentence-transformers model for the providers suite")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Record Python heap peaks with tracemalloc (slows every suite)")
+    args = parser.parse_args()
+
+    upstreams = FakeUpstreams(
+        embed_latency_ms=args.embed_latency_ms,
+        llm_latency_ms=args.llm_latency_ms,
+        postgrest_url=args.postgrest_url,
+    ).start()
+    os.environ.update({
+        "SUPABASE_URL": upstreams.url,
+        "SUPABASE_SERVICE_KEY": "bench-service-key",
+        "OPENAI_API_KEY": "bench-openai-key",
+        "OPENAI_BASE_URL": f"{upstreams.url}/v1",
+        "TOGETHER_API_KEY": "bench-together-key",
+        "TOGETHER_BASE_URL": f"{upstreams.url}/v1",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+
+    try:
+        applied = asyncio.run(reset_database(args.database_url))
+        print(f"Applied migrations: {', '.join(applied)}", file=sys.stderr)
+        time.sleep(0.5)  # let PostgREST pick up the schema reload
+        results = asyncio.run(_run_suites(args, upstreams))
+    finally:
+        upstreams.stop()
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "params": {
+            "embed_latency_ms": args.embed_latency_ms,
+            "llm_latency_ms": args.llm_latency_ms,
+            "documents": args.documents,
+            "paragraphs": args.paragraphs,
+            "query_repeats": args.query_repeats,
+            "concurrency": args.concurrency,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
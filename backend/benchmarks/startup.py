@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""CLI startup benchmark: import cost and cold/warm cf.py latency.
+
+    python -m benchmarks.startup --out benchmarks/results/startup-$(git rev-parse --short HEAD).json
+    python -m benchmarks.compare <old>.json <new>.json
+
+No Postgres needed: cf runs on the local storage backend (a fresh SQLite
+file) with OpenAI replaced by benchmarks.fakes at zero latency, so the
+numbers are process start, imports and client setup rather than network.
+
+- imports: ``python -X importtime`` for ``import cf`` (what every cf
+  invocation pays) and for the in-process query path, with the slowest
+  modules those import directly.
+- cold: ``cf.py QUERY --no-daemon``, a fresh interpreter each run.
+- warm: ``cf.py QUERY`` against a running ``cf.py daemon``.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _BACKEND_DIR)
+
+import cf_daemon
+from benchmarks.fakes import FakeUpstreams
+
+QUERY = "how should I rotate refresh tokens?"
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, float, int]]:
+    """(module, cumulative ms, nesting depth) per `-X importtime` line."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        rows.append((name.strip(), int(cumulative) / 1000, depth))
+    return rows
+
+
+def import_profile(statement: str, env: dict[str, str], top: int = 10) -> dict[str, Any]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=_BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    rows = parse_importtime(proc.stderr)
+    # A top-level import's cumulative time already includes its children
+    total = sum(ms for _, ms, depth in rows if depth == 0)
+    direct = sorted((r for r in rows if r[2] == 1), key=lambda r: r[1], reverse=True)[:top]
+    return {
+        "total_ms": round(total, 1),
+        "modules": len(rows),
+        "slowest": {name: round(ms, 1) for name, ms, _ in direct},
+    }
+
+
+def _stats(samples_ms: list[float]) -> dict[str, float]:
+    ordered = sorted(samples_ms)
+    return {
+        "p50_ms": round(ordered[len(ordered) // 2], 1),
+        "min_ms": round(ordered[0], 1),
+        "max_ms": round(ordered[-1], 1),
+    }
+
+
+def time_cli(args: list[str], env: dict[str, str], runs: int) -> dict[str, float]:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, os.path.join(_BACKEND_DIR, "cf.py"), *args],
+            cwd=_BACKEND_DIR, env=env, capture_output=True, check=True,
+        )
+        samples.append((time.perf_counter() - started) * 1000)
+    return _stats(samples)
+
+
+def run(runs: int) -> dict[str, Any]:
+    upstreams = FakeUpstreams(embed_latency_ms=0, llm_latency_ms=0).start()
+    workdir = tempfile.mkdtemp(prefix="cf-startup-")
+    socket = os.path.join(workdir, "cf.sock")
+    env = {
+        **os.environ,
+        "STORAGE_BACKEND": "local",
+        "LOCAL_STORE_PATH": os.path.join(workdir, "cf.db"),
+        "OPENAI_API_KEY": "bench-openai-key",
+        "OPENAI_BASE_URL": f"{upstreams.url}/v1",
+        "CONTEXTFLOW_SOCKET": socket,
+        "LOG_LEVEL": "WARNING",
+    }
+    daemon = None
+    try:
+        results: dict[str, Any] = {
+            "imports": {
+                "cf": import_profile("import cf", env),
+                "query_path": import_profile("import cf, orchestrator.orchestrator", env),
+            },
+        }
+        # Creates the store file, so neither timed run pays for that
+        subprocess.run([sys.executable, "cf.py", "--list-projects", "--no-daemon"],
+                       cwd=_BACKEND_DIR, env=env, capture_output=True, check=True)
+        results["cold"] = time_cli([QUERY, "--no-daemon"], env, runs)
+
+        started = time.perf_counter()
+        daemon = subprocess.Popen([sys.executable, "cf.py", "daemon"], cwd=_BACKEND_DIR, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        while not cf_daemon.is_running(socket):
+            if daemon.poll() is not None or time.perf_counter() - started > 60:
+                raise RuntimeError("cf daemon did not start")
+            time.sleep(0.05)
+        results["daemon_ready_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        results["warm"] = time_cli([QUERY], env, runs)
+        results["warm_speedup"] = round(results["cold"]["p50_ms"] / max(results["warm"]["p50_ms"], 0.1), 1)
+    finally:
+        if daemon is not None:
+            subprocess.run([sys.executable, "cf.py", "daemon", "--stop"], cwd=_BACKEND_DIR, env=env,
+                           capture_output=True)
+            daemon.wait(timeout=10)
+        upstreams.stop()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="benchmarks.startup", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=os.path.join(_BACKEND_DIR, "benchmarks", "results", "startup-latest.json"))
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {"startup": run(args.runs)}
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=_BACKEND_DIR, text=True).strip()
+    except Exception:
+        commit = "unknown"
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "params": {"runs": args.runs},
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
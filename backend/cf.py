@@ -2,7 +2,6 @@
 from __future__ import annotations
 
 import argparse
-import asyncio
 import json
 import os
 import sys
@@ -11,7 +10,13 @@ import sys
 _BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, _BACKEND_DIR)
 
+# Standard library only: the backend is imported when a command runs
+# in-process, never just to talk to the daemon
+import cf_daemon
+
 _PROJECTS_FILE = os.path.join(_BACKEND_DIR, "projects.json")
+# Cleared by --no-daemon, or after the daemon is found not to be running
+_use_daemon = True
 
 # ── Colour helpers ────────────────────────────────────────────────────────────
 try:
@@ -49,15 +54,41 @@ def _load_projects_json() -> dict[str, str]:
         return json.load(f)
 
 
+def _daemon_events(op: dict):
+    """Events for `op` from the daemon, or None to run in-process instead."""
+    global _use_daemon
+    if not _use_daemon:
+        return None
+    events = cf_daemon.request(op)
+    try:
+        first = next(events, None)
+    except cf_daemon.DaemonUnavailable:
+        _use_daemon = False
+        return None
+
+    def replay():
+        if first is not None:
+            yield first
+        for event in events:
+            yield event
+
+    return replay()
+
+
 def _supabase_search(name: str) -> list[dict]:
-    from utils.supabase_client import get_client
-    client = get_client()
-    response = client.table("projects").select("id, name, description, project_type").execute()
     needle = name.lower().strip()
-    return [p for p in (response.data or []) if needle in p.get("name", "").lower()]
+    return [p for p in _supabase_list_all() if needle in p.get("name", "").lower()]
 
 
 def _supabase_list_all() -> list[dict]:
+    events = _daemon_events({"op": "projects"})
+    if events is not None:
+        projects: list[dict] = []
+        for event in events:
+            if event["event"] == "error":
+                raise RuntimeError(event["payload"]["error"])
+            projects = event["payload"]
+        return projects
     from utils.supabase_client import get_client
     client = get_client()
     response = client.table("projects").select("id, name, description, project_type, status").order("name").execute()
@@ -89,12 +120,7 @@ def _pct(similarity: float) -> str:
     return f"{round(similarity * 100)}%"
 
 
-def _print_results(query: str, project_name: str | None, data: dict) -> None:
-    project_context = data.get("project_context") or []
-    principles = data.get("principles") or []
-    related = data.get("related_context") or {}
-    meta = data.get("meta") or {}
-
+def _print_header(query: str, project_name: str | None) -> None:
     print()
     print(_divider())
     label = f"ContextFlow  |  Query: \"{query}\""
@@ -103,7 +129,8 @@ def _print_results(query: str, project_name: str | None, data: dict) -> None:
         print(f"Project: {_c(Fore.YELLOW, project_name.title())}")
     print(_divider())
 
-    # ── Doc chunks ──
+
+def _print_doc_chunks(project_context: list[dict]) -> None:
     print()
     print(_bold(_c(Fore.GREEN, "📄 FROM YOUR DOCS")))
     if project_context:
@@ -120,7 +147,8 @@ def _print_results(query: str, project_name: str | None, data: dict) -> None:
     else:
         print(f"  {_c(Fore.WHITE, 'No matching document chunks found.')}")
 
-    # ── Principles ──
+
+def _print_principles(principles: list[dict]) -> None:
     print()
     print(_bold(_c(Fore.MAGENTA, "💡 PRINCIPLES")))
     if principles:
@@ -139,7 +167,8 @@ def _print_results(query: str, project_name: str | None, data: dict) -> None:
     else:
         print(f"  {_c(Fore.WHITE, 'No principles found for this query.')}")
 
-    # ── Related context ──
+
+def _print_related(related: dict) -> None:
     related_items: list[tuple[str, str]] = []
     for category, items in related.items():
         if isinstance(items, list):
@@ -153,7 +182,13 @@ def _print_results(query: str, project_name: str | None, data: dict) -> None:
         for category, content in related_items:
             print(f"  • {content} {_c(Fore.CYAN, f'({category})')}")
 
-    # ── Footer ──
+
+def _print_footer(data: dict) -> None:
+    project_context = data.get("project_context") or []
+    principles = data.get("principles") or []
+    related = data.get("related_context") or {}
+    meta = data.get("meta") or {}
+
     doc_count = meta.get("storage1_count", len(project_context))
     prin_count = meta.get("storage2_count", len(principles))
     rel_count = sum(len(v) for v in related.values() if isinstance(v, list))
@@ -166,6 +201,14 @@ def _print_results(query: str, project_name: str | None, data: dict) -> None:
     print()
 
 
+def _print_results(query: str, project_name: str | None, data: dict) -> None:
+    _print_header(query, project_name)
+    _print_doc_chunks(data.get("project_context") or [])
+    _print_principles(data.get("principles") or [])
+    _print_related(data.get("related_context") or {})
+    _print_footer(data)
+
+
 def _print_projects() -> None:
     print()
     print(_divider())
@@ -197,6 +240,53 @@ def _print_projects() -> None:
 
 
 # ── Main ──────────────────────────────────────────────────────────────────────
+class _StreamPrinter:
+    """Prints each stream_query stage as it arrives."""
+
+    def __init__(self, query: str, project_name: str | None):
+        self.query = query
+        self.project_name = project_name
+        self.header_printed = False
+
+    def __call__(self, stage: str, payload: dict) -> None:
+        if stage == "error":
+            print(_c(Fore.RED, f"\n✗ Error: {payload['error']}\n"))
+            sys.exit(1)
+        if not self.header_printed:
+            _print_header(self.query, self.project_name)
+            self.header_printed = True
+        if stage == "project_context":
+            _print_doc_chunks(payload["project_context"])
+        elif stage == "principles":
+            _print_principles(payload["principles"])
+            _print_related(payload["related_context"])
+        elif stage == "result":
+            _print_footer(payload)
+
+
+def _print_result(query: str, project_name: str | None, result: dict) -> None:
+    if result.get("error"):
+        print(_c(Fore.RED, f"\n✗ Error: {result['error']}\n"))
+        sys.exit(1)
+    _print_results(query, project_name, result)
+
+
+def _run_daemon(query: str, project_id: str | None, project_name: str | None, limit: int, stream: bool) -> bool:
+    """Answer through the daemon; False if none is running."""
+    events = _daemon_events({
+        "op": "query", "query": query, "project_id": project_id, "limit": limit, "stream": stream,
+    })
+    if events is None:
+        return False
+    printer = _StreamPrinter(query, project_name)
+    for event in events:
+        if stream or event["event"] == "error":
+            printer(event["event"], event["payload"])
+        else:
+            _print_result(query, project_name, event["payload"])
+    return True
+
+
 async def _run(query: str, project_id: str | None, project_name: str | None, limit: int) -> None:
     from orchestrator.orchestrator import orchestrate_query
 
@@ -206,15 +296,98 @@ async def _run(query: str, project_id: str | None, project_name: str | None, lim
         category_hint=None,
         limit=limit,
     )
+    _print_result(query, project_name, result)
 
-    if result.get("error"):
-        print(_c(Fore.RED, f"\n✗ Error: {result['error']}\n"))
+
+async def _run_streaming(query: str, project_id: str | None, project_name: str | None, limit: int) -> None:
+    """Print each section as soon as its source answers instead of waiting
+    for the slowest one."""
+    from orchestrator.orchestrator import stream_query
+
+    printer = _StreamPrinter(query, project_name)
+    async for stage, payload in stream_query(
+        query=query,
+        project_id=project_id,
+        category_hint=None,
+        limit=limit,
+    ):
+        printer(stage, payload)
+
+
+# ── Ingest ────────────────────────────────────────────────────────────────────
+def _print_ingest(result: dict) -> None:
+    print()
+    print(_divider())
+    print(_bold("ContextFlow  |  Ingest"))
+    print(_divider())
+    for doc in result["documents"]:
+        if doc["success"]:
+            chunks = f"{doc.get('chunk_count', 0)} chunks"
+            print(f"  {_c(Fore.GREEN, '✓')} {doc['filename']}  {_c(Fore.WHITE, chunks)}")
+        else:
+            print(f"  {_c(Fore.RED, '✗')} {doc['filename']}  {_c(Fore.RED, doc.get('error', ''))}")
+    summary = result["summary"]
+    print(_divider())
+    print(
+        f"  {summary['succeeded']}/{summary['files']} files, {summary['chunks']} chunks in {summary['elapsed_s']}s  "
+        f"({summary['files_per_s']} files/s, {summary['chunks_per_s']} chunks/s, {summary['mb_per_s']} MB/s)"
+    )
+    print()
+
+
+def _ingest_main(argv: list[str]) -> None:
+    parser = argparse.ArgumentParser(
+        prog="cf ingest",
+        description="Upload every .md, .txt and .pdf file under the given paths to a project",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""Examples:
+  python cf.py ingest docs/ --project worcoor
+  python cf.py ingest "specs/**/*.md" notes.txt --project-id <uuid> --category prd
+""",
+    )
+    parser.add_argument("paths", nargs="+", help="Files, directories or glob patterns")
+    parser.add_argument("--project", "-p", metavar="NAME", help="Project name (from projects.json)")
+    parser.add_argument("--project-id", metavar="UUID", help="Project UUID directly")
+    parser.add_argument("--category", default="other", choices=["prd", "brd", "architecture", "chat", "other"],
+                        help="Document category (default: other)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Files processed at once (default: 8)")
+    args = parser.parse_args(argv)
+
+    project_id: str | None = args.project_id
+    if args.project and not project_id:
+        project_id, _ = _resolve_project(args.project)
+    if not project_id:
+        print(_c(Fore.RED, "\n✗ Pass --project NAME or --project-id UUID.\n"))
         sys.exit(1)
 
-    _print_results(query, project_name, result)
+    from file_processing.batch_ingest import expand_paths, ingest_documents
+
+    files = expand_paths(args.paths, args.category)
+    if not files:
+        print(_c(Fore.YELLOW, "\n⚠ No .md, .txt or .pdf files matched.\n"))
+        sys.exit(1)
+
+    import asyncio
+
+    try:
+        result = asyncio.run(ingest_documents(project_id, files, concurrency=args.concurrency))
+    except KeyboardInterrupt:
+        print("\nCancelled.")
+        sys.exit(1)
+    _print_ingest(result)
+    if result["summary"]["failed"]:
+        sys.exit(1)
 
 
 def main() -> None:
+    global _use_daemon
+    if sys.argv[1:2] == ["ingest"]:
+        _ingest_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["daemon"]:
+        cf_daemon.main(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(
         prog="cf",
         description="ContextFlow CLI — query your project knowledge base",
@@ -223,6 +396,10 @@ def main() -> None:
   python cf.py "how should I handle auth?"
   python cf.py "what database patterns should I use?" --project worcoor
   python cf.py --list-projects
+  python cf.py ingest docs/ --project worcoor
+  python cf.py daemon          # keep ContextFlow warm; later queries use it
+
+Queries go through a running daemon when there is one, else run in-process.
 """,
     )
     parser.add_argument("query", nargs="?", help="Your question")
@@ -230,8 +407,12 @@ def main() -> None:
     parser.add_argument("--project-id", metavar="UUID", help="Project UUID directly")
     parser.add_argument("--limit", "-n", type=int, default=10, help="Max results (default: 10)")
     parser.add_argument("--list-projects", "-l", action="store_true", help="List configured projects")
+    parser.add_argument("--no-stream", action="store_true", help="Wait for all sources before printing")
+    parser.add_argument("--no-daemon", action="store_true", help="Run in-process even if a daemon is running")
 
     args = parser.parse_args()
+    if args.no_daemon:
+        _use_daemon = False
 
     if args.list_projects:
         _print_projects()
@@ -252,7 +433,12 @@ def main() -> None:
             sys.exit(1)
 
     try:
-        asyncio.run(_run(args.query, project_id, project_name, args.limit))
+        if _run_daemon(args.query, project_id, project_name, args.limit, stream=not args.no_stream):
+            return
+        import asyncio
+
+        run = _run if args.no_stream else _run_streaming
+        asyncio.run(run(args.query, project_id, project_name, args.limit))
     except KeyboardInterrupt:
         print("\nCancelled.")
     except Exception as exc:
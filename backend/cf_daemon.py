@@ -0,0 +1,185 @@
+"""Warm ContextFlow daemon for cf.py.
+
+    python cf.py daemon            # serve until Ctrl-C
+    python cf.py daemon --stop     # ask a running daemon to exit
+
+A one-off ``cf`` query otherwise spends most of its time importing openai,
+supabase and pydantic and building clients. The daemon pays for that once
+and answers cf over a Unix socket (CONTEXTFLOW_SOCKET, default
+~/.contextflow/cf.sock); cf uses it whenever it is listening and runs
+in-process otherwise. It serves with the configuration it was started with.
+
+Protocol: one JSON request line per connection, answered by JSON event
+lines, the last of which is ``{"event": "done"}``.
+
+    {"op": "ping"}                                   -> {"event": "pong", "pid": ...}
+    {"op": "projects"}                               -> {"event": "projects", "payload": [...]}
+    {"op": "query", "query": ..., "project_id": ...,
+     "limit": ..., "stream": true}                   -> {"event": <stage>, "payload": {...}} ...
+    {"op": "shutdown"}
+
+Failures arrive as ``{"event": "error", "payload": {"error": ...}}``, the
+same shape as stream_query's own error stage. This module imports only the
+standard library until serve() runs, so cf can use the client side without
+paying for the backend.
+"""
+from __future__ import annotations
+
+import json
+import os
+import socket
+import sys
+from typing import Any, Iterator, Optional
+
+CONNECT_TIMEOUT_S = 0.2
+_DEFAULT_SOCKET = os.path.join("~", ".contextflow", "cf.sock")
+
+
+class DaemonUnavailable(Exception):
+    """No daemon is listening on the socket."""
+
+
+def socket_path(path: Optional[str] = None) -> str:
+    return os.path.expanduser(path or os.environ.get("CONTEXTFLOW_SOCKET") or _DEFAULT_SOCKET)
+
+
+# ── Client ────────────────────────────────────────────────────────────────────
+def request(op: dict[str, Any], path: Optional[str] = None) -> Iterator[dict[str, Any]]:
+    """Send one request and yield its events until "done".
+
+    Raises DaemonUnavailable before anything is yielded if no daemon
+    answers, so callers can fall back to running in-process.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        raise DaemonUnavailable("Unix sockets are not supported on this platform")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT_S)
+    try:
+        sock.connect(socket_path(path))
+    except OSError as exc:
+        sock.close()
+        raise DaemonUnavailable(str(exc)) from exc
+    sock.settimeout(None)
+    with sock, sock.makefile("rwb") as stream:
+        stream.write(json.dumps(op).encode() + b"\n")
+        stream.flush()
+        for line in stream:
+            event = json.loads(line)
+            if event.get("event") == "done":
+                return
+            yield event
+    raise ConnectionError("daemon closed the connection mid-response")
+
+
+def is_running(path: Optional[str] = None) -> bool:
+    try:
+        return any(e.get("event") == "pong" for e in request({"op": "ping"}, path))
+    except (DaemonUnavailable, ConnectionError):
+        return False
+
+
+# ── Server ────────────────────────────────────────────────────────────────────
+async def _handle(op: dict[str, Any], send) -> None:
+    name = op.get("op")
+    if name == "ping":
+        await send({"event": "pong", "pid": os.getpid()})
+    elif name == "projects":
+        from utils.supabase_client import _run, get_client
+
+        client = get_client()
+        response = await _run(
+            client.table("projects").select("id, name, description, project_type, status").order("name").execute
+        )
+        await send({"event": "projects", "payload": response.data or []})
+    elif name == "query":
+        from orchestrator.orchestrator import orchestrate_query, stream_query
+
+        kwargs = {
+            "query": op["query"],
+            "project_id": op.get("project_id"),
+            "category_hint": op.get("category"),
+            "limit": int(op.get("limit") or 10),
+        }
+        if op.get("stream", True):
+            async for stage, payload in stream_query(**kwargs):
+                await send({"event": stage, "payload": payload})
+        else:
+            await send({"event": "result", "payload": await orchestrate_query(**kwargs)})
+    else:
+        await send({"event": "error", "payload": {"error": f"unknown op {name!r}"}})
+
+
+async def serve(path: Optional[str] = None) -> None:
+    import asyncio
+    import logging
+
+    logger = logging.getLogger("contextflow")
+    path = socket_path(path)
+    if is_running(path):
+        raise SystemExit(f"A ContextFlow daemon is already listening on {path}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        os.unlink(path)  # stale socket from a daemon that did not exit cleanly
+
+    # Pay for the backend once, before the first request
+    import orchestrator.orchestrator  # noqa: F401
+    from utils.supabase_client import get_client
+
+    get_client()
+    stop = asyncio.Event()
+
+    async def on_connect(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        async def send(event: dict[str, Any]) -> None:
+            writer.write(json.dumps(event, default=str).encode() + b"\n")
+            await writer.drain()
+
+        try:
+            op = json.loads(await reader.readline() or b"{}")
+            if op.get("op") == "shutdown":
+                stop.set()
+            else:
+                await _handle(op, send)
+            await send({"event": "done"})
+        except ConnectionError:
+            pass  # the client went away
+        except Exception as exc:
+            logger.error("cf daemon request failed: %s", exc)
+            try:
+                await send({"event": "error", "payload": {"error": str(exc)}})
+                await send({"event": "done"})
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_unix_server(on_connect, path=path)
+    os.chmod(path, 0o600)
+    print(f"ContextFlow daemon listening on {path} (pid {os.getpid()})", file=sys.stderr)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def main(argv: list[str]) -> None:
+    import argparse
+    import asyncio
+
+    parser = argparse.ArgumentParser(prog="cf daemon", description="Keep ContextFlow warm for cf queries")
+    parser.add_argument("--socket", metavar="PATH", help="Socket path (default: $CONTEXTFLOW_SOCKET or ~/.contextflow/cf.sock)")
+    parser.add_argument("--stop", action="store_true", help="Stop the running daemon")
+    args = parser.parse_args(argv)
+
+    if args.stop:
+        try:
+            list(request({"op": "shutdown"}, args.socket))
+        except DaemonUnavailable:
+            print("No ContextFlow daemon is running.", file=sys.stderr)
+            sys.exit(1)
+        return
+    try:
+        asyncio.run(serve(args.socket))
+    except KeyboardInterrupt:
+        pass
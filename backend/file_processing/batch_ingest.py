@@ -0,0 +1,256 @@
+"""Multi-document ingestion (contextflow_upload_documents, cf.py ingest).
+
+One call instead of one upload per file:
+
+1. files are read and uploaded to storage in parallel, at most
+   ``concurrency`` at a time;
+2. text is extracted and chunked in worker threads;
+3. the ``documents`` rows of files with text are inserted with a single
+   bulk insert; a file already uploaded to the project under the same name
+   keeps its document, and its analysis too when its bytes are unchanged;
+4. every chunk of every file goes through one generate_embeddings_batch
+   call, so the provider sees full batches instead of one request per chunk;
+   chunks a kept document already has with the same content are skipped,
+   so a retried ingest embeds only what the failed attempt did not store;
+5. chunk rows are bulk-inserted per document.
+
+A failure is recorded against the file it belongs to; the other files carry
+on. The result lists per-file status plus aggregate throughput.
+"""
+from __future__ import annotations
+
+import asyncio
+import glob
+import hashlib
+import logging
+import os
+import re
+import time
+
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from file_processing.chunker import CHUNK_CONFLICT, chunk_row, chunk_text, stored_chunks, trim_chunks, unstored
+from file_processing.extractor import CONTENT_TYPES, FILE_TYPES, extract_text, infer_file_type
+from utils.embeddings import embedding_columns, generate_embeddings_batch
+from utils.supabase_client import _run, get_client, register_documents
+
+logger = logging.getLogger("contextflow")
+
+CHUNK_INSERT_BATCH = 100
+DEFAULT_CONCURRENCY = 8
+
+
+@dataclass
+class IngestFile:
+    filename: str
+    path: Optional[str] = None
+    content: Optional[str] = None
+    file_type: Optional[str] = None
+    doc_category: str = "other"
+
+
+def expand_paths(patterns: list[str], doc_category: str = "other") -> list[IngestFile]:
+    """Files, directories (searched recursively) and globs -> IngestFiles.
+
+    Files found under a directory are named by their path relative to it,
+    so same-named files in different folders stay distinct.
+    """
+    found: dict[str, IngestFile] = {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            root = os.path.abspath(pattern)
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+                for name in sorted(filenames):
+                    ext = name.rsplit(".", 1)[-1].lower() if "." in name else ""
+                    if ext in FILE_TYPES:
+                        path = os.path.join(dirpath, name)
+                        found.setdefault(path, IngestFile(
+                            filename=os.path.relpath(path, root), path=path, doc_category=doc_category,
+                        ))
+            continue
+        matches = sorted(glob.glob(pattern, recursive=True)) or ([pattern] if os.path.isfile(pattern) else [])
+        for path in matches:
+            if os.path.isfile(path):
+                path = os.path.abspath(path)
+                found.setdefault(path, IngestFile(
+                    filename=os.path.basename(path), path=path, doc_category=doc_category,
+                ))
+    return list(found.values())
+
+
+def _storage_path(project_id: str, filename: str) -> str:
+    return f"{project_id}/{re.sub(r'[^a-zA-Z0-9._-]', '_', filename)}"
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _prepare(data: bytes, filename: str, file_type: str) -> tuple[int, list[dict]]:
+    text = extract_text(data, filename, file_type) or ""
+    return len(text), chunk_text(text) if text else []
+
+
+async def ingest_documents(
+    project_id: str,
+    files: list[IngestFile],
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> dict[str, Any]:
+    started = time.perf_counter()
+    client = get_client()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    statuses: list[dict[str, Any]] = [{"filename": f.filename, "success": False} for f in files]
+    payloads: list[Optional[bytes]] = [None] * len(files)
+    hashes: list[Optional[str]] = [None] * len(files)
+
+    seen: set[str] = set()
+    for status, f in zip(statuses, files):
+        status["file_type"] = (f.file_type or infer_file_type(f.filename)).lstrip(".").lower()
+        status["storage_path"] = _storage_path(project_id, f.filename)
+        if status["storage_path"] in seen:
+            status["error"] = "duplicate filename in batch"
+        seen.add(status["storage_path"])
+
+    # 1. Read + upload, bounded
+    async def upload(i: int) -> None:
+        f, status = files[i], statuses[i]
+        async with semaphore:
+            try:
+                if f.path is not None:
+                    data = await asyncio.to_thread(_read, f.path)
+                else:
+                    data = (f.content or "").encode("utf-8")
+                if not data:
+                    raise ValueError("file is empty")
+                await _run(
+                    client.storage.from_("documents").upload,
+                    path=status["storage_path"],
+                    file=data,
+                    file_options={
+                        "content-type": CONTENT_TYPES.get(status["file_type"], "text/plain"),
+                        "upsert": "true",
+                    },
+                )
+                payloads[i] = data
+                hashes[i] = hashlib.sha256(data).hexdigest()
+                status["bytes"] = len(data)
+            except Exception as exc:
+                status["error"] = f"upload failed: {exc}"
+
+    await asyncio.gather(*[upload(i) for i, s in enumerate(statuses) if "error" not in s])
+    uploaded = [i for i, s in enumerate(statuses) if "error" not in s]
+
+    # 2. Extract + chunk off the event loop
+    async def prepare(i: int) -> list[dict]:
+        async with semaphore:
+            char_count, chunks = await asyncio.to_thread(
+                _prepare, payloads[i], files[i].filename, statuses[i]["file_type"],
+            )
+        payloads[i] = None
+        statuses[i]["char_count"] = char_count
+        if not chunks:
+            statuses[i]["error"] = "no text extracted"
+        return chunks
+
+    chunk_lists = await asyncio.gather(*[prepare(i) for i in uploaded])
+    work = [(i, chunks) for i, chunks in zip(uploaded, chunk_lists) if chunks]
+
+    # 3. One insert for every new documents row, only for files with text
+    if work:
+        try:
+            documents = await register_documents([
+                {
+                    "project_id": project_id,
+                    "filename": files[i].filename,
+                    "file_type": statuses[i]["file_type"],
+                    "doc_category": files[i].doc_category,
+                    "storage_path": statuses[i]["storage_path"],
+                    "file_size": statuses[i]["bytes"],
+                    "content_hash": hashes[i],
+                    "analyzed": False,
+                }
+                for i, _ in work
+            ])
+            for (i, _), row in zip(work, documents):
+                statuses[i]["document_id"] = row["id"]
+        except Exception as exc:
+            for i, _ in work:
+                statuses[i]["error"] = f"document insert failed: {exc}"
+            work = []
+
+    existing: dict[str, dict[int, str]] = {}
+    if work:
+        try:
+            existing = await stored_chunks([statuses[i]["document_id"] for i, _ in work])
+        except Exception as exc:
+            logger.warning("ingest_documents: could not read stored chunks, embedding all: %s", exc)
+    totals = {i: len(chunks) for i, chunks in work}
+    work = [(i, unstored(chunks, existing.get(statuses[i]["document_id"], {}))) for i, chunks in work]
+    for i, chunks in work:
+        statuses[i]["chunk_count"] = totals[i] - len(chunks)
+
+    # 4. One shared embedding pass over every chunk
+    texts = [c["content"] for _, chunks in work for c in chunks]
+    columns: list[dict] = []
+    if texts:
+        try:
+            columns = await embedding_columns(texts, await generate_embeddings_batch(texts))
+        except Exception as exc:
+            for i, _ in work:
+                statuses[i]["error"] = f"embedding failed: {exc}"
+            work = []
+
+    # 5. Bulk-insert chunk rows per document
+    async def store(i: int, chunks: list[dict], cols: list[dict]) -> None:
+        document_id = statuses[i]["document_id"]
+        rows = [chunk_row(document_id, c, col) for c, col in zip(chunks, cols)]
+        stored = 0
+        try:
+            for start in range(0, len(rows), CHUNK_INSERT_BATCH):
+                async with semaphore:
+                    await _run(client.table("document_chunks").upsert(
+                        rows[start:start + CHUNK_INSERT_BATCH], on_conflict=CHUNK_CONFLICT,
+                    ).execute)
+                stored += len(rows[start:start + CHUNK_INSERT_BATCH])
+            if any(index >= totals[i] for index in existing.get(document_id, {})):
+                await trim_chunks(document_id, totals[i])
+        except Exception as exc:
+            statuses[i]["error"] = f"chunk insert failed after {stored} chunks: {exc}"
+        statuses[i]["chunk_count"] += stored
+        statuses[i]["embedded_chunks"] = stored
+
+    offset = 0
+    tasks = []
+    for i, chunks in work:
+        tasks.append(store(i, chunks, columns[offset:offset + len(chunks)]))
+        offset += len(chunks)
+    await asyncio.gather(*tasks)
+
+    for status in statuses:
+        status["success"] = "error" not in status
+
+    elapsed = time.perf_counter() - started
+    succeeded = [s for s in statuses if s["success"]]
+    total_bytes = sum(s.get("bytes", 0) for s in succeeded)
+    total_chunks = sum(s.get("chunk_count", 0) for s in statuses)
+    logger.info(
+        "ingest_documents: %d/%d files, %d chunks in %.2fs",
+        len(succeeded), len(statuses), total_chunks, elapsed,
+    )
+    return {
+        "documents": statuses,
+        "summary": {
+            "files": len(statuses),
+            "succeeded": len(succeeded),
+            "failed": len(statuses) - len(succeeded),
+            "bytes": total_bytes,
+            "chunks": total_chunks,
+            "elapsed_s": round(elapsed, 3),
+            "files_per_s": round(len(succeeded) / elapsed, 2) if elapsed else 0.0,
+            "chunks_per_s": round(total_chunks / elapsed, 2) if elapsed else 0.0,
+            "mb_per_s": round(total_bytes / elapsed / (1024 * 1024), 3) if elapsed else 0.0,
+        },
+    }
@@ -2,19 +2,19 @@ from __future__ import annotations
 
 import asyncio
 import logging
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import re
 
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 
-from utils.embeddings import generate_embedding
-from utils.supabase_client import get_client
+from utils.embeddings import embedding_columns, generate_embedding
+from utils.supabase_client import _run, get_client
 from utils.config import MVP_USER_ID
 from file_processing.extractor import extract_text_from_storage, clean_extracted_text
 
 logger = logging.getLogger("contextflow")
 
+_NON_SPACE_RE = re.compile(r"\S")
+
 
 def chunk_text(
     text: str,
@@ -117,56 +117,288 @@ def chunk_text(
         return []
 
 
+def _section_chunk(content: str, chunk_index: int) -> dict:
+    section_title: Optional[str] = None
+    first_line = content.lstrip().split("\n")[0]
+    if first_line.startswith("#"):
+        section_title = first_line.lstrip("#").strip()
+    return {
+        "content": content,
+        "chunk_index": chunk_index,
+        "chunk_type": "header" if section_title else "paragraph",
+        "section_title": section_title,
+    }
+
+
+class ChunkStream:
+    """chunk_text fed a piece of text at a time.
+
+    feed() returns the chunks completed so far and close() the rest; together
+    they match chunk_text on the joined text (content, chunk_index,
+    chunk_type, section_title). Only the current paragraph is held until it
+    is known to overflow, and an overflowing paragraph is split into
+    sentences as it arrives, so memory stays at a few chunks however large
+    the document. Character offsets are not tracked; they are not stored.
+    """
+
+    def __init__(self, chunk_size: int = 1000, overlap: int = 100):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self._index = 0
+        self._out: list[dict] = []
+        self._current = ""
+        self._tail = ""  # a trailing "\n" that may open a paragraph break
+        self._para = ""
+        # Set once the paragraph cannot join _current: what precedes it
+        self._prefix: Optional[str] = None
+        # Sentence mode: the sub-chunk being built and the text not yet split
+        self._sub: Optional[str] = None
+        self._pending = ""
+        self._scan = 0
+
+    def feed(self, text: str) -> list[dict]:
+        buf = self._tail + text
+        start = 0
+        while True:
+            end = buf.find("\n\n", start)
+            if end < 0:
+                break
+            self._feed_paragraph(buf[start:end])
+            self._end_paragraph()
+            start = end + 2
+        rest = buf[start:]
+        self._tail = "\n" if rest.endswith("\n") else ""
+        self._feed_paragraph(rest[:-1] if self._tail else rest)
+        return self._drain()
+
+    def close(self) -> list[dict]:
+        self._feed_paragraph(self._tail)
+        self._tail = ""
+        self._end_paragraph()
+        if self._current.strip():
+            self._emit(_section_chunk(self._current, self._index))
+        self._current = ""
+        return self._drain()
+
+    def _drain(self) -> list[dict]:
+        out, self._out = self._out, []
+        return out
+
+    def _emit(self, chunk: dict) -> None:
+        self._out.append(chunk)
+        self._index += 1
+
+    def _feed_paragraph(self, text: str) -> None:
+        if self._sub is not None:
+            self._pending += text
+            self._split_sentences(final=False)
+            return
+        if not self._para:
+            text = text.lstrip()
+            if not text:
+                return
+        self._para += text
+        # The paragraph is at least this long once stripped
+        known = len(self._para.rstrip())
+        if self._prefix is None and len(self._current) + known + 2 > self.chunk_size:
+            if self._current:
+                self._emit(_section_chunk(self._current, self._index))
+                overlap_text = self._current[-self.overlap:] if len(self._current) > self.overlap else self._current
+                self._prefix = overlap_text + "\n\n"
+            else:
+                self._prefix = ""
+            self._current = ""
+        if self._prefix is not None and len(self._prefix) + known > self.chunk_size:
+            self._sub = ""
+            self._pending = self._prefix + self._para
+            self._scan = 0
+            self._para = ""
+            self._split_sentences(final=False)
+
+    def _end_paragraph(self) -> None:
+        if self._sub is not None:
+            self._pending = self._pending.rstrip()
+            self._split_sentences(final=True)
+            if self._sub:
+                self._current = self._sub
+            self._sub = None
+            self._prefix = None
+            return
+        para = self._para.strip()
+        self._para = ""
+        prefix, self._prefix = self._prefix, None
+        if not para:
+            return
+        if prefix is not None:
+            self._current = prefix + para
+        elif self._current:
+            self._current += "\n\n" + para
+        else:
+            self._current = para
+
+    def _split_sentences(self, final: bool) -> None:
+        pending, start = self._pending, 0
+        while True:
+            i = pending.find(". ", max(start, self._scan))
+            # A break followed only by whitespace may yet be stripped away
+            if i < 0 or (not final and not _NON_SPACE_RE.search(pending, i + 2)):
+                self._scan = max(start, len(pending) - 1) if i < 0 else i
+                break
+            self._add_sentence(pending[start:i])
+            start = i + 2
+        self._pending = pending[start:]
+        self._scan -= start
+        if final:
+            self._add_sentence(self._pending)
+            self._pending = ""
+        if final or self._scan < 0:
+            self._scan = 0
+
+    def _add_sentence(self, sentence: str) -> None:
+        sub = self._sub
+        if len(sub) + len(sentence) + 2 <= self.chunk_size:
+            sub = sub + ". " + sentence if sub else sentence
+        elif sub:
+            self._emit({
+                "content": sub,
+                "chunk_index": self._index,
+                "chunk_type": "paragraph",
+                "section_title": None,
+            })
+            sub = sub[-self.overlap:] + ". " + sentence if len(sub) > self.overlap else sentence
+        else:
+            sub = sentence
+        self._sub = sub
+
+
+def iter_chunks(pieces: Iterable[str], chunk_size: int = 1000, overlap: int = 100) -> Iterator[dict]:
+    """Chunks of a stream of text pieces; see ChunkStream."""
+    stream = ChunkStream(chunk_size, overlap)
+    for piece in pieces:
+        yield from stream.feed(piece)
+    yield from stream.close()
+
+
+# Chunk rows are unique per document and index (migration 014); writers upsert
+# on them, so a retried batch replaces its rows rather than duplicating them
+CHUNK_CONFLICT = "document_id,chunk_index"
+
+
+def chunk_row(document_id: str, chunk: dict, embedding_cols: dict) -> dict:
+    return {
+        "document_id": document_id,
+        "content": chunk["content"],
+        "chunk_index": chunk["chunk_index"],
+        "chunk_type": chunk["chunk_type"],
+        "section_title": chunk.get("section_title"),
+        "token_count": len(chunk["content"]) // 4,
+        **embedding_cols,
+    }
+
+
+async def stored_chunks(document_ids: list[str]) -> dict[str, dict[int, str]]:
+    """The chunks each document already has, as chunk_index -> content."""
+    stored: dict[str, dict[int, str]] = {document_id: {} for document_id in document_ids}
+    if not document_ids:
+        return stored
+    client = get_client()
+    response = await _run(
+        client.table("document_chunks").select("document_id, chunk_index, content")
+        .in_("document_id", document_ids)
+        .execute
+    )
+    for row in response.data or []:
+        stored.setdefault(row["document_id"], {})[int(row["chunk_index"])] = row["content"]
+    return stored
+
+
+def unstored(chunks: list[dict], stored: dict[int, str]) -> list[dict]:
+    """The chunks not already stored with the same content.
+
+    Writers embed only these: a retried upload pays only for the chunks the
+    failed attempt never wrote, and a changed file for the chunks that changed.
+    """
+    return [c for c in chunks if stored.get(c["chunk_index"]) != c["content"]]
+
+
+async def trim_chunks(document_id: str, count: int) -> None:
+    """Delete a document's chunks from index `count` on, left over from a
+    longer earlier version of the file."""
+    client = get_client()
+    await _run(
+        client.table("document_chunks").delete()
+        .eq("document_id", document_id)
+        .gte("chunk_index", count)
+        .execute
+    )
+
+
 async def process_and_store_chunks(
     document_id: str,
     text: str,
     batch_size: int = 10,
 ) -> int:
-    try:
-        chunks = chunk_text(text)
-        if not chunks:
-            logger.warning("process_and_store_chunks: no chunks produced for document %s", document_id)
-            return 0
+    """Embed and store the chunks of `text`; returns how many the document has.
+
+    Chunks the document already has with the same content are not embedded
+    again and rows are upserted, so calling it again after a failure finishes
+    the document without duplicates. A failure is raised; what was stored stays.
+    """
+    chunks = chunk_text(text)
+    if not chunks:
+        logger.warning("process_and_store_chunks: no chunks produced for document %s", document_id)
+        return 0
 
-        client = get_client()
-        stored = 0
+    client = get_client()
+    existing = (await stored_chunks([document_id]))[document_id]
+    pending = unstored(chunks, existing)
+    if len(pending) < len(chunks):
+        logger.info(
+            "process_and_store_chunks: resuming %s, %d/%d chunks stored",
+            document_id, len(chunks) - len(pending), len(chunks),
+        )
+    stored = len(chunks) - len(pending)
 
-        for batch_start in range(0, len(chunks), batch_size):
-            batch = chunks[batch_start:batch_start + batch_size]
+    try:
+        for batch_start in range(0, len(pending), batch_size):
+            batch = pending[batch_start:batch_start + batch_size]
 
             embeddings = await asyncio.gather(
                 *[generate_embedding(c["content"]) for c in batch]
             )
 
-            rows = []
+            embedded = []
             for chunk, embedding in zip(batch, embeddings):
                 if embedding is None:
                     logger.warning("process_and_store_chunks: no embedding for chunk %d", chunk["chunk_index"])
                     continue
-                rows.append({
-                    "document_id": document_id,
-                    "content": chunk["content"],
-                    "chunk_index": chunk["chunk_index"],
-                    "chunk_type": chunk["chunk_type"],
-                    "section_title": chunk.get("section_title"),
-                    "token_count": len(chunk["content"]) // 4,
-                    "embedding": list(embedding),
-                })
+                embedded.append((chunk, embedding))
+            columns = await embedding_columns(
+                [c["content"] for c, _ in embedded], [e for _, e in embedded],
+            )
+
+            rows = [
+                chunk_row(document_id, chunk, embedding_cols)
+                for (chunk, _), embedding_cols in zip(embedded, columns)
+            ]
 
             if rows:
-                client.table("document_chunks").insert(rows).execute()
+                await _run(client.table("document_chunks").upsert(rows, on_conflict=CHUNK_CONFLICT).execute)
                 stored += len(rows)
 
-            if stored % 10 == 0 or batch_start + batch_size >= len(chunks):
+            if stored % 10 == 0 or batch_start + batch_size >= len(pending):
                 logger.info("process_and_store_chunks: stored %d/%d chunks", stored, len(chunks))
 
-            await asyncio.sleep(0.1)
-
+        if any(index >= len(chunks) for index in existing):
+            await trim_chunks(document_id, len(chunks))
         return stored
 
     except Exception as exc:
-        logger.error("process_and_store_chunks failed for document %s: %s", document_id, exc)
-        return 0
+        logger.error(
+            "process_and_store_chunks failed for document %s after %d/%d chunks: %s",
+            document_id, stored, len(chunks), exc,
+        )
+        raise
 
 
 async def process_document_file(
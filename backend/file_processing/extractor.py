@@ -1,13 +1,11 @@
 from __future__ import annotations
 
+import codecs
 import io
 import logging
 import re
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from typing import Optional
+from typing import BinaryIO, Iterable, Iterator, Optional
 
 import pypdf
 
@@ -27,11 +25,119 @@ def clean_extracted_text(text: str) -> str:
         return text
 
 
+FILE_TYPES = ("pdf", "md", "txt")
+CONTENT_TYPES: dict[str, str] = {
+    "pdf": "application/pdf",
+    "md": "text/markdown",
+    "txt": "text/plain",
+}
+
+
+# Bytes read per step by the streaming extractor
+READ_BLOCK = 1024 * 1024
+PAGE_BREAK = "\n\n---PAGE BREAK---\n\n"
+
+
+def infer_file_type(filename: str) -> str:
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    return ext if ext in FILE_TYPES else "txt"
+
+
+def sniff_file_type(head: bytes, filename: str = "") -> Optional[str]:
+    """File type from the first bytes of a file, or None if unsupported.
+
+    The extension only decides between md and txt; a PDF is recognized by
+    its signature whatever it is called, and other binary data is rejected.
+    """
+    if head.lstrip(b"\x00\t\n\r\f ").startswith(b"%PDF-"):
+        return "pdf"
+    if b"\x00" in head:
+        return None
+    try:
+        # A multi-byte character may be cut off at the end of the sample
+        codecs.getincrementaldecoder("utf-8")().decode(head)
+    except UnicodeDecodeError:
+        return None
+    return "md" if infer_file_type(filename) == "md" else "txt"
+
+
+def iter_extracted_text(stream: BinaryIO, file_type: str) -> Iterator[str]:
+    """Raw text of a file, a block or a page at a time.
+
+    Text files are decoded incrementally; PDFs are read page by page from
+    the (seekable) stream instead of from an in-memory copy.
+    """
+    normalized = file_type.lstrip(".").lower()
+    if normalized == "pdf":
+        reader = pypdf.PdfReader(stream)
+        for i, page in enumerate(reader.pages):
+            if i:
+                yield PAGE_BREAK
+            yield page.extract_text() or ""
+        return
+    if normalized not in ("md", "txt"):
+        raise ValueError(f"Unsupported file type: {file_type}")
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while True:
+        block = stream.read(READ_BLOCK)
+        if not block:
+            break
+        yield decoder.decode(block)
+    yield decoder.decode(b"", final=True)
+
+
+def iter_clean_text(pieces: Iterable[str]) -> Iterator[str]:
+    """clean_extracted_text over a stream of pieces.
+
+    Joining the output gives exactly clean_extracted_text of the joined
+    input, while only a partial line is held at any time.
+    """
+    partial = ""
+    held_cr = ""
+    last: Optional[str] = None
+    for piece in pieces:
+        text = held_cr + piece.replace("\x00", "")
+        held_cr = "\r" if text.endswith("\r") else ""
+        if held_cr:
+            text = text[:-1]
+        lines = (partial + text.replace("\r\n", "\n").replace("\r", "\n")).split("\n")
+        partial = lines.pop()
+        out: list[str] = []
+        for line in lines:
+            if not line.strip():
+                continue
+            if last is None:
+                line = line.lstrip()
+            else:
+                out.append(last + "\n")
+            last = line
+        if out:
+            yield "".join(out)
+    for line in (partial + ("\n" if held_cr else "")).split("\n"):
+        if line.strip():
+            if last is None:
+                line = line.lstrip()
+            else:
+                yield last + "\n"
+            last = line
+    if last is not None:
+        yield last.rstrip()
+
+
 async def extract_text_from_bytes(
     content_bytes: bytes,
     filename: str,
     file_type: str,
 ) -> Optional[str]:
+    return extract_text(content_bytes, filename, file_type)
+
+
+def extract_text(
+    content_bytes: bytes,
+    filename: str,
+    file_type: str,
+) -> Optional[str]:
+    """Synchronous extraction, for callers running it in a worker thread."""
     try:
         normalized = file_type.lstrip(".").lower()
 
@@ -42,7 +148,7 @@ async def extract_text_from_bytes(
                 for page in reader.pages:
                     page_text = page.extract_text() or ""
                     pages.append(page_text)
-                combined = "\n\n---PAGE BREAK---\n\n".join(pages)
+                combined = PAGE_BREAK.join(pages)
                 return clean_extracted_text(combined)
             except Exception as exc:
                 logger.error("PDF extraction failed for %s: %s", filename, exc)
@@ -56,7 +162,7 @@ async def extract_text_from_bytes(
         return None
 
     except Exception as exc:
-        logger.error("extract_text_from_bytes failed for %s: %s", filename, exc)
+        logger.error("extract_text failed for %s: %s", filename, exc)
         return None
 
 
@@ -0,0 +1,178 @@
+"""Streamed single-document upload (contextflow_upload_document path / content_base64).
+
+The inline ``content`` mode holds a document several times over: the JSON
+argument, the str, its bytes and the cleaned copy. This path works from a
+binary stream instead (a local file, or base64 decoded into a spooled
+temporary file):
+
+1. the real type is sniffed from the first bytes, so a PDF is parsed as a
+   PDF whatever its name or declared type;
+2. the bytes go to storage a piece at a time (upload_stream);
+3. extraction, cleaning and chunking run as generators over the stream, and
+   chunks are embedded and stored EMBED_BATCH at a time.
+
+Uploading the same file name to a project again reuses its document, and
+only chunks not already stored with the same content are embedded, so a
+retry after a failure pays for what the failed attempt did not write.
+
+Peak memory is a few read blocks and one batch of chunks, independent of
+file size.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import re
+import tempfile
+
+from typing import Any, BinaryIO, Iterator, Optional
+
+from file_processing.chunker import CHUNK_CONFLICT, chunk_row, iter_chunks, stored_chunks, trim_chunks, unstored
+from file_processing.extractor import CONTENT_TYPES, iter_clean_text, iter_extracted_text, sniff_file_type
+from utils.embeddings import embedding_columns, generate_embeddings_batch
+from utils.supabase_client import _run, get_client, register_documents, upload_stream
+
+logger = logging.getLogger("contextflow")
+
+SNIFF_BYTES = 8192
+EMBED_BATCH = 64
+# Decoded base64 stays in memory up to this size, then spills to disk
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+_B64_SLICE = 4 * 1024 * 1024
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def open_base64(data: str) -> BinaryIO:
+    """Decode base64 text a slice at a time into a seekable temporary file."""
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    carry = ""
+    try:
+        for start in range(0, len(data), _B64_SLICE):
+            text = carry + _WHITESPACE_RE.sub("", data[start:start + _B64_SLICE])
+            usable = len(text) - len(text) % 4
+            out.write(base64.b64decode(text[:usable], validate=True))
+            carry = text[usable:]
+        if carry:
+            raise ValueError("truncated base64 input")
+    except (binascii.Error, ValueError) as exc:
+        out.close()
+        raise ValueError(f"content_base64 is not valid base64: {exc}") from exc
+    out.seek(0)
+    return out
+
+
+def _size(stream: BinaryIO) -> int:
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+
+def _sha256(stream: BinaryIO) -> str:
+    digest = hashlib.sha256()
+    for block in iter(lambda: stream.read(_B64_SLICE), b""):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def iter_document_chunks(stream: BinaryIO, file_type: str, stats: dict[str, int]) -> Iterator[dict]:
+    """Chunks of the cleaned text of `stream`; counts characters into stats."""
+    stats.setdefault("char_count", 0)
+
+    def counted(pieces: Iterator[str]) -> Iterator[str]:
+        for piece in pieces:
+            stats["char_count"] += len(piece)
+            yield piece
+
+    yield from iter_chunks(counted(iter_clean_text(iter_extracted_text(stream, file_type))))
+
+
+def _take(chunks: Iterator[dict], n: int) -> list[dict]:
+    batch: list[dict] = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= n:
+            break
+    return batch
+
+
+async def upload_document_stream(
+    project_id: str,
+    filename: str,
+    stream: BinaryIO,
+    doc_category: str = "other",
+    file_type: Optional[str] = None,
+) -> dict[str, Any]:
+    """Store, register and chunk one document read from a seekable binary stream."""
+    size = _size(stream)
+    if not size:
+        raise ValueError("file is empty")
+    head = stream.read(SNIFF_BYTES)
+    stream.seek(0)
+    sniffed = sniff_file_type(head, filename)
+    if sniffed is None:
+        raise ValueError(f"{filename}: unsupported binary content (expected PDF, Markdown or text)")
+    declared = (file_type or "").lstrip(".").lower()
+    if declared and declared != sniffed:
+        logger.warning("upload_document_stream: %s declared as %s but looks like %s", filename, declared, sniffed)
+
+    content_hash = await asyncio.to_thread(_sha256, stream)
+    storage_path = f"{project_id}/{re.sub(r'[^a-zA-Z0-9._-]', '_', filename)}"
+    await upload_stream("documents", storage_path, stream, size, CONTENT_TYPES[sniffed])
+    stream.seek(0)
+
+    stats: dict[str, int] = {}
+    chunks = iter_document_chunks(stream, sniffed, stats)
+    # Extraction and chunking are CPU work; keep them off the event loop
+    batch = await asyncio.to_thread(_take, chunks, EMBED_BATCH)
+    if not batch:
+        # Registered only once there is text, so this leaves no empty document
+        raise ValueError(f"{filename}: no text extracted")
+
+    [document] = await register_documents([{
+        "project_id": project_id,
+        "filename": filename,
+        "file_type": sniffed,
+        "doc_category": doc_category,
+        "storage_path": storage_path,
+        "file_size": size,
+        "content_hash": content_hash,
+        "analyzed": False,
+    }])
+    existing = (await stored_chunks([document["id"]]))[document["id"]]
+
+    client = get_client()
+    stored = 0
+    embedded = 0
+    while batch:
+        stored += len(batch)
+        batch = unstored(batch, existing)
+        if batch:
+            texts = [c["content"] for c in batch]
+            columns = await embedding_columns(texts, await generate_embeddings_batch(texts))
+            rows = [chunk_row(document["id"], chunk, cols) for chunk, cols in zip(batch, columns)]
+            await _run(client.table("document_chunks").upsert(rows, on_conflict=CHUNK_CONFLICT).execute)
+            embedded += len(rows)
+        batch = await asyncio.to_thread(_take, chunks, EMBED_BATCH)
+    if any(index >= stored for index in existing):
+        await trim_chunks(document["id"], stored)
+
+    logger.info(
+        "upload_document_stream: %s (%s, %d bytes) -> %d chunks, %d embedded",
+        filename, sniffed, size, stored, embedded,
+    )
+    return {
+        "document_id": document["id"],
+        "filename": filename,
+        "file_type": sniffed,
+        "storage_path": storage_path,
+        "bytes": size,
+        "chunk_count": stored,
+        "embedded_chunks": embedded,
+        "char_count": stats.get("char_count", 0),
+    }
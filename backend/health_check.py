@@ -9,6 +9,7 @@ app = typer.Typer()
 
 try:
     from utils.config import (
+        STORAGE_BACKEND,
         SUPABASE_URL,
         SUPABASE_SERVICE_KEY,
         OPENAI_API_KEY,
@@ -59,11 +60,13 @@ def check_env_vars() -> bool:
         return _fail("Config import failed", _config_error)
 
     all_pass = True
-    for name, value in [
-        ("SUPABASE_URL", SUPABASE_URL),
-        ("SUPABASE_SERVICE_KEY", SUPABASE_SERVICE_KEY),
-        ("OPENAI_API_KEY", OPENAI_API_KEY),
-    ]:
+    required = [("OPENAI_API_KEY", OPENAI_API_KEY)]
+    if STORAGE_BACKEND != "local":
+        required = [
+            ("SUPABASE_URL", SUPABASE_URL),
+            ("SUPABASE_SERVICE_KEY", SUPABASE_SERVICE_KEY),
+        ] + required
+    for name, value in required:
         if value:
             preview = value[:8] + "..."
             _ok(f"{name}", preview)
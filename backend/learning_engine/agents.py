@@ -2,9 +2,8 @@ from __future__ import annotations
 
 import asyncio
 import logging
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from typing import Awaitable, Callable, Optional
 
 from learning_engine.extraction_strategy import extract_with_3x3
 from learning_engine.document_router import get_agents_for_doc_type, prepare_content_for_agent
@@ -142,20 +141,32 @@ async def run_agents_for_document(
     content: str,
     doc_type: str,
     filename: str,
+    done: Optional[dict[str, list[dict]]] = None,
+    on_result: Optional[Callable[[str, list[dict]], Awaitable[None]]] = None,
 ) -> dict[str, list[dict]]:
+    """Each agent's extractions, by agent name. Agents already in `done`
+    (from an earlier, interrupted run) are not called again; `on_result` is
+    awaited as each remaining agent finishes, so its output can be saved
+    even if another agent then fails."""
     agent_names = get_agents_for_doc_type(doc_type)
     prepared_content = prepare_content_for_agent(content)
-    results: dict[str, list[dict]] = {}
-
-    logger.info("Running agents %s for %s (type=%s)", agent_names, filename, doc_type)
-
-    valid_agents = [(name, _AGENT_MAP[name]) for name in agent_names if name in _AGENT_MAP]
+    results: dict[str, list[dict]] = dict(done or {})
+
+    valid_agents = [
+        (name, _AGENT_MAP[name]) for name in agent_names if name in _AGENT_MAP and name not in results
+    ]
+    logger.info(
+        "Running agents %s for %s (type=%s)%s", [n for n, _ in valid_agents], filename, doc_type,
+        f", {sorted(results)} already done" if results else "",
+    )
 
     async def run_agent(name: str, fn) -> tuple[str, list[dict]]:
         items = await fn(prepared_content)
         logger.info("Agent %s: extracted %d items", name, len(items))
+        if on_result is not None:
+            await on_result(name, items)
         return name, items
 
     pairs = await asyncio.gather(*[run_agent(n, f) for n, f in valid_agents])
-    results = dict(pairs)
-    return results
+    results.update(pairs)
+    return {name: results[name] for name in agent_names if name in results}
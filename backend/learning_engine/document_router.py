@@ -1,9 +1,6 @@
 from __future__ import annotations
 
 import logging
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 logger = logging.getLogger("contextflow")
 
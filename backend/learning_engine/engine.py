@@ -2,21 +2,21 @@ from __future__ import annotations
 
 import asyncio
 import logging
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from typing import Optional
 
 from utils.supabase_client import (
     get_client,
+    claim_analysis_job,
     create_analysis_job,
     update_document_analyzed,
     update_analysis_job,
+    JobCheckpoint,
 )
 from learning_engine.document_router import detect_document_type
 from learning_engine.agents import run_agents_for_document
 from learning_engine.synthesizer import synthesize_and_store
+from utils.tracing import span, traced
 
 logger = logging.getLogger("contextflow")
 
@@ -31,6 +31,7 @@ async def fetch_document_content(storage_path: str) -> Optional[str]:
         return None
 
 
+@traced("process_document")
 async def process_document(document: dict, job_id: str) -> dict:
     doc_id = document["id"]
     filename = document.get("filename", "")
@@ -39,25 +40,61 @@ async def process_document(document: dict, job_id: str) -> dict:
     doc_category = document.get("doc_category") or None
 
     try:
-        await update_analysis_job(job_id, status="running")
-        logger.info("process_document: starting %s (job=%s)", filename, job_id)
-
-        content = await fetch_document_content(storage_path)
-        if content is None:
-            await update_analysis_job(job_id, status="failed", error="Failed to download document content")
-            return {"job_id": job_id, "status": "failed", "error": "Failed to download content"}
-
-        if doc_category and doc_category in ("prd", "brd", "architecture", "chat", "other"):
-            doc_type_map = {"architecture": "technical", "other": "general"}
-            doc_type = doc_type_map.get(doc_category, doc_category)
+        if not await claim_analysis_job(job_id):
+            logger.info("process_document: job %s for %s is not pending, skipping", job_id, filename)
+            return {"job_id": job_id, "status": "skipped"}
+        job = await JobCheckpoint.load(job_id)
+        await update_analysis_job(job_id, status="running", attempts=job.attempts + 1)
+
+        extractions = job.data.get("extractions")
+        if extractions is None:
+            logger.info("process_document: starting %s (job=%s)", filename, job_id)
+
+            content = await fetch_document_content(storage_path)
+            if content is None:
+                await update_analysis_job(job_id, status="failed", error="Failed to download document content")
+                return {"job_id": job_id, "status": "failed", "error": "Failed to download content"}
+
+            doc_type = job.data.get("doc_type")
+            if doc_type is None:
+                if doc_category and doc_category in ("prd", "brd", "architecture", "chat", "other"):
+                    doc_type_map = {"architecture": "technical", "other": "general"}
+                    doc_type = doc_type_map.get(doc_category, doc_category)
+                else:
+                    doc_type = detect_document_type(filename, content)
+                await job.save("extracted", doc_type=doc_type)
+
+            logger.info("process_document: doc_type=%s for %s", doc_type, filename)
+
+            # Each agent's output is kept as it finishes, so a retry only
+            # runs the agents that had not
+            agents_done: dict[str, list[dict]] = dict(job.data.get("agents_done") or {})
+
+            async def agent_finished(name: str, items: list[dict]) -> None:
+                agents_done[name] = items
+                await job.save("extracted", agents_done=agents_done)
+
+            with span("agents"):
+                extractions = await run_agents_for_document(
+                    content, doc_type, filename, done=agents_done, on_result=agent_finished,
+                )
+            await job.save("agents", extractions=extractions)
         else:
-            doc_type = detect_document_type(filename, content)
+            doc_type = job.data["doc_type"]
+            logger.info(
+                "process_document: resuming %s after %s (job=%s, attempt %d)",
+                filename, job.stage, job_id, job.attempts + 1,
+            )
 
-        logger.info("process_document: doc_type=%s for %s", doc_type, filename)
+        synthesized: dict[str, str] = dict(job.data.get("synthesized") or {})
 
-        extractions = await run_agents_for_document(content, doc_type, filename)
+        async def item_stored(key: str, result: str) -> None:
+            synthesized[key] = result
+            await job.save("synthesized", synthesized=synthesized)
 
-        summary = await synthesize_and_store(extractions, doc_type, project_id)
+        summary = await synthesize_and_store(
+            extractions, doc_type, project_id, done=dict(synthesized), on_item=item_stored,
+        )
 
         await update_document_analyzed(doc_id, True)
         await update_analysis_job(
@@ -79,6 +116,15 @@ async def process_document(document: dict, job_id: str) -> dict:
             **summary,
         }
 
+    except asyncio.CancelledError:
+        # Stopped (a timeout or shutdown): fail the job so it can be queued
+        # again, rather than leaving it running until it goes stale
+        logger.warning("process_document: stopped while processing %s", filename)
+        try:
+            await update_analysis_job(job_id, status="failed", error="stopped")
+        except Exception:
+            pass
+        raise
     except Exception as exc:
         logger.error("process_document failed for %s: %s", filename, exc)
         try:
@@ -3,9 +3,6 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from typing import Optional
 
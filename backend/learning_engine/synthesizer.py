@@ -1,22 +1,26 @@
 from __future__ import annotations
 
 import logging
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from typing import Optional
+from typing import Awaitable, Callable, Optional
 
 import asyncio
 
 from utils.supabase_client import (
     get_client,
+    bump_principle,
     create_principle,
-    update_principle_confidence,
 )
-from utils.embeddings import generate_embedding, generate_embeddings_batch
+from utils.embeddings import (
+    embedding_columns,
+    generate_embedding,
+    generate_embeddings_batch,
+    is_retired,
+    version_tag,
+)
 from utils.config import MVP_USER_ID
 from utils.errors import wrap_upstream_errors
+from utils.tracing import record_round_trip, traced
 
 logger = logging.getLogger("contextflow")
 
@@ -69,7 +73,9 @@ async def _search_similar_by_embedding(
             "min_confidence": 0.0,
             "category_filter": category if category != "other" else None,
             "match_count": 1,
+            "embedding_version_filter": version_tag(embedding),
         }).execute()
+        record_round_trip("db")
         rows = response.data or []
         if not rows:
             return None
@@ -100,27 +106,7 @@ async def store_or_update_principle(
 
         if existing:
             principle_id = existing["id"]
-            current_confidence = float(existing.get("confidence_score", 0.5))
-            current_times_applied = int(existing.get("times_applied", 0))
-
-            new_confidence = min(current_confidence + 0.05, 0.95)
-            new_times_applied = current_times_applied + 1
-
-            await update_principle_confidence(
-                principle_id=principle_id,
-                score=new_confidence,
-                times_applied=new_times_applied,
-                times_failed=0,
-            )
-
-            client = get_client()
-            existing_row = client.table("principles").select("source_projects").eq("id", principle_id).execute()
-            if existing_row.data:
-                source_projects = existing_row.data[0].get("source_projects") or []
-                if project_id not in source_projects:
-                    source_projects.append(project_id)
-                    client.table("principles").update({"source_projects": source_projects}).eq("id", principle_id).execute()
-
+            await bump_principle(principle_id, delta=0.05, cap=0.95, project_id=project_id)
             logger.info("Updated existing principle %s", principle_id)
             return "updated"
 
@@ -148,7 +134,7 @@ async def store_or_update_principle(
             "when_to_use": item.get("when_to_use") or None,
             "when_not_to_use": item.get("when_not_to_use") or None,
             "source_projects": [project_id],
-            "embedding": embedding,
+            **(await embedding_columns([content], [embedding]))[0],
         }
 
         new_principle = await create_principle(principle_data)
@@ -172,26 +158,15 @@ async def _store_or_update_with_embedding(
         category = item.get("category", "other").strip()
         if not content or not category:
             return None
+        if await is_retired(embedding):
+            # Embedded before another process cut over: it would match no
+            # principle and be stored under the retired version
+            embedding = await generate_embedding(content)
 
         existing = await _search_similar_by_embedding(embedding, category)
 
         if existing:
-            principle_id = existing["id"]
-            current_confidence = float(existing.get("confidence_score", 0.5))
-            current_times_applied = int(existing.get("times_applied", 0))
-            await update_principle_confidence(
-                principle_id=principle_id,
-                score=min(current_confidence + 0.05, 0.95),
-                times_applied=current_times_applied + 1,
-                times_failed=0,
-            )
-            client = get_client()
-            existing_row = client.table("principles").select("source_projects").eq("id", principle_id).execute()
-            if existing_row.data:
-                source_projects = existing_row.data[0].get("source_projects") or []
-                if project_id not in source_projects:
-                    source_projects.append(project_id)
-                    client.table("principles").update({"source_projects": source_projects}).eq("id", principle_id).execute()
+            await bump_principle(existing["id"], delta=0.05, cap=0.95, project_id=project_id)
             return "updated"
 
         confidence = calculate_initial_confidence(
@@ -212,7 +187,7 @@ async def _store_or_update_with_embedding(
             "when_to_use": item.get("when_to_use") or None,
             "when_not_to_use": item.get("when_not_to_use") or None,
             "source_projects": [project_id],
-            "embedding": embedding,
+            **(await embedding_columns([content], [embedding]))[0],
         }
         new_principle = await create_principle(principle_data)
         logger.info("Created new principle %s", new_principle["id"])
@@ -222,23 +197,43 @@ async def _store_or_update_with_embedding(
         return None
 
 
+@traced("synthesize")
 async def synthesize_and_store(
     all_extractions: dict[str, list[dict]],
     doc_type: str,
     project_id: str,
+    done: Optional[dict[str, str]] = None,
+    on_item: Optional[Callable[[str, str], Awaitable[None]]] = None,
 ) -> dict:
+    """Store each extraction as a new principle or a bump of a similar one.
+
+    Items are keyed "<agent>:<position>". Those in `done` (key -> "updated"
+    or the new principle's id, from an interrupted run) are counted but not
+    stored again, which would bump their own principle; `on_item` is awaited
+    with each item stored now, so progress survives a later failure.
+    """
     created = 0
     updated = 0
     failed = 0
+    done = done or {}
 
     all_items: list[dict] = []
+    keys: list[str] = []
     for agent_name, items in all_extractions.items():
-        for item in items:
+        for n, item in enumerate(items):
+            key = f"{agent_name}:{n}"
+            if key in done:
+                if done[key] == "updated":
+                    updated += 1
+                else:
+                    created += 1
+                continue
             item["_agent"] = agent_name
             all_items.append(item)
+            keys.append(key)
 
     if not all_items:
-        return {"created": 0, "updated": 0, "failed": 0}
+        return {"created": created, "updated": updated, "failed": 0}
 
     logger.info("Agent 5: synthesizing %d total extractions", len(all_items))
 
@@ -254,17 +249,21 @@ async def synthesize_and_store(
         try:
             if embeddings_batch is not None:
                 embedding = embeddings_batch[i]
-                return await _store_or_update_with_embedding(
+                result = await _store_or_update_with_embedding(
                     item=item,
                     embedding=embedding,
                     doc_type=doc_type,
                     project_id=project_id,
                 )
-            return await store_or_update_principle(
-                item=item,
-                doc_type=doc_type,
-                project_id=project_id,
-            )
+            else:
+                result = await store_or_update_principle(
+                    item=item,
+                    doc_type=doc_type,
+                    project_id=project_id,
+                )
+            if result is not None and on_item is not None:
+                await on_item(keys[i], result)
+            return result
         except Exception as exc:
             logger.error("store_single failed for item %d: %s", i, exc)
             return None
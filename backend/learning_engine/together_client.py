@@ -2,23 +2,14 @@ from __future__ import annotations
 
 import asyncio
 import logging
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from typing import Optional
 
-from openai import AsyncOpenAI
-
-from utils.config import TOGETHER_API_KEY
+from utils.clients import get_together_client, request_timeout
+from utils.tracing import record_usage, span
 
 logger = logging.getLogger("contextflow")
 
-together_client = AsyncOpenAI(
-    api_key=TOGETHER_API_KEY,
-    base_url="https://api.together.xyz/v1",
-)
-
 MODEL_DEEPSEEK = "deepseek-ai/DeepSeek-V3"
 MODEL_LLAMA = "meta-llama/Llama-3.3-70B-Instruct-Turbo"
 ALL_MODELS = [MODEL_LLAMA]
@@ -32,15 +23,18 @@ async def call_model(
     max_tokens: int = 2000,
 ) -> Optional[str]:
     try:
-        response = await together_client.chat.completions.create(
-            model=model,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-        )
+        with span("agent_call"):
+            response = await get_together_client().chat.completions.create(
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=request_timeout("agent"),
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+            )
+        record_usage("llm", response.usage)
         return response.choices[0].message.content
     except Exception as exc:
         logger.error("call_model failed model=%s: %s", model, exc)
@@ -10,12 +10,14 @@ sys.stdout.reconfigure(line_buffering=True)
 import asyncio
 import json
 import logging
-from typing import Any, Optional
+from typing import Any, Callable, Optional
 
-from utils.config import LOG_LEVEL
+from utils.config import LOG_LEVEL, METRICS_FILE
+from utils.tracing import render_prometheus, start_trace, write_prometheus
 
 _tools_loaded = False
 _HANDLERS: dict[str, Any] = {}
+_STREAM_HANDLERS: dict[str, Any] = {}
 
 # Logging — stderr only
 _handler = logging.StreamHandler(sys.stderr)
@@ -26,25 +28,34 @@ logger.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
 logger.propagate = False
 
 def _ensure_tools_loaded() -> None:
-    global _tools_loaded, _HANDLERS
+    global _tools_loaded, _HANDLERS, _STREAM_HANDLERS
     if _tools_loaded:
         return
     from mcp_server.tools import (
         handle_query,
+        handle_query_batch,
+        handle_query_stream,
         handle_create_project,
         handle_upload_document,
+        handle_upload_documents,
         handle_analyze_project,
         handle_list_projects,
         handle_get_principles,
     )
     _HANDLERS = {
         "contextflow_query": handle_query,
+        "contextflow_query_batch": handle_query_batch,
         "contextflow_create_project": handle_create_project,
         "contextflow_upload_document": handle_upload_document,
+        "contextflow_upload_documents": handle_upload_documents,
         "contextflow_analyze_project": handle_analyze_project,
         "contextflow_list_projects": handle_list_projects,
         "contextflow_get_principles": handle_get_principles,
     }
+    # Tools that can emit partial results when the caller sends a progressToken
+    _STREAM_HANDLERS = {
+        "contextflow_query": handle_query_stream,
+    }
     _tools_loaded = True
 
 
@@ -74,11 +85,70 @@ TOOLS: dict[str, dict[str, Any]] = {
                         "type": "integer",
                         "description": "Max results to return (default 10)",
                     },
+                    "max_tokens": {
+                        "type": "integer",
+                        "description": "Optional: token budget for the response. Context is packed by relevance per token instead of fixed 5-item, 300-character sections",
+                    },
+                    "deadline_ms": {
+                        "type": "integer",
+                        "description": "Optional: answer within this many milliseconds with whatever sources have responded (default 8000, 0 for no deadline). Missing parts are listed in meta.degraded",
+                    },
                 },
                 "required": ["query"],
             },
         },
     },
+    "contextflow_query_batch": {
+        "handler": None,
+        "schema": {
+            "name": "contextflow_query_batch",
+            "description": "Run several contextflow_query questions in one call. Classification, embedding and search are shared across the batch, so it is much cheaper than one call per question",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "queries": {
+                        "type": "array",
+                        "description": "Up to 32 questions: strings, or objects with query and optional project_id and category",
+                        "items": {
+                            "anyOf": [
+                                {"type": "string"},
+                                {
+                                    "type": "object",
+                                    "properties": {
+                                        "query": {"type": "string"},
+                                        "project_id": {"type": "string"},
+                                        "category": {"type": "string"},
+                                    },
+                                    "required": ["query"],
+                                },
+                            ],
+                        },
+                    },
+                    "project_id": {
+                        "type": "string",
+                        "description": "Optional: project UUID for every query that does not set its own",
+                    },
+                    "category": {
+                        "type": "string",
+                        "description": "Optional: category hint for every query that does not set its own",
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Max results per query (default 10)",
+                    },
+                    "max_tokens": {
+                        "type": "integer",
+                        "description": "Optional: token budget for each query's context, as in contextflow_query",
+                    },
+                    "deadline_ms": {
+                        "type": "integer",
+                        "description": "Optional: deadline for the whole batch in milliseconds (default 8000, 0 for no deadline)",
+                    },
+                },
+                "required": ["queries"],
+            },
+        },
+    },
     "contextflow_create_project": {
         "handler": None,
         "schema": {
@@ -113,7 +183,7 @@ TOOLS: dict[str, dict[str, Any]] = {
         "handler": None,
         "schema": {
             "name": "contextflow_upload_document",
-            "description": "Upload a document to a project for analysis",
+            "description": "Upload a document to a project for analysis. Send text as content, binary files (e.g. PDF) as content_base64, or give a local path; the file is streamed and its type detected from its bytes",
             "inputSchema": {
                 "type": "object",
                 "properties": {
@@ -123,16 +193,24 @@ TOOLS: dict[str, dict[str, Any]] = {
                     },
                     "filename": {
                         "type": "string",
-                        "description": "Name of the file",
+                        "description": "Name of the file (defaults to the basename of path)",
                     },
                     "content": {
                         "type": "string",
                         "description": "Text content of the document",
                     },
+                    "content_base64": {
+                        "type": "string",
+                        "description": "Raw file bytes, base64-encoded",
+                    },
+                    "path": {
+                        "type": "string",
+                        "description": "Local file to upload, streamed from disk",
+                    },
                     "file_type": {
                         "type": "string",
                         "enum": ["pdf", "md", "txt"],
-                        "description": "File type",
+                        "description": "File type (optional; detected from the content)",
                     },
                     "doc_category": {
                         "type": "string",
@@ -140,7 +218,55 @@ TOOLS: dict[str, dict[str, Any]] = {
                         "description": "Document category",
                     },
                 },
-                "required": ["project_id", "filename", "content", "file_type"],
+                "required": ["project_id"],
+            },
+        },
+    },
+    "contextflow_upload_documents": {
+        "handler": None,
+        "schema": {
+            "name": "contextflow_upload_documents",
+            "description": "Upload many documents to a project in one call: inline contents and/or local files, directories or globs. Reports per-file status and throughput",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "project_id": {
+                        "type": "string",
+                        "description": "ID of the project to upload to",
+                    },
+                    "documents": {
+                        "type": "array",
+                        "description": "Inline documents",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "filename": {"type": "string"},
+                                "content": {"type": "string"},
+                                "file_type": {"type": "string", "enum": ["pdf", "md", "txt"]},
+                                "doc_category": {
+                                    "type": "string",
+                                    "enum": ["prd", "brd", "architecture", "chat", "other"],
+                                },
+                            },
+                            "required": ["filename", "content"],
+                        },
+                    },
+                    "paths": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Local files, directories (searched recursively for .md, .txt and .pdf) or glob patterns",
+                    },
+                    "doc_category": {
+                        "type": "string",
+                        "enum": ["prd", "brd", "architecture", "chat", "other"],
+                        "description": "Category for files that do not set their own (default other)",
+                    },
+                    "concurrency": {
+                        "type": "integer",
+                        "description": "Files read, uploaded and stored at once (default 8)",
+                    },
+                },
+                "required": ["project_id"],
             },
         },
     },
@@ -202,7 +328,11 @@ TOOLS: dict[str, dict[str, Any]] = {
 }
 
 
-async def dispatch(tool_name: str, arguments: dict[str, Any]) -> dict[str, Any]:
+async def dispatch(
+    tool_name: str,
+    arguments: dict[str, Any],
+    notify: Optional[Callable[[str, dict[str, Any]], None]] = None,
+) -> dict[str, Any]:
     if tool_name not in TOOLS:
         return {"error": f"Unknown tool: {tool_name}", "success": False}
 
@@ -215,20 +345,52 @@ async def dispatch(tool_name: str, arguments: dict[str, Any]) -> dict[str, Any]:
         return {"error": f"Missing required arguments: {', '.join(missing)}", "success": False}
 
     _ensure_tools_loaded()
-    handler = _HANDLERS[tool_name]
 
-    try:
-        result = await handler(arguments)
-        return result
-    except Exception as exc:
-        logger.error("Tool %s raised exception: %s", tool_name, exc)
-        return {"error": str(exc), "success": False}
+    with start_trace(tool_name) as trace:
+        try:
+            if notify is not None and tool_name in _STREAM_HANDLERS:
+                result = await _STREAM_HANDLERS[tool_name](arguments, notify)
+            else:
+                result = await _HANDLERS[tool_name](arguments)
+        except Exception as exc:
+            logger.error("Tool %s raised exception [cid=%s]: %s", tool_name, trace.correlation_id, exc)
+            result = {"error": str(exc), "success": False}
+        result.setdefault("meta", {})["trace"] = trace.summary()
+
+    if METRICS_FILE:
+        try:
+            write_prometheus(METRICS_FILE)
+        except OSError as exc:
+            logger.warning("Could not write metrics to %s: %s", METRICS_FILE, exc)
+    return result
 
 
 def _make_response(request_id: Optional[Any], result: Any) -> dict[str, Any]:
     return {"jsonrpc": "2.0", "id": request_id, "result": result}
 
 
+def _make_notification(method: str, params: dict[str, Any]) -> dict[str, Any]:
+    return {"jsonrpc": "2.0", "method": method, "params": params}
+
+
+def _progress_notifier(progress_token: Any) -> Callable[[str, dict[str, Any]], None]:
+    """Build a `notify` callback that writes each partial result as an MCP
+    notifications/progress message tied to the caller's progressToken."""
+    step = 0
+
+    def notify(stage: str, payload: dict[str, Any]) -> None:
+        nonlocal step
+        step += 1
+        _write(_make_notification("notifications/progress", {
+            "progressToken": progress_token,
+            "progress": step,
+            "message": stage,
+            "partial": payload,
+        }))
+
+    return notify
+
+
 def _make_error(request_id: Optional[Any], code: int, message: str) -> dict[str, Any]:
     return {
         "jsonrpc": "2.0",
@@ -255,10 +417,15 @@ async def handle_request(request: dict[str, Any]) -> dict[str, Any]:
         tools_list = [entry["schema"] for entry in TOOLS.values()]
         return _make_response(request_id, {"tools": tools_list})
 
+    if method == "contextflow/metrics":
+        return _make_response(request_id, {"text": render_prometheus()})
+
     if method == "tools/call":
         tool_name = params.get("name", "")
         arguments = params.get("arguments") or {}
-        result = await dispatch(tool_name, arguments)
+        progress_token = (params.get("_meta") or {}).get("progressToken")
+        notify = _progress_notifier(progress_token) if progress_token is not None else None
+        result = await dispatch(tool_name, arguments, notify=notify)
         return _make_response(request_id, {
             "content": [{"type": "text", "text": json.dumps(result, indent=2)}],
         })
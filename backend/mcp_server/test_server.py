@@ -24,18 +24,20 @@ def _fail(label: str, detail: str = "") -> None:
 
 
 async def test_tools_list() -> bool:
-    label = "tools/list → 6 tools returned"
+    label = "tools/list → 8 tools returned"
     try:
         tools = list(TOOLS.keys())
         expected = {
             "contextflow_query",
+            "contextflow_query_batch",
             "contextflow_create_project",
             "contextflow_upload_document",
+            "contextflow_upload_documents",
             "contextflow_analyze_project",
             "contextflow_list_projects",
             "contextflow_get_principles",
         }
-        if set(tools) == expected and len(tools) == 6:
+        if set(tools) == expected and len(tools) == 8:
             _pass(label, f"tools={tools}")
             return True
         _fail(label, f"got {tools}")
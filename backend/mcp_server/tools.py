@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import logging
 import sys
-from typing import Any
+from typing import Any, Callable, Optional
 
 from utils.config import MVP_USER_ID
 from utils.supabase_client import (
@@ -57,65 +57,88 @@ async def handle_create_project(arguments: dict[str, Any]) -> dict[str, Any]:
 
 
 async def handle_upload_document(arguments: dict[str, Any]) -> dict[str, Any]:
+    import io
+    import os
+    from file_processing.streaming import open_base64, upload_document_stream
 
-    required = ["project_id", "filename", "file_type", "doc_category", "content"]
-    missing = [r for r in required if not arguments.get(r)]
-    if missing:
-        return {"success": False, "error": f"Missing required arguments: {', '.join(missing)}"}
+    project_id = arguments.get("project_id")
+    if not project_id:
+        return {"success": False, "error": "Missing required arguments: project_id"}
 
-    project_id = arguments["project_id"]
-    filename = arguments["filename"]
-    file_type = arguments["file_type"].lstrip(".").lower()
-    doc_category = arguments["doc_category"]
-    content = arguments["content"]
+    sources = [key for key in ("content", "content_base64", "path") if arguments.get(key)]
+    if len(sources) != 1:
+        return {"success": False, "error": "Provide exactly one of content, content_base64 or path"}
+    source = sources[0]
 
-    valid_categories = ["prd", "brd", "architecture", "chat", "other"]
-    if doc_category not in valid_categories:
-        return {"success": False, "error": f"doc_category must be one of: {valid_categories}"}
+    path = arguments.get("path")
+    filename = arguments.get("filename") or (os.path.basename(path) if path else "")
+    if not filename:
+        return {"success": False, "error": "Missing required arguments: filename"}
 
-    try:
-        import re
-        client = get_client()
-
-        safe_filename = re.sub(r'[^a-zA-Z0-9._-]', '_', filename)
-        storage_path = f"{project_id}/{safe_filename}"
-        content_bytes = content.encode("utf-8")
-        client.storage.from_("documents").upload(
-            path=storage_path,
-            file=content_bytes,
-            file_options={"content-type": "text/plain", "upsert": "true"},
-        )
-
-        doc_data: dict[str, Any] = {
-            "project_id": project_id,
-            "filename": filename,
-            "file_type": file_type,
-            "doc_category": doc_category,
-            "storage_path": storage_path,
-            "analyzed": False,
-        }
-        doc_response = client.table("documents").insert(doc_data).execute()
-        document_id = doc_response.data[0]["id"]
+    doc_category = arguments.get("doc_category") or "other"
+    if doc_category not in _VALID_DOC_CATEGORIES:
+        return {"success": False, "error": f"doc_category must be one of: {sorted(_VALID_DOC_CATEGORIES)}"}
 
-        from file_processing.extractor import clean_extracted_text
-        from file_processing.chunker import process_and_store_chunks
+    file_type = arguments.get("file_type")
+    if file_type and file_type.lstrip(".").lower() not in _VALID_FILE_TYPES:
+        return {"success": False, "error": f"file_type must be one of: {sorted(_VALID_FILE_TYPES)}"}
 
-        cleaned = clean_extracted_text(content)
-        chunk_count = await process_and_store_chunks(document_id, cleaned)
-
-        return {
-            "success": True,
-            "data": {
-                "document_id": document_id,
-                "filename": filename,
-                "storage_path": storage_path,
-                "chunk_count": chunk_count,
-                "char_count": len(cleaned),
-            },
-        }
+    stream = None
+    try:
+        if source == "path":
+            if not os.path.isfile(path):
+                return {"success": False, "error": f"No such file: {path}"}
+            stream = open(path, "rb")
+        elif source == "content_base64":
+            stream = open_base64(arguments["content_base64"])
+        else:
+            stream = io.BytesIO(arguments["content"].encode("utf-8"))
+
+        data = await upload_document_stream(project_id, filename, stream, doc_category, file_type)
+        return {"success": True, "data": data}
     except Exception as exc:
         logger.error("handle_upload_document error: %s", exc)
         return {"success": False, "error": str(exc)}
+    finally:
+        if stream is not None:
+            stream.close()
+
+
+async def handle_upload_documents(arguments: dict[str, Any]) -> dict[str, Any]:
+    from file_processing.batch_ingest import DEFAULT_CONCURRENCY, IngestFile, expand_paths, ingest_documents
+
+    project_id = (arguments.get("project_id") or "").strip()
+    if not project_id:
+        return {"success": False, "error": "Missing required arguments: project_id"}
+
+    doc_category = arguments.get("doc_category") or "other"
+    if doc_category not in _VALID_DOC_CATEGORIES:
+        return {"success": False, "error": f"doc_category must be one of: {sorted(_VALID_DOC_CATEGORIES)}"}
+
+    files: list[IngestFile] = []
+    for i, doc in enumerate(arguments.get("documents") or []):
+        if not doc.get("filename") or not doc.get("content"):
+            return {"success": False, "error": f"documents[{i}] needs filename and content"}
+        category = doc.get("doc_category") or doc_category
+        if category not in _VALID_DOC_CATEGORIES:
+            return {"success": False, "error": f"documents[{i}].doc_category must be one of: {sorted(_VALID_DOC_CATEGORIES)}"}
+        files.append(IngestFile(
+            filename=doc["filename"],
+            content=doc["content"],
+            file_type=doc.get("file_type"),
+            doc_category=category,
+        ))
+    files.extend(expand_paths(arguments.get("paths") or [], doc_category))
+    if not files:
+        return {"success": False, "error": "Provide documents and/or paths matching at least one file"}
+
+    try:
+        concurrency = int(arguments.get("concurrency") or DEFAULT_CONCURRENCY)
+        result = await ingest_documents(project_id, files, concurrency=concurrency)
+        return {"success": result["summary"]["succeeded"] > 0, "data": result}
+    except Exception as exc:
+        logger.error("handle_upload_documents error: %s", exc)
+        return {"success": False, "error": str(exc)}
 
 
 async def handle_analyze_project(arguments: dict[str, Any]) -> dict[str, Any]:
@@ -232,6 +255,22 @@ async def handle_get_principles(arguments: dict[str, Any]) -> dict[str, Any]:
         return {"success": False, "error": str(exc)}
 
 
+def _query_options(arguments: dict[str, Any]) -> tuple[dict[str, Any], Optional[dict[str, Any]]]:
+    """limit, max_tokens and deadline_ms for the query tools, and the error
+    response to return instead when one of them is invalid."""
+    try:
+        limit = int(arguments.get("limit", 10))
+        max_tokens = int(arguments["max_tokens"]) if arguments.get("max_tokens") else None
+        deadline_ms = int(arguments["deadline_ms"]) if arguments.get("deadline_ms") is not None else None
+    except (TypeError, ValueError):
+        return {}, {"success": False, "error": "limit, max_tokens and deadline_ms must be integers"}
+    if max_tokens is not None and max_tokens <= 0:
+        return {}, {"success": False, "error": "max_tokens must be a positive integer"}
+    if deadline_ms is not None and deadline_ms < 0:
+        return {}, {"success": False, "error": "deadline_ms must be a non-negative integer"}
+    return {"limit": limit, "max_tokens": max_tokens, "deadline_ms": deadline_ms}, None
+
+
 async def handle_query(arguments: dict[str, Any]) -> dict[str, Any]:
     from orchestrator.orchestrator import orchestrate_query
 
@@ -241,16 +280,88 @@ async def handle_query(arguments: dict[str, Any]) -> dict[str, Any]:
 
     project_id = arguments.get("project_id") or None
     category = arguments.get("category") or None
-    limit = int(arguments.get("limit", 10))
+    options, error = _query_options(arguments)
+    if error is not None:
+        return error
 
     result = await orchestrate_query(
         query=query,
         project_id=project_id,
         category_hint=category,
-        limit=limit,
+        **options,
     )
 
     if result.get("error"):
         return {"success": False, "error": result["error"]}
 
     return {"success": True, "data": result}
+
+
+async def handle_query_batch(arguments: dict[str, Any]) -> dict[str, Any]:
+    from orchestrator.orchestrator import MAX_BATCH_QUERIES, orchestrate_queries
+
+    raw = arguments.get("queries")
+    if not isinstance(raw, list) or not raw:
+        return {"success": False, "error": "queries must be a non-empty array"}
+    if len(raw) > MAX_BATCH_QUERIES:
+        return {"success": False, "error": f"queries may hold at most {MAX_BATCH_QUERIES} entries"}
+
+    project_id = arguments.get("project_id") or None
+    category = arguments.get("category") or None
+    queries: list[dict[str, Any]] = []
+    for i, item in enumerate(raw):
+        if isinstance(item, str):
+            item = {"query": item}
+        if not isinstance(item, dict) or not str(item.get("query") or "").strip():
+            return {"success": False, "error": f"queries[{i}] needs a non-empty query"}
+        queries.append({
+            "query": item["query"].strip(),
+            "project_id": item.get("project_id") or project_id,
+            "category": item.get("category") or category,
+        })
+
+    options, error = _query_options(arguments)
+    if error is not None:
+        return error
+
+    result = await orchestrate_queries(queries, **options)
+
+    if result.get("error"):
+        return {"success": False, "error": result["error"]}
+
+    return {"success": True, "data": result}
+
+
+async def handle_query_stream(
+    arguments: dict[str, Any],
+    notify: Callable[[str, dict[str, Any]], None],
+) -> dict[str, Any]:
+    """Progressive contextflow_query: each partial section is passed to
+    `notify` as soon as it is ready; the return value matches handle_query."""
+    from orchestrator.orchestrator import stream_query
+
+    query = arguments.get("query", "").strip()
+    if not query:
+        return {"success": False, "error": "query argument is required and cannot be empty"}
+
+    project_id = arguments.get("project_id") or None
+    category = arguments.get("category") or None
+    options, error = _query_options(arguments)
+    if error is not None:
+        return error
+
+    result: dict[str, Any] = {}
+    async for stage, payload in stream_query(
+        query=query,
+        project_id=project_id,
+        category_hint=category,
+        **options,
+    ):
+        if stage == "error":
+            return {"success": False, "error": payload["error"]}
+        if stage == "result":
+            result = payload
+            continue
+        notify(stage, payload)
+
+    return {"success": True, "data": result}
@@ -0,0 +1,124 @@
+"""Maximal Marginal Relevance re-ranking for search results.
+
+Chunks overlap and neighbouring chunks of one file are near-duplicates, so
+the top results by score are often consecutive slices of the same document.
+mmr_select picks greedily by
+
+    lambda_ * relevance - (1 - lambda_) * max(similarity to already picked)
+
+using the compact embeddings the hybrid search RPCs return with
+``return_embeddings``, and can cap how many picks share a document or
+project. Caps are soft: when the pool cannot fill ``k`` within them, the
+remaining slots are filled by plain MMR.
+"""
+from __future__ import annotations
+
+import json
+import math
+from typing import Any, Optional
+
+try:
+    import numpy as np
+except ImportError:  # pure-Python fallback
+    np = None
+
+MMR_LAMBDA = 0.7
+
+
+def parse_compact_embedding(value: Any) -> Optional[list[float]]:
+    """halfvec text literal ('[0.1,...]') or list -> list of floats."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return None
+    return [float(v) for v in value] if value else None
+
+
+def _normalized(values: list[float]) -> list[float]:
+    top = max(values)
+    if top <= 0:
+        return [1.0] * len(values)
+    return [max(v, 0.0) / top for v in values]
+
+
+class _Similarity:
+    """Pairwise cosine over the pool's embeddings; rows without one score 0."""
+
+    def __init__(self, vectors: list[Optional[list[float]]]):
+        dims = max((len(v) for v in vectors if v), default=0)
+        rows = [(v if v and len(v) == dims else [0.0] * dims) for v in vectors]
+        if np is not None:
+            m = np.asarray(rows, dtype=np.float32).reshape(len(rows), dims)
+            norms = np.linalg.norm(m, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            m = m / norms
+            self._matrix = m @ m.T
+            self._rows = None
+        else:
+            self._matrix = None
+            self._rows = []
+            for row in rows:
+                norm = math.sqrt(sum(x * x for x in row)) or 1.0
+                self._rows.append([x / norm for x in row])
+
+    def to(self, i: int) -> list[float]:
+        """Similarity of every pool item to item i."""
+        if self._matrix is not None:
+            return self._matrix[i].tolist()
+        ri = self._rows[i]
+        return [sum(a * b for a, b in zip(ri, rj)) for rj in self._rows]
+
+
+def mmr_select(
+    items: list[dict],
+    k: int,
+    relevance_key: str = "score",
+    lambda_: float = MMR_LAMBDA,
+    max_per_document: Optional[int] = None,
+    max_per_project: Optional[int] = None,
+) -> list[dict]:
+    """Pick up to k items from `items` in MMR order.
+
+    Relevance is ``item[relevance_key]`` scaled so the best item scores 1,
+    which puts RRF scores, similarities and confidences on one footing.
+    Items are compared by their ``compact_embedding``; items without one
+    are never penalized.
+    """
+    if k <= 0 or not items:
+        return []
+    relevance = _normalized([float(item.get(relevance_key) or 0.0) for item in items])
+    similarity = _Similarity([parse_compact_embedding(item.get("compact_embedding")) for item in items])
+
+    penalty = [0.0] * len(items)
+    remaining = set(range(len(items)))
+    picked: list[int] = []
+    per_document: dict[Any, int] = {}
+    per_project: dict[Any, int] = {}
+
+    def within_caps(i: int) -> bool:
+        doc = items[i].get("document_id")
+        project = items[i].get("project_id")
+        if max_per_document is not None and doc is not None and per_document.get(doc, 0) >= max_per_document:
+            return False
+        if max_per_project is not None and project is not None and per_project.get(project, 0) >= max_per_project:
+            return False
+        return True
+
+    capped = max_per_document is not None or max_per_project is not None
+    while remaining and len(picked) < k:
+        eligible = [i for i in remaining if within_caps(i)] if capped else list(remaining)
+        if not eligible:
+            capped = False
+            continue
+        best = max(eligible, key=lambda i: (lambda_ * relevance[i] - (1 - lambda_) * penalty[i], -i))
+        picked.append(best)
+        remaining.discard(best)
+        doc, project = items[best].get("document_id"), items[best].get("project_id")
+        per_document[doc] = per_document.get(doc, 0) + 1
+        per_project[project] = per_project.get(project, 0) + 1
+        penalty = [max(p, s) for p, s in zip(penalty, similarity.to(best))]
+
+    return [items[i] for i in picked]
@@ -1,24 +1,18 @@
 from __future__ import annotations
 
 import logging
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from dataclasses import dataclass
-from typing import Optional
+from typing import Any, Optional
 
-from openai import AsyncOpenAI
-
-from utils.config import OPENAI_API_KEY, MVP_USER_ID
+from utils.clients import get_openai_client, request_timeout
+from utils.config import MVP_USER_ID
 from utils.supabase_client import get_client, get_projects
 from utils.errors import wrap_upstream_errors, parse_json_or_raise
+from utils.tracing import record_usage, span
 
 logger = logging.getLogger("contextflow")
 
-_openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-
-
 @dataclass
 class Intent:
     query_type: str
@@ -26,28 +20,26 @@ class Intent:
     scope: str
     project_id: Optional[str]
     confidence: float
+    query_text: str = ""
 
 
-@wrap_upstream_errors("classify_intent")
-async def classify_intent(
-    query: str,
-    project_id_hint: Optional[str] = None,
-) -> Intent:
-    system_prompt = (
-        "You are a query classifier for ContextFlow, an engineering knowledge system.\n"
-        "Classify the user query and return ONLY valid JSON, no other text."
-    )
-    user_prompt = f"""Classify this query: "{query}"
+_SYSTEM_PROMPT = (
+    "You are a query classifier for ContextFlow, an engineering knowledge system.\n"
+    "Classify the user query and return ONLY valid JSON, no other text."
+)
+_BATCH_SYSTEM_PROMPT = (
+    "You are a query classifier for ContextFlow, an engineering knowledge system.\n"
+    "Classify each user query and return ONLY a valid JSON array, no other text."
+)
 
-Return JSON with exactly these fields:
-{{
+_FIELDS = """{
   "query_type": "pattern|decision|error|lesson|general",
   "category": "auth|payment|api|database|frontend|backend|security|deployment|testing|performance|other",
   "scope": "project_specific|all_projects|general",
   "confidence": 0.0-1.0
-}}
+}"""
 
-Rules:
+_RULES = """Rules:
 - query_type "pattern": asks HOW to implement something
 - query_type "decision": asks WHICH option to choose
 - query_type "error": asks about fixing a problem
@@ -57,23 +49,49 @@ Rules:
 - scope "all_projects": asks about patterns across projects
 - scope "general": asks for general best practices"""
 
-    response = await _openai_client.chat.completions.create(
+
+def _intent_from(parsed: Any, query: str, project_id: Optional[str]) -> Intent:
+    if not isinstance(parsed, dict):
+        parsed = {}
+    return Intent(
+        query_type=parsed.get("query_type", "general"),
+        category=parsed.get("category", "other"),
+        scope=parsed.get("scope", "general"),
+        project_id=project_id,
+        confidence=float(parsed.get("confidence", 0.5)),
+        query_text=query,
+    )
+
+
+async def _complete(system_prompt: str, user_prompt: str) -> str:
+    response = await get_openai_client().chat.completions.create(
         model="gpt-4o-mini",
         temperature=0.1,
+        timeout=request_timeout("classify"),
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ],
     )
-    raw = response.choices[0].message.content or ""
+    record_usage("llm", response.usage)
+    return response.choices[0].message.content or ""
+
+
+@wrap_upstream_errors("classify_intent")
+async def classify_intent(
+    query: str,
+    project_id_hint: Optional[str] = None,
+) -> Intent:
+    user_prompt = f"""Classify this query: "{query}"
+
+Return JSON with exactly these fields:
+{_FIELDS}
+
+{_RULES}"""
+
+    raw = await _complete(_SYSTEM_PROMPT, user_prompt)
     parsed = parse_json_or_raise(raw, label="classify_intent")
-    intent = Intent(
-        query_type=parsed.get("query_type", "general"),
-        category=parsed.get("category", "other"),
-        scope=parsed.get("scope", "general"),
-        project_id=project_id_hint,
-        confidence=float(parsed.get("confidence", 0.5)),
-    )
+    intent = _intent_from(parsed, query, project_id_hint)
     logger.info(
         "classify_intent result: type=%s category=%s scope=%s confidence=%.2f",
         intent.query_type,
@@ -84,29 +102,62 @@ Rules:
     return intent
 
 
-async def detect_project_from_query(query: str) -> Optional[str]:
+@wrap_upstream_errors("classify_intents")
+async def classify_intents(
+    queries: list[str],
+    project_id_hints: Optional[list[Optional[str]]] = None,
+) -> list[Intent]:
+    """classify_intent for several queries in one LLM call. The model
+    answers with a JSON array in query order; an entry that is missing or
+    not an object leaves its query unclassified (general/other) rather than
+    failing the batch."""
+    hints = project_id_hints or [None] * len(queries)
+    numbered = "\n".join(f'{n}. "{query}"' for n, query in enumerate(queries, start=1))
+    user_prompt = f"""Classify each of these {len(queries)} queries:
+{numbered}
+
+Return a JSON array with exactly one object per query, in the same order, each with exactly these fields:
+{_FIELDS}
+
+{_RULES}"""
+
+    raw = await _complete(_BATCH_SYSTEM_PROMPT, user_prompt)
+    parsed = parse_json_or_raise(raw, label="classify_intents")
+    if isinstance(parsed, dict):  # {"intents": [...]} and the like
+        parsed = next((v for v in parsed.values() if isinstance(v, list)), [])
+    if not isinstance(parsed, list):
+        parsed = []
+    if len(parsed) != len(queries):
+        logger.warning("classify_intents: %d answers for %d queries", len(parsed), len(queries))
+    intents = [
+        _intent_from(parsed[n] if n < len(parsed) else None, query, hint)
+        for n, (query, hint) in enumerate(zip(queries, hints))
+    ]
+    logger.info("classify_intents: %s", ", ".join(i.category for i in intents))
+    return intents
+
+
+async def detect_projects_from_queries(queries: list[str]) -> list[Optional[str]]:
+    """detect_project_from_query for several queries, reading the projects once."""
     try:
-        projects = await get_projects(MVP_USER_ID)
-        query_lower = query.lower()
-        for project in projects:
-            name = project.get("name", "")
-            if name and name.lower() in query_lower:
-                logger.info("detect_project_from_query: matched project '%s' (%s)", name, project["id"])
-                return project["id"]
-        return None
+        with span("detect_project"):
+            projects = await get_projects(MVP_USER_ID)
+        found: list[Optional[str]] = []
+        for query in queries:
+            query_lower = query.lower()
+            match = None
+            for project in projects:
+                name = project.get("name", "")
+                if name and name.lower() in query_lower:
+                    logger.info("detect_project_from_query: matched project '%s' (%s)", name, project["id"])
+                    match = project["id"]
+                    break
+            found.append(match)
+        return found
     except Exception as exc:
         logger.error("detect_project_from_query failed: %s", exc)
-        return None
-
+        return [None] * len(queries)
 
-async def classify_with_project_detection(
-    query: str,
-    project_id_hint: Optional[str] = None,
-) -> Intent:
-    if project_id_hint:
-        project_id = project_id_hint
-    else:
-        project_id = await detect_project_from_query(query)
 
-    intent = await classify_intent(query, project_id_hint=project_id)
-    return intent
+async def detect_project_from_query(query: str) -> Optional[str]:
+    return (await detect_projects_from_queries([query]))[0]
@@ -1,29 +1,53 @@
 from __future__ import annotations
 
 import asyncio
+import dataclasses
 import logging
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import time
 
-from typing import Optional
+from typing import AsyncIterator, Awaitable, Optional, TypeVar
 
-from orchestrator.intent_classifier import Intent, classify_with_project_detection
-from orchestrator.storage1_query import query_storage1_filtered
-from orchestrator.storage2_query import query_storage2_with_expansions
+from orchestrator.diversify import mmr_select
+from orchestrator.intent_classifier import (
+    Intent,
+    classify_intent,
+    classify_intents,
+    detect_project_from_query,
+    detect_projects_from_queries,
+)
+from orchestrator.packing import pack_context
+from orchestrator.storage1_query import query_storage1_batch, query_storage1_filtered
+from orchestrator.storage2_query import (
+    query_storage2_candidates,
+    query_storage2_candidates_batch,
+    select_by_category,
+)
+from utils import config
+from utils.deadline import DeadlineExceeded, deadline, deadline_context, hedged, remaining, within_deadline
+from utils.embeddings import generate_embedding, generate_embeddings_batch
+from utils.errors import UpstreamLLMError
+from utils.tracing import span
 
 logger = logging.getLogger("contextflow")
 
+T = TypeVar("T")
 
-async def merge_and_format(
-    query: str,
-    intent: Intent,
-    storage1_results: list[dict],
-    storage2_primary: list[dict],
-    storage2_related: dict[str, list[dict]],
-) -> dict:
+# Payload budget per section, and how much of it one file or project may
+# take before other sources get a turn (relaxed when nothing else matches).
+CONTEXT_ITEMS = 5
+MAX_CHUNKS_PER_DOCUMENT = 2
+MAX_CHUNKS_PER_PROJECT = 3
+
+
+def format_project_context(storage1_results: list[dict]) -> list[dict]:
     project_context = []
-    for chunk in sorted(storage1_results, key=lambda c: c.get("similarity", 0.0), reverse=True)[:5]:
+    ranked = sorted(storage1_results, key=lambda c: c.get("score", 0.0), reverse=True)
+    for chunk in mmr_select(
+        ranked,
+        CONTEXT_ITEMS,
+        max_per_document=MAX_CHUNKS_PER_DOCUMENT,
+        max_per_project=MAX_CHUNKS_PER_PROJECT,
+    ):
         content = chunk.get("content") or ""
         project_context.append({
             "project_name": chunk.get("project_name"),
@@ -33,9 +57,13 @@ async def merge_and_format(
             "similarity": float(chunk.get("similarity", 0.0)),
             "doc_category": chunk.get("doc_category"),
         })
+    return project_context
 
+
+def format_principles(storage2_primary: list[dict]) -> list[dict]:
     principles = []
-    for p in sorted(storage2_primary, key=lambda x: float(x.get("confidence_score", 0.0)), reverse=True)[:5]:
+    ranked = sorted(storage2_primary, key=lambda x: float(x.get("confidence_score", 0.0)), reverse=True)
+    for p in mmr_select(ranked, CONTEXT_ITEMS, relevance_key="confidence_score"):
         principles.append({
             "content": (p.get("content") or "")[:300],
             "type": p.get("type"),
@@ -46,7 +74,10 @@ async def merge_and_format(
             "when_not_to_use": p.get("when_not_to_use"),
             "similarity": float(p.get("similarity", 0.0)),
         })
+    return principles
+
 
+def format_related_context(storage2_related: dict[str, list[dict]]) -> dict[str, list[dict]]:
     related_context: dict[str, list[dict]] = {}
     for cat, items in storage2_related.items():
         related_context[cat] = [
@@ -56,53 +87,371 @@ async def merge_and_format(
             }
             for item in items[:2]
         ]
+    return related_context
+
 
+def format_intent(intent: Intent) -> dict:
+    return {
+        "type": intent.query_type,
+        "category": intent.category,
+        "scope": intent.scope,
+    }
+
+
+async def merge_and_format(
+    query: str,
+    intent: Intent,
+    storage1_results: list[dict],
+    storage2_primary: list[dict],
+    storage2_related: dict[str, list[dict]],
+    max_tokens: Optional[int] = None,
+) -> dict:
+    """Without max_tokens each section is a fixed top five cut to 300
+    characters; with it, sections are packed to the token budget instead."""
+    tokens: Optional[dict] = None
+    if max_tokens:
+        packed = pack_context(storage1_results, storage2_primary, storage2_related, max_tokens)
+        project_context = packed.project_context
+        principles = packed.principles
+        related_context = packed.related_context
+        tokens = {
+            "budget": max_tokens,
+            "used": packed.tokens_used,
+            "truncated": packed.truncated,
+            "dropped": packed.dropped,
+            "merged_chunks": packed.merged,
+        }
+    else:
+        project_context = format_project_context(storage1_results)
+        principles = format_principles(storage2_primary)
+        related_context = format_related_context(storage2_related)
+
+    meta = {
+        "storage1_count": len(storage1_results),
+        "storage2_count": len(storage2_primary),
+        "related_categories": list(storage2_related.keys()),
+        "has_project_context": len(project_context) > 0,
+        "orchestrator_ready": True,
+    }
+    if tokens is not None:
+        meta["tokens"] = tokens
     return {
         "query": query,
-        "intent": {
-            "type": intent.query_type,
-            "category": intent.category,
-            "scope": intent.scope,
-        },
+        "intent": format_intent(intent),
         "project_context": project_context,
         "principles": principles,
         "related_context": related_context,
-        "meta": {
-            "storage1_count": len(storage1_results),
-            "storage2_count": len(storage2_primary),
-            "related_categories": list(storage2_related.keys()),
-            "has_project_context": len(project_context) > 0,
-            "orchestrator_ready": True,
-        },
+        "meta": meta,
     }
 
 
+async def _timed(timings: dict[str, float], stage: str, coro: Awaitable[T]) -> T:
+    start = time.perf_counter()
+    try:
+        with span(stage):
+            return await coro
+    finally:
+        timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+
+
+def _critical_path(timings: dict[str, float]) -> dict[str, float]:
+    """Compare the measured wall time with what the strictly sequential
+    classify → embed → search → merge pipeline would have cost."""
+    sequential = (
+        timings.get("detect_project", 0.0)
+        + timings.get("classify", 0.0)
+        + timings.get("embed", 0.0)
+        + max(timings.get("storage1", 0.0), timings.get("storage2", 0.0) + timings.get("rerank", 0.0))
+        + timings.get("merge", 0.0)
+    )
+    return {
+        "sequential_ms": round(sequential, 1),
+        "speculative_ms": timings.get("total", 0.0),
+    }
+
+
+async def _detect_project(query: str, missing: list[str]) -> Optional[str]:
+    try:
+        return await within_deadline(detect_project_from_query(query))
+    except DeadlineExceeded:
+        missing.append("project")
+        return None
+
+
 async def orchestrate_query(
     query: str,
     project_id: Optional[str] = None,
     category_hint: Optional[str] = None,
     limit: int = 10,
+    max_tokens: Optional[int] = None,
+    deadline_ms: Optional[int] = None,
 ) -> dict:
+    result: dict = {"error": "query produced no result", "success": False, "query": query}
+    async for stage, payload in stream_query(query, project_id, category_hint, limit, max_tokens, deadline_ms):
+        if stage in ("result", "error"):
+            result = payload
+    return result
+
+
+async def stream_query(
+    query: str,
+    project_id: Optional[str] = None,
+    category_hint: Optional[str] = None,
+    limit: int = 10,
+    max_tokens: Optional[int] = None,
+    deadline_ms: Optional[int] = None,
+) -> AsyncIterator[tuple[str, dict]]:
+    """Progressive query pipeline; orchestrate_query is this with only the
+    final stage kept.
+
+    Yields ``(stage, payload)`` pairs as soon as each source answers:
+    ``intent``, ``project_context`` and ``principles`` in completion order,
+    then a final ``result`` whose ``meta`` carries per-stage timings. On
+    failure a single ``error`` stage is yielded instead. The partial stages
+    use the fixed format; max_tokens applies to the final result.
+
+    Nothing waits on the intent classifier except the category step: the
+    query is embedded, chunks are searched and a category-agnostic pool of
+    principles is fetched while the LLM call is in flight, and the
+    classified category is then applied to that pool as a filter.
+
+    Everything runs under one deadline (deadline_ms, default
+    QUERY_DEADLINE_MS; 0 for none), which every upstream call sees. The
+    embedding and both searches are hedged. When the deadline passes the
+    result is built from what has answered: a missing intent falls back to
+    the category-agnostic one, missing sections are left empty, and
+    ``meta["degraded"]`` lists what is missing. A classifier failure is
+    treated the same way as a late classifier.
+    """
+    timings: dict[str, float] = {}
+    started = time.perf_counter()
+    pending: set[asyncio.Task] = set()
+    missing: list[str] = []
+    if deadline_ms is None:
+        deadline_ms = config.QUERY_DEADLINE_MS
+    # stream_query yields, so it cannot hold `with deadline()` open; its
+    # tasks run in a context that carries the deadline instead
+    ctx = deadline_context(deadline_ms / 1000 if deadline_ms else None)
     try:
-        intent = await classify_with_project_detection(query, project_id)
+        embedding_task = asyncio.create_task(
+            _timed(timings, "embed", hedged("embed", lambda: generate_embedding(query))), context=ctx,
+        )
+        pending = {embedding_task}
+        if not project_id:
+            project_id = await asyncio.create_task(
+                _timed(timings, "detect_project", _detect_project(query, missing)), context=ctx,
+            )
+
+        async def run_classifier() -> Intent:
+            try:
+                intent = await classify_intent(query, project_id_hint=project_id)
+            except (DeadlineExceeded, UpstreamLLMError) as exc:
+                # The searches do not depend on it; fall back to the hint
+                logger.warning("stream_query: classification unavailable, using hint: %s", exc)
+                missing.append("intent")
+                return dataclasses.replace(seed_intent, category=category_hint or seed_intent.category)
+            if category_hint and intent.category == "other":
+                intent.category = category_hint
+            return intent
+
+        seed_intent = Intent(
+            query_type="general",
+            category="other",
+            scope="general",
+            project_id=project_id,
+            confidence=0.0,
+            query_text=query,
+        )
+        intent_task = asyncio.create_task(_timed(timings, "classify", run_classifier()), context=ctx)
+
+        async def run_storage1() -> list[dict]:
+            embedding = await embedding_task
+            return await _timed(timings, "storage1", hedged("storage1", lambda: query_storage1_filtered(
+                seed_intent, min_similarity=0.1, limit=limit, embedding=embedding, with_embeddings=True,
+            )))
+
+        async def run_candidates() -> list[dict]:
+            embedding = await embedding_task
+            return await _timed(timings, "storage2", hedged("storage2", lambda: query_storage2_candidates(
+                seed_intent, embedding=embedding, with_embeddings=True,
+            )))
+
+        async def run_storage2() -> dict:
+            candidates = await candidates_task
+            intent = await intent_task
+            # Twice the payload budget, so format_principles has room to diversify
+            return await _timed(timings, "rerank", select_by_category(
+                candidates, intent, embedding=embedding_task.result(), limit=CONTEXT_ITEMS * 2,
+            ))
+
+        storage1_task = asyncio.create_task(run_storage1(), context=ctx)
+        candidates_task = asyncio.create_task(run_candidates(), context=ctx)
+        storage2_task = asyncio.create_task(run_storage2(), context=ctx)
+        pending = {embedding_task, intent_task, storage1_task, candidates_task, storage2_task}
 
-        if category_hint and intent.category == "other":
-            intent.category = category_hint
+        while storage1_task in pending or storage2_task in pending or intent_task in pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=ctx.run(remaining), return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                break  # deadline
+            for task in done:
+                result = task.result()
+                if task is intent_task:
+                    if "intent" not in missing:
+                        yield "intent", format_intent(result)
+                elif task is storage1_task:
+                    yield "project_context", {"project_context": format_project_context(result)}
+                elif task is storage2_task:
+                    yield "principles", {
+                        "principles": format_principles(result["primary"]),
+                        "related_context": format_related_context(result["related"]),
+                    }
 
-        storage1_task = query_storage1_filtered(intent, min_similarity=0.1, limit=limit)
-        storage2_task = query_storage2_with_expansions(intent)
-        results = await asyncio.gather(storage1_task, storage2_task)
+        for task in pending:
+            task.cancel()
 
-        storage1_results = results[0]
-        storage2_data = results[1]
+        if intent_task.done():
+            intent = intent_task.result()
+        else:
+            missing.append("intent")
+            intent = dataclasses.replace(seed_intent, category=category_hint or seed_intent.category)
+        if storage1_task.done():
+            storage1_results = storage1_task.result()
+        else:
+            missing.append("project_context")
+            storage1_results = []
+        if storage2_task.done():
+            storage2_data = storage2_task.result()
+        elif candidates_task.done():
+            # The pool is in but its ranking was late: rank it here, without
+            # the fallback search, since the deadline has passed
+            storage2_data = await select_by_category(
+                candidates_task.result(), intent,
+                embedding=embedding_task.result(), limit=CONTEXT_ITEMS * 2, search=False,
+            )
+        else:
+            missing.append("principles")
+            storage2_data = {"primary": [], "related": {}}
 
-        return await merge_and_format(
+        merged = await _timed(timings, "merge", merge_and_format(
             query,
             intent,
             storage1_results,
             storage2_data["primary"],
             storage2_data["related"],
-        )
+            max_tokens,
+        ))
+        timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+        merged["meta"]["timings_ms"] = timings
+        merged["meta"]["critical_path"] = _critical_path(timings)
+        if missing:
+            merged["meta"]["degraded"] = {"deadline_ms": deadline_ms, "missing": missing}
+        yield "result", merged
     except Exception as exc:
-        logger.error("orchestrate_query failed: %s", exc)
-        return {"error": str(exc), "success": False, "query": query}
+        logger.error("stream_query failed: %s", exc)
+        yield "error", {"error": str(exc), "success": False, "query": query}
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+MAX_BATCH_QUERIES = 32
+
+
+async def orchestrate_queries(
+    queries: list[dict],
+    limit: int = 10,
+    max_tokens: Optional[int] = None,
+    deadline_ms: Optional[int] = None,
+) -> dict:
+    """orchestrate_query for several queries, sharing the upstream work.
+
+    Each entry of `queries` is ``{"query", "project_id"?, "category"?}``.
+    Projects are read once for detection, all queries are classified in one
+    LLM call and embedded in one batch, and the chunk and principle searches
+    each take one batched round trip (or one batched product on the search
+    cache), so the cost grows well below linearly with the batch size.
+    Classification overlaps the embedding and both searches, as in
+    stream_query.
+
+    Returns ``{"results": [...], "meta": {...}}`` with one orchestrate_query
+    result per query, in order, and the timings shared by the batch in meta.
+    When the classifier fails or misses the deadline, the queries fall back
+    to their category hints and ``meta["degraded"]`` says so; the searches
+    do not depend on it.
+    """
+    timings: dict[str, float] = {}
+    started = time.perf_counter()
+    texts = [q["query"] for q in queries]
+    missing: list[str] = []
+    if deadline_ms is None:
+        deadline_ms = config.QUERY_DEADLINE_MS
+    pending: list[asyncio.Task] = []
+    try:
+        with deadline(deadline_ms / 1000 if deadline_ms else None):
+            embed_task = asyncio.create_task(_timed(timings, "embed", generate_embeddings_batch(texts)))
+            pending.append(embed_task)
+            project_ids = [q.get("project_id") for q in queries]
+            undetected = [i for i, pid in enumerate(project_ids) if not pid]
+            if undetected:
+                detected = await _timed(timings, "detect_project", detect_projects_from_queries(
+                    [texts[i] for i in undetected]))
+                for i, pid in zip(undetected, detected):
+                    project_ids[i] = pid
+
+            seeds = [
+                Intent(query_type="general", category="other", scope="general",
+                       project_id=pid, confidence=0.0, query_text=text)
+                for text, pid in zip(texts, project_ids)
+            ]
+            intents_task = asyncio.create_task(_timed(timings, "classify", classify_intents(texts, project_ids)))
+            pending.append(intents_task)
+
+            embeddings = await within_deadline(embed_task)
+            storage1, candidates = await within_deadline(asyncio.gather(
+                _timed(timings, "storage1", query_storage1_batch(
+                    seeds, embeddings, min_similarity=0.1, limit=limit, with_embeddings=True,
+                )),
+                _timed(timings, "storage2", query_storage2_candidates_batch(
+                    seeds, embeddings, with_embeddings=True,
+                )),
+            ))
+
+            try:
+                intents = await within_deadline(intents_task)
+            except (DeadlineExceeded, UpstreamLLMError) as exc:
+                logger.warning("orchestrate_queries: classification unavailable, using hints: %s", exc)
+                missing.append("intent")
+                intents = [dataclasses.replace(seed) for seed in seeds]
+            for intent, q in zip(intents, queries):
+                if q.get("category") and intent.category == "other":
+                    intent.category = q["category"]
+
+            # Twice the payload budget, so format_principles has room to diversify
+            principles = await _timed(timings, "rerank", asyncio.gather(*[
+                select_by_category(pool, intent, embedding=embedding, limit=CONTEXT_ITEMS * 2)
+                for pool, intent, embedding in zip(candidates, intents, embeddings)
+            ]))
+            results = await _timed(timings, "merge", asyncio.gather(*[
+                merge_and_format(text, intent, chunks, found["primary"], found["related"], max_tokens)
+                for text, intent, chunks, found in zip(texts, intents, storage1, principles)
+            ]))
+    except DeadlineExceeded:
+        return {"error": f"batch did not finish within {deadline_ms} ms", "success": False, "queries": texts}
+    except Exception as exc:
+        logger.error("orchestrate_queries failed: %s", exc)
+        return {"error": str(exc), "success": False, "queries": texts}
+    finally:
+        for task in pending:
+            task.cancel()
+
+    timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+    meta: dict = {
+        "queries": len(queries),
+        "timings_ms": timings,
+        "per_query_ms": round(timings["total"] / len(queries), 1),
+    }
+    if missing:
+        meta["degraded"] = {"deadline_ms": deadline_ms, "missing": missing}
+    return {"results": results, "meta": meta}
@@ -0,0 +1,232 @@
+"""Token-budgeted packing of query results (contextflow_query max_tokens).
+
+Without a budget merge_and_format returns a fixed five items per section,
+each cut to 300 characters. With one, pack_context spends the budget where
+it buys the most relevance:
+
+- adjacent chunks of one document (consecutive chunk_index) are merged into
+  one passage, dropping the overlap the chunker repeats between them;
+- every chunk passage, principle and related principle becomes a candidate
+  entry valued by its relevance, and entries are taken greedily by
+  relevance per token;
+- an entry that no longer fits is cut at the last sentence boundary that
+  does, rather than mid-word.
+
+Token counts use tiktoken when installed and a 4-characters-per-token
+estimate otherwise; either way the count covers the entry as serialized
+JSON, so the reported total tracks what the client actually receives.
+"""
+from __future__ import annotations
+
+import json
+import math
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+try:
+    import tiktoken
+except ImportError:  # estimate instead
+    tiktoken = None
+
+_encoding = None
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+# Related principles are context around the answer, not the answer
+RELATED_WEIGHT = 0.5
+# Longest repeated prefix looked for when merging adjacent chunks
+_MAX_OVERLAP = 200
+
+
+def count_tokens(text: str) -> int:
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        return len(_encoding.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def _entry_tokens(entry: dict) -> int:
+    return count_tokens(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+def trim_to_sentences(text: str, fits: Callable[[str], bool]) -> Optional[str]:
+    """Longest prefix of `text` ending at a sentence boundary that `fits`."""
+    ends = [m.start() for m in _SENTENCE_END_RE.finditer(text)] + [len(text)]
+    best = None
+    lo, hi = 0, len(ends) - 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        candidate = text[: ends[mid]].rstrip()
+        if candidate and fits(candidate):
+            best = candidate
+            lo = mid + 1
+        else:
+            hi = mid - 1
+    return best
+
+
+def _join_overlapping(a: str, b: str) -> str:
+    for k in range(min(len(a), len(b), _MAX_OVERLAP), 19, -1):
+        if a.endswith(b[:k]):
+            return a + b[k:]
+    return a + "\n\n" + b
+
+
+def merge_adjacent_chunks(chunks: list[dict]) -> list[dict]:
+    """Merge runs of consecutive chunk_index within a document.
+
+    The merged chunk keeps the first chunk's metadata, the best similarity
+    and the sum of the scores of its parts.
+    """
+    by_document: dict[Any, list[dict]] = {}
+    for chunk in chunks:
+        by_document.setdefault(chunk.get("document_id"), []).append(chunk)
+
+    merged: list[dict] = []
+    for document_id, parts in by_document.items():
+        if document_id is None:
+            merged.extend(parts)
+            continue
+        parts = sorted(parts, key=lambda c: c.get("chunk_index") or 0)
+        run = dict(parts[0])
+        for part in parts[1:]:
+            last = run.get("chunk_index_end", run.get("chunk_index"))
+            if last is not None and part.get("chunk_index") == last + 1:
+                run["content"] = _join_overlapping(run.get("content") or "", part.get("content") or "")
+                run["chunk_index_end"] = part.get("chunk_index")
+                run["score"] = float(run.get("score") or 0.0) + float(part.get("score") or 0.0)
+                run["similarity"] = max(float(run.get("similarity") or 0.0), float(part.get("similarity") or 0.0))
+            else:
+                merged.append(run)
+                run = dict(part)
+        merged.append(run)
+    return merged
+
+
+@dataclass
+class _Candidate:
+    section: str
+    order: int  # position in its source list, for stable ties
+    relevance: float
+    entry: dict
+    category: Optional[str] = None
+    tokens: int = 0
+
+
+@dataclass
+class PackedContext:
+    project_context: list[dict]
+    principles: list[dict]
+    related_context: dict[str, list[dict]]
+    tokens_used: int
+    truncated: int = 0
+    dropped: int = 0
+    merged: int = 0
+
+
+def _scaled(values: list[float]) -> list[float]:
+    top = max(values, default=0.0)
+    return [max(v, 0.0) / top if top > 0 else 1.0 for v in values]
+
+
+def _chunk_entry(chunk: dict) -> dict:
+    return {
+        "project_name": chunk.get("project_name"),
+        "filename": chunk.get("filename"),
+        "section": chunk.get("section_title"),
+        "content": chunk.get("content") or "",
+        "similarity": float(chunk.get("similarity", 0.0)),
+        "doc_category": chunk.get("doc_category"),
+    }
+
+
+def _principle_entry(p: dict) -> dict:
+    return {
+        "content": p.get("content") or "",
+        "type": p.get("type"),
+        "category": p.get("category"),
+        "source": p.get("source"),
+        "confidence": float(p.get("confidence_score", 0.0)),
+        "when_to_use": p.get("when_to_use"),
+        "when_not_to_use": p.get("when_not_to_use"),
+        "similarity": float(p.get("similarity", 0.0)),
+    }
+
+
+def pack_context(
+    storage1_results: list[dict],
+    storage2_primary: list[dict],
+    storage2_related: dict[str, list[dict]],
+    max_tokens: int,
+) -> PackedContext:
+    """Fill `max_tokens` with the most relevant context per token."""
+    chunks = merge_adjacent_chunks(storage1_results)
+    candidates: list[_Candidate] = []
+
+    for order, (chunk, rel) in enumerate(zip(chunks, _scaled([float(c.get("score") or 0.0) for c in chunks]))):
+        candidates.append(_Candidate("project_context", order, rel, _chunk_entry(chunk)))
+
+    # A principle is as useful as it is relevant to the query and trusted
+    principle_scores = _scaled([float(p.get("score") or p.get("similarity") or 0.0) for p in storage2_primary])
+    for order, (p, rel) in enumerate(zip(storage2_primary, principle_scores)):
+        confidence = float(p.get("confidence_score", 0.0))
+        candidates.append(_Candidate("principles", order, rel * confidence, _principle_entry(p)))
+
+    order = 0
+    for category, items in storage2_related.items():
+        for item in items:
+            entry = {"content": item.get("content") or "", "confidence": float(item.get("confidence_score", 0.0))}
+            candidates.append(_Candidate(
+                "related_context", order, RELATED_WEIGHT * entry["confidence"], entry, category=category,
+            ))
+            order += 1
+
+    for c in candidates:
+        c.tokens = _entry_tokens(c.entry)
+    candidates.sort(key=lambda c: (c.relevance / max(c.tokens, 1), c.relevance), reverse=True)
+
+    remaining = max_tokens
+    chosen: list[_Candidate] = []
+    truncated = dropped = 0
+    for c in candidates:
+        if c.relevance <= 0:
+            dropped += 1
+            continue
+        if c.tokens <= remaining:
+            chosen.append(c)
+            remaining -= c.tokens
+            continue
+        overhead = _entry_tokens({**c.entry, "content": "", "truncated": True})
+        trimmed = None
+        if overhead < remaining:
+            budget = remaining - overhead
+            trimmed = trim_to_sentences(
+                c.entry["content"], lambda text: count_tokens(json.dumps(text, ensure_ascii=False)) <= budget,
+            )
+        entry = {**c.entry, "content": trimmed, "truncated": True} if trimmed else None
+        if entry is None or _entry_tokens(entry) > remaining:
+            dropped += 1
+            continue
+        c.entry = entry
+        c.tokens = _entry_tokens(entry)
+        chosen.append(c)
+        remaining -= c.tokens
+        truncated += 1
+
+    # Present each section in relevance order, whatever order it was packed in
+    chosen.sort(key=lambda c: (-c.relevance, c.order))
+    related: dict[str, list[dict]] = {}
+    for c in chosen:
+        if c.section == "related_context":
+            related.setdefault(c.category, []).append(c.entry)
+
+    return PackedContext(
+        project_context=[c.entry for c in chosen if c.section == "project_context"],
+        principles=[c.entry for c in chosen if c.section == "principles"],
+        related_context=related,
+        tokens_used=max_tokens - remaining,
+        truncated=truncated,
+        dropped=dropped,
+        merged=len(storage1_results) - len(chunks),
+    )
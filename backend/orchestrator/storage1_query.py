@@ -1,52 +1,123 @@
 from __future__ import annotations
 
 import logging
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from typing import Optional
 
+from orchestrator.diversify import parse_compact_embedding
 from orchestrator.intent_classifier import Intent
-from utils.embeddings import generate_embedding
-from utils.supabase_client import get_client
+from utils.embeddings import (
+    EMBEDDING_PROFILE,
+    _vector_literal,
+    generate_embedding,
+    generate_embeddings_batch,
+    is_retired,
+    version_tag,
+)
+from utils.supabase_client import _run, get_client
+from utils import search_cache
 from utils.config import MVP_USER_ID
+from utils.tracing import span
 
 logger = logging.getLogger("contextflow")
 
 
-async def query_storage1(intent: Intent, limit: int = 10) -> list[dict]:
+def _search_text(intent: Intent) -> str:
+    return intent.query_text or f"{intent.category} {intent.query_type}"
+
+
+def _search_params(
+    intent: Intent,
+    query_text: str,
+    embedding: list[float],
+    limit: int,
+    with_embeddings: bool,
+) -> dict:
+    return {
+        "query_text": query_text,
+        "query_embedding": list(embedding),
+        "user_id_filter": MVP_USER_ID,
+        "project_id_filter": str(intent.project_id) if intent.project_id else None,
+        "match_count": limit,
+        "embedding_version_filter": version_tag(embedding),
+        "return_embeddings": with_embeddings,
+    }
+
+
+def _result(row: dict, with_embeddings: bool) -> dict:
+    return {
+        "id": row.get("id"),
+        "content": row.get("content"),
+        "chunk_type": row.get("chunk_type"),
+        "section_title": row.get("section_title"),
+        "chunk_index": row.get("chunk_index"),
+        "document_id": row.get("document_id"),
+        "filename": row.get("filename"),
+        "doc_category": row.get("doc_category"),
+        "project_id": row.get("project_id"),
+        "project_name": row.get("project_name"),
+        "similarity": float(row.get("similarity") or 0.0),
+        "text_rank": float(row.get("text_rank") or 0.0),
+        "score": float(row.get("score") or 0.0),
+        **({"compact_embedding": parse_compact_embedding(row.get("compact_embedding"))}
+           if with_embeddings else {}),
+    }
+
+
+def _relevant(chunks: list[dict], min_similarity: float, limit: int) -> list[dict]:
+    # Full-text hits are kept even when their vector similarity is low:
+    # an exact keyword match is exactly what the semantic side misses.
+    filtered = [
+        c for c in chunks
+        if c.get("similarity", 0.0) >= min_similarity or c.get("text_rank", 0.0) > 0.0
+    ]
+    filtered.sort(key=lambda c: c.get("score", 0.0), reverse=True)
+    return filtered[:limit]
+
+
+def _vector_hits(rows: list[dict]) -> bool:
+    return any(row.get("similarity") for row in rows)
+
+
+async def _search(
+    intent: Intent,
+    query_text: str,
+    embedding: list[float],
+    limit: int,
+    with_embeddings: bool,
+) -> list[dict]:
+    params = _search_params(intent, query_text, embedding, limit, with_embeddings)
+    rows = await search_cache.search("hybrid_search_document_chunks", params)
+    if rows is None:
+        client = get_client()
+        with span("rpc_search_chunks"):
+            rpc = client.rpc(EMBEDDING_PROFILE.search_rpc("hybrid_search_document_chunks"), params)
+            response = await _run(rpc.execute)
+        rows = response.data if response.data else []
+    return rows
+
+
+async def query_storage1(
+    intent: Intent,
+    limit: int = 10,
+    embedding: Optional[list[float]] = None,
+    with_embeddings: bool = False,
+) -> list[dict]:
     try:
-        query_text = f"{intent.category} {intent.query_type} {intent.query_type}"
-        embedding = await generate_embedding(query_text)
+        query_text = _search_text(intent)
+        if embedding is None:
+            embedding = await generate_embedding(query_text)
         if not embedding:
             logger.warning("query_storage1: generate_embedding returned empty")
             return []
 
-        client = get_client()
-        embedding_list = list(embedding)
-        response = client.rpc("search_document_chunks", {
-            "query_embedding": embedding_list,
-            "user_id_filter": MVP_USER_ID,
-            "project_id_filter": str(intent.project_id) if intent.project_id else None,
-            "match_count": limit,
-        }).execute()
-        rows = response.data if response.data else []
+        rows = await _search(intent, query_text, embedding, limit, with_embeddings)
+        if not _vector_hits(rows) and await is_retired(embedding):
+            # Another process cut over to a new version since this one read them
+            embedding = await generate_embedding(query_text)
+            rows = await _search(intent, query_text, embedding, limit, with_embeddings)
 
-        results = [
-            {
-                "id": row.get("id"),
-                "content": row.get("content"),
-                "chunk_type": row.get("chunk_type"),
-                "section_title": row.get("section_title"),
-                "filename": row.get("filename"),
-                "doc_category": row.get("doc_category"),
-                "project_id": row.get("project_id"),
-                "project_name": row.get("project_name"),
-                "similarity": float(row.get("similarity", 0.0)),
-            }
-            for row in rows
-        ]
+        results = [_result(row, with_embeddings) for row in rows]
 
         logger.info("query_storage1: returned %d chunks", len(results))
         return results
@@ -60,17 +131,82 @@ async def query_storage1_filtered(
     intent: Intent,
     min_similarity: float = 0.3,
     limit: int = 10,
+    embedding: Optional[list[float]] = None,
+    with_embeddings: bool = False,
 ) -> list[dict]:
     try:
-        chunks = await query_storage1(intent, limit=limit * 2)
-        filtered = [c for c in chunks if c.get("similarity", 0.0) >= min_similarity]
-        filtered.sort(key=lambda c: c.get("similarity", 0.0), reverse=True)
-        return filtered[:limit]
+        chunks = await query_storage1(
+            intent, limit=limit * 2, embedding=embedding, with_embeddings=with_embeddings,
+        )
+        return _relevant(chunks, min_similarity, limit)
     except Exception as exc:
         logger.error("query_storage1_filtered failed: %s", exc)
         return []
 
 
+async def _search_batch(
+    intents: list[Intent],
+    embeddings: list[list[float]],
+    limit: int,
+    with_embeddings: bool,
+) -> tuple[list[list[dict]], int]:
+    """Rows per query, and how many queries went to the database."""
+    params = [
+        _search_params(intent, _search_text(intent), embedding, limit * 2, with_embeddings)
+        for intent, embedding in zip(intents, embeddings)
+    ]
+    rows = await search_cache.search_many("hybrid_search_document_chunks", params)
+    missing = [i for i, r in enumerate(rows) if r is None]
+    if missing:
+        client = get_client()
+        batch = {
+            "query_texts": [params[i]["query_text"] for i in missing],
+            "query_embeddings": [_vector_literal(params[i]["query_embedding"]) for i in missing],
+            "user_id_filter": MVP_USER_ID,
+            "project_id_filters": [params[i]["project_id_filter"] for i in missing],
+            "match_count": limit * 2,
+            "embedding_version_filter": params[missing[0]]["embedding_version_filter"],
+            "return_embeddings": with_embeddings,
+        }
+        with span("rpc_search_chunks_batch"):
+            rpc = client.rpc(EMBEDDING_PROFILE.search_rpc("hybrid_search_document_chunks_batch"), batch)
+            response = await _run(rpc.execute)
+        for i in missing:
+            rows[i] = []
+        for row in response.data or []:
+            rows[missing[row["query_index"]]].append(row)
+    return rows, len(missing)
+
+
+async def query_storage1_batch(
+    intents: list[Intent],
+    embeddings: list[list[float]],
+    min_similarity: float = 0.3,
+    limit: int = 10,
+    with_embeddings: bool = False,
+) -> list[list[dict]]:
+    """query_storage1_filtered for several queries at once, one embedding
+    each. Queries the search cache holds are answered there in one batched
+    product; the rest go to the database in one batch RPC (migration 013).
+    A failure leaves every query without chunks, as query_storage1 does."""
+    try:
+        rows, from_db = await _search_batch(intents, embeddings, limit, with_embeddings)
+        if embeddings and not all(_vector_hits(r) for r in rows) and await is_retired(embeddings[0]):
+            embeddings = await generate_embeddings_batch([_search_text(intent) for intent in intents])
+            rows, from_db = await _search_batch(intents, embeddings, limit, with_embeddings)
+
+        results = [
+            _relevant([_result(row, with_embeddings) for row in query_rows], min_similarity, limit)
+            for query_rows in rows
+        ]
+        logger.info("query_storage1_batch: %d queries, %d from the database", len(intents), from_db)
+        return results
+
+    except Exception as exc:
+        logger.error("query_storage1_batch failed: %s", exc)
+        return [[] for _ in intents]
+
+
 def group_chunks_by_project(chunks: list[dict]) -> dict[str, list[dict]]:
     grouped: dict[str, list[dict]] = {}
     for chunk in chunks:
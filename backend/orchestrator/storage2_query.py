@@ -1,16 +1,25 @@
 from __future__ import annotations
 
-import asyncio
 import copy
+import dataclasses
 import logging
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from typing import Optional
+
+from orchestrator.diversify import parse_compact_embedding
 from orchestrator.intent_classifier import Intent
-from utils.embeddings import generate_embedding
+from utils.embeddings import (
+    EMBEDDING_PROFILE,
+    _vector_literal,
+    generate_embedding,
+    generate_embeddings_batch,
+    is_retired,
+    version_tag,
+)
+from utils import search_cache
 from utils.config import MVP_USER_ID
-from utils.supabase_client import get_client
+from utils.supabase_client import _run, get_client
+from utils.tracing import span
 
 logger = logging.getLogger("contextflow")
 
@@ -30,46 +39,93 @@ QUERY_EXPANSIONS: dict[str, list[str]] = {
 }
 
 
+def _search_text(intent: Intent) -> str:
+    return intent.query_text or f"{intent.category} {intent.query_type} best practices"
+
+
+def _search_params(
+    intent: Intent,
+    embedding: list[float],
+    min_confidence: float,
+    limit: int,
+    with_embeddings: bool,
+) -> dict:
+    return {
+        "query_text": _search_text(intent),
+        "query_embedding": list(embedding),
+        "user_id_filter": MVP_USER_ID,
+        "min_confidence": min_confidence,
+        "category_filter": intent.category if intent.category != "other" else None,
+        "match_count": limit,
+        "embedding_version_filter": version_tag(embedding),
+        "return_embeddings": with_embeddings,
+    }
+
+
+def _result(row: dict, with_embeddings: bool) -> dict:
+    return {
+        "id": row.get("id"),
+        "content": row.get("content"),
+        "type": row.get("type"),
+        "category": row.get("category"),
+        "source": row.get("source"),
+        "confidence_score": float(row.get("confidence_score", 0.0)),
+        "times_applied": row.get("times_applied"),
+        "when_to_use": row.get("when_to_use"),
+        "when_not_to_use": row.get("when_not_to_use"),
+        "reasoning": row.get("reasoning"),
+        "tradeoffs": row.get("tradeoffs"),
+        "similarity": float(row.get("similarity") or 0.0),
+        "text_rank": float(row.get("text_rank") or 0.0),
+        "score": float(row.get("score") or 0.0),
+        **({"compact_embedding": parse_compact_embedding(row.get("compact_embedding"))}
+           if with_embeddings else {}),
+    }
+
+
+def _vector_hits(rows: list[dict]) -> bool:
+    return any(row.get("similarity") for row in rows)
+
+
+async def _search(
+    intent: Intent,
+    embedding: list[float],
+    min_confidence: float,
+    limit: int,
+    with_embeddings: bool,
+) -> list[dict]:
+    params = _search_params(intent, embedding, min_confidence, limit, with_embeddings)
+    rows = await search_cache.search("hybrid_search_principles", params)
+    if rows is None:
+        client = get_client()
+        with span("rpc_search_principles"):
+            rpc = client.rpc(EMBEDDING_PROFILE.search_rpc("hybrid_search_principles"), params)
+            response = await _run(rpc.execute)
+        rows = response.data if response.data else []
+    return rows
+
+
 async def query_storage2(
     intent: Intent,
     min_confidence: float = 0.5,
     limit: int = 5,
+    embedding: Optional[list[float]] = None,
+    with_embeddings: bool = False,
 ) -> list[dict]:
     try:
-        query_text = f"{intent.category} {intent.query_type} best practices"
-        embedding = await generate_embedding(query_text)
+        if embedding is None:
+            embedding = await generate_embedding(_search_text(intent))
         if not embedding:
             logger.warning("query_storage2: generate_embedding returned empty for category=%s", intent.category)
             return []
 
-        client = get_client()
-        embedding_list = list(embedding)
-        response = client.rpc("search_principles", {
-            "query_embedding": embedding_list,
-            "user_id_filter": MVP_USER_ID,
-            "min_confidence": min_confidence,
-            "category_filter": intent.category if intent.category != "other" else None,
-            "match_count": limit,
-        }).execute()
-        rows = response.data if response.data else []
+        rows = await _search(intent, embedding, min_confidence, limit, with_embeddings)
+        if not _vector_hits(rows) and await is_retired(embedding):
+            # Another process cut over to a new version since this one read them
+            embedding = await generate_embedding(_search_text(intent))
+            rows = await _search(intent, embedding, min_confidence, limit, with_embeddings)
 
-        results = [
-            {
-                "id": row.get("id"),
-                "content": row.get("content"),
-                "type": row.get("type"),
-                "category": row.get("category"),
-                "source": row.get("source"),
-                "confidence_score": float(row.get("confidence_score", 0.0)),
-                "times_applied": row.get("times_applied"),
-                "when_to_use": row.get("when_to_use"),
-                "when_not_to_use": row.get("when_not_to_use"),
-                "reasoning": row.get("reasoning"),
-                "tradeoffs": row.get("tradeoffs"),
-                "similarity": float(row.get("similarity", 0.0)),
-            }
-            for row in rows
-        ]
+        results = [_result(row, with_embeddings) for row in rows]
 
         logger.info("query_storage2: category=%s returned %d principles", intent.category, len(results))
         return results
@@ -83,50 +139,133 @@ async def _query_single_category(
     intent: Intent,
     category: str,
     limit_per_category: int,
+    embedding: Optional[list[float]] = None,
 ) -> tuple[str, list[dict]]:
     modified = copy.copy(intent)
     modified.category = category
-    results = await query_storage2(modified, min_confidence=0.6, limit=limit_per_category)
+    results = await query_storage2(
+        modified, min_confidence=0.6, limit=limit_per_category, embedding=embedding,
+    )
     return category, results
 
 
-async def query_related_categories(
+async def query_storage2_candidates(
     intent: Intent,
-    limit_per_category: int = 3,
-) -> dict[str, list[dict]]:
-    try:
-        related_categories = QUERY_EXPANSIONS.get(intent.category, [])[:3]
-        if not related_categories:
-            return {}
-
-        tasks = [
-            _query_single_category(intent, cat, limit_per_category)
-            for cat in related_categories
-        ]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        grouped: dict[str, list[dict]] = {}
-        for result in results:
-            if isinstance(result, Exception):
-                logger.error("query_related_categories task failed: %s", result)
-                continue
-            category, principles = result
-            if principles:
-                grouped[category] = principles
-
-        return grouped
+    embedding: Optional[list[float]] = None,
+    min_confidence: float = 0.5,
+    limit: int = 30,
+    with_embeddings: bool = False,
+) -> list[dict]:
+    """Category-agnostic principle search. Needs only the query embedding,
+    so it can start before the intent classifier has answered; the category
+    is applied afterwards by select_by_category."""
+    agnostic = copy.copy(intent)
+    agnostic.category = "other"
+    return await query_storage2(
+        agnostic, min_confidence=min_confidence, limit=limit, embedding=embedding,
+        with_embeddings=with_embeddings,
+    )
 
-    except Exception as exc:
-        logger.error("query_related_categories failed: %s", exc)
-        return {}
+
+async def _search_batch(
+    intents: list[Intent],
+    embeddings: list[list[float]],
+    min_confidence: float,
+    limit: int,
+    with_embeddings: bool,
+) -> tuple[list[list[dict]], int]:
+    """Rows per query, and how many queries went to the database."""
+    params = [
+        _search_params(intent, embedding, min_confidence, limit, with_embeddings)
+        for intent, embedding in zip(intents, embeddings)
+    ]
+    rows = await search_cache.search_many("hybrid_search_principles", params)
+    missing = [i for i, r in enumerate(rows) if r is None]
+    if missing:
+        client = get_client()
+        batch = {
+            "query_texts": [params[i]["query_text"] for i in missing],
+            "query_embeddings": [_vector_literal(params[i]["query_embedding"]) for i in missing],
+            "user_id_filter": MVP_USER_ID,
+            "min_confidence": min_confidence,
+            "category_filters": [params[i]["category_filter"] for i in missing],
+            "match_count": limit,
+            "embedding_version_filter": params[missing[0]]["embedding_version_filter"],
+            "return_embeddings": with_embeddings,
+        }
+        with span("rpc_search_principles_batch"):
+            rpc = client.rpc(EMBEDDING_PROFILE.search_rpc("hybrid_search_principles_batch"), batch)
+            response = await _run(rpc.execute)
+        for i in missing:
+            rows[i] = []
+        for row in response.data or []:
+            rows[missing[row["query_index"]]].append(row)
+    return rows, len(missing)
 
 
-async def query_storage2_with_expansions(intent: Intent) -> dict:
+async def query_storage2_candidates_batch(
+    intents: list[Intent],
+    embeddings: list[list[float]],
+    min_confidence: float = 0.5,
+    limit: int = 30,
+    with_embeddings: bool = False,
+) -> list[list[dict]]:
+    """query_storage2_candidates for several queries at once, one embedding
+    each: from the search cache in one batched product where it can, and
+    otherwise in one batch RPC (migration 013)."""
     try:
-        primary_task = query_storage2(intent)
-        related_task = query_related_categories(intent)
-        primary, related = await asyncio.gather(primary_task, related_task)
-        return {"primary": primary, "related": related}
+        agnostic = [dataclasses.replace(intent, category="other") for intent in intents]
+        rows, from_db = await _search_batch(agnostic, embeddings, min_confidence, limit, with_embeddings)
+        if embeddings and not all(_vector_hits(r) for r in rows) and await is_retired(embeddings[0]):
+            embeddings = await generate_embeddings_batch([_search_text(intent) for intent in agnostic])
+            rows, from_db = await _search_batch(agnostic, embeddings, min_confidence, limit, with_embeddings)
+
+        logger.info("query_storage2_candidates_batch: %d queries, %d from the database", len(intents), from_db)
+        return [[_result(row, with_embeddings) for row in query_rows] for query_rows in rows]
+
     except Exception as exc:
-        logger.error("query_storage2_with_expansions failed: %s", exc)
-        return {"primary": [], "related": {}}
+        logger.error("query_storage2_candidates_batch failed: %s", exc)
+        return [[] for _ in intents]
+
+
+async def select_by_category(
+    candidates: list[dict],
+    intent: Intent,
+    embedding: Optional[list[float]] = None,
+    limit: int = 5,
+    limit_per_category: int = 3,
+    search: bool = True,
+) -> dict:
+    """Split a category-agnostic candidate pool into the
+    ``{"primary", "related"}`` shape the orchestrator merges: the classified
+    category's best principles and, per related category, its own.
+
+    Falls back to a category-filtered search only when the pool holds no
+    principle in the classified category. With search=False (past a
+    deadline) the pool's best principles of any category stand in instead.
+    """
+    ranked = sorted(candidates, key=lambda p: p.get("score", 0.0), reverse=True)
+
+    if intent.category == "other":
+        primary = ranked[:limit]
+    else:
+        primary = [p for p in ranked if p.get("category") == intent.category][:limit]
+        if not primary and not search:
+            primary = ranked[:limit]
+        elif not primary:
+            logger.info("select_by_category: no %s candidates, falling back to filtered search", intent.category)
+            primary = await query_storage2(
+                intent, limit=limit, embedding=embedding,
+                with_embeddings=any("compact_embedding" in p for p in candidates),
+            )
+
+    related: dict[str, list[dict]] = {}
+    for category in QUERY_EXPANSIONS.get(intent.category, [])[:3]:
+        matches = [
+            p for p in ranked
+            if p.get("category") == category and p.get("confidence_score", 0.0) >= 0.6
+        ][:limit_per_category]
+        if matches:
+            related[category] = matches
+
+    return {"primary": primary, "related": related}
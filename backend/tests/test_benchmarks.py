@@ -0,0 +1,46 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.compare import compare
+from benchmarks.fakes import fake_embedding
+from benchmarks.startup import parse_importtime
+
+
+# ── TEST 1: fake embeddings are deterministic and word-overlap aware ──
+def test_fake_embedding_deterministic():
+    a = fake_embedding("rotate refresh tokens on every use")
+    b = fake_embedding("rotate refresh tokens on every use")
+    c = fake_embedding("index foreign keys in postgres")
+    assert a == b
+    assert len(a) == 1536
+    same = sum(x * y for x, y in zip(a, b))
+    different = sum(x * y for x, y in zip(a, c))
+    assert same > 0.99
+    assert different < same
+    print("PASS - fake embeddings deterministic")
+
+
+# ── TEST 2: compare flags regressions in the right direction ──
+def test_compare_flags_regressions():
+    old = {"results": {"query": {"sequential": {"p95_ms": 100.0}, "concurrent_queries_per_s": 50.0}}}
+    new = {"results": {"query": {"sequential": {"p95_ms": 130.0}, "concurrent_queries_per_s": 60.0}}}
+    _, regressions = compare(old, new, threshold_pct=10.0)
+    assert regressions == ["query.sequential.p95_ms"]
+    print("PASS - compare flags latency regression only")
+
+
+# ── TEST 3: -X importtime output is parsed with nesting depth ──
+def test_parse_importtime():
+    stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   _io\n"
+        "import time:       300 |        300 |     json.decoder\n"
+        "import time:       500 |       1800 |   json\n"
+        "import time:      2000 |       4000 | cf\n"
+    )
+    rows = parse_importtime(stderr)
+    assert rows[1] == ("json.decoder", 0.3, 2)
+    assert rows[-1] == ("cf", 4.0, 0)
+    print("PASS - parse importtime")
@@ -0,0 +1,192 @@
+import asyncio
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import deadline as dl
+from utils.deadline import DeadlineExceeded, deadline, deadline_context, hedged, remaining, within_deadline
+
+
+# ── TEST 1: nested deadlines only tighten ──
+def test_deadline_nesting():
+    assert remaining() is None
+    with deadline(10):
+        assert 9 < remaining() <= 10
+        with deadline(60):
+            assert remaining() <= 10
+        with deadline(1):
+            assert remaining() <= 1
+        with deadline(None):
+            assert 9 < remaining() <= 10
+        ctx = deadline_context(2)
+        assert ctx.run(remaining) <= 2 and remaining() > 9
+    assert remaining() is None
+    print("PASS - deadline nesting")
+
+
+# ── TEST 2: awaiting past the deadline raises DeadlineExceeded ──
+def test_within_deadline():
+    async def main():
+        with deadline(0.05):
+            await within_deadline(asyncio.sleep(5))
+
+    started = time.perf_counter()
+    try:
+        asyncio.run(main())
+    except DeadlineExceeded:
+        pass
+    else:
+        raise AssertionError("expected DeadlineExceeded")
+    assert time.perf_counter() - started < 1
+    print("PASS - within deadline")
+
+
+# ── TEST 3: a slow first attempt is hedged and the faster answer wins ──
+def test_hedged_takes_faster_answer():
+    window = dl.latency_window("test-hedge")
+    for _ in range(dl.HEDGE_MIN_SAMPLES):
+        window.observe(0.02)
+    calls = []
+
+    async def call():
+        calls.append(len(calls))
+        await asyncio.sleep(5 if len(calls) == 1 else 0.01)
+        return len(calls)
+
+    started = time.perf_counter()
+    assert asyncio.run(hedged("test-hedge", call)) == 2
+    assert len(calls) == 2 and time.perf_counter() - started < 1
+
+    calls.clear()
+
+    async def fast():
+        calls.append(1)
+        return "ok"
+
+    assert asyncio.run(hedged("test-hedge", fast)) == "ok" and len(calls) == 1
+    print("PASS - hedged takes faster answer")
+
+
+# ── TEST 4: a query past its deadline answers without the late source ──
+def test_stream_query_degrades_at_deadline(monkeypatch):
+    from orchestrator import orchestrator
+    from orchestrator.intent_classifier import Intent
+
+    async def embed(query):
+        return [0.1] * 8
+
+    async def classify(query, project_id_hint=None):
+        return Intent("pattern", "auth", "general", project_id_hint, 0.9, query)
+
+    async def slow_storage1(intent, **kwargs):
+        await asyncio.sleep(5)
+        return []
+
+    async def candidates(intent, **kwargs):
+        return [{"content": "Rotate refresh tokens", "category": "auth", "score": 0.9, "confidence_score": 0.8}]
+
+    monkeypatch.setattr(orchestrator, "generate_embedding", embed)
+    monkeypatch.setattr(orchestrator, "classify_intent", classify)
+    monkeypatch.setattr(orchestrator, "query_storage1_filtered", slow_storage1)
+    monkeypatch.setattr(orchestrator, "query_storage2_candidates", candidates)
+
+    async def main():
+        return [stage async for stage in orchestrator.stream_query("token rotation", project_id="p1", deadline_ms=200)]
+
+    started = time.perf_counter()
+    stages = asyncio.run(main())
+    assert time.perf_counter() - started < 1
+    names = [name for name, _ in stages]
+    assert "project_context" not in names and names[-1] == "result"
+    result = stages[-1][1]
+    assert result["meta"]["degraded"] == {"deadline_ms": 200, "missing": ["project_context"]}
+    assert result["principles"][0]["content"] == "Rotate refresh tokens"
+    assert result["intent"]["category"] == "auth"
+    print("PASS - stream query degrades at deadline")
+
+
+# ── TEST 5: a failed classifier degrades the stream instead of ending it ──
+def test_stream_query_survives_classifier_failure(monkeypatch):
+    from orchestrator import orchestrator
+    from utils.errors import UpstreamLLMError
+
+    async def embed(query):
+        return [0.1] * 8
+
+    async def classify(query, project_id_hint=None):
+        await asyncio.sleep(0.05)
+        raise UpstreamLLMError("classify_intent failed", correlation_id="test")
+
+    async def storage1(intent, **kwargs):
+        return [{"content": "Tokens rotate hourly", "filename": "auth.md", "score": 0.8, "similarity": 0.8}]
+
+    async def candidates(intent, **kwargs):
+        return [
+            {"content": "Rotate refresh tokens", "category": "auth", "score": 0.9, "confidence_score": 0.8},
+            {"content": "Cache sessions", "category": "performance", "score": 0.95, "confidence_score": 0.8},
+        ]
+
+    monkeypatch.setattr(orchestrator, "generate_embedding", embed)
+    monkeypatch.setattr(orchestrator, "classify_intent", classify)
+    monkeypatch.setattr(orchestrator, "query_storage1_filtered", storage1)
+    monkeypatch.setattr(orchestrator, "query_storage2_candidates", candidates)
+
+    async def main():
+        return [stage async for stage in orchestrator.stream_query(
+            "token rotation", project_id="p1", category_hint="auth", deadline_ms=2000,
+        )]
+
+    stages = asyncio.run(main())
+    names = [name for name, _ in stages]
+    assert names[-1] == "result" and "error" not in names and "intent" not in names
+    assert "project_context" in names and "principles" in names
+    result = stages[-1][1]
+    assert result["meta"]["degraded"]["missing"] == ["intent"]
+    assert result["intent"]["category"] == "auth"
+    # The hint still picks the category
+    assert [p["content"] for p in result["principles"]] == ["Rotate refresh tokens"]
+    print("PASS - stream query survives classifier failure")
+
+
+# ── TEST 6: ranking the pool after the deadline starts no search ──
+def test_late_rerank_does_not_search(monkeypatch):
+    from orchestrator import orchestrator, storage2_query
+    searched = []
+
+    async def embed(query):
+        return [0.1] * 8
+
+    async def slow_classify(query, project_id_hint=None):
+        await asyncio.sleep(5)
+
+    async def storage1(intent, **kwargs):
+        return []
+
+    async def candidates(intent, **kwargs):
+        return [{"content": "Rotate refresh tokens", "category": "auth", "score": 0.9, "confidence_score": 0.8}]
+
+    async def search(intent, **kwargs):
+        searched.append(intent.category)
+        return []
+
+    monkeypatch.setattr(orchestrator, "generate_embedding", embed)
+    monkeypatch.setattr(orchestrator, "classify_intent", slow_classify)
+    monkeypatch.setattr(orchestrator, "query_storage1_filtered", storage1)
+    monkeypatch.setattr(orchestrator, "query_storage2_candidates", candidates)
+    monkeypatch.setattr(storage2_query, "query_storage2", search)
+
+    async def main():
+        return [stage async for stage in orchestrator.stream_query(
+            "token rotation", project_id="p1", category_hint="security", deadline_ms=200,
+        )]
+
+    started = time.perf_counter()
+    stages = asyncio.run(main())
+    assert time.perf_counter() - started < 1 and searched == []
+    result = stages[-1][1]
+    assert stages[-1][0] == "result" and result["meta"]["degraded"]["missing"] == ["intent"]
+    # No security principle in the pool: its best principle stands in
+    assert [p["content"] for p in result["principles"]] == ["Rotate refresh tokens"]
+    print("PASS - late rerank does not search")
@@ -0,0 +1,34 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from orchestrator.diversify import mmr_select
+
+
+def _chunk(id_, doc, project, score, vec):
+    return {"id": id_, "document_id": doc, "project_id": project, "score": score, "compact_embedding": vec}
+
+
+# ── TEST 1: near-duplicates lose to a less relevant but distinct result ──
+def test_mmr_prefers_distinct_context():
+    pool = [
+        _chunk("a1", "doc-a", "p1", 0.030, [1.0, 0.0, 0.0]),
+        _chunk("a2", "doc-a", "p1", 0.029, [0.99, 0.14, 0.0]),
+        _chunk("b1", "doc-b", "p1", 0.020, [0.0, 1.0, 0.0]),
+    ]
+    picked = mmr_select(pool, 2)
+    assert [c["id"] for c in picked] == ["a1", "b1"]
+    # Without embeddings MMR degrades to plain relevance order
+    plain = mmr_select([{**c, "compact_embedding": None} for c in pool], 2)
+    assert [c["id"] for c in plain] == ["a1", "a2"]
+    print("PASS - mmr prefers distinct context")
+
+
+# ── TEST 2: caps spread picks, then relax when the pool runs out ──
+def test_mmr_caps_are_soft():
+    pool = [_chunk(f"a{i}", "doc-a", "p1", 1.0 - i * 0.1, None) for i in range(4)]
+    pool.append(_chunk("b0", "doc-b", "p2", 0.1, None))
+    picked = mmr_select(pool, 4, max_per_document=2)
+    assert [c["id"] for c in picked] == ["a0", "a1", "b0", "a2"]
+    print("PASS - mmr caps are soft")
@@ -0,0 +1,175 @@
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from utils import config, embedding_providers, embeddings
+from utils.deadline import deadline, remaining
+from utils.embedding_batcher import EmbeddingBatcher
+from utils.embedding_providers import split_tokens
+from utils.embeddings import EmbeddingVersion, generate_embedding, generate_embeddings_batch
+
+V1 = EmbeddingVersion("1", "text-embedding-3-small")
+V2 = EmbeddingVersion("2", "local:all-MiniLM-L6-v2")
+
+
+def _batcher(max_items=8, max_tokens=None, window_s=0.01, fail=False):
+    sent = []
+
+    async def send(version, texts, tokens):
+        sent.append((version.version, list(texts), remaining()))
+        await asyncio.sleep(0.001)
+        if fail:
+            raise RuntimeError("upstream down")
+        return [[float(len(t)), float(version.version)] for t in texts]
+
+    return EmbeddingBatcher(send, lambda version: (max_items, max_tokens), window_s), sent
+
+
+# ── TEST 1: concurrent texts share requests, split by version, size and tokens ──
+def test_concurrent_texts_share_requests():
+    batcher, sent = _batcher(max_items=4)
+
+    async def main():
+        texts = ["text 0", "text 1", "text 1", "text 2", "text 3", "text 4", "text 5"]
+        return await asyncio.gather(
+            *[batcher.embed(t, V1) for t in texts], batcher.embed("other model", V2),
+        )
+
+    vectors = asyncio.run(main())
+    assert vectors[1] == vectors[2] == [6.0, 1.0] and vectors[7] == [11.0, 2.0]
+    # 4 distinct inputs fill the first request at once; the duplicate is sent once
+    assert [(v, len(texts)) for v, texts, _ in sent] == [("1", 4), ("1", 2), ("2", 1)]
+    assert batcher.stats.snapshot() == {
+        "texts": 8, "deduplicated": 1, "requests": 3, "full": 1, "failures": 0, "texts_per_request": 2.67,
+    }
+
+    batcher, sent = _batcher(max_tokens=10)
+
+    async def by_tokens():
+        return await asyncio.gather(batcher.embed("aaaaaa", V1), batcher.embed("bbbbbb", V1), batcher.embed("ü", V1))
+
+    asyncio.run(by_tokens())
+    assert [texts for _, texts, _ in sent] == [["aaaaaa"], ["bbbbbb", "ü"]]
+    print("PASS - concurrent texts share requests")
+
+
+# ── TEST 2: failures reach every caller; a caller that gives up leaves the rest ──
+def test_failures_and_cancellation():
+    batcher, _ = _batcher(fail=True)
+
+    async def failing():
+        return await asyncio.gather(batcher.embed("a", V1), batcher.embed("b", V1), return_exceptions=True)
+
+    assert [str(e) for e in asyncio.run(failing())] == ["upstream down", "upstream down"]
+    assert batcher.stats.failures == 1
+
+    batcher, sent = _batcher(window_s=0.05)
+
+    async def impatient():
+        with deadline(10):
+            patient = asyncio.ensure_future(batcher.embed("kept", V1))
+        with deadline(0.01):
+            try:
+                await asyncio.wait_for(batcher.embed("dropped", V1), remaining())
+            except asyncio.TimeoutError:
+                pass
+        return await patient
+
+    assert asyncio.run(impatient()) == [4.0, 1.0]
+    # Only the text still awaited is sent, under the later caller's deadline
+    (_, texts, left), = sent
+    assert texts == ["kept"] and 9 < left <= 10
+    print("PASS - failures and cancellation")
+
+
+# ── TEST 3: generate_embedding goes through the batcher unless the window is 0 ──
+def test_generate_embedding_batches(monkeypatch):
+    calls = []
+
+    async def embed(inputs, version, span_name, tokens=None):
+        calls.append((list(inputs), span_name))
+        return [embeddings.Embedding([float(len(t))], version) for t in inputs]
+
+    monkeypatch.setattr(embeddings, "_embed", embed)
+    monkeypatch.setattr(config, "EMBEDDING_BATCH_WINDOW_MS", 5.0, raising=False)
+
+    async def main():
+        return await asyncio.gather(*[generate_embedding(t, version=V1) for t in ["a", "bb", "a"]])
+
+    first, second, again = asyncio.run(main())
+    assert calls == [(["a", "bb"], "embed_batch")]
+    assert first == again == [1.0] and second == [2.0]
+    assert first.version == V1 and first is not again
+
+    monkeypatch.setattr(config, "EMBEDDING_BATCH_WINDOW_MS", 0.0, raising=False)
+    calls.clear()
+    asyncio.run(main())
+    assert len(calls) == 3 and calls[0] == (["a"], "embed")
+    print("PASS - generate_embedding batches")
+
+
+class _WordProvider:
+    """One token per word; three inputs or nine tokens per request, four per input."""
+
+    name = "words"
+    max_batch = 3
+    max_batch_tokens = 9
+    rate_limited = True
+
+    def __init__(self):
+        self.requests = []
+
+    def windows(self, text, model):
+        words = text.split()
+        return [(" ".join(words[i:i + 4]), len(words[i:i + 4])) for i in range(0, len(words), 4)] or [(text, 0)]
+
+    async def embed(self, inputs, model):
+        self.requests.append(list(inputs))
+        await asyncio.sleep(0.01)
+        return [[1.0, 0.0] if "x" in text else [0.0, 1.0] for text in inputs]
+
+
+# ── TEST 4: requests are packed by inputs and tokens; long texts are windowed and pooled ──
+def test_batch_packs_by_tokens_and_pools(monkeypatch):
+    provider = _WordProvider()
+    monkeypatch.setitem(embedding_providers._providers, "words", provider)
+    monkeypatch.setattr(config, "EMBEDDING_CONCURRENCY", 2, raising=False)
+    monkeypatch.setattr(config, "EMBEDDING_TOKENS_PER_MINUTE", 0, raising=False)
+    version = EmbeddingVersion("w", "words:test")
+
+    texts = ["a b", "c d e", "f", "g h i j", "x x x x y y"]
+    vectors = asyncio.run(generate_embeddings_batch(texts, version=version))
+    # 2+3+1 tokens fill one request by count; 4 + the long text's first window by tokens
+    assert provider.requests == [["a b", "c d e", "f"], ["g h i j", "x x x x"], ["y y"]]
+    assert len(vectors) == 5 and vectors[0] == [0.0, 1.0] and vectors[0].version == version
+    # Windows of 4 and 2 tokens: the token-weighted mean, at unit length
+    assert vectors[4] == pytest.approx([4 / 20 ** 0.5, 2 / 20 ** 0.5])
+
+    provider.requests.clear()
+    assert asyncio.run(generate_embedding("x y z w v", version=version)) == pytest.approx([4 / 17 ** 0.5, 1 / 17 ** 0.5])
+    assert provider.requests == [["x y z w", "v"]]
+
+    # Without a tokenizer, windows are cut by UTF-8 length, never mid-character
+    monkeypatch.setattr(embedding_providers, "_encoding", lambda model: None)
+    windows = split_tokens("ab" * 5 + "é" * 4, "text-embedding-3-small", 8)
+    assert [w for w, _ in windows] == ["abababab", "abééé", "é"] and [n for _, n in windows] == [8, 8, 2]
+    assert split_tokens("short", "text-embedding-3-small", 8) == [("short", 5)]
+    print("PASS - batch packs by tokens and pools")
+
+
+# ── TEST 5: the token budget paces requests once it is spent ──
+def test_token_budget_paces_requests():
+    budget = embeddings._TokenBudget(per_minute=6000)  # 100 tokens a second
+
+    async def main():
+        started = asyncio.get_running_loop().time()
+        await budget.take(6000)
+        await budget.take(10)
+        return asyncio.get_running_loop().time() - started
+
+    assert 0.08 <= asyncio.run(main()) < 0.5
+    print("PASS - token budget paces requests")
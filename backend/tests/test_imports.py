@@ -0,0 +1,79 @@
+import sys
+import os
+import json
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.startup import parse_importtime
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NETWORK_MODULES = ("openai", "httpx", "httpcore", "supabase", "postgrest", "asyncpg", "aiohttp")
+# Generous: these catch a heavy import creeping back in, not small regressions
+BUDGET_MS = {"import cf": 150, "import mcp_server.server": 800}
+
+
+def _run(code, *flags):
+    env = {**os.environ, "OPENAI_API_KEY": "", "TOGETHER_API_KEY": "", "STORAGE_BACKEND": "supabase"}
+    return subprocess.run(
+        [sys.executable, *flags, "-c", code],
+        cwd=_BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+
+
+def _loaded(modules, roots):
+    return sorted(m for m in modules if m.split(".")[0] in roots)
+
+
+# ── TEST 1: initialize and tools/list answer without network libraries or keys ──
+def test_server_handshake_is_offline():
+    code = """
+import asyncio, json, sys
+from mcp_server.server import handle_request
+
+async def main():
+    init = await handle_request({"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {}})
+    tools = await handle_request({"jsonrpc": "2.0", "id": 2, "method": "tools/list", "params": {}})
+    return init, tools
+
+init, tools = asyncio.run(main())
+print(json.dumps({"init": init, "tools": tools, "modules": sorted(sys.modules)}))
+"""
+    out = json.loads(_run(code).stdout.strip().splitlines()[-1])
+    assert "result" in out["init"] and out["tools"]["result"]["tools"]
+    assert _loaded(out["modules"], NETWORK_MODULES) == []
+    assert "mcp_server.tools" not in out["modules"]
+    print("PASS - server handshake is offline")
+
+
+# ── TEST 2: importing the query and upload paths builds no client ──
+def test_library_imports_are_lazy():
+    code = """
+import json, sys
+import orchestrator.orchestrator, mcp_server.tools, file_processing.streaming, learning_engine.engine
+print(json.dumps(sorted(sys.modules)))
+"""
+    modules = json.loads(_run(code).stdout.strip().splitlines()[-1])
+    assert _loaded(modules, NETWORK_MODULES) == []
+    print("PASS - library imports are lazy")
+
+
+# ── TEST 3: cf loads no backend module just to start ──
+def test_cf_import_is_stdlib_only():
+    code = "import json, sys, cf; print(json.dumps(sorted(sys.modules)))"
+    modules = json.loads(_run(code).stdout.strip().splitlines()[-1])
+    backend = ("utils", "orchestrator", "learning_engine", "file_processing", "mcp_server", "pydantic_settings")
+    assert _loaded(modules, backend + NETWORK_MODULES) == []
+    print("PASS - cf import is stdlib only")
+
+
+# ── TEST 4: import time stays within budget ──
+def test_import_time_budget():
+    for statement, budget in BUDGET_MS.items():
+        # Best of three, so a busy machine does not fail the build
+        best = min(
+            sum(ms for _, ms, depth in parse_importtime(_run(statement, "-X", "importtime").stderr) if depth == 0)
+            for _ in range(3)
+        )
+        assert best < budget, f"{statement}: {best:.0f} ms (budget {budget} ms)"
+    print("PASS - import time budget")
@@ -0,0 +1,224 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.local_store import LocalStoreClient
+from benchmarks.fakes import fake_embedding
+
+USER = "123e4567-e89b-12d3-a456-426614174000"
+
+
+def _seed(client: LocalStoreClient) -> dict:
+    project = client.table("projects").insert({"user_id": USER, "name": "API"}).execute().data[0]
+    other = client.table("projects").insert({"user_id": USER, "name": "Web"}).execute().data[0]
+    doc = client.table("documents").insert(
+        {"project_id": project["id"], "filename": "auth.md", "analyzed": True}
+    ).execute().data[0]
+    web_doc = client.table("documents").insert(
+        {"project_id": other["id"], "filename": "ui.md", "analyzed": True}
+    ).execute().data[0]
+    texts = [
+        (doc, "rotate refresh tokens on every use"),
+        (doc, "index foreign keys in postgres"),
+        (web_doc, "debounce search input in the browser"),
+    ]
+    client.table("document_chunks").insert([
+        {"document_id": d["id"], "content": t, "chunk_index": i,
+         "embedding": fake_embedding(t), "embedding_version": "1"}
+        for i, (d, t) in enumerate(texts)
+    ]).execute()
+    return {"project": project, "other": other}
+
+
+# ── TEST 1: query chains return plain rows without vector columns ──
+def test_table_queries():
+    client = LocalStoreClient(":memory:")
+    seeded = _seed(client)
+
+    rows = client.table("projects").select("id, name", count="exact").eq("user_id", USER).order("name").execute()
+    assert [r["name"] for r in rows.data] == ["API", "Web"]
+    assert rows.count == 2
+
+    client.table("projects").update({"status": "archived"}).eq("id", seeded["other"]["id"]).execute()
+    active = client.table("projects").select("*").neq("status", "archived").execute().data
+    assert [p["name"] for p in active] == ["API"]
+    assert active[0]["created_at"]
+
+    chunks = client.table("document_chunks").select("*").not_.is_("embedding", "null").execute().data
+    assert len(chunks) == 3
+    assert all("embedding" not in c for c in chunks)
+
+    either = client.table("document_chunks").select("id").or_("chunk_index.eq.0,chunk_index.gte.2").execute().data
+    assert len(either) == 2
+    print("PASS - table queries")
+
+
+# ── TEST 2: hybrid search ranks, scopes by project and filters versions ──
+def test_hybrid_search():
+    client = LocalStoreClient(":memory:")
+    seeded = _seed(client)
+    query = "refresh tokens rotation"
+    params = {
+        "query_text": query,
+        "query_embedding": str(fake_embedding(query)),
+        "user_id_filter": USER,
+        "match_count": 5,
+    }
+
+    results = client.rpc("hybrid_search_document_chunks_2stage", params).execute().data
+    assert results[0]["content"] == "rotate refresh tokens on every use"
+    assert results[0]["text_rank"] > 0
+    assert {"similarity", "score", "project_name", "filename"} <= set(results[0])
+
+    scoped = client.rpc(
+        "hybrid_search_document_chunks", {**params, "project_id_filter": seeded["other"]["id"]}
+    ).execute().data
+    assert {r["filename"] for r in scoped} == {"ui.md"}
+
+    mismatched = client.rpc(
+        "hybrid_search_document_chunks", {**params, "embedding_version_filter": "2"}
+    ).execute().data
+    assert all(r["similarity"] == 0.0 for r in mismatched)
+    print("PASS - hybrid search")
+
+
+# ── TEST 3: principles search and bulk embedding writes ──
+def test_principles_and_bulk_update():
+    client = LocalStoreClient(":memory:")
+    principle = client.table("principles").insert(
+        {"content": "Use short-lived access tokens", "user_id": USER, "source": "user"}
+    ).execute().data[0]
+    assert principle["confidence_score"] == 0.5
+
+    missing = client.table("principles").select("id").is_("embedding", "null").execute().data
+    assert [p["id"] for p in missing] == [principle["id"]]
+
+    updated = client.rpc("bulk_update_embeddings", {
+        "table_name": "principles",
+        "ids": [principle["id"]],
+        "embeddings": [str(fake_embedding("short-lived access tokens"))],
+        "version": "1",
+        "job": "principles:1",
+        "last_id": principle["id"],
+    }).execute().data
+    assert updated == 1
+
+    found = client.rpc("search_principles", {
+        "query_embedding": fake_embedding("access tokens"),
+        "user_id_filter": USER,
+    }).execute().data
+    assert found[0]["id"] == principle["id"]
+    assert found[0]["similarity"] > 0
+
+    checkpoint = client.table("embedding_backfill_checkpoints").select("*").eq("job", "principles:1").execute().data
+    assert checkpoint[0]["processed"] == 1
+    print("PASS - principles and bulk update")
+
+
+# ── TEST 4: storage round trip persists in the file ──
+def test_storage_persists(tmp_path):
+    path = str(tmp_path / "store.db")
+    LocalStoreClient(path).storage.from_("documents").upload(
+        path="u/p/a.md", file=b"# Notes", file_options={"content-type": "text/markdown"}
+    )
+    assert LocalStoreClient(path).storage.from_("documents").download("u/p/a.md") == b"# Notes"
+    print("PASS - storage persists")
+
+
+# ── TEST 5: concurrent bumps of one principle are not lost ──
+def test_bump_principle_concurrent():
+    from concurrent.futures import ThreadPoolExecutor
+
+    client = LocalStoreClient(":memory:")
+    principle = client.table("principles").insert(
+        {"content": "Validate webhook signatures", "user_id": USER, "source": "user_derived",
+         "confidence_score": 0.9, "times_applied": 1}
+    ).execute().data[0]
+    projects = [f"project-{i % 4}" for i in range(40)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda p: client.rpc("bump_principle", {
+            "principle_id": principle["id"], "delta": 0.05, "cap": 0.95, "project_id": p,
+        }).execute(), projects))
+
+    row = client.table("principles").select("*").eq("id", principle["id"]).execute().data[0]
+    assert row["times_applied"] == 41
+    assert row["confidence_score"] == 0.95
+    assert sorted(row["source_projects"]) == sorted(set(projects))
+    print("PASS - concurrent bumps")
+
+
+# ── TEST 6: a process that missed a cutover re-embeds and searches again ──
+def test_search_after_cutover_elsewhere(monkeypatch):
+    import asyncio
+    import time
+
+    from orchestrator import storage1_query
+    from orchestrator.intent_classifier import Intent
+    from utils import config, embeddings, supabase_client
+    from utils.embeddings import Embedding, EmbeddingVersion
+
+    client = LocalStoreClient(":memory:")
+    _seed(client)
+    monkeypatch.setattr(supabase_client, "get_client", lambda: client)
+    monkeypatch.setattr(storage1_query, "get_client", lambda: client)
+    monkeypatch.setattr(config, "SEARCH_CACHE", False, raising=False)
+    old, new = EmbeddingVersion("1", "text-embedding-3-small"), EmbeddingVersion("2", "text-embedding-3-large")
+    # This process read the versions 5 s ago, before another one cut over to "2"
+    monkeypatch.setattr(embeddings, "_versions_cache", (time.monotonic() - 5, old, None))
+    client.table("embedding_versions").upsert([
+        {"version": "1", "model": old.model, "status": "retired"},
+        {"version": "2", "model": new.model, "status": "active"},
+    ]).execute()
+    client.table("document_chunks").update({"embedding_version": "2"}).neq("chunk_index", -1).execute()
+
+    embedded = []
+
+    async def embed(text):
+        active, _ = await embeddings.get_embedding_versions()
+        embedded.append(active.version)
+        return Embedding(fake_embedding(text), active)
+
+    monkeypatch.setattr(storage1_query, "generate_embedding", embed)
+    query = "refresh tokens rotation"
+    intent = Intent(query_type="general", category="other", scope="general",
+                    project_id=None, confidence=1.0, query_text=query)
+    results = asyncio.run(storage1_query.query_storage1(intent, embedding=Embedding(fake_embedding(query), old)))
+    assert embedded == ["2"]
+    assert results[0]["content"] == "rotate refresh tokens on every use" and results[0]["similarity"] > 0
+    print("PASS - search after cutover elsewhere")
+
+
+# ── TEST 7: statement writes replace rows in one transaction ──
+def test_statement_writes():
+    client = LocalStoreClient(":memory:")
+    doc = client.table("documents").insert({"project_id": "p", "filename": "a.md", "analyzed": True}).execute().data[0]
+    rows = [{"document_id": doc["id"], "chunk_index": i, "content": f"webhook retry {i}"} for i in range(20)]
+    client.table("document_chunks").insert(rows).execute()
+
+    again = client.table("document_chunks").upsert(
+        [{**r, "content": f"signed webhook retry {r['chunk_index']}"} for r in rows[:5]],
+        on_conflict="document_id,chunk_index",
+    ).execute().data
+    assert len(again) == 5 and len(client.table("document_chunks").select("id").execute().data) == 20
+    client.table("document_chunks").update({"chunk_type": "paragraph"}).lt("chunk_index", 3).execute()
+    typed = client.table("document_chunks").select("id").eq("chunk_type", "paragraph").execute().data
+    assert len(typed) == 3
+
+    # Replaced rows keep one full-text entry each
+    store = client.store
+    hits = store._conn.execute("SELECT count(*) FROM fts WHERE fts MATCH 'signed'").fetchone()[0]
+    assert hits == 5
+    assert store._conn.execute("SELECT count(*) FROM fts").fetchone()[0] == 20
+
+    # A backfill page and its checkpoint are written together
+    ids = [r["id"] for r in again]
+    updated = client.rpc("bulk_update_embeddings", {
+        "table_name": "document_chunks", "ids": ids, "embeddings": [str(fake_embedding("x"))] * 5,
+        "version": "1", "job": "chunks:1", "last_id": ids[-1],
+    }).execute().data
+    assert updated == 5
+    assert len(client.table("document_chunks").select("id").not_.is_("embedding", "null").execute().data) == 5
+    checkpoint = client.table("embedding_backfill_checkpoints").select("*").execute().data
+    assert [(c["last_id"], c["processed"]) for c in checkpoint] == [(ids[-1], 5)]
+    print("PASS - statement writes")
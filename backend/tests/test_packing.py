@@ -0,0 +1,40 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from orchestrator.packing import merge_adjacent_chunks, pack_context
+
+
+def _chunk(index, content, score, doc="doc-a"):
+    return {"document_id": doc, "chunk_index": index, "content": content, "score": score,
+            "similarity": score, "filename": f"{doc}.md", "project_name": "API"}
+
+
+# ── TEST 1: adjacent chunks merge without repeating the overlap ──
+def test_merge_adjacent_chunks():
+    first = "Tokens expire after an hour. Refresh tokens rotate on every use."
+    second = "Refresh tokens rotate on every use. Reuse revokes the whole family."
+    merged = merge_adjacent_chunks([_chunk(1, second, 0.4), _chunk(0, first, 0.5), _chunk(5, "Unrelated.", 0.1)])
+    assert len(merged) == 2
+    assert merged[0]["content"] == (
+        "Tokens expire after an hour. Refresh tokens rotate on every use. Reuse revokes the whole family."
+    )
+    assert merged[0]["chunk_index_end"] == 1
+    print("PASS - merge adjacent chunks")
+
+
+# ── TEST 2: the budget is respected and overflow is cut at a sentence ──
+def test_pack_context_respects_budget():
+    long_text = " ".join(f"Sentence number {i} explains one more detail." for i in range(60))
+    chunks = [_chunk(0, long_text, 1.0), _chunk(0, "Short and useful.", 0.9, doc="doc-b")]
+    principles = [{"content": "Rotate refresh tokens.", "confidence_score": 0.9, "score": 0.03}]
+    packed = pack_context(chunks, principles, {}, max_tokens=200)
+
+    assert 0 < packed.tokens_used <= 200
+    assert packed.principles and packed.principles[0]["content"] == "Rotate refresh tokens."
+    assert {c["filename"] for c in packed.project_context} == {"doc-a.md", "doc-b.md"}
+    cut = next(c for c in packed.project_context if c["filename"] == "doc-a.md")
+    assert cut["truncated"] and cut["content"].endswith(".")
+    assert packed.truncated == 1
+    print("PASS - pack context respects budget")
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import fake_embedding
+from orchestrator import intent_classifier
+from orchestrator.intent_classifier import Intent, classify_intents
+from utils import config
+from utils.local_store import LocalStoreClient
+
+USER = "123e4567-e89b-12d3-a456-426614174000"
+QUERIES = [
+    "how should I rotate refresh tokens?",
+    "which index for foreign keys in postgres?",
+    "debounce search input",
+]
+
+
+# ── TEST 1: one LLM call classifies the batch, in order, tolerating a short answer ──
+def test_classify_intents(monkeypatch):
+    prompts = []
+    answers = iter([
+        json.dumps([
+            {"query_type": "pattern", "category": "auth", "scope": "general", "confidence": 0.9},
+            {"query_type": "decision", "category": "database", "scope": "general", "confidence": 0.8},
+            {"query_type": "pattern", "category": "frontend", "scope": "general", "confidence": 0.7},
+        ]),
+        json.dumps({"intents": [{"query_type": "error", "category": "api", "scope": "general"}]}),
+    ])
+
+    async def complete(system_prompt, user_prompt):
+        prompts.append(user_prompt)
+        return next(answers)
+
+    monkeypatch.setattr(intent_classifier, "_complete", complete)
+    intents = asyncio.run(classify_intents(QUERIES, ["p1", None, None]))
+    assert [i.category for i in intents] == ["auth", "database", "frontend"]
+    assert intents[0].project_id == "p1" and intents[1].query_text == QUERIES[1]
+    assert len(prompts) == 1 and all(f'{n}. "{q}"' in prompts[0] for n, q in enumerate(QUERIES, start=1))
+
+    intents = asyncio.run(classify_intents(QUERIES[:2]))
+    assert [(i.query_type, i.category) for i in intents] == [("error", "api"), ("general", "other")]
+    print("PASS - classify intents")
+
+
+# ── TEST 2: a batch classifies, embeds and searches once, whatever its size ──
+def test_orchestrate_queries_shares_work(monkeypatch):
+    from orchestrator import orchestrator
+    from utils.errors import UpstreamLLMError
+
+    calls = {"classify": 0, "embed": 0, "storage1": 0, "storage2": 0, "detect": 0}
+
+    async def detect(queries):
+        calls["detect"] += 1
+        return [None] * len(queries)
+
+    async def classify(queries, project_ids=None):
+        calls["classify"] += 1
+        if queries[0].startswith("fail"):
+            raise UpstreamLLMError("classify_intents failed", correlation_id="test")
+        return [Intent("pattern", "auth" if "token" in q else "other", "general", pid, 0.9, q)
+                for q, pid in zip(queries, project_ids)]
+
+    async def embed(texts):
+        calls["embed"] += 1
+        return [fake_embedding(t, 8) for t in texts]
+
+    async def storage1(intents, embeddings, **kwargs):
+        calls["storage1"] += 1
+        return [[{"content": f"chunk for {i.query_text}", "project_name": "api", "score": 0.5}] for i in intents]
+
+    async def storage2(intents, embeddings, **kwargs):
+        calls["storage2"] += 1
+        return [[{"content": "Rotate refresh tokens", "category": "auth", "score": 0.9, "confidence_score": 0.8}]
+                for _ in intents]
+
+    monkeypatch.setattr(orchestrator, "detect_projects_from_queries", detect)
+    monkeypatch.setattr(orchestrator, "classify_intents", classify)
+    monkeypatch.setattr(orchestrator, "generate_embeddings_batch", embed)
+    monkeypatch.setattr(orchestrator, "query_storage1_batch", storage1)
+    monkeypatch.setattr(orchestrator, "query_storage2_candidates_batch", storage2)
+
+    queries = [{"query": q} for q in QUERIES] + [{"query": "cache keys", "project_id": "p2"}]
+    batch = asyncio.run(orchestrator.orchestrate_queries(queries))
+    assert calls == {"classify": 1, "embed": 1, "storage1": 1, "storage2": 1, "detect": 1}
+    results = batch["results"]
+    assert [r["query"] for r in results] == [q["query"] for q in queries]
+    assert results[0]["intent"]["category"] == "auth" and results[0]["principles"][0]["category"] == "auth"
+    assert results[1]["project_context"][0]["content"] == f"chunk for {QUERIES[1]}"
+    assert batch["meta"]["queries"] == 4 and "total" in batch["meta"]["timings_ms"]
+
+    degraded = asyncio.run(orchestrator.orchestrate_queries([
+        {"query": "fail: token question", "category": "security"}, {"query": "plain", "project_id": "p1"},
+    ]))
+    assert degraded["meta"]["degraded"]["missing"] == ["intent"]
+    assert [r["intent"]["category"] for r in degraded["results"]] == ["security", "other"]
+    print("PASS - orchestrate queries shares work")
+
+
+# ── TEST 3: the batch searches match the single-query ones on the local backend ──
+def test_storage_batch_matches_single(monkeypatch):
+    from orchestrator import storage1_query, storage2_query
+
+    client = LocalStoreClient(":memory:")
+    project = client.table("projects").insert({"user_id": USER, "name": "API"}).execute().data[0]
+    doc = client.table("documents").insert(
+        {"project_id": project["id"], "filename": "notes.md", "analyzed": True}
+    ).execute().data[0]
+    texts = ["rotate refresh tokens on every use", "index foreign keys in postgres", "debounce search input"]
+    client.table("document_chunks").insert([
+        {"document_id": doc["id"], "content": t, "chunk_index": i, "embedding": fake_embedding(t)}
+        for i, t in enumerate(texts)
+    ]).execute()
+    client.table("principles").insert([
+        {"content": t, "category": c, "confidence_score": 0.8, "embedding": fake_embedding(t)}
+        for t, c in [("Rotate tokens on use", "auth"), ("Index every foreign key", "database")]
+    ]).execute()
+    monkeypatch.setattr(storage1_query, "get_client", lambda: client)
+    monkeypatch.setattr(storage2_query, "get_client", lambda: client)
+    monkeypatch.setattr(config, "SEARCH_CACHE", False)
+
+    intents = [Intent("general", "other", "general", pid, 0.0, q)
+               for q, pid in zip(QUERIES, [project["id"], None, None])]
+    embeddings = [fake_embedding(q) for q in QUERIES]
+
+    async def main():
+        chunks = await storage1_query.query_storage1_batch(intents, embeddings, min_similarity=0.1, limit=2)
+        single = [await storage1_query.query_storage1_filtered(i, min_similarity=0.1, limit=2, embedding=e)
+                  for i, e in zip(intents, embeddings)]
+        pools = await storage2_query.query_storage2_candidates_batch(intents, embeddings, limit=5)
+        single_pools = [await storage2_query.query_storage2_candidates(i, embedding=e, limit=5)
+                        for i, e in zip(intents, embeddings)]
+        return chunks, single, pools, single_pools
+
+    chunks, single, pools, single_pools = asyncio.run(main())
+    assert chunks == single and pools == single_pools
+    assert chunks[0][0]["content"] == texts[0] and pools[1][0]["content"] == "Index every foreign key"
+    print("PASS - storage batch matches single")
+
+
+# ── TEST 4: the query tools share option checks and reject bad values ──
+def test_query_tool_options():
+    from mcp_server.tools import handle_query, handle_query_batch, handle_query_stream
+
+    calls = [
+        lambda args: handle_query({"query": "auth", **args}),
+        lambda args: handle_query_batch({"queries": ["auth"], **args}),
+        lambda args: handle_query_stream({"query": "auth", **args}, lambda stage, payload: None),
+    ]
+    for call in calls:
+        for args, error in (
+            ({"max_tokens": "lots"}, "must be integers"),
+            ({"deadline_ms": [5]}, "must be integers"),
+            ({"limit": "ten"}, "must be integers"),
+            ({"max_tokens": -5}, "max_tokens must be a positive integer"),
+            ({"deadline_ms": -1}, "deadline_ms must be a non-negative integer"),
+        ):
+            result = asyncio.run(call(args))
+            assert result["success"] is False and error in result["error"], (args, result)
+    print("PASS - query tool options")
@@ -0,0 +1,239 @@
+import asyncio
+import io
+import sys
+import os
+
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_processing import batch_ingest, chunker, streaming
+from learning_engine import agents, engine, synthesizer
+from utils import supabase_client
+from utils.local_store import LocalStoreClient
+from utils.supabase_client import claim_analysis_job, create_analysis_job
+
+USER = "123e4567-e89b-12d3-a456-426614174000"
+
+
+def _setup(monkeypatch):
+    client = LocalStoreClient(":memory:")
+    for module in (supabase_client, chunker, engine):
+        monkeypatch.setattr(module, "get_client", lambda: client)
+    project = client.table("projects").insert({"user_id": USER, "name": "API"}).execute().data[0]
+    doc = client.table("documents").insert(
+        {"project_id": project["id"], "filename": "auth.md", "storage_path": "auth.md", "doc_category": "prd"}
+    ).execute().data[0]
+    return client, project, doc
+
+
+# ── TEST 1: a retried upload reuses its document and embeds only the missing chunks ──
+def test_upload_resumes_without_duplicates(monkeypatch):
+    client, project, _ = _setup(monkeypatch)
+    for module in (streaming, batch_ingest):
+        monkeypatch.setattr(module, "get_client", lambda: client)
+    embedded = []
+    fail_at = [2]
+
+    async def embed_batch(texts):
+        if fail_at[0] is not None and len(embedded) >= fail_at[0]:
+            fail_at[0] = None
+            raise RuntimeError("rate limited")
+        embedded.extend(texts)
+        return [[0.1] * 8 for _ in texts]
+
+    async def columns(texts, embeddings):
+        return [{"embedding": e} for e in embeddings]
+
+    for module in (streaming, batch_ingest):
+        monkeypatch.setattr(module, "generate_embeddings_batch", embed_batch)
+        monkeypatch.setattr(module, "embedding_columns", columns)
+    monkeypatch.setattr(streaming, "EMBED_BATCH", 2)
+    text = "\n\n".join(f"Paragraph {i} about token rotation. " * 20 for i in range(6))
+
+    def chunk(content):
+        return list(streaming.iter_document_chunks(io.BytesIO(content.encode("utf-8")), "md", {}))
+
+    chunks = chunk(text)
+    assert len(chunks) >= 4
+
+    def upload(content):
+        stream = io.BytesIO(content.encode("utf-8"))
+        return asyncio.run(streaming.upload_document_stream(project["id"], "rotation.md", stream, "prd"))
+
+    def stored():
+        rows = client.table("document_chunks").select("document_id, chunk_index, content").execute().data
+        return [r for r in rows if r["document_id"] == document_ids()[0]]
+
+    def document_ids():
+        rows = client.table("documents").select("id, storage_path").execute().data
+        return [r["id"] for r in rows if r["storage_path"].endswith("rotation.md")]
+
+    try:
+        upload(text)
+        assert False, "failure swallowed"
+    except RuntimeError:
+        pass
+    assert len(embedded) == 2 and len(stored()) == 2
+
+    # The retry writes to the same document and embeds only what is missing
+    result = upload(text)
+    assert [result["document_id"]] == document_ids()
+    assert result["chunk_count"] == len(chunks) and result["embedded_chunks"] == len(chunks) - 2
+    assert len(embedded) == len(chunks)
+    assert sorted(r["chunk_index"] for r in stored()) == list(range(len(chunks)))
+
+    # An identical re-upload keeps the document's analysis; a changed file does not
+    def analyzed():
+        return client.table("documents").select("analyzed").eq("id", result["document_id"]).execute().data[0]["analyzed"]
+
+    asyncio.run(supabase_client.update_document_analyzed(result["document_id"], True))
+    assert upload(text)["embedded_chunks"] == 0 and analyzed() is True
+
+    # A file with no text registers no document
+    try:
+        asyncio.run(streaming.upload_document_stream(project["id"], "blank.md", io.BytesIO(b"  \n\n  "), "prd"))
+        assert False, "blank file accepted"
+    except ValueError:
+        pass
+    blank = asyncio.run(batch_ingest.ingest_documents(project["id"], [batch_ingest.IngestFile("blank.md", content="  \n ")]))
+    assert blank["documents"][0]["error"] == "no text extracted"
+    paths = [r["storage_path"] for r in client.table("documents").select("storage_path").execute().data]
+    assert not any(p.endswith("blank.md") for p in paths)
+
+    # A shorter version keeps its unchanged chunks and drops the rest
+    shorter = "\n\n".join(text.split("\n\n")[:3])
+    result = upload(shorter)
+    new_chunks = chunk(shorter)
+    assert [result["document_id"]] == document_ids() and result["chunk_count"] == len(new_chunks)
+    assert 0 < result["embedded_chunks"] < len(new_chunks)
+    assert analyzed() is False
+    assert sorted((r["chunk_index"], r["content"]) for r in stored()) == [
+        (c["chunk_index"], c["content"]) for c in new_chunks
+    ]
+
+    # Bulk ingest of the same file reuses the document too; a changed file re-embeds its chunks
+    before = len(embedded)
+    files = [
+        batch_ingest.IngestFile("rotation.md", content=shorter),
+        batch_ingest.IngestFile("sessions.md", content=text),
+    ]
+    first = asyncio.run(batch_ingest.ingest_documents(project["id"], files))["documents"]
+    assert first[0]["document_id"] == document_ids()[0] and first[0]["embedded_chunks"] == 0
+    assert first[1]["embedded_chunks"] == len(chunks) == len(embedded) - before
+    files[1].content = text.replace("Paragraph 5", "Paragraph five")
+    again = asyncio.run(batch_ingest.ingest_documents(project["id"], files))["documents"]
+    assert [d["document_id"] for d in again] == [d["document_id"] for d in first]
+    assert again[0]["embedded_chunks"] == 0 and 0 < again[1]["embedded_chunks"] < len(chunks)
+    assert all(d["success"] for d in again) and again[1]["chunk_count"] == len(chunks)
+    assert len(client.table("documents").select("id").execute().data) == 3
+
+    # Writing a batch again replaces its rows
+    row = chunker.chunk_row(result["document_id"], new_chunks[0], {"embedding": [0.2] * 8})
+    client.table("document_chunks").upsert([row], on_conflict=chunker.CHUNK_CONFLICT).execute()
+    assert len(stored()) == len(new_chunks)
+    print("PASS - uploads resume without duplicates")
+
+
+# ── TEST 2: a retried job skips finished agents and already stored principles ──
+def test_process_document_resumes(monkeypatch):
+    client, project, doc = _setup(monkeypatch)
+    calls = {"fetch": 0, "pattern_extractor": 0, "decision_analyzer": 0}
+    stored = []
+    failing = {"decision_analyzer"}
+
+    async def fetch(path):
+        calls["fetch"] += 1
+        return "We rotate refresh tokens. We chose Postgres."
+
+    def agent(name):
+        async def run(content):
+            calls[name] += 1
+            if name in failing:
+                raise RuntimeError(f"{name} timed out")
+            return [{"content": f"{name} {i}", "category": "security"} for i in range(2)]
+        return run
+
+    async def embed_batch(texts):
+        return [[0.1] * 8 for _ in texts]
+
+    async def store(item, embedding, doc_type, project_id):
+        if item["content"] == "decision_analyzer 1" and "stall" in failing:
+            await asyncio.Event().wait()  # until the worker is stopped
+        stored.append(item["content"])
+        return f"principle-{len(stored)}"
+
+    monkeypatch.setattr(engine, "fetch_document_content", fetch)
+    monkeypatch.setattr(agents, "get_agents_for_doc_type", lambda doc_type: ["pattern_extractor", "decision_analyzer"])
+    monkeypatch.setattr(agents, "_AGENT_MAP", {n: agent(n) for n in ("pattern_extractor", "decision_analyzer")})
+    monkeypatch.setattr(synthesizer, "generate_embeddings_batch", embed_batch)
+    monkeypatch.setattr(synthesizer, "_store_or_update_with_embedding", store)
+
+    async def attempt():
+        job = await create_analysis_job(doc["id"])
+        try:
+            return await asyncio.wait_for(engine.process_document(dict(doc), job["id"]), 0.5)
+        except asyncio.TimeoutError:
+            return {"job_id": job["id"], "status": "stopped"}
+
+    first = asyncio.run(attempt())
+    assert first["status"] == "failed" and calls["pattern_extractor"] == 1
+
+    failing = {"stall"}
+    second = asyncio.run(attempt())
+    assert second["status"] == "stopped" and second["job_id"] == first["job_id"]
+    # Finished agents are not run again
+    assert calls == {"fetch": 2, "pattern_extractor": 1, "decision_analyzer": 2}
+
+    failing = set()
+    third = asyncio.run(attempt())
+    assert third["status"] == "completed" and third["job_id"] == first["job_id"]
+    assert third["created"] == 4 and third["failed"] == 0
+    # The third attempt neither re-read the document nor stored anything twice
+    assert calls["fetch"] == 2
+    assert sorted(stored) == sorted(
+        [f"pattern_extractor {i}" for i in range(2)] + [f"decision_analyzer {i}" for i in range(2)]
+    )
+
+    job = client.table("analysis_jobs").select("*").eq("id", first["job_id"]).execute().data[0]
+    assert job["status"] == "completed" and job["attempts"] == 3 and job["stage"] == "synthesized"
+    assert len(client.table("analysis_jobs").select("id").execute().data) == 1
+    # A completed job is not reused
+    assert asyncio.run(create_analysis_job(doc["id"]))["id"] != first["job_id"]
+    print("PASS - process_document resumes")
+
+
+# ── TEST 3: a running job is never handed to a second worker ──
+def test_running_job_not_reset(monkeypatch):
+    client, _, doc = _setup(monkeypatch)
+    fetched = []
+
+    async def fetch(path):
+        fetched.append(path)
+        return None
+
+    monkeypatch.setattr(engine, "fetch_document_content", fetch)
+
+    async def main():
+        job = await create_analysis_job(doc["id"])
+        # Only one of two concurrent claims wins
+        claims = await asyncio.gather(*[claim_analysis_job(job["id"]) for _ in range(2)])
+        assert sorted(claims) == [False, True]
+
+        # Queuing the document again leaves the running job alone and adds none
+        again = await create_analysis_job(doc["id"])
+        assert again["id"] == job["id"] and again["status"] == "running"
+        assert (await engine.process_document(dict(doc), job["id"]))["status"] == "skipped"
+        assert fetched == []
+
+        # A running job that stopped writing is queued again
+        old = (datetime.now(timezone.utc) - timedelta(seconds=supabase_client.JOB_STALE_S + 60)).isoformat()
+        client.table("analysis_jobs").update({"updated_at": old}).eq("id", job["id"]).execute()
+        stale = await create_analysis_job(doc["id"])
+        assert stale["id"] == job["id"] and stale["status"] == "pending"
+        return job
+
+    job = asyncio.run(main())
+    assert len(client.table("analysis_jobs").select("id").execute().data) == 1
+    assert client.table("analysis_jobs").select("status").eq("id", job["id"]).execute().data[0]["status"] == "pending"
+    print("PASS - running job not reset")
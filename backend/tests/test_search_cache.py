@@ -0,0 +1,263 @@
+import asyncio
+import copy
+import random
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from utils import config
+from utils.local_store import LocalStoreClient
+from utils.search_cache import PartitionKey, SearchCache
+
+USER = "123e4567-e89b-12d3-a456-426614174000"
+PROJECTS = ["p-auth", "p-billing"]
+WORDS = "token rotation refresh revoke webhook retry idempotency ledger invoice cache".split()
+
+
+def _corpus(seed=3, dims=24):
+    rng = random.Random(seed)
+
+    def vector():
+        return [rng.uniform(-1, 1) for _ in range(dims)]
+
+    projects = [{"id": pid, "name": pid, "user_id": USER} for pid in PROJECTS]
+    documents = [
+        {"id": f"d{i}", "project_id": PROJECTS[i % 2], "filename": f"doc{i}.md", "doc_category": "architecture",
+         "analyzed": True}
+        for i in range(6)
+    ]
+    chunks = [
+        {"id": f"c{i}", "document_id": f"d{i % 6}", "chunk_index": i, "chunk_type": "text", "section_title": None,
+         "content": " ".join(rng.sample(WORDS, 4)), "embedding": vector(), "embedding_version": "1"}
+        for i in range(60)
+    ]
+    principles = [
+        {"id": f"pr{i}", "content": " ".join(rng.sample(WORDS, 5)), "type": "pattern",
+         "category": ["auth", "payment", "api"][i % 3], "source": "generic", "user_id": None,
+         "confidence_score": round(rng.uniform(0.4, 0.95), 2), "times_applied": 0,
+         "embedding": vector(), "embedding_version": "1"}
+        for i in range(30)
+    ]
+    return {"projects": projects, "documents": documents, "document_chunks": chunks, "principles": principles}
+
+
+class _Db:
+    """The database as the cache sees it: a loader, version counters, and
+    the RPCs to compare against."""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.client = LocalStoreClient(":memory:")
+        for name, rows in tables.items():
+            self.client.store.put_many(name, copy.deepcopy(rows))
+        self.versions = {}
+        self.loads = []
+
+    async def load(self, key: PartitionKey):
+        self.loads.append(key)
+        if key.table == "principles":
+            return copy.deepcopy(self.tables["principles"])
+        documents = {d["id"]: d for d in self.tables["documents"] if key.project_id in (None, d["project_id"])}
+        rows = []
+        for chunk in self.tables["document_chunks"]:
+            document = documents.get(chunk["document_id"])
+            if document is not None:
+                rows.append({**copy.deepcopy(chunk), "filename": document["filename"],
+                             "doc_category": document["doc_category"], "project_id": document["project_id"],
+                             "project_name": document["project_id"]})
+        return rows
+
+    async def read_versions(self, scopes):
+        return {s: self.versions[s] for s in scopes if s in self.versions}
+
+    def rpc(self, name, params):
+        return self.client.rpc(name, params).execute().data
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    monkeypatch.setattr(config, "SEARCH_CACHE_HOT_AFTER", 2)
+    monkeypatch.setattr(config, "SEARCH_CACHE_CHECK_S", 0.0)
+    monkeypatch.setattr(config, "SEARCH_CACHE_MAX_ROWS", 1000)
+    monkeypatch.setattr(config, "SEARCH_INDEX_DIR", "")
+
+
+async def _settle(cache):
+    while cache._loading:
+        await asyncio.gather(*cache._loading.values(), return_exceptions=True)
+
+
+def _chunk_params(project_id, query_embedding):
+    return {
+        "query_text": "token rotation", "query_embedding": query_embedding, "user_id_filter": USER,
+        "project_id_filter": project_id, "match_count": 5, "embedding_version_filter": "1",
+        "return_embeddings": True,
+    }
+
+
+# ── TEST 1: a hot partition is loaded and answers as the RPC would ──
+def test_hot_partition_matches_rpc(settings, monkeypatch):
+    monkeypatch.setattr(config, "SEARCH_CACHE_MAX_ROWS", 100)  # 30 + 60 + 30 rows: evicts one
+    tables = _corpus()
+    db = _Db(tables)
+    cache = SearchCache(loader=db.load, versions=db.read_versions)
+    query = tables["document_chunks"][7]["embedding"]
+    principle_params = {
+        "query_text": "webhook retry", "query_embedding": query, "user_id_filter": USER, "min_confidence": 0.6,
+        "category_filter": "payment", "match_count": 5, "embedding_version_filter": "1", "return_embeddings": False,
+    }
+
+    def check(cached, rpc, params):
+        # Lexical ranks are bm25 over the partition's own corpus, so the fused
+        # order can differ from the full store's; vector similarity cannot
+        expected = db.rpc(rpc, params)
+        exact = {r["id"]: r["similarity"] for r in db.rpc(rpc.replace("hybrid_", ""), {**params, "match_count": 100})}
+        assert cached and len(cached) == len(expected)
+        assert all(r["similarity"] == pytest.approx(exact[r["id"]], abs=1e-6) for r in cached)
+        return cached
+
+    async def main():
+        for project_id in ("p-auth", None):
+            params = _chunk_params(project_id, query)
+            assert await cache.search("hybrid_search_document_chunks", params) is None
+            assert await cache.search("hybrid_search_document_chunks", params) is None  # hot: load starts
+            await _settle(cache)
+            cached = check(await cache.search("hybrid_search_document_chunks", params),
+                           "hybrid_search_document_chunks", params)
+            assert all(r["project_id"] == (project_id or r["project_id"]) for r in cached)
+            assert all(r["compact_embedding"] for r in cached)
+        for _ in range(2):
+            await cache.search("hybrid_search_principles", principle_params)
+        await _settle(cache)
+        cached = check(await cache.search("hybrid_search_principles", principle_params),
+                       "hybrid_search_principles", principle_params)
+        assert all(r["category"] == "payment" and r["confidence_score"] >= 0.6 for r in cached)
+
+    asyncio.run(main())
+    assert len(db.loads) == 3
+    assert cache.stats.hits == 3 and cache.stats.misses == 6
+    assert cache.snapshot()["partitions"] == {"document_chunks:*": 60, "principles:*": 30}
+    assert cache.stats.evictions == 1
+    print("PASS - hot partition matches rpc")
+
+
+# ── TEST 2: a moved version counter or a local write drops the partition ──
+def test_partition_invalidation(settings):
+    tables = _corpus()
+    db = _Db(tables)
+    cache = SearchCache(loader=db.load, versions=db.read_versions)
+    params = _chunk_params("p-auth", tables["document_chunks"][0]["embedding"])
+
+    async def warm():
+        for _ in range(2):
+            await cache.search("hybrid_search_document_chunks", params)
+        await _settle(cache)
+        assert await cache.search("hybrid_search_document_chunks", params) is not None
+
+    async def main():
+        await warm()
+        db.versions["chunks:p-billing"] = 1  # another project: still served
+        assert await cache.search("hybrid_search_document_chunks", params) is not None
+        db.versions["chunks:p-auth"] = 1
+        assert await cache.search("hybrid_search_document_chunks", params) is None
+        await warm()
+        cache.invalidate("principles")
+        assert await cache.search("hybrid_search_document_chunks", params) is not None
+        cache.invalidate("chunks")
+        assert await cache.search("hybrid_search_document_chunks", params) is None
+
+    asyncio.run(main())
+    assert len(db.loads) == 2 and cache.stats.invalidations == 2
+    print("PASS - partition invalidation")
+
+
+# ── TEST 3: oversized partitions and missing counters fall back to the DB ──
+def test_fallbacks(settings):
+    loads = []
+
+    async def too_large(key):
+        loads.append(key)
+        return None
+
+    async def no_versions(scopes):
+        raise RuntimeError('relation "search_cache_versions" does not exist')
+
+    async def main(cache):
+        params = _chunk_params("p-auth", [0.1] * 24)
+        for _ in range(5):
+            assert await cache.search("hybrid_search_document_chunks", params) is None
+            await _settle(cache)
+
+    asyncio.run(main(SearchCache(loader=too_large, versions=_Db(_corpus()).read_versions)))
+    assert len(loads) == 1
+
+    unavailable = SearchCache(loader=too_large, versions=no_versions)
+    asyncio.run(main(unavailable))
+    assert unavailable._unavailable and len(loads) == 1
+    print("PASS - fallbacks")
+
+
+# ── TEST 4: a partition written to SEARCH_INDEX_DIR is reopened, not reloaded ──
+def test_partition_reopened_from_disk(settings, monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "SEARCH_INDEX_DIR", str(tmp_path))
+    tables = _corpus()
+    db = _Db(tables)
+    db.versions["chunks:p-auth"] = "3@2026-10-19T10:00:00+00:00"
+    params = _chunk_params("p-auth", tables["document_chunks"][4]["embedding"])
+
+    async def warm(cache):
+        for _ in range(2):
+            await cache.search("hybrid_search_document_chunks", params)
+        await _settle(cache)
+        return await cache.search("hybrid_search_document_chunks", params)
+
+    first = SearchCache(loader=db.load, versions=db.read_versions)
+    expected = asyncio.run(warm(first))
+    restarted = SearchCache(loader=db.load, versions=db.read_versions)
+    assert asyncio.run(warm(restarted)) == expected
+    assert len(db.loads) == 1 and restarted.stats.reopened == 1
+    partition = next(iter(restarted._partitions.values()))
+    assert isinstance(partition.shards[0].matrix, np.memmap)
+
+    db.versions["chunks:p-auth"] = "4@2026-10-19T10:05:00+00:00"
+    asyncio.run(warm(SearchCache(loader=db.load, versions=db.read_versions)))
+    assert len(db.loads) == 2
+    assert len(os.listdir(os.path.dirname(partition.path))) == 1  # version 3 removed
+    print("PASS - partition reopened from disk")
+
+
+# ── TEST 5: search_many answers held partitions in one batch, the rest with None ──
+def test_search_many_matches_search(settings):
+    tables = _corpus()
+    db = _Db(tables)
+    cache = SearchCache(loader=db.load, versions=db.read_versions)
+    vectors = [tables["document_chunks"][i]["embedding"] for i in (1, 8, 15)]
+    principles = [
+        {"query_text": "webhook retry", "query_embedding": v, "user_id_filter": USER, "min_confidence": 0.5,
+         "category_filter": category, "match_count": 4, "embedding_version_filter": "1"}
+        for v, category in zip(vectors, ["payment", None, "auth"])
+    ]
+
+    async def main():
+        for _ in range(2):
+            await cache.search("hybrid_search_principles", principles[0])
+        await _settle(cache)
+        batched = await cache.search_many("hybrid_search_principles", principles)
+        single = [await cache.search("hybrid_search_principles", p) for p in principles]
+        chunks = await cache.search_many("hybrid_search_document_chunks", [_chunk_params("p-auth", vectors[0])])
+        return batched, single, chunks
+
+    batched, single, chunks = asyncio.run(main())
+    # A batched product may round the last float32 bit differently
+    assert [[r["id"] for r in rows] for rows in batched] == [[r["id"] for r in rows] for rows in single]
+    assert all(a["similarity"] == pytest.approx(b["similarity"], abs=1e-6)
+               for rows, expected in zip(batched, single) for a, b in zip(rows, expected))
+    assert all(batched)
+    assert all(r["category"] == "payment" for r in batched[0]) and all(r["category"] == "auth" for r in batched[2])
+    assert chunks == [None]
+    print("PASS - search_many matches search")
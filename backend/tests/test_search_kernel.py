@@ -0,0 +1,84 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from utils import search_kernel
+from utils.search_kernel import Shard, normalize, search_shards, top_k
+
+
+def _exact(matrix, query, k, mask=None):
+    """Reference ranking: every score in float64, fully sorted."""
+    scores = matrix.astype(np.float64) @ query.astype(np.float64)
+    rows = [r for r in np.argsort(-scores, kind="stable") if mask is None or mask[r]]
+    return rows[:k]
+
+
+# ── TEST 1: blocked, batched top-k equals a full sort, with masks ──
+def test_top_k_is_exact(monkeypatch):
+    monkeypatch.setattr(search_kernel, "BLOCK_ROWS", 97)  # several blocks, the last one partial
+    rng = np.random.default_rng(7)
+    matrix = normalize(rng.standard_normal((1000, 32)))
+    queries = normalize(rng.standard_normal((4, 32)))
+    shared = rng.random(1000) < 0.3
+    sparse = rng.random(1000) < 0.1  # under SPARSE_MASK: only these rows are scored
+    per_query = rng.random((4, 1000)) < 0.5
+
+    for q, (rows, scores) in enumerate(top_k(matrix, queries, 10)):
+        assert rows.tolist() == _exact(matrix, queries[q], 10)
+        assert np.all(np.diff(scores) <= 0)
+        assert scores[0] == pytest.approx(float(matrix[rows[0]] @ queries[q]), abs=1e-6)
+    for q, (rows, _) in enumerate(top_k(matrix, queries, 10, shared)):
+        assert rows.tolist() == _exact(matrix, queries[q], 10, shared)
+    for q, (rows, _) in enumerate(top_k(matrix, queries, 10, sparse)):
+        assert rows.tolist() == _exact(matrix, queries[q], 10, sparse)
+    for q, (rows, _) in enumerate(top_k(matrix, queries, 10, per_query)):
+        assert rows.tolist() == _exact(matrix, queries[q], 10, per_query[q])
+
+    only_three = np.zeros(1000, dtype=bool)
+    only_three[[5, 500, 999]] = True
+    rows, _ = top_k(matrix, queries[:1], 10, only_three)[0]
+    assert sorted(rows.tolist()) == [5, 500, 999]
+    assert top_k(matrix[:0], queries, 10)[0][0].size == 0
+    print("PASS - top_k is exact")
+
+
+# ── TEST 2: column masks, and a saved shard searched memory-mapped ──
+def test_shard_masks_and_memmap(tmp_path):
+    rng = np.random.default_rng(11)
+    vectors = rng.standard_normal((50, 16))
+    shard = Shard.build(
+        [f"c{i}" for i in range(50)],
+        vectors,
+        {
+            "category": [["auth", "api", None][i % 3] for i in range(50)],
+            "confidence_score": [None if i == 0 else i / 50 for i in range(50)],
+        },
+    )
+    assert shard.mask() is None and shard.mask(equal={"category": None}) is None
+    assert shard.mask(equal={"category": "auth"}).sum() == 17
+    assert shard.mask(equal={"category": ["auth", "api"]}).sum() == 34
+    high = shard.mask(equal={"category": "auth"}, at_least={"confidence_score": 0.5})
+    assert high.tolist() == [i % 3 == 0 and i >= 25 for i in range(50)]  # NaN never passes
+    assert not shard.mask(at_least={"confidence_score": 0.0})[0]
+
+    saved = shard.save(str(tmp_path / "principles"))
+    assert isinstance(saved.matrix, np.memmap) and saved.path
+    reopened = Shard.open(str(tmp_path / "principles"))
+    query = vectors[9]
+    hits = reopened.search(query, 5, reopened.mask(equal={"category": "auth"}))[0]
+    assert hits == shard.search(query, 5, shard.mask(equal={"category": "auth"}))[0]
+    assert hits[0][0] == "c9" and hits[0][1] == pytest.approx(1.0, abs=1e-6)
+    assert reopened.similarity("c9", query) == pytest.approx(1.0, abs=1e-6)
+    assert len(reopened.compact("c9", 8)) == 8 and reopened.compact("missing") is None
+
+    # Two shards searched together give the k best over both
+    other = Shard.build(["x0", "x1"], [query * 2, -query])
+    merged = search_shards([shard, other], [query], 3)[0]
+    assert [id_ for id_, _ in merged[:2]] in (["c9", "x0"], ["x0", "c9"])
+    assert "x1" not in dict(merged)
+    print("PASS - shard masks and memmap")
@@ -0,0 +1,107 @@
+import sys
+import os
+import base64
+import random
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_processing import extractor
+from file_processing.chunker import chunk_text, iter_chunks
+from file_processing.extractor import clean_extracted_text, iter_clean_text, sniff_file_type
+from file_processing.streaming import iter_document_chunks, open_base64
+from utils.local_store import LocalStoreClient
+
+_KEYS = ("content", "chunk_index", "chunk_type", "section_title")
+
+
+def _pieces(text, rng):
+    out, i = [], 0
+    while i < len(text):
+        n = rng.randint(1, 97)
+        out.append(text[i:i + n])
+        i += n
+    return out
+
+
+def _document(rng, sentences=400):
+    parts = []
+    for i in range(sentences):
+        if i % 37 == 0:
+            parts.append(f"\n\n## Section {i}\n")
+        parts.append(f"Sentence {i} covers token rotation and retry budgets{'.' * rng.randint(0, 1)} ")
+        if i % 11 == 0:
+            parts.append("\r\n  \n\x00\n\n\n")
+    return "".join(parts)
+
+
+# ── TEST 1: streamed cleaning and chunking match the in-memory functions ──
+def test_stream_matches_in_memory():
+    rng = random.Random(7)
+    for _ in range(20):
+        text = _document(rng)
+        for chunk_size, overlap in ((1000, 100), (120, 20)):
+            pieces = _pieces(text, rng)
+            assert "".join(iter_clean_text(pieces)) == clean_extracted_text(text)
+            expected = [{k: c[k] for k in _KEYS} for c in chunk_text(text, chunk_size, overlap)]
+            assert list(iter_chunks(pieces, chunk_size, overlap)) == expected
+    print("PASS - stream matches in-memory")
+
+
+# ── TEST 2: the type is sniffed from the bytes ──
+def test_sniff_file_type():
+    assert sniff_file_type(b"%PDF-1.7\n%\xe2\xe3", "notes.md") == "pdf"
+    assert sniff_file_type(b"# Title\nBody", "notes.md") == "md"
+    assert sniff_file_type("Café".encode()[:-1], "notes.txt") == "txt"  # cut mid-character
+    assert sniff_file_type(b"\x89PNG\r\n\x1a\n\x00\x00", "image.md") is None
+    assert sniff_file_type(b"\xff\xfe\xfa", "latin.txt") is None
+    print("PASS - sniff file type")
+
+
+# ── TEST 3: base64 decodes a slice at a time, with line breaks ──
+def test_open_base64():
+    raw = bytes(range(256)) * 300
+    encoded = base64.encodebytes(raw).decode()  # wrapped at 76 characters
+    with open_base64(encoded) as stream:
+        assert stream.read() == raw
+    try:
+        open_base64("abc")
+        assert False, "truncated base64 accepted"
+    except ValueError:
+        pass
+    print("PASS - open base64")
+
+
+# ── TEST 4: storage upload and chunking stay bounded for a large file ──
+def test_large_file_memory_is_bounded():
+    block = extractor.READ_BLOCK
+    extractor.READ_BLOCK = 64 * 1024
+    path = None
+    try:
+        with tempfile.NamedTemporaryFile("wb", suffix=".md", delete=False) as f:
+            path = f.name
+            rng = random.Random(3)
+            while f.tell() < 16 * 1024 * 1024:
+                f.write(_document(rng, sentences=200).encode())
+        size = os.path.getsize(path)
+
+        client = LocalStoreClient(":memory:")
+        tracemalloc.start()
+        with open(path, "rb") as stream:
+            client.storage.from_("documents").upload_stream("p/big.md", stream, size, "text/markdown")
+            stream.seek(0)
+            stats = {}
+            chunks = sum(1 for _ in iter_document_chunks(stream, "md", stats))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        assert chunks > 1000 and stats["char_count"] > 0
+        assert peak < size / 4, f"peak {peak} bytes for a {size}-byte file"
+        with open(path, "rb") as f:
+            assert client.storage.from_("documents").download("p/big.md") == f.read()
+    finally:
+        extractor.READ_BLOCK = block
+        if path:
+            os.unlink(path)
+    print("PASS - large file memory is bounded")
@@ -0,0 +1,61 @@
+import asyncio
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.tracing import (
+    current_correlation_id,
+    record_round_trip,
+    record_tokens,
+    render_prometheus,
+    span,
+    start_trace,
+    traced,
+)
+
+
+# ── TEST 1: spans from child tasks land on the parent trace ──
+def test_spans_aggregate_across_tasks():
+    @traced("child")
+    async def child() -> None:
+        record_round_trip("db")
+        await asyncio.sleep(0)
+
+    async def run() -> dict:
+        with start_trace("unit_tool") as trace:
+            with span("outer"):
+                await asyncio.gather(child(), child(), child())
+            record_tokens("llm_prompt", 42)
+            return trace.summary()
+
+    summary = asyncio.run(run())
+    assert summary["spans"]["child"]["count"] == 3
+    assert summary["spans"]["outer"]["count"] == 1
+    assert summary["round_trips"] == {"db": 3}
+    assert summary["tokens"] == {"llm_prompt": 42}
+    json.dumps(summary)
+    print("PASS - tracing aggregates child-task spans")
+
+
+# ── TEST 2: correlation id is scoped to the trace ──
+def test_correlation_id_scoped_to_trace():
+    assert current_correlation_id() is None
+    with start_trace("unit_tool") as trace:
+        assert current_correlation_id() == trace.correlation_id
+        with start_trace("nested") as nested:
+            assert nested is trace
+    assert current_correlation_id() is None
+    print("PASS - correlation id scoped to trace")
+
+
+# ── TEST 3: Prometheus dump includes finished traces ──
+def test_prometheus_dump():
+    with start_trace("prom_tool"):
+        with span("prom_span"):
+            pass
+    text = render_prometheus()
+    assert 'contextflow_tool_call_seconds_count{tool="prom_tool"}' in text
+    assert 'contextflow_span_seconds_count{span="prom_span"}' in text
+    print("PASS - Prometheus dump")
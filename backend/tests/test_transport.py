@@ -0,0 +1,104 @@
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakeUpstreams
+from utils import clients
+from utils.clients import PoolStats
+from utils.tracing import render_prometheus
+
+
+# ── TEST 1: pool stats derive utilization and reuse ──
+def test_pool_stats_snapshot():
+    stats = PoolStats(max_connections=4)
+    for _ in range(3):
+        stats.begin()
+    stats.end()
+    stats.connections_opened = 1
+    snap = stats.snapshot()
+    assert snap["in_flight"] == 2 and snap["peak_in_flight"] == 3
+    assert snap["utilization"] == 0.5 and snap["peak_utilization"] == 0.75
+    assert snap["reuse_ratio"] == round(2 / 3, 3)
+    print("PASS - pool stats snapshot")
+
+
+# ── TEST 2: pool metrics are part of the Prometheus dump ──
+def test_pool_metrics_rendered():
+    clients._pools["test-provider"] = PoolStats(max_connections=8, requests=5, connections_opened=2)
+    try:
+        text = render_prometheus()
+    finally:
+        del clients._pools["test-provider"]
+    assert 'contextflow_http_requests_total{provider="test-provider"} 5' in text
+    assert 'contextflow_http_connections_opened_total{provider="test-provider"} 2' in text
+    print("PASS - pool metrics rendered")
+
+
+# ── TEST 3: bursts through the metered transport reuse connections ──
+def test_transport_reuses_connections():
+    import httpx
+
+    from utils.transport import MeteredTransport
+
+    upstreams = FakeUpstreams(embed_latency_ms=5).start()
+    stats = PoolStats(max_connections=16)
+    limits = httpx.Limits(max_connections=16, max_keepalive_connections=16)
+
+    async def main():
+        async with httpx.AsyncClient(transport=MeteredTransport(stats, limits)) as client:
+            for _ in range(3):
+                responses = await asyncio.gather(*[
+                    client.post(f"{upstreams.url}/v1/embeddings", json={"input": "token rotation", "dimensions": 8})
+                    for _ in range(12)
+                ])
+                assert all(r.status_code == 200 for r in responses)
+
+    try:
+        asyncio.run(main())
+    finally:
+        upstreams.stop()
+    snap = stats.snapshot()
+    assert snap["requests"] == 36 and snap["in_flight"] == 0
+    assert snap["peak_in_flight"] == 12
+    assert snap["connections_opened"] == upstreams.connections <= 12
+    assert snap["reuse_ratio"] >= 0.6
+    print("PASS - transport reuses connections")
+
+
+# ── TEST 4: without httpx's pool the transport still counts requests ──
+def test_transport_without_pool(monkeypatch):
+    import httpx
+
+    from utils import transport
+
+    assert transport._connection_pools([object()]) == []
+    monkeypatch.setattr(transport, "_connection_pools", lambda shards: [])
+    upstreams = FakeUpstreams(embed_latency_ms=5).start()
+    stats = PoolStats(max_connections=8)
+
+    async def main():
+        async with httpx.AsyncClient(transport=transport.MeteredTransport(stats, httpx.Limits(max_connections=8))) as client:
+            responses = await asyncio.gather(*[
+                client.post(f"{upstreams.url}/v1/embeddings", json={"input": "token rotation", "dimensions": 8})
+                for _ in range(4)
+            ])
+            assert all(r.status_code == 200 for r in responses)
+
+    try:
+        asyncio.run(main())
+    finally:
+        upstreams.stop()
+    snap = stats.snapshot()
+    assert snap["requests"] == 4 and snap["in_flight"] == 0
+    assert snap["connections_opened"] is None and snap["reuse_ratio"] is None
+
+    clients._pools["test-unmetered"] = stats
+    try:
+        text = render_prometheus()
+    finally:
+        del clients._pools["test-unmetered"]
+    assert 'contextflow_http_requests_total{provider="test-unmetered"} 4' in text
+    assert 'contextflow_http_open_connections{provider="test-unmetered"}' not in text
+    print("PASS - transport without pool")
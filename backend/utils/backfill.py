@@ -0,0 +1,69 @@
+"""Maintenance jobs for stored embeddings, meant to run alongside the server.
+
+    python -m utils.backfill embeddings [--table principles] [--reembed] [--version 2]
+    python -m utils.backfill migrate --version 2 --model text-embedding-3-large
+    python -m utils.backfill compact [--batch-size 500]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.embeddings import (
+    BACKFILL_TABLES,
+    backfill_compact_embeddings,
+    backfill_embeddings,
+    migrate_embeddings,
+)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(prog="utils.backfill", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="job", required=True)
+    embed = sub.add_parser("embeddings", help="Embed missing rows, or re-embed rows under a new version tag")
+    embed.add_argument("--table", choices=BACKFILL_TABLES, action="append",
+                       help="Table to process (repeatable; default: all)")
+    embed.add_argument("--version", help="Active (default) or building version to fill")
+    embed.add_argument("--reembed", action="store_true",
+                       help="Re-embed every row whose embedding_version differs from the active version")
+    embed.add_argument("--page-size", type=int, default=200)
+    migrate = sub.add_parser("migrate", help="Dual-write, re-embed and cut over to a new embedding model")
+    migrate.add_argument("--version", required=True)
+    migrate.add_argument("--model", required=True)
+    migrate.add_argument("--page-size", type=int, default=200)
+    compact = sub.add_parser("compact", help="Fill embedding_compact for rows written before migration 007")
+    compact.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.job == "embeddings":
+        async def run_all() -> list[dict]:
+            return [
+                await backfill_embeddings(table, version=args.version, reembed=args.reembed,
+                                          page_size=args.page_size)
+                for table in args.table or BACKFILL_TABLES
+            ]
+
+        results = asyncio.run(run_all())
+        print(json.dumps(results))
+        if any("error" in r for r in results):
+            sys.exit(1)
+    elif args.job == "migrate":
+        result = asyncio.run(migrate_embeddings(args.version, args.model, page_size=args.page_size))
+        print(json.dumps(result))
+        if not result.get("active"):
+            sys.exit(1)
+    elif args.job == "compact":
+        result = asyncio.run(backfill_compact_embeddings(batch_size=args.batch_size))
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Process-wide API clients, built on first use.
+
+One AsyncOpenAI per provider, so every caller of a provider (embeddings,
+intent classification, synthesis) shares its connection pool instead of
+opening its own. Nothing here imports openai or httpx until a client is
+asked for, which keeps MCP initialize/tools/list and cf startup free of
+network libraries.
+
+Each client sits on a metered transport (utils.transport) with limits sized
+for the learning engine's bursts: run_learning_engine fans out agents x
+models x runs chat calls per document, several documents at a time, and
+synthesize_and_store embeds every extraction at once. Keep-alive covers the
+whole burst, so connections are reused rather than reopened, and HTTP/2 is
+negotiated where the optional ``h2`` package is installed. Timeouts are per
+operation class (request_timeout), not one value for every call.
+"""
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Optional
+
+from utils import config
+from utils.deadline import DEADLINE_GRACE_S, remaining
+from utils.tracing import register_collector
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI
+
+# Seconds to wait for a response, by operation class. Connecting is bounded
+# separately (CONNECT_TIMEOUT_S) so an unreachable host fails fast whatever
+# the class.
+TIMEOUTS_S = {
+    "embedding": 30.0,
+    "classify": 20.0,
+    "agent": 120.0,
+    "default": 60.0,
+}
+CONNECT_TIMEOUT_S = 5.0
+
+
+@dataclass
+class PoolStats:
+    """Counters for one provider's connection pool."""
+
+    max_connections: int
+    requests: int = 0
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    connections_opened: int = 0
+    open_connections: int = 0
+    idle_connections: int = 0
+    http2_requests: int = 0
+    # False when the transport cannot see its connections (utils.transport);
+    # the connection counts are then reported as None
+    pool_metered: bool = True
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def begin(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def end(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            reused = max(0, self.requests - self.connections_opened)
+            snap = {
+                "max_connections": self.max_connections,
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "utilization": round(self.in_flight / self.max_connections, 3),
+                "peak_utilization": round(self.peak_in_flight / self.max_connections, 3),
+                "connections_opened": self.connections_opened,
+                "open_connections": self.open_connections,
+                "idle_connections": self.idle_connections,
+                "reuse_ratio": round(reused / self.requests, 3) if self.requests else 0.0,
+                "http2_requests": self.http2_requests,
+            }
+            if not self.pool_metered:
+                for key in ("connections_opened", "open_connections", "idle_connections", "reuse_ratio"):
+                    snap[key] = None
+            return snap
+
+
+_lock = threading.Lock()
+_openai: Optional["AsyncOpenAI"] = None
+_together: Optional["AsyncOpenAI"] = None
+_pools: dict[str, PoolStats] = {}
+
+
+def _timeout(seconds: float) -> "httpx.Timeout":
+    import httpx
+
+    return httpx.Timeout(seconds, connect=min(CONNECT_TIMEOUT_S, seconds))
+
+
+def request_timeout(op: str) -> "httpx.Timeout":
+    """Timeout for one call of operation class `op` (see TIMEOUTS_S), cut
+    short by the request's deadline when one is set (utils.deadline)."""
+    seconds = TIMEOUTS_S.get(op, TIMEOUTS_S["default"])
+    left = remaining()
+    if left is not None:
+        seconds = min(seconds, left + DEADLINE_GRACE_S)
+    return _timeout(seconds)
+
+
+def _build(provider: str, api_key: str, base_url: Optional[str], key_name: str) -> "AsyncOpenAI":
+    if not api_key:
+        raise RuntimeError(f"{key_name} is not set")
+    from openai import AsyncOpenAI
+
+    from utils.transport import build_http_client
+
+    stats = PoolStats(max_connections=config.HTTP_MAX_CONNECTIONS)
+    http_client = build_http_client(stats, timeout=_timeout(TIMEOUTS_S["default"]))
+    _pools[provider] = stats
+    return AsyncOpenAI(api_key=api_key, base_url=base_url or None, http_client=http_client)
+
+
+def get_openai_client() -> "AsyncOpenAI":
+    global _openai
+    if _openai is None:
+        with _lock:
+            if _openai is None:
+                _openai = _build("openai", config.OPENAI_API_KEY, config.OPENAI_BASE_URL, "OPENAI_API_KEY")
+    return _openai
+
+
+def get_together_client() -> "AsyncOpenAI":
+    global _together
+    if _together is None:
+        with _lock:
+            if _together is None:
+                _together = _build("together", config.TOGETHER_API_KEY, config.TOGETHER_BASE_URL, "TOGETHER_API_KEY")
+    return _together
+
+
+def pool_stats() -> dict[str, dict[str, Any]]:
+    """Snapshot of every pool built so far, by provider."""
+    return {provider: stats.snapshot() for provider, stats in sorted(_pools.items())}
+
+
+def _render_pools() -> list[str]:
+    pools = pool_stats()
+    if not pools:
+        return []
+    lines = []
+    for metric, kind, key in (
+        ("http_requests_total", "counter", "requests"),
+        ("http_connections_opened_total", "counter", "connections_opened"),
+        ("http_in_flight", "gauge", "in_flight"),
+        ("http_peak_in_flight", "gauge", "peak_in_flight"),
+        ("http_open_connections", "gauge", "open_connections"),
+        ("http_idle_connections", "gauge", "idle_connections"),
+        ("http_max_connections", "gauge", "max_connections"),
+    ):
+        lines.append(f"# TYPE contextflow_{metric} {kind}")
+        for provider, snap in pools.items():
+            if snap[key] is not None:
+                lines.append(f'contextflow_{metric}{{provider="{provider}"}} {snap[key]}')
+    return lines
+
+
+register_collector(_render_pools)
@@ -1,29 +1,68 @@
-from pydantic_settings import BaseSettings
-from dotenv import load_dotenv
+"""Settings from the environment and .env, read on first use.
+
+``from utils.config import X`` works as before, but Settings() is built only
+when the first setting is looked up (module __getattr__), so importing a
+module that needs config costs nothing until the value is used. No setting
+is required at load time: credentials are checked where a client is built
+(utils.clients, utils.supabase_client), so tools/list, cf --help and the
+local backend work without an OpenAI key.
+"""
+from __future__ import annotations
+
+import functools
+from typing import Any
 
-load_dotenv()
+from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
-    SUPABASE_URL: str
-    SUPABASE_SERVICE_KEY: str
+    STORAGE_BACKEND: str = "supabase"
+    LOCAL_STORE_PATH: str = "~/.contextflow/contextflow.db"
+    SUPABASE_URL: str = ""
+    SUPABASE_SERVICE_KEY: str = ""
     SUPABASE_ANON_KEY: str = ""
-    OPENAI_API_KEY: str
+    OPENAI_API_KEY: str = ""
+    OPENAI_BASE_URL: str = ""
     TOGETHER_API_KEY: str = ""
+    TOGETHER_BASE_URL: str = "https://api.together.xyz/v1"
     MVP_USER_ID: str = "123e4567-e89b-12d3-a456-426614174000"
     ENVIRONMENT: str = "development"
     LOG_LEVEL: str = "INFO"
+    METRICS_FILE: str = ""
+    EMBEDDING_PROFILE: str = "halfvec-256"
+    EMBEDDING_MODEL: str = "text-embedding-3-small"
+    EMBEDDING_VERSION: str = "1"
+    EMBEDDING_LOCAL_WORKERS: int = 2
+    EMBEDDING_LOCAL_BATCH_SIZE: int = 32
+    EMBEDDING_LOCAL_DEVICE: str = "cpu"
+    EMBEDDING_BATCH_WINDOW_MS: float = 5.0
+    EMBEDDING_CONCURRENCY: int = 4
+    EMBEDDING_TOKENS_PER_MINUTE: int = 1_000_000
+    HTTP_MAX_CONNECTIONS: int = 64
+    HTTP_MAX_KEEPALIVE: int = 64
+    HTTP_KEEPALIVE_EXPIRY_S: float = 30.0
+    HTTP2: bool = True
+    QUERY_DEADLINE_MS: int = 8000
+    SEARCH_CACHE: bool = True
+    SEARCH_CACHE_HOT_AFTER: int = 3
+    SEARCH_CACHE_MAX_ROWS: int = 20000
+    SEARCH_CACHE_CHECK_S: float = 1.0
+    SEARCH_INDEX_DIR: str = "~/.contextflow/search-index"
 
     model_config = {"env_file": ".env", "extra": "ignore"}
 
 
-_settings = Settings()
+@functools.lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return Settings()
+
 
-SUPABASE_URL: str = _settings.SUPABASE_URL
-SUPABASE_SERVICE_KEY: str = _settings.SUPABASE_SERVICE_KEY
-SUPABASE_ANON_KEY: str = _settings.SUPABASE_ANON_KEY
-OPENAI_API_KEY: str = _settings.OPENAI_API_KEY
-TOGETHER_API_KEY: str = _settings.TOGETHER_API_KEY
-MVP_USER_ID: str = _settings.MVP_USER_ID
-ENVIRONMENT: str = _settings.ENVIRONMENT
-LOG_LEVEL: str = _settings.LOG_LEVEL
+def __getattr__(name: str) -> Any:
+    if name in Settings.model_fields:
+        value = getattr(get_settings(), name)
+        globals()[name] = value  # later lookups skip __getattr__
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,174 @@
+"""End-to-end deadlines and hedged requests.
+
+A deadline is set once per request (``with deadline(seconds):``) and lives in
+a context variable, so every task created under it inherits it the same way
+tracing does. Upstream calls read what is left of it: the OpenAI clients cap
+their per-call timeout with remaining() (utils.clients.request_timeout), and
+the query pipeline stops waiting when it runs out and answers with what it
+has (orchestrator.stream_query).
+
+hedged() is for idempotent calls (embeddings, searches): when the first
+attempt has not answered within that operation's recent p95 latency, a
+duplicate is sent and whichever answers first wins. At most one duplicate is
+sent, so a hedge costs a few percent more requests for a shorter tail.
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from typing import Awaitable, Callable, Iterator, Optional, TypeVar
+
+from utils.tracing import record_round_trip
+
+logger = logging.getLogger("contextflow")
+
+T = TypeVar("T")
+
+# Upstream timeouts run this much past the deadline, so the caller's own
+# deadline handling (which degrades) fires before the call's (which errors)
+DEADLINE_GRACE_S = 0.25
+# Hedge after the default delay until an operation has this many samples
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY_S = 1.0
+_WINDOW = 256
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "contextflow_deadline", default=None,
+)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The request's deadline passed before the awaited call answered."""
+
+
+@contextlib.contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """Give the enclosed work `seconds` to finish. Nesting only tightens it;
+    None leaves any outer deadline as it is."""
+    if seconds is None:
+        yield
+        return
+    token = _deadline.set(_tightened(seconds))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def deadline_context(seconds: Optional[float]) -> contextvars.Context:
+    """Copy of the current context with the deadline applied, for tasks
+    started (``create_task(..., context=ctx)``) by code that cannot hold
+    ``with deadline()`` open, such as an async generator that yields."""
+    ctx = contextvars.copy_context()
+    if seconds is not None:
+        ctx.run(_deadline.set, _tightened(seconds))
+    return ctx
+
+
+def deadline_at() -> Optional[float]:
+    """The current deadline as a time.monotonic() value, or None."""
+    return _deadline.get()
+
+
+def shared_context(at: Optional[float]) -> contextvars.Context:
+    """Copy of the current context whose deadline is `at` (a deadline_at()
+    value, None for no deadline) instead of the current one. For work done on
+    behalf of several requests, which has to run as long as the last of them
+    waits, where deadline_context() could only tighten it."""
+    ctx = contextvars.copy_context()
+    ctx.run(_deadline.set, at)
+    return ctx
+
+
+def _tightened(seconds: float) -> float:
+    at = time.monotonic() + seconds
+    outer = _deadline.get()
+    return at if outer is None else min(outer, at)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline (never negative), or None."""
+    at = _deadline.get()
+    return None if at is None else max(0.0, at - time.monotonic())
+
+
+async def within_deadline(awaitable: Awaitable[T]) -> T:
+    """Await `awaitable`, raising DeadlineExceeded if the deadline passes first."""
+    left = remaining()
+    if left is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=left)
+    except asyncio.TimeoutError as exc:
+        if remaining() == 0.0:
+            raise DeadlineExceeded("deadline exceeded") from exc
+        raise
+
+
+class LatencyWindow:
+    """Recent latencies of one operation, for its hedge delay."""
+
+    def __init__(self, size: int = _WINDOW) -> None:
+        self._samples: collections.deque[float] = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+_windows: dict[str, LatencyWindow] = {}
+
+
+def latency_window(op: str) -> LatencyWindow:
+    window = _windows.get(op)
+    if window is None:
+        window = _windows.setdefault(op, LatencyWindow())
+    return window
+
+
+def hedge_delay(op: str) -> float:
+    p95 = latency_window(op).p95()
+    return HEDGE_DEFAULT_DELAY_S if p95 is None else p95
+
+
+async def hedged(op: str, call: Callable[[], Awaitable[T]]) -> T:
+    """Run call(), and a duplicate if the first has not answered within the
+    p95 latency of `op`. Returns the first answer; an attempt that fails
+    leaves the other to answer. Only for idempotent calls."""
+    window = latency_window(op)
+
+    async def attempt() -> T:
+        started = time.perf_counter()
+        result = await call()
+        window.observe(time.perf_counter() - started)
+        return result
+
+    pending = {asyncio.ensure_future(attempt())}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=hedge_delay(op))
+        if done:
+            return done.pop().result()
+
+        record_round_trip("hedge")
+        pending.add(asyncio.ensure_future(attempt()))
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            answered = [task for task in done if task.exception() is None]
+            if answered or not pending:
+                return (answered or list(done))[0].result()
+    finally:
+        for task in pending:
+            task.cancel()
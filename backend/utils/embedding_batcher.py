@@ -0,0 +1,144 @@
+"""Micro-batching of single-text embedding requests.
+
+Many places embed one text at a time, concurrently: a query embeds itself
+while storage 2 embeds its category searches, the synthesizer embeds each
+candidate principle, the chunker gathers one call per chunk. Sent as they
+come, each is its own HTTP request, and the request's fixed cost (round
+trip, queueing at the API, rate limit) dwarfs the embedding itself.
+
+An EmbeddingBatcher holds a text for at most `window_s` and sends everything
+collected by then for the same embedding version as one request; each
+caller gets its own vector back. A batch goes out before the window closes
+once it reaches the provider's limits: `max_items` inputs, or `max_tokens`
+counted with the caller's token counts (or, without one, a worst-case
+count: a token is at least one UTF-8 byte). A text asked for twice within a
+window is sent once.
+
+A caller keeps its own deadline and cancellation: giving up only stops its
+wait. The request runs under the latest deadline among the callers it
+serves, and is counted on the trace of the caller that opened the batch.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from utils.deadline import deadline_at, shared_context
+
+# (version, texts, their tokens) -> one vector per text
+Send = Callable[[Any, list[str], int], Awaitable[list[Any]]]
+# version -> (most inputs per request, most tokens per request or None)
+Limits = Callable[[Any], tuple[int, Optional[int]]]
+
+
+def token_bound(text: str) -> int:
+    """Upper bound on the tokens of `text` under any byte-level BPE."""
+    return len(text.encode("utf-8"))
+
+
+@dataclass
+class BatcherStats:
+    texts: int = 0          # embed() calls
+    deduplicated: int = 0   # calls served by another call's input
+    requests: int = 0       # batched requests sent
+    full: int = 0           # of which sent before the window closed
+    failures: int = 0
+
+    def snapshot(self) -> dict[str, Any]:
+        snap: dict[str, Any] = asdict(self)
+        snap["texts_per_request"] = round(self.texts / self.requests, 2) if self.requests else 0.0
+        return snap
+
+
+@dataclass
+class _Batch:
+    context: contextvars.Context
+    waiters: dict[str, list[asyncio.Future]] = field(default_factory=dict)
+    counts: dict[str, int] = field(default_factory=dict)
+    tokens: int = 0
+    deadlines: list[Optional[float]] = field(default_factory=list)
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+class EmbeddingBatcher:
+    def __init__(self, send: Send, limits: Limits, window_s: float) -> None:
+        self._send = send
+        self._limits = limits
+        self.window_s = window_s
+        self.stats = BatcherStats()
+        self._open: dict[Hashable, _Batch] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def embed(self, text: str, version: Hashable, tokens: Optional[int] = None) -> Any:
+        """Vector of `text`; `tokens` is its token count (token_bound when None)."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Batches (and their futures) belong to the loop that opened them
+            self._open.clear()
+            self._loop = loop
+        max_items, max_tokens = self._limits(version)
+        if tokens is None:
+            tokens = token_bound(text)
+
+        batch = self._open.get(version)
+        if batch is not None and text not in batch.waiters and (
+            len(batch.waiters) >= max_items or (max_tokens is not None and batch.tokens + tokens > max_tokens)
+        ):
+            self._flush(version, batch, full=True)
+            batch = None
+        if batch is None:
+            batch = self._open[version] = _Batch(contextvars.copy_context())
+            batch.timer = loop.call_later(self.window_s, self._flush, version, batch)
+
+        future = loop.create_future()
+        waiters = batch.waiters.setdefault(text, [])
+        if waiters:
+            self.stats.deduplicated += 1
+        else:
+            batch.counts[text] = tokens
+            batch.tokens += tokens
+        waiters.append(future)
+        batch.deadlines.append(deadline_at())
+        self.stats.texts += 1
+        if len(batch.waiters) >= max_items:
+            self._flush(version, batch, full=True)
+        return await future
+
+    def _flush(self, version: Hashable, batch: _Batch, full: bool = False) -> None:
+        if self._open.get(version) is not batch:
+            return  # already sent
+        del self._open[version]
+        if batch.timer is not None:
+            batch.timer.cancel()
+        if full:
+            self.stats.full += 1
+        latest = None if None in batch.deadlines else max(batch.deadlines)
+        context = batch.context.run(shared_context, latest)
+        task = asyncio.get_running_loop().create_task(self._deliver(version, batch), context=context)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, version: Hashable, batch: _Batch) -> None:
+        # Texts whose callers all gave up while the batch was open are dropped
+        texts = [t for t, waiters in batch.waiters.items() if not all(f.done() for f in waiters)]
+        if not texts:
+            return
+        self.stats.requests += 1
+        try:
+            vectors = await self._send(version, texts, sum(batch.counts[t] for t in texts))
+            if len(vectors) != len(texts):
+                raise ValueError(f"{len(texts)} texts embedded into {len(vectors)} vectors")
+        except Exception as exc:
+            self.stats.failures += 1
+            for text in texts:
+                for future in batch.waiters[text]:
+                    if not future.done():
+                        future.set_exception(exc)
+            return
+        for text, vector in zip(texts, vectors):
+            for future in batch.waiters[text]:
+                if not future.done():
+                    future.set_result(vector)
@@ -0,0 +1,217 @@
+"""Embedding backends.
+
+The model string of an embedding version picks the backend:
+
+    text-embedding-3-small                          OpenAI (remote)
+    local:sentence-transformers/all-MiniLM-L6-v2    CPU, in this process
+
+The full string is what lands in embedding_model on every row and in
+embedding_versions, so vectors from different providers always belong to
+different versions and are never searched together. Switching provider is
+an ordinary model migration (utils.embeddings.migrate_embeddings).
+
+The local backend needs the optional ``sentence-transformers`` package.
+
+Remote inputs are measured in tokens with tiktoken when it is installed (and
+its encoding files can be loaded), and by their UTF-8 length otherwise, which
+is never less than the token count. A text longer than one input allows is
+cut into windows that utils.embeddings embeds separately and pools.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional, Protocol
+
+from utils.clients import get_openai_client, request_timeout
+from utils.embedding_batcher import token_bound
+from utils.config import (
+    EMBEDDING_LOCAL_BATCH_SIZE,
+    EMBEDDING_LOCAL_DEVICE,
+    EMBEDDING_LOCAL_WORKERS,
+)
+from utils.tracing import record_round_trip, record_usage, span
+
+logger = logging.getLogger(__name__)
+
+# Every stored vector is vector(1536); smaller local models are zero-padded,
+# which leaves cosine similarity unchanged.
+VECTOR_DIMS = 1536
+
+
+class EmbeddingProvider(Protocol):
+    name: str
+    max_batch: int                   # inputs per request
+    max_batch_tokens: Optional[int]  # tokens per request; None when unlimited
+    rate_limited: bool               # requests draw on EMBEDDING_TOKENS_PER_MINUTE
+
+    def windows(self, text: str, model: str) -> list[tuple[str, int]]: ...
+
+    async def embed(self, inputs: list[str], model: str) -> list[list[float]]: ...
+
+
+# Tokens left free in a window cut from a longer text: the cut can split a
+# character, which decodes to one or two replacement characters
+_WINDOW_SLACK = 8
+_encodings: dict[str, Any] = {}
+_encodings_lock = threading.Lock()
+
+
+def _encoding(model: str) -> Any:
+    """tiktoken's encoding for `model`, or None without tiktoken or its data
+    files (downloaded on first use), in which case token_bound is used."""
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                import tiktoken
+
+                try:
+                    _encodings[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    _encodings[model] = tiktoken.get_encoding("cl100k_base")
+            except Exception as exc:
+                logger.warning("No tokenizer for %s, counting UTF-8 bytes instead: %s", model, exc)
+                _encodings[model] = None
+        return _encodings[model]
+
+
+def split_tokens(text: str, model: str, max_tokens: int) -> list[tuple[str, int]]:
+    """`text` as windows of at most `max_tokens` tokens, each with an upper
+    bound on its token count; a text that fits is one window."""
+    encoding = _encoding(model)
+    if encoding is not None:
+        ids = encoding.encode(text, disallowed_special=())
+        if len(ids) <= max_tokens:
+            return [(text, len(ids))]
+        size = max_tokens - _WINDOW_SLACK
+        return [
+            (encoding.decode(ids[start:start + size]), len(ids[start:start + size]) + _WINDOW_SLACK)
+            for start in range(0, len(ids), size)
+        ]
+
+    bound = token_bound(text)
+    if bound <= max_tokens:
+        return [(text, bound)]
+    windows: list[tuple[str, int]] = []
+    start = size = 0
+    for n, char in enumerate(text):
+        width = len(char.encode("utf-8"))
+        if size + width > max_tokens:
+            windows.append((text[start:n], size))
+            start, size = n, 0
+        size += width
+    windows.append((text[start:], size))
+    return windows
+
+
+class OpenAIEmbeddingProvider:
+    name = "openai"
+    # The embeddings endpoint's limits
+    max_batch = 2048
+    max_batch_tokens = 300_000
+    max_input_tokens = 8191
+    rate_limited = True
+
+    def windows(self, text: str, model: str) -> list[tuple[str, int]]:
+        return split_tokens(text, model, self.max_input_tokens)
+
+    async def embed(self, inputs: list[str], model: str) -> list[list[float]]:
+        kwargs = {"dimensions": VECTOR_DIMS} if model.startswith("text-embedding-3") else {}
+        response = await get_openai_client().embeddings.create(
+            model=model, input=inputs, timeout=request_timeout("embedding"), **kwargs,
+        )
+        record_usage("embedding", response.usage)
+        return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+
+
+class LocalEmbeddingProvider:
+    """sentence-transformers on CPU, run in a small thread pool.
+
+    The encoder releases the GIL inside its tensor ops, so threads give real
+    parallelism without copying the model into every worker process. Each
+    call is one batch of at most EMBEDDING_LOCAL_BATCH_SIZE texts; callers
+    submit batches concurrently to keep every worker busy.
+    """
+
+    name = "local"
+    max_batch_tokens = None
+    rate_limited = False
+
+    def __init__(self, workers: int, batch_size: int, device: str) -> None:
+        self.max_batch = batch_size
+        self._batch_size = batch_size
+        self._device = device
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed-local")
+        self._models: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def windows(self, text: str, model: str) -> list[tuple[str, int]]:
+        # The encoder truncates to its own sequence length; no token budget applies
+        return [(text, 0)]
+
+    def _load(self, model: str) -> Any:
+        with self._lock:
+            if model not in self._models:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except ImportError as exc:
+                    raise RuntimeError(
+                        "Local embeddings need the sentence-transformers package "
+                        "(pip install sentence-transformers)"
+                    ) from exc
+                logger.info("Loading local embedding model %s on %s", model, self._device)
+                self._models[model] = SentenceTransformer(model, device=self._device)
+            return self._models[model]
+
+    def _encode(self, model: str, inputs: list[str]) -> list[list[float]]:
+        encoder = self._load(model)
+        matrix = encoder.encode(
+            inputs,
+            batch_size=self._batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        if matrix.shape[1] > VECTOR_DIMS:
+            raise ValueError(f"{model} produces {matrix.shape[1]} dims; at most {VECTOR_DIMS} fit")
+        padding = [0.0] * (VECTOR_DIMS - matrix.shape[1])
+        return [row.tolist() + padding for row in matrix]
+
+    async def embed(self, inputs: list[str], model: str) -> list[list[float]]:
+        loop = asyncio.get_running_loop()
+        with span("embed_local"):
+            vectors = await loop.run_in_executor(self._executor, self._encode, model, inputs)
+        record_round_trip("embedding_local")
+        return vectors
+
+
+_providers: dict[str, EmbeddingProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def split_model(model: str) -> tuple[str, str]:
+    """'local:all-MiniLM-L6-v2' -> ('local', 'all-MiniLM-L6-v2'); unprefixed is OpenAI."""
+    if ":" in model:
+        provider, name = model.split(":", 1)
+        return provider, name
+    return "openai", model
+
+
+def get_provider(name: str) -> EmbeddingProvider:
+    with _providers_lock:
+        provider: Optional[EmbeddingProvider] = _providers.get(name)
+        if provider is None:
+            if name == "openai":
+                provider = OpenAIEmbeddingProvider()
+            elif name == "local":
+                provider = LocalEmbeddingProvider(
+                    workers=EMBEDDING_LOCAL_WORKERS,
+                    batch_size=EMBEDDING_LOCAL_BATCH_SIZE,
+                    device=EMBEDDING_LOCAL_DEVICE,
+                )
+            else:
+                raise ValueError(f"Unknown embedding provider {name!r}")
+            _providers[name] = provider
+        return provider
@@ -1,63 +1,584 @@
 import asyncio
 import logging
-from openai import AsyncOpenAI
-from utils.config import OPENAI_API_KEY
+import math
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+from utils import config
+from utils.config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_PROFILE as _PROFILE_NAME,
+    EMBEDDING_VERSION,
+)
+from utils.embedding_batcher import EmbeddingBatcher
+from utils.embedding_providers import get_provider, split_model
+from utils.tracing import register_collector, span
 
 logger = logging.getLogger(__name__)
 
-_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+_FULL_DIMS = 1536
 
-_MODEL = "text-embedding-3-small"
-_MAX_CHARS = 8000
-_BATCH_SIZE = 20
-_BATCH_DELAY = 0.1
 
+@dataclass(frozen=True)
+class EmbeddingProfile:
+    """How vectors are stored and searched.
 
-async def generate_embedding(text: str) -> list[float]:
-    truncated = text[:_MAX_CHARS]
+    The full float32 vector is always kept for re-ranking. A compact profile
+    adds a Matryoshka-truncated, half-precision copy (maintained by a trigger,
+    see migration 007) that the search RPCs scan first. Each profile keeps
+    only the vector indexes it searches; apply_embedding_profile (migration
+    015) switches them.
+    """
+
+    name: str
+    dimensions: int
+    storage: str  # "vector" (float32) or "halfvec" (float16)
+
+    @property
+    def two_stage(self) -> bool:
+        return self.dimensions < _FULL_DIMS
+
+    def search_rpc(self, base: str) -> str:
+        return f"{base}_2stage" if self.two_stage else base
+
+
+EMBEDDING_PROFILES: dict[str, EmbeddingProfile] = {
+    "vector-1536": EmbeddingProfile("vector-1536", _FULL_DIMS, "vector"),
+    "halfvec-256": EmbeddingProfile("halfvec-256", 256, "halfvec"),
+}
+
+if _PROFILE_NAME not in EMBEDDING_PROFILES:
+    raise ValueError(
+        f"Unknown EMBEDDING_PROFILE {_PROFILE_NAME!r}; expected one of {sorted(EMBEDDING_PROFILES)}"
+    )
+
+EMBEDDING_PROFILE: EmbeddingProfile = EMBEDDING_PROFILES[_PROFILE_NAME]
+
+
+@dataclass(frozen=True)
+class EmbeddingVersion:
+    """A vector space: the model plus the version tag stored on each row."""
+
+    version: str
+    model: str
+
+
+class Embedding(list):
+    """A vector that remembers which version produced it.
+
+    Search callers pass `.version` as the RPC's embedding_version_filter, so a
+    query vector is only ever compared with rows from the same space.
+    """
+
+    def __init__(self, values, version: EmbeddingVersion):
+        super().__init__(values)
+        self.version = version
+
+
+def version_tag(embedding: list[float]) -> Optional[str]:
+    """The version an Embedding came from; None for a plain list (no filtering)."""
+    version = getattr(embedding, "version", None)
+    return version.version if version is not None else None
+
+
+_DEFAULT_VERSION = EmbeddingVersion(EMBEDDING_VERSION, EMBEDDING_MODEL)
+_VERSIONS_TTL = 15.0
+# How stale the versions may be when a search suggests they changed
+_VERSIONS_RECHECK_S = 1.0
+_versions_cache: Optional[tuple[float, EmbeddingVersion, Optional[EmbeddingVersion]]] = None
+
+
+async def get_embedding_versions(
+    refresh: bool = False,
+    max_age: float = _VERSIONS_TTL,
+) -> tuple[EmbeddingVersion, Optional[EmbeddingVersion]]:
+    """(active, building) from embedding_versions, cached for up to `max_age`
+    seconds.
+
+    Falls back to EMBEDDING_VERSION/EMBEDDING_MODEL when the table is missing
+    or unreachable.
+    """
+    global _versions_cache
+    now = time.monotonic()
+    if not refresh and _versions_cache is not None and now - _versions_cache[0] < max_age:
+        return _versions_cache[1], _versions_cache[2]
+
+    from utils.supabase_client import _run, get_client
+
+    active, building = _DEFAULT_VERSION, None
     try:
-        response = await _client.embeddings.create(model=_MODEL, input=truncated)
-        return response.data[0].embedding
+        client = get_client()
+        rows = (await _run(
+            lambda: client.table("embedding_versions")
+            .select("version, model, status")
+            .in_("status", ["active", "building"])
+            .execute()
+        )).data or []
+        for row in rows:
+            version = EmbeddingVersion(row["version"], row["model"])
+            if row["status"] == "active":
+                active = version
+            else:
+                building = version
+    except Exception as exc:
+        logger.warning("Could not read embedding_versions, using %s: %s", _DEFAULT_VERSION, exc)
+    _versions_cache = (now, active, building)
+    return active, building
+
+
+async def is_retired(embedding: list[float]) -> bool:
+    """Whether `embedding` comes from a version that is no longer active.
+
+    Another process may have cut over since this one cached the versions;
+    its searches then match no vector rows. Callers ask when a search comes
+    back without vector hits, so the versions are re-read at most every
+    _VERSIONS_RECHECK_S, and only then.
+    """
+    tag = version_tag(embedding)
+    if tag is None:
+        return False
+    active, _ = await get_embedding_versions(max_age=_VERSIONS_RECHECK_S)
+    return tag != active.version
+
+
+class _TokenBudget:
+    """Tokens per minute for a rate-limited provider, refilled continuously.
+
+    take() waits until a request's tokens are available, so concurrent
+    requests pace themselves rather than run into the API's rate limit. A
+    request larger than the whole budget waits for a full one.
+    """
+
+    def __init__(self, per_minute: int) -> None:
+        self.per_minute = per_minute
+        self._level = float(per_minute)
+        self._at = time.monotonic()
+
+    async def take(self, tokens: int) -> None:
+        tokens = min(tokens, self.per_minute)
+        while True:
+            now = time.monotonic()
+            self._level = min(self.per_minute, self._level + (now - self._at) * self.per_minute / 60)
+            self._at = now
+            if self._level >= tokens:
+                self._level -= tokens
+                return
+            await asyncio.sleep((tokens - self._level) * 60 / self.per_minute)
+
+
+_budgets: dict[str, Optional[_TokenBudget]] = {}
+
+
+def _budget(provider) -> Optional[_TokenBudget]:
+    if provider.name not in _budgets:
+        per_minute = config.EMBEDDING_TOKENS_PER_MINUTE
+        _budgets[provider.name] = _TokenBudget(per_minute) if provider.rate_limited and per_minute > 0 else None
+    return _budgets[provider.name]
+
+
+async def _embed(
+    inputs: list[str],
+    version: EmbeddingVersion,
+    span_name: str,
+    tokens: Optional[int] = None,
+) -> list[Embedding]:
+    """One request. `tokens` (counted from the inputs when None) is drawn
+    from the provider's rate budget first."""
+    provider_name, model = split_model(version.model)
+    provider = get_provider(provider_name)
+    budget = _budget(provider)
+    if budget is not None:
+        if tokens is None:
+            tokens = sum(n for text in inputs for _, n in provider.windows(text, model))
+        with span("embed_rate_wait"):
+            await budget.take(tokens)
+    with span(span_name):
+        vectors = await provider.embed(inputs, model)
+    return [Embedding(v, version) for v in vectors]
+
+
+def _batch_limits(version: EmbeddingVersion) -> tuple[int, Optional[int]]:
+    provider = get_provider(split_model(version.model)[0])
+    return provider.max_batch, provider.max_batch_tokens
+
+
+_batcher = EmbeddingBatcher(
+    lambda version, texts, tokens: _embed(texts, version, "embed_batch", tokens), _batch_limits, window_s=0.0,
+)
+
+
+async def generate_embedding(text: str, version: Optional[EmbeddingVersion] = None) -> Embedding:
+    """Embed one text. Concurrent calls within EMBEDDING_BATCH_WINDOW_MS of
+    each other share one request (utils.embedding_batcher); 0 sends each alone.
+    A text too long for one input is windowed and pooled, as in
+    generate_embeddings_batch."""
+    try:
+        if version is None:
+            version, _ = await get_embedding_versions()
+        provider_name, model = split_model(version.model)
+        windows = get_provider(provider_name).windows(text, model)
+        if len(windows) > 1:
+            return (await generate_embeddings_batch([text], version))[0]
+        tokens = windows[0][1]
+        window_ms = config.EMBEDDING_BATCH_WINDOW_MS
+        if window_ms <= 0:
+            return (await _embed([text], version, "embed", tokens))[0]
+        _batcher.window_s = window_ms / 1000
+        with span("embed"):
+            return Embedding(await _batcher.embed(text, version, tokens), version)
     except Exception as exc:
         logger.error("Failed to generate embedding: %s", exc)
         raise
 
 
-async def generate_embeddings_batch(texts: list[str]) -> list[list[float]]:
-    results: list[list[float]] = []
-    for i in range(0, len(texts), _BATCH_SIZE):
-        batch = [t[:_MAX_CHARS] for t in texts[i : i + _BATCH_SIZE]]
-        try:
-            response = await _client.embeddings.create(model=_MODEL, input=batch)
-            sorted_data = sorted(response.data, key=lambda d: d.index)
-            results.extend(d.embedding for d in sorted_data)
-        except Exception as exc:
-            logger.error("Failed to generate embeddings for batch %d: %s", i // _BATCH_SIZE, exc)
-            raise
-        if i + _BATCH_SIZE < len(texts):
-            await asyncio.sleep(_BATCH_DELAY)
-    return results
+def _pool(vectors: list[Embedding], weights: list[int], version: EmbeddingVersion) -> Embedding:
+    """Token-weighted mean of a text's window vectors, at unit length."""
+    if not any(weights):
+        weights = [1] * len(vectors)
+    pooled = [sum(w * v[i] for v, w in zip(vectors, weights)) for i in range(len(vectors[0]))]
+    norm = math.sqrt(sum(x * x for x in pooled)) or 1.0
+    return Embedding([x / norm for x in pooled], version)
 
 
-async def update_principle_embeddings() -> int:
-    from utils.supabase_client import get_client
+async def generate_embeddings_batch(
+    texts: list[str],
+    version: Optional[EmbeddingVersion] = None,
+) -> list[Embedding]:
+    """Embed `texts` in as few requests as the provider's limits allow.
+
+    Each text becomes one input, or several windows when it is longer than
+    one input may be. Inputs are packed in order into requests of at most
+    max_batch inputs and max_batch_tokens tokens. Rate-limited providers run
+    EMBEDDING_CONCURRENCY requests at a time, each paid for from the
+    EMBEDDING_TOKENS_PER_MINUTE budget; local backends run them all at once
+    to keep the worker pool full. A windowed text gets the token-weighted
+    mean of its windows' vectors.
+    """
+    if not texts:
+        return []
+    if version is None:
+        version, _ = await get_embedding_versions()
+    provider_name, model = split_model(version.model)
+    provider = get_provider(provider_name)
+
+    owners: list[int] = []
+    inputs: list[str] = []
+    counts: list[int] = []
+    for n, text in enumerate(texts):
+        for window, tokens in provider.windows(text, model):
+            owners.append(n)
+            inputs.append(window)
+            counts.append(tokens)
+
+    requests: list[tuple[int, int, int]] = []  # (first input, end, tokens)
+    start = total = 0
+    for i, tokens in enumerate(counts):
+        if i > start and (
+            i - start >= provider.max_batch
+            or (provider.max_batch_tokens is not None and total + tokens > provider.max_batch_tokens)
+        ):
+            requests.append((start, i, total))
+            start, total = i, 0
+        total += tokens
+    requests.append((start, len(inputs), total))
+
+    limit = asyncio.Semaphore(config.EMBEDDING_CONCURRENCY if provider.rate_limited else len(requests))
+
+    async def send(n: int, first: int, end: int, tokens: int) -> list[Embedding]:
+        async with limit:
+            try:
+                return await _embed(inputs[first:end], version, "embed_batch", tokens)
+            except Exception as exc:
+                logger.error("Failed to generate embeddings for batch %d: %s", n, exc)
+                raise
+
+    tasks = [asyncio.ensure_future(send(n, *request)) for n, request in enumerate(requests)]
+    try:
+        embedded = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    vectors = [e for batch in embedded for e in batch]
+    if len(vectors) == len(texts):
+        return vectors
+
+    windows: list[list[int]] = [[] for _ in texts]
+    for i, owner in enumerate(owners):
+        windows[owner].append(i)
+    return [
+        vectors[w[0]] if len(w) == 1 else _pool([vectors[i] for i in w], [counts[i] for i in w], version)
+        for w in windows
+    ]
+
+
+def embedding_batch_stats() -> dict:
+    """Counters of the generate_embedding micro-batcher since start."""
+    return _batcher.stats.snapshot()
+
+
+def _render_batching() -> list[str]:
+    snap = embedding_batch_stats()
+    if not snap["texts"]:
+        return []
+    lines = []
+    for metric in ("texts", "deduplicated", "requests", "full", "failures"):
+        lines.append(f"# TYPE contextflow_embedding_batch_{metric}_total counter")
+        lines.append(f"contextflow_embedding_batch_{metric}_total {snap[metric]}")
+    return lines
+
+
+register_collector(_render_batching)
+
+
+async def embedding_columns(texts: list[str], embeddings: list[Embedding]) -> list[dict]:
+    """Row columns for freshly embedded texts (the dual-write side of a migration).
+
+    Always carries the serving vector and its tags; while a version is
+    building, also embeds the texts with that model into the next slot so new
+    rows never need backfilling before cutover.
+    """
+    _, building = await get_embedding_versions()
+    columns = [
+        {
+            "embedding": list(e),
+            "embedding_model": e.version.model,
+            "embedding_version": e.version.version,
+        }
+        for e in embeddings
+    ]
+    if building is not None and texts:
+        next_embeddings = await generate_embeddings_batch(texts, version=building)
+        for row, e in zip(columns, next_embeddings):
+            row.update({
+                "embedding_next": list(e),
+                "embedding_next_model": building.model,
+                "embedding_next_version": building.version,
+            })
+    return columns
+
+
+BACKFILL_TABLES = ("principles", "document_chunks")
+
+
+def _vector_literal(embedding: list[float]) -> str:
+    return "[" + ",".join(f"{v:.8g}" for v in embedding) + "]"
+
+
+async def backfill_embeddings(
+    table: str,
+    version: Optional[str] = None,
+    reembed: bool = False,
+    page_size: int = 200,
+    job: Optional[str] = None,
+) -> dict:
+    """Embed rows of `table` page by page under `version`.
+
+    For the active version (the default) only rows without an embedding are
+    filled; with reembed=True every row tagged with another version is
+    re-embedded in place. For the building version of a migration, every
+    embedded row gets a vector in the next slot instead, leaving the serving
+    vectors untouched. Pages are read in id order and written with one
+    bulk_update_embeddings call, which also advances the job's checkpoint, so
+    an interrupted run resumes after the last written page.
+    """
+    from utils.supabase_client import _run, get_client
+
+    if table not in BACKFILL_TABLES:
+        raise ValueError(f"backfill_embeddings: unsupported table {table!r}")
+
+    active, building = await get_embedding_versions(refresh=True)
+    version = version or active.version
+    if version == active.version:
+        target, slot = active, "embedding"
+        mode = "reembed" if reembed else "missing"
+    elif building is not None and version == building.version:
+        target, slot, mode = building, "embedding_next", "next"
+    else:
+        raise ValueError(
+            f"backfill_embeddings: version {version!r} is neither active nor building; "
+            "start a migration first"
+        )
+
+    client = get_client()
+    job = job or f"{table}:{version}:{mode}"
+    result: dict = {"job": job, "table": table, "version": version, "processed": 0}
+
+    try:
+        existing = (await _run(
+            lambda: client.table("embedding_backfill_checkpoints").select("*").eq("job", job).execute()
+        )).data
+        if existing and existing[0].get("completed_at") is None:
+            last_id: Optional[str] = existing[0].get("last_id")
+            result["processed"] = int(existing[0].get("processed") or 0)
+            logger.info("Resuming %s after %s (%d done)", job, last_id, result["processed"])
+        else:
+            last_id = None
+            await _run(lambda: client.table("embedding_backfill_checkpoints").upsert({
+                "job": job,
+                "table_name": table,
+                "version": version,
+                "last_id": None,
+                "processed": 0,
+                "completed_at": None,
+            }).execute())
+
+        while True:
+            def fetch_page():
+                query = client.table(table).select("id, content")
+                if mode == "next":
+                    query = query.not_.is_("embedding", "null").or_(
+                        f"embedding_next_version.is.null,embedding_next_version.neq.{version}"
+                    )
+                elif mode == "reembed":
+                    query = query.or_(f"embedding_version.is.null,embedding_version.neq.{version}")
+                else:
+                    query = query.is_("embedding", "null")
+                if last_id:
+                    query = query.gt("id", last_id)
+                return query.order("id").limit(page_size).execute()
+
+            rows: list[dict] = (await _run(fetch_page)).data or []
+            if not rows:
+                break
+
+            todo = [r for r in rows if (r.get("content") or "").strip()]
+            embeddings = (
+                await generate_embeddings_batch([r["content"] for r in todo], version=target)
+                if todo else []
+            )
+            page_last_id = rows[-1]["id"]
+            response = await _run(lambda: client.rpc("bulk_update_embeddings", {
+                "table_name": table,
+                "ids": [r["id"] for r in todo],
+                "embeddings": [_vector_literal(e) for e in embeddings],
+                "version": version,
+                "job": job,
+                "last_id": page_last_id,
+                "model": target.model,
+                "slot": slot,
+            }).execute())
+            result["processed"] += int(response.data or 0)
+            last_id = page_last_id
+            logger.info("%s: %d rows embedded", job, result["processed"])
+            if len(rows) < page_size:
+                break
+
+        await _run(lambda: client.table("embedding_backfill_checkpoints").update({
+            "completed_at": datetime.now(timezone.utc).isoformat(),
+        }).eq("job", job).execute())
+    except Exception as exc:
+        logger.error("Embedding backfill %s stopped: %s", job, exc)
+        result["error"] = str(exc)
+
+    return result
+
+
+async def start_embedding_migration(version: str, model: str) -> EmbeddingVersion:
+    """Register `version` as building; writers start dual-writing within _VERSIONS_TTL."""
+    from utils.supabase_client import _run, get_client
+
+    client = get_client()
+    await _run(lambda: client.table("embedding_versions").insert({
+        "version": version,
+        "model": model,
+        "status": "building",
+    }).execute())
+    await get_embedding_versions(refresh=True)
+    logger.info("Started embedding migration to %s (%s)", version, model)
+    return EmbeddingVersion(version, model)
+
+
+async def embedding_coverage(version: str) -> dict[str, dict]:
+    from utils.supabase_client import _run, get_client
 
     client = get_client()
-    response = client.table("principles").select("id, content").is_("embedding", "null").execute()
-    principles: list[dict] = response.data
+    rows = (await _run(
+        lambda: client.rpc("embedding_version_coverage", {"target_version": version}).execute()
+    )).data or []
+    return {r["table_name"]: {"total": int(r["total"]), "covered": int(r["covered"])} for r in rows}
 
-    if not principles:
-        return 0
 
-    texts = [p["content"] for p in principles]
-    embeddings = await generate_embeddings_batch(texts)
+async def migrate_embeddings(
+    version: str,
+    model: str,
+    page_size: int = 200,
+    max_rounds: int = 3,
+) -> dict:
+    """Move the corpus to a new embedding model without taking search offline.
 
-    updated = 0
-    for principle, embedding in zip(principles, embeddings):
-        try:
-            client.table("principles").update({"embedding": embedding}).eq("id", principle["id"]).execute()
-            updated += 1
-        except Exception as exc:
-            logger.error("Failed to update embedding for principle %s: %s", principle["id"], exc)
+    Queries keep using the active version throughout. The building version is
+    backfilled into the next slot (rows written meanwhile are dual-written),
+    and once coverage is complete cutover_embedding_version swaps the slots
+    and activates it in one transaction. Rows that slip in while a round runs
+    are picked up by the next round.
+    """
+    from utils.supabase_client import _run, get_client
 
-    return updated
+    active, building = await get_embedding_versions(refresh=True)
+    if active.version == version:
+        return {"version": version, "active": True, "rounds": 0}
+    if building is None:
+        await start_embedding_migration(version, model)
+    elif building.version != version:
+        raise ValueError(f"migrate_embeddings: version {building.version!r} is already building")
+
+    client = get_client()
+    coverage: dict[str, dict] = {}
+    for round_number in range(1, max_rounds + 1):
+        backfills = [await backfill_embeddings(t, version=version, page_size=page_size) for t in BACKFILL_TABLES]
+        failed = [b for b in backfills if "error" in b]
+        if failed:
+            return {"version": version, "active": False, "rounds": round_number, "error": failed[0]["error"]}
+
+        coverage = await embedding_coverage(version)
+        if any(c["covered"] < c["total"] for c in coverage.values()):
+            continue
+        swapped = (await _run(
+            lambda: client.rpc("cutover_embedding_version", {"target_version": version}).execute()
+        )).data
+        if swapped:
+            await get_embedding_versions(refresh=True)
+            logger.info("Embedding version %s (%s) is now active", version, model)
+            return {"version": version, "active": True, "rounds": round_number, "coverage": coverage}
+
+    return {"version": version, "active": False, "rounds": max_rounds, "coverage": coverage}
+
+
+async def update_principle_embeddings() -> int:
+    result = await backfill_embeddings("principles")
+    return result["processed"]
+
+
+async def backfill_compact_embeddings(batch_size: int = 500) -> dict[str, int]:
+    """Fill embedding_compact for rows written before migration 007.
+
+    Runs in batches so each UPDATE holds its row locks briefly; new writes are
+    already covered by the trigger. Until a row is converted the two-stage
+    search scans it exactly, so this can run while queries are served.
+    """
+    from utils.supabase_client import _run, get_client
+
+    client = get_client()
+    converted: dict[str, int] = {}
+    for table in ("document_chunks", "principles"):
+        total = 0
+        while True:
+            try:
+                response = await _run(
+                    lambda: client.rpc("backfill_compact_embeddings", {
+                        "table_name": table,
+                        "batch_size": batch_size,
+                    }).execute()
+                )
+            except Exception as exc:
+                logger.error("Compact embedding backfill failed for %s: %s", table, exc)
+                break
+            count = int(response.data or 0)
+            total += count
+            if count < batch_size:
+                break
+        converted[table] = total
+        logger.info("Backfilled %d compact embeddings in %s", total, table)
+    return converted
@@ -13,6 +13,8 @@ import logging
 import uuid
 from typing import Any, Awaitable, Callable, TypeVar
 
+from utils.tracing import current_correlation_id, span
+
 logger = logging.getLogger("contextflow")
 
 
@@ -51,17 +53,21 @@ def wrap_upstream_errors(
     name: str,
 ) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
     """Decorator: wrap an async LLM-call function. Generic exceptions are
-    logged with a fresh correlation_id and re-raised as UpstreamLLMError.
+    logged with a correlation_id and re-raised as UpstreamLLMError.
     UpstreamLLMError instances raised by the wrapped function pass through
     unchanged so nested wrappers don't double-wrap.
+
+    The call is timed as a tracing span named `name`; inside a trace the
+    trace's correlation_id is reused, otherwise a fresh one is minted.
     """
 
     def decorator(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
         @functools.wraps(fn)
         async def wrapper(*args, **kwargs):
-            correlation_id = new_correlation_id()
+            correlation_id = current_correlation_id() or new_correlation_id()
             try:
-                return await fn(*args, **kwargs)
+                with span(name):
+                    return await fn(*args, **kwargs)
             except UpstreamLLMError:
                 raise
             except Exception as exc:
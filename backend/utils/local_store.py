@@ -0,0 +1,1011 @@
+"""Single-file local storage backend (STORAGE_BACKEND=local).
+
+LocalStoreClient answers the part of the supabase-py client this backend
+uses: ``table(...)`` query chains, ``rpc(...)`` for the search, principle
+and embedding-maintenance functions of migrations 005–011, and
+``storage.from_(bucket)``. All of it is served from one SQLite file, so
+every module keeps calling ``get_client()`` unchanged and a single developer
+can run ContextFlow with no network at all.
+
+- Rows are JSON documents in ``records``. Vector columns (``embedding``,
+  ``embedding_next``) are stored as float32 blobs in ``vectors`` and never
+  appear in query results. Generated columns (``embedding_compact``,
+  ``content_tsv``) are ignored on write.
+- Every table is mirrored in memory after its first read and reloaded
+  after writes. Vector search is exact cosine over a per-table matrix,
+  vectorized with NumPy when it is installed and a plain loop otherwise.
+- Full-text search uses an FTS5 index (bm25) and is fused with the vector
+  ranking by reciprocal-rank fusion, as in the hybrid RPCs.
+"""
+from __future__ import annotations
+
+import heapq
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from array import array
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Callable, Optional
+
+try:
+    import numpy as np
+except ImportError:  # pure-Python fallback
+    np = None
+
+
+class LocalStoreError(RuntimeError):
+    pass
+
+
+@dataclass
+class LocalResponse:
+    data: Any
+    count: Optional[int] = None
+
+
+_VECTOR_COLUMNS = ("embedding", "embedding_next")
+_COMPACT_DIMS = 256
+_DERIVED_COLUMNS = ("embedding_compact", "content_tsv")
+_FTS_TABLES = ("document_chunks", "principles")
+
+_KEYS: dict[str, str] = {
+    "embedding_backfill_checkpoints": "job",
+    "embedding_versions": "version",
+}
+
+_DEFAULTS: dict[str, dict[str, Any]] = {
+    "projects": {"status": "active"},
+    "documents": {"analyzed": False},
+    "principles": {
+        "source": "generic",
+        "confidence_score": 0.5,
+        "times_applied": 0,
+        "times_failed": 0,
+        "production_months": 0,
+    },
+    "analysis_jobs": {
+        "status": "pending",
+        "principles_created": 0,
+        "principles_updated": 0,
+        "checkpoint": {},
+        "attempts": 0,
+    },
+    "embedding_versions": {"status": "building"},
+    "embedding_backfill_checkpoints": {"processed": 0},
+}
+
+_TIMESTAMPS: dict[str, tuple[str, ...]] = {
+    "projects": ("created_at", "updated_at"),
+    "documents": ("upload_date",),
+    "principles": ("created_at", "updated_at"),
+    "embedding_backfill_checkpoints": ("updated_at",),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    tbl TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (tbl, id)
+);
+CREATE TABLE IF NOT EXISTS vectors (
+    tbl TEXT NOT NULL,
+    id TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    vec BLOB NOT NULL,
+    PRIMARY KEY (tbl, id, slot)
+);
+CREATE TABLE IF NOT EXISTS objects (
+    bucket TEXT NOT NULL,
+    path TEXT NOT NULL,
+    data BLOB NOT NULL,
+    content_type TEXT,
+    PRIMARY KEY (bucket, path)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS fts USING fts5(
+    tbl UNINDEXED, id UNINDEXED, content, tokenize = 'porter unicode61'
+);
+"""
+
+_FTS_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _key(table: str) -> str:
+    return _KEYS.get(table, "id")
+
+
+# ── Filter helpers (PostgREST semantics, loosely typed) ───────────────────────
+def _as_bool(v: Any) -> bool:
+    return v.lower() == "true" if isinstance(v, str) else bool(v)
+
+
+def _coerce(a: Any, b: Any) -> tuple[Any, Any]:
+    if isinstance(a, bool) or isinstance(b, bool):
+        return _as_bool(a), _as_bool(b)
+    if isinstance(a, (int, float)) or isinstance(b, (int, float)):
+        try:
+            return float(a), float(b)
+        except (TypeError, ValueError):
+            pass
+    return str(a), str(b)
+
+
+def _eq(a: Any, b: Any) -> bool:
+    if a is None or b is None:
+        return a is None and b is None
+    x, y = _coerce(a, b)
+    return x == y
+
+
+def _compare(a: Any, b: Any, op: str) -> bool:
+    if a is None or b is None:
+        return False
+    x, y = _coerce(a, b)
+    return {"gt": x > y, "gte": x >= y, "lt": x < y, "lte": x <= y}[op]
+
+
+def _is(a: Any, value: Any) -> bool:
+    value = str(value).lower()
+    if value == "null":
+        return a is None
+    return a is (value == "true")
+
+
+def _predicate(column: str, op: str, value: Any) -> Callable[[dict], bool]:
+    if op == "eq":
+        return lambda r: _eq(r.get(column), value)
+    if op == "neq":
+        return lambda r: r.get(column) is not None and not _eq(r.get(column), value)
+    if op in ("gt", "gte", "lt", "lte"):
+        return lambda r: _compare(r.get(column), value, op)
+    if op == "is":
+        return lambda r: _is(r.get(column), value)
+    if op == "in":
+        values = list(value)
+        return lambda r: any(_eq(r.get(column), v) for v in values)
+    raise LocalStoreError(f"Unsupported filter operator {op!r}")
+
+
+def _parse_or(expression: str) -> Callable[[dict], bool]:
+    """'a.is.null,a.neq.2' -> any of the comma-separated column.op.value terms."""
+    terms = []
+    for part in expression.split(","):
+        negate = False
+        column, op, value = part.split(".", 2)
+        if op == "not":
+            negate = True
+            op, value = value.split(".", 1)
+        pred = _predicate(column, op, value)
+        terms.append((lambda p: (lambda r: not p(r)))(pred) if negate else pred)
+    return lambda r: any(t(r) for t in terms)
+
+
+def _vector_from(value: Any) -> list[float]:
+    if isinstance(value, str):
+        value = json.loads(value)
+    return [float(v) for v in value]
+
+
+# ── Store ─────────────────────────────────────────────────────────────────────
+class _Matrix:
+    """Unit-normalized vectors of one (table, slot), ready for dot products."""
+
+    def __init__(self, ids: list[str], vectors: list[list[float]]):
+        self.ids = ids
+        self.index = {id_: i for i, id_ in enumerate(ids)}
+        if np is not None:
+            m = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+            norms = np.linalg.norm(m, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.matrix = m / norms
+        else:
+            self.matrix = []
+            for v in vectors:
+                norm = math.sqrt(sum(x * x for x in v)) or 1.0
+                self.matrix.append([x / norm for x in v])
+
+    def scores(self, query: list[float]) -> "np.ndarray":
+        """similarities() as a NumPy array (NumPy only)."""
+        q = np.asarray(query, dtype=np.float32)
+        q /= np.linalg.norm(q) or 1.0
+        return self.matrix @ q
+
+    def similarities(self, query: list[float]) -> list[float]:
+        if not self.ids:
+            return []
+        if np is not None:
+            return self.scores(query).tolist()
+        norm = math.sqrt(sum(x * x for x in query)) or 1.0
+        q = [x / norm for x in query]
+        return [sum(a * b for a, b in zip(row, q)) for row in self.matrix]
+
+
+class LocalStore:
+    def __init__(self, path: str):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.RLock()
+        self._rows: dict[str, dict[str, dict]] = {}
+        self._matrices: dict[tuple[str, str], _Matrix] = {}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # Rows ────────────────────────────────────────────────────────────────────
+    def rows(self, table: str) -> dict[str, dict]:
+        """id -> row for `table`; vector columns appear as True when present."""
+        with self._lock:
+            cached = self._rows.get(table)
+            if cached is None:
+                cached = {
+                    id_: json.loads(data)
+                    for id_, data in self._conn.execute(
+                        "SELECT id, data FROM records WHERE tbl = ?", (table,)
+                    )
+                }
+                for id_, slot in self._conn.execute(
+                    "SELECT id, slot FROM vectors WHERE tbl = ?", (table,)
+                ):
+                    if id_ in cached:
+                        cached[id_][slot] = True
+                self._rows[table] = cached
+            return cached
+
+    def _invalidate(self, table: str) -> None:
+        self._rows.pop(table, None)
+        for slot in _VECTOR_COLUMNS:
+            self._matrices.pop((table, slot), None)
+
+    def put(self, table: str, row: dict) -> dict:
+        """Insert or replace one row. Vector columns are split out; None clears them."""
+        return self.put_many(table, [row])[0]
+
+    def put_many(self, table: str, rows: list[dict]) -> list[dict]:
+        """put() for many rows in one transaction, reloading the table once."""
+        return self.put_tables({table: rows})[table]
+
+    def put_tables(self, writes: dict[str, list[dict]]) -> dict[str, list[dict]]:
+        """put_many() for several tables in one transaction."""
+        with self._lock:
+            ids: dict[str, list[str]] = {}
+            self._conn.execute("BEGIN")
+            try:
+                for table, rows in writes.items():
+                    key, existing = _key(table), self.rows(table)
+                    if table in _FTS_TABLES:
+                        self._delete_fts(table, [
+                            str(row.get(key)) for row in rows if "content" in row and str(row.get(key)) in existing
+                        ])
+                    ids[table] = [self._write(table, key, row) for row in rows]
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            written = {}
+            for table, table_ids in ids.items():
+                self._invalidate(table)
+                current = self.rows(table)
+                written[table] = [current[id_] for id_ in table_ids]
+            return written
+
+    def _delete_fts(self, table: str, ids: list[str]) -> None:
+        # id is not indexed in fts, so each delete is a scan: one per statement
+        if ids:
+            self._conn.execute(
+                "DELETE FROM fts WHERE tbl = ? AND id IN (SELECT value FROM json_each(?))",
+                (table, json.dumps(ids)),
+            )
+
+    def _write(self, table: str, key: str, row: dict) -> str:
+        data = {k: v for k, v in row.items() if k not in _VECTOR_COLUMNS and k not in _DERIVED_COLUMNS}
+        vectors = {k: row[k] for k in _VECTOR_COLUMNS if k in row and row[k] is not True}
+        id_ = str(data[key])
+        self._conn.execute(
+            "INSERT OR REPLACE INTO records (tbl, id, data) VALUES (?, ?, ?)",
+            (table, id_, json.dumps(data, default=str)),
+        )
+        for slot, value in vectors.items():
+            if value is None:
+                self._conn.execute(
+                    "DELETE FROM vectors WHERE tbl = ? AND id = ? AND slot = ?", (table, id_, slot),
+                )
+            else:
+                blob = array("f", _vector_from(value)).tobytes()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO vectors (tbl, id, slot, vec) VALUES (?, ?, ?, ?)",
+                    (table, id_, slot, blob),
+                )
+        if table in _FTS_TABLES and "content" in data:
+            self._conn.execute(
+                "INSERT INTO fts (tbl, id, content) VALUES (?, ?, ?)",
+                (table, id_, data.get("content") or ""),
+            )
+        return id_
+
+    def delete(self, table: str, ids: list[str]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            for id_ in ids:
+                self._conn.execute("DELETE FROM records WHERE tbl = ? AND id = ?", (table, id_))
+                self._conn.execute("DELETE FROM vectors WHERE tbl = ? AND id = ?", (table, id_))
+            self._delete_fts(table, [str(id_) for id_ in ids])
+            self._conn.execute("COMMIT")
+            self._invalidate(table)
+
+    # Search ──────────────────────────────────────────────────────────────────
+    def matrix(self, table: str, slot: str = "embedding") -> _Matrix:
+        with self._lock:
+            cached = self._matrices.get((table, slot))
+            if cached is None:
+                ids, vectors = [], []
+                for id_, blob in self._conn.execute(
+                    "SELECT id, vec FROM vectors WHERE tbl = ? AND slot = ?", (table, slot)
+                ):
+                    ids.append(id_)
+                    vectors.append(array("f", blob).tolist())
+                cached = _Matrix(ids, vectors)
+                self._matrices[(table, slot)] = cached
+            return cached
+
+    def vector_ranking(
+        self,
+        table: str,
+        query: list[float],
+        eligible: Callable[[str], bool],
+        limit: int,
+    ) -> list[tuple[str, float]]:
+        """Top `limit` (id, cosine similarity) among eligible rows."""
+        matrix = self.matrix(table)
+        if np is not None and matrix.ids:
+            # Walk the rows best first until `limit` are eligible; usually
+            # most rows are, so this stops long before the end
+            sims = matrix.scores(query)
+            out = []
+            for i in np.argsort(-sims, kind="stable"):
+                id_ = matrix.ids[i]
+                if eligible(id_):
+                    out.append((id_, float(sims[i])))
+                    if len(out) == limit:
+                        break
+            return out
+        sims = matrix.similarities(query)
+        candidates = ((s, id_) for id_, s in zip(matrix.ids, sims) if eligible(id_))
+        return [(id_, s) for s, id_ in heapq.nlargest(limit, candidates)]
+
+    def text_ranking(
+        self,
+        table: str,
+        query_text: str,
+        eligible: Callable[[str], bool],
+        limit: int,
+    ) -> list[tuple[str, float]]:
+        """Top `limit` (id, rank) FTS matches; any query term may match."""
+        tokens = _FTS_TOKEN_RE.findall(query_text.lower())
+        if not tokens:
+            return []
+        match = " OR ".join(f'"{t}"' for t in tokens)
+        # FTS5 ranks only the top `window` matches (rank is bm25 here); the
+        # full ranking is needed only when too few of those are eligible
+        window = limit * 4
+        with self._lock:
+            for bound in (window, -1):
+                out, seen = [], 0
+                for id_, rank in self._conn.execute(
+                    "SELECT id, -rank FROM fts WHERE fts MATCH ? AND tbl = ? ORDER BY rank LIMIT ?",
+                    (match, table, bound),
+                ):
+                    seen += 1
+                    if eligible(id_):
+                        out.append((id_, rank))
+                        if len(out) == limit:
+                            return out
+                if seen < window:
+                    break
+        return out
+
+    # Objects ─────────────────────────────────────────────────────────────────
+    def put_object(self, bucket: str, path: str, data: bytes, content_type: Optional[str]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO objects (bucket, path, data, content_type) VALUES (?, ?, ?, ?)",
+                (bucket, path, data, content_type),
+            )
+
+    def put_object_stream(
+        self, bucket: str, path: str, stream: BinaryIO, size: int, content_type: Optional[str],
+        block_size: int = 1024 * 1024,
+    ) -> None:
+        """Write `size` bytes from `stream` into the object a block at a time."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                cursor = self._conn.execute(
+                    "INSERT OR REPLACE INTO objects (bucket, path, data, content_type) VALUES (?, ?, zeroblob(?), ?)",
+                    (bucket, path, size, content_type),
+                )
+                written = 0
+                with self._conn.blobopen("objects", "data", cursor.lastrowid) as blob:
+                    while written < size:
+                        block = stream.read(min(block_size, size - written))
+                        if not block:
+                            raise LocalStoreError(f"Stream ended after {written} of {size} bytes")
+                        blob.write(block)
+                        written += len(block)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get_object(self, bucket: str, path: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM objects WHERE bucket = ? AND path = ?", (bucket, path)
+            ).fetchone()
+        return bytes(row[0]) if row else None
+
+
+# ── Query builder ─────────────────────────────────────────────────────────────
+def _project(row: dict, columns: str) -> dict:
+    visible = {k: v for k, v in row.items() if k not in _VECTOR_COLUMNS}
+    if columns.strip() == "*":
+        return visible
+    wanted = [c.strip() for c in columns.split(",") if c.strip()]
+    return {c: visible.get(c) for c in wanted}
+
+
+class _Query:
+    def __init__(self, store: LocalStore, table: str):
+        self._store = store
+        self._table = table
+        self._op = "select"
+        self._columns = "*"
+        self._count: Optional[str] = None
+        self._payload: Any = None
+        self._filters: list[Callable[[dict], bool]] = []
+        self._negate_next = False
+        self._order: list[tuple[str, bool]] = []
+        self._limit: Optional[int] = None
+        self._on_conflict: Optional[list[str]] = None
+
+    # Verbs
+    def select(self, columns: str = "*", count: Optional[str] = None) -> "_Query":
+        self._columns, self._count = columns, count
+        return self
+
+    def insert(self, payload: Any) -> "_Query":
+        self._op, self._payload = "insert", payload
+        return self
+
+    def upsert(self, payload: Any, on_conflict: str = "", **_: Any) -> "_Query":
+        self._op, self._payload = "upsert", payload
+        self._on_conflict = [c.strip() for c in on_conflict.split(",") if c.strip()] or None
+        return self
+
+    def update(self, payload: dict) -> "_Query":
+        self._op, self._payload = "update", payload
+        return self
+
+    def delete(self) -> "_Query":
+        self._op = "delete"
+        return self
+
+    # Filters
+    @property
+    def not_(self) -> "_Query":
+        self._negate_next = True
+        return self
+
+    def _filter(self, column: str, op: str, value: Any) -> "_Query":
+        pred = _predicate(column, op, value)
+        if self._negate_next:
+            self._negate_next = False
+            self._filters.append(lambda r: not pred(r))
+        else:
+            self._filters.append(pred)
+        return self
+
+    def eq(self, column: str, value: Any) -> "_Query":
+        return self._filter(column, "eq", value)
+
+    def neq(self, column: str, value: Any) -> "_Query":
+        return self._filter(column, "neq", value)
+
+    def gt(self, column: str, value: Any) -> "_Query":
+        return self._filter(column, "gt", value)
+
+    def gte(self, column: str, value: Any) -> "_Query":
+        return self._filter(column, "gte", value)
+
+    def lt(self, column: str, value: Any) -> "_Query":
+        return self._filter(column, "lt", value)
+
+    def lte(self, column: str, value: Any) -> "_Query":
+        return self._filter(column, "lte", value)
+
+    def is_(self, column: str, value: Any) -> "_Query":
+        return self._filter(column, "is", value)
+
+    def in_(self, column: str, values: list) -> "_Query":
+        return self._filter(column, "in", values)
+
+    def or_(self, expression: str) -> "_Query":
+        self._filters.append(_parse_or(expression))
+        return self
+
+    def order(self, column: str, desc: bool = False) -> "_Query":
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, n: int) -> "_Query":
+        self._limit = n
+        return self
+
+    # Execution
+    def _matching(self) -> list[dict]:
+        rows = [r for r in self._store.rows(self._table).values() if all(f(r) for f in self._filters)]
+        for column, desc in reversed(self._order):
+            rows.sort(key=lambda r: (r.get(column) is None, r.get(column) if r.get(column) is not None else ""),
+                      reverse=desc)
+        return rows
+
+    def _new_row(self, payload: dict) -> dict:
+        row = {**_DEFAULTS.get(self._table, {}), **payload}
+        key = _key(self._table)
+        if row.get(key) is None:
+            row[key] = str(uuid.uuid4())
+        for column in _TIMESTAMPS.get(self._table, ("created_at",)):
+            row.setdefault(column, _now())
+        return row
+
+    def execute(self) -> LocalResponse:
+        store, table = self._store, self._table
+        if self._op == "select":
+            rows = self._matching()
+            total = len(rows)
+            if self._limit is not None:
+                rows = rows[: self._limit]
+            return LocalResponse([_project(r, self._columns) for r in rows], total if self._count else None)
+
+        if self._op == "insert":
+            payloads = self._payload if isinstance(self._payload, list) else [self._payload]
+            inserted = store.put_many(table, [self._new_row(p) for p in payloads])
+            return LocalResponse([_project(r, "*") for r in inserted])
+
+        if self._op == "upsert":
+            payloads = self._payload if isinstance(self._payload, list) else [self._payload]
+            key = _key(table)
+            existing = store.rows(table)
+            if self._on_conflict:
+                # Match on the given unique columns instead of the key
+                columns = self._on_conflict
+                payloads = [dict(p) for p in payloads]
+                by_columns = {tuple(str(r.get(c)) for c in columns): r for r in existing.values()}
+                existing = {}
+                for p in payloads:
+                    match = by_columns.get(tuple(str(p.get(c)) for c in columns))
+                    if match is not None:
+                        p.setdefault(key, match[key])
+                        existing[str(match[key])] = match
+            rows = []
+            for p in payloads:
+                current = existing.get(str(p.get(key))) if p.get(key) is not None else None
+                rows.append({**current, **p} if current is not None else self._new_row(p))
+            written = store.put_many(table, rows)
+            return LocalResponse([_project(r, "*") for r in written])
+
+        if self._op == "update":
+            # Matched and written under one lock, so a conditional update (such
+            # as claiming a pending job) is atomic, as it is in Postgres
+            with store._lock:
+                updated = store.put_many(table, [{**r, **self._payload} for r in self._matching()])
+            return LocalResponse([_project(r, "*") for r in updated])
+
+        if self._op == "delete":
+            matching = self._matching()
+            store.delete(table, [str(r[_key(table)]) for r in matching])
+            return LocalResponse([_project(r, "*") for r in matching])
+
+        raise LocalStoreError(f"Unsupported operation {self._op!r}")
+
+
+# ── RPCs (mirrors of the SQL functions) ───────────────────────────────────────
+class _Rpc:
+    def __init__(self, fn: Callable[[], Any]):
+        self._fn = fn
+
+    def execute(self) -> LocalResponse:
+        return LocalResponse(self._fn())
+
+
+def _version_ok(row: dict, version_filter: Optional[str]) -> bool:
+    return version_filter is None or row.get("embedding_version") == version_filter
+
+
+def _rrf(
+    semantic: list[tuple[str, float]],
+    lexical: list[tuple[str, float]],
+    rrf_k: int,
+) -> list[tuple[str, float, float]]:
+    """(id, text_rank, score) ordered by fused score."""
+    scores: dict[str, float] = {}
+    text_ranks: dict[str, float] = {}
+    for rank, (id_, _) in enumerate(semantic, start=1):
+        scores[id_] = scores.get(id_, 0.0) + 1.0 / (rrf_k + rank)
+    for rank, (id_, text_rank) in enumerate(lexical, start=1):
+        scores[id_] = scores.get(id_, 0.0) + 1.0 / (rrf_k + rank)
+        text_ranks[id_] = text_rank
+    return sorted(
+        ((id_, text_ranks.get(id_, 0.0), score) for id_, score in scores.items()),
+        key=lambda t: t[2],
+        reverse=True,
+    )
+
+
+class _Functions:
+    def __init__(self, store: LocalStore):
+        self._store = store
+        self._scopes: dict[tuple, tuple[tuple, tuple[dict, dict, dict]]] = {}
+
+    # Scopes
+    def _chunk_scope(self, user_id: Optional[str], project_id: Optional[str]) -> tuple[dict, dict, dict]:
+        # Reused while the three tables are unchanged: a write replaces the
+        # table's row dict, so identity is the version
+        tables = tuple(self._store.rows(t) for t in ("projects", "documents", "document_chunks"))
+        cached = self._scopes.get((user_id, project_id))
+        if cached is not None and all(a is b for a, b in zip(cached[0], tables)):
+            return cached[1]
+        project_rows, document_rows, chunk_rows = tables
+        projects = {
+            pid: p for pid, p in project_rows.items()
+            if _eq(p.get("user_id"), user_id) and (project_id is None or pid == str(project_id))
+        }
+        documents = {
+            did: d for did, d in document_rows.items()
+            if d.get("analyzed") and str(d.get("project_id")) in projects
+        }
+        chunks = {
+            cid: c for cid, c in chunk_rows.items()
+            if str(c.get("document_id")) in documents
+        }
+        self._scopes[(user_id, project_id)] = (tables, (projects, documents, chunks))
+        return projects, documents, chunks
+
+    def _principle_scope(self, user_id: Optional[str], min_confidence: float, category: Optional[str]) -> dict:
+        return {
+            pid: p for pid, p in self._store.rows("principles").items()
+            if (p.get("source") == "generic" or _eq(p.get("user_id"), user_id))
+            and float(p.get("confidence_score") or 0.0) >= float(min_confidence)
+            and (category is None or p.get("category") == category)
+        }
+
+    # Chunk searches
+    def _chunk_row(self, chunk: dict, documents: dict, projects: dict) -> dict:
+        doc = documents[str(chunk["document_id"])]
+        project = projects[str(doc["project_id"])]
+        return {
+            "id": chunk["id"],
+            "content": chunk.get("content"),
+            "chunk_type": chunk.get("chunk_type"),
+            "section_title": chunk.get("section_title"),
+            "chunk_index": chunk.get("chunk_index"),
+            "document_id": doc["id"],
+            "filename": doc.get("filename"),
+            "doc_category": doc.get("doc_category"),
+            "project_id": project["id"],
+            "project_name": project.get("name"),
+        }
+
+    def search_document_chunks(
+        self, query_embedding, user_id_filter, project_id_filter=None, match_count=10, **_: Any,
+    ) -> list[dict]:
+        projects, documents, chunks = self._chunk_scope(user_id_filter, project_id_filter)
+        ranked = self._store.vector_ranking(
+            "document_chunks", _vector_from(query_embedding), lambda i: i in chunks, match_count,
+        )
+        return [
+            {**self._chunk_row(chunks[id_], documents, projects), "similarity": sim}
+            for id_, sim in ranked
+        ]
+
+    def hybrid_search_document_chunks(
+        self, query_text, query_embedding, user_id_filter, project_id_filter=None,
+        match_count=10, rrf_k=60, embedding_version_filter=None, return_embeddings=False, **_: Any,
+    ) -> list[dict]:
+        projects, documents, chunks = self._chunk_scope(user_id_filter, project_id_filter)
+        query = _vector_from(query_embedding)
+        semantic = self._store.vector_ranking(
+            "document_chunks", query,
+            lambda i: i in chunks and _version_ok(chunks[i], embedding_version_filter),
+            match_count * 2,
+        )
+        lexical = self._store.text_ranking("document_chunks", query_text or "", lambda i: i in chunks, match_count * 2)
+        similarity = dict(semantic)
+        out = []
+        for id_, text_rank, score in _rrf(semantic, lexical, rrf_k)[:match_count]:
+            out.append({
+                **self._chunk_row(chunks[id_], documents, projects),
+                "similarity": similarity.get(id_, self._similarity("document_chunks", id_, query)
+                                             if _version_ok(chunks[id_], embedding_version_filter) else 0.0),
+                "text_rank": text_rank,
+                "score": score,
+                "compact_embedding": self._compact("document_chunks", id_) if return_embeddings else None,
+            })
+        return out
+
+    # Principle searches
+    @staticmethod
+    def _principle_row(p: dict) -> dict:
+        return {
+            k: p.get(k) for k in (
+                "id", "content", "type", "category", "source", "confidence_score", "times_applied",
+                "when_to_use", "when_not_to_use", "reasoning", "tradeoffs",
+            )
+        }
+
+    def search_principles(
+        self, query_embedding, user_id_filter, min_confidence=0.5, category_filter=None,
+        match_count=5, embedding_version_filter=None, **_: Any,
+    ) -> list[dict]:
+        scope = self._principle_scope(user_id_filter, min_confidence, category_filter)
+        ranked = self._store.vector_ranking(
+            "principles", _vector_from(query_embedding),
+            lambda i: i in scope and _version_ok(scope[i], embedding_version_filter),
+            match_count,
+        )
+        return [{**self._principle_row(scope[id_]), "similarity": sim} for id_, sim in ranked]
+
+    def hybrid_search_principles(
+        self, query_text, query_embedding, user_id_filter, min_confidence=0.5, category_filter=None,
+        match_count=5, rrf_k=60, embedding_version_filter=None, return_embeddings=False, **_: Any,
+    ) -> list[dict]:
+        scope = self._principle_scope(user_id_filter, min_confidence, category_filter)
+        query = _vector_from(query_embedding)
+        semantic = self._store.vector_ranking(
+            "principles", query,
+            lambda i: i in scope and _version_ok(scope[i], embedding_version_filter),
+            match_count * 2,
+        )
+        lexical = self._store.text_ranking("principles", query_text or "", lambda i: i in scope, match_count * 2)
+        similarity = dict(semantic)
+        out = []
+        for id_, text_rank, score in _rrf(semantic, lexical, rrf_k)[:match_count]:
+            out.append({
+                **self._principle_row(scope[id_]),
+                "similarity": similarity.get(id_, self._similarity("principles", id_, query)
+                                             if _version_ok(scope[id_], embedding_version_filter) else 0.0),
+                "text_rank": text_rank,
+                "score": score,
+                "compact_embedding": self._compact("principles", id_) if return_embeddings else None,
+            })
+        return out
+
+    def _compact(self, table: str, id_: str) -> Optional[list[float]]:
+        """embedding_compact as the 007 trigger derives it: the first 256
+        dimensions, renormalized."""
+        matrix = self._store.matrix(table)
+        i = matrix.index.get(id_)
+        if i is None:
+            return None
+        if np is not None:
+            head = matrix.matrix[i][:_COMPACT_DIMS].astype(np.float64)
+            return (head / (np.linalg.norm(head) or 1.0)).tolist()
+        head = [float(x) for x in matrix.matrix[i][:_COMPACT_DIMS]]
+        norm = math.sqrt(sum(x * x for x in head)) or 1.0
+        return [x / norm for x in head]
+
+    def _similarity(self, table: str, id_: str, query: list[float]) -> float:
+        matrix = self._store.matrix(table)
+        i = matrix.index.get(id_)
+        if i is None:
+            return 0.0
+        if np is not None:
+            q = np.asarray(query, dtype=np.float32)
+            return float(matrix.matrix[i] @ (q / (np.linalg.norm(q) or 1.0)))
+        return _Matrix([id_], [list(matrix.matrix[i])]).similarities(query)[0]
+
+    # Batch searches (migration 013): one result set per query, tagged query_index
+    def hybrid_search_document_chunks_batch(
+        self, query_texts, query_embeddings, user_id_filter, project_id_filters=None, match_count=10,
+        rrf_k=60, embedding_version_filter=None, return_embeddings=False, **_: Any,
+    ) -> list[dict]:
+        project_ids = project_id_filters or [None] * len(query_texts)
+        return [
+            {"query_index": n, **row}
+            for n, (text, embedding, project_id) in enumerate(zip(query_texts, query_embeddings, project_ids))
+            for row in self.hybrid_search_document_chunks(
+                text, embedding, user_id_filter, project_id, match_count, rrf_k,
+                embedding_version_filter, return_embeddings,
+            )
+        ]
+
+    def hybrid_search_principles_batch(
+        self, query_texts, query_embeddings, user_id_filter, min_confidence=0.5, category_filters=None,
+        match_count=5, rrf_k=60, embedding_version_filter=None, return_embeddings=False, **_: Any,
+    ) -> list[dict]:
+        categories = category_filters or [None] * len(query_texts)
+        return [
+            {"query_index": n, **row}
+            for n, (text, embedding, category) in enumerate(zip(query_texts, query_embeddings, categories))
+            for row in self.hybrid_search_principles(
+                text, embedding, user_id_filter, min_confidence, category, match_count, rrf_k,
+                embedding_version_filter, return_embeddings,
+            )
+        ]
+
+    # Search is exact here, so the two-stage variants are the same functions
+    hybrid_search_document_chunks_2stage = hybrid_search_document_chunks
+    hybrid_search_principles_2stage = hybrid_search_principles
+    hybrid_search_document_chunks_batch_2stage = hybrid_search_document_chunks_batch
+    hybrid_search_principles_batch_2stage = hybrid_search_principles_batch
+
+    # Principle maintenance
+    def bump_principle(self, principle_id, delta=0.05, cap=0.95, project_id=None, **_: Any) -> list[dict]:
+        store = self._store
+        with store._lock:
+            row = store.rows("principles").get(str(principle_id))
+            if row is None:
+                return []
+            confidence = float(row.get("confidence_score") or 0.0)
+            source_projects = list(row.get("source_projects") or [])
+            if project_id is not None and project_id not in source_projects:
+                source_projects.append(project_id)
+            updated = store.put("principles", {
+                **row,
+                # confidence_score is DECIMAL(3,2)
+                "confidence_score": round(max(confidence, min(confidence + float(delta), float(cap))), 2),
+                "times_applied": int(row.get("times_applied") or 0) + 1,
+                "source_projects": source_projects,
+                "updated_at": _now(),
+            })
+            return [{k: updated.get(k) for k in ("id", "confidence_score", "times_applied", "source_projects")}]
+
+    # Embedding maintenance
+    def backfill_compact_embeddings(self, table_name, batch_size=500, **_: Any) -> int:
+        return 0
+
+    def bulk_update_embeddings(
+        self, table_name, ids, embeddings, version, job=None, last_id=None, model=None,
+        slot="embedding", **_: Any,
+    ) -> int:
+        if table_name not in _FTS_TABLES or slot not in _VECTOR_COLUMNS:
+            raise LocalStoreError(f"bulk_update_embeddings: unsupported target {table_name}.{slot}")
+        store = self._store
+        with store._lock:
+            rows = store.rows(table_name)
+            model_column = "embedding_model" if slot == "embedding" else "embedding_next_model"
+            patched = []
+            for id_, literal in zip(ids, embeddings):
+                row = rows.get(str(id_))
+                if row is None:
+                    continue
+                patch = {slot: literal, f"{slot}_version": version}
+                if model is not None:
+                    patch[model_column] = model
+                patched.append({**row, **patch})
+            # The page and its checkpoint commit together, as in the SQL function
+            writes = {table_name: patched}
+            if job is not None:
+                checkpoints = store.rows("embedding_backfill_checkpoints")
+                current = checkpoints.get(
+                    job, {"job": job, "table_name": table_name, "version": version, "processed": 0},
+                )
+                writes["embedding_backfill_checkpoints"] = [{
+                    **current,
+                    "last_id": last_id,
+                    "processed": int(current.get("processed") or 0) + len(patched),
+                    "updated_at": _now(),
+                }]
+            store.put_tables(writes)
+            return len(patched)
+
+    def embedding_version_coverage(self, target_version, **_: Any) -> list[dict]:
+        out = []
+        for table in ("document_chunks", "principles"):
+            embedded = [r for r in self._store.rows(table).values() if r.get("embedding")]
+            covered = [
+                r for r in embedded
+                if target_version in (r.get("embedding_version"), r.get("embedding_next_version"))
+            ]
+            out.append({"table_name": table, "total": len(embedded), "covered": len(covered)})
+        return out
+
+    def cutover_embedding_version(self, target_version, **_: Any) -> bool:
+        store = self._store
+        with store._lock:
+            versions = store.rows("embedding_versions")
+            if versions.get(target_version, {}).get("status") != "building":
+                raise LocalStoreError(f"cutover_embedding_version: {target_version} is not a building version")
+            if any(c["covered"] < c["total"] for c in self.embedding_version_coverage(target_version)):
+                return False
+            writes: dict[str, list[dict]] = {}
+            for table in ("document_chunks", "principles"):
+                writes[table] = []
+                for id_, row in store.rows(table).items():
+                    if row.get("embedding_next_version") != target_version:
+                        continue
+                    blob = store._conn.execute(
+                        "SELECT vec FROM vectors WHERE tbl = ? AND id = ? AND slot = 'embedding_next'",
+                        (table, id_),
+                    ).fetchone()
+                    writes[table].append({
+                        **row,
+                        "embedding": array("f", blob[0]).tolist() if blob else None,
+                        "embedding_model": row.get("embedding_next_model"),
+                        "embedding_version": target_version,
+                        "embedding_next": None,
+                        "embedding_next_model": None,
+                        "embedding_next_version": None,
+                    })
+            writes["embedding_versions"] = [
+                {**row, "status": "retired"} for row in versions.values() if row.get("status") == "active"
+            ] + [{**versions[target_version], "status": "active", "activated_at": _now()}]
+            # The swap and the version flip commit together, as in the SQL function
+            store.put_tables(writes)
+            return True
+
+
+# ── Storage buckets ───────────────────────────────────────────────────────────
+class _Bucket:
+    def __init__(self, store: LocalStore, name: str):
+        self._store = store
+        self._name = name
+
+    def upload(self, path: str, file: Any, file_options: Optional[dict] = None) -> dict:
+        if isinstance(file, (str, os.PathLike)) and os.path.exists(file):
+            with open(file, "rb") as f:
+                file = f.read()
+        content_type = (file_options or {}).get("content-type")
+        self._store.put_object(self._name, path, bytes(file), content_type)
+        return {"Key": f"{self._name}/{path}"}
+
+    def upload_stream(self, path: str, stream: BinaryIO, size: int, content_type: Optional[str] = None) -> dict:
+        self._store.put_object_stream(self._name, path, stream, size, content_type)
+        return {"Key": f"{self._name}/{path}"}
+
+    def download(self, path: str) -> bytes:
+        data = self._store.get_object(self._name, path)
+        if data is None:
+            raise LocalStoreError(f"Object not found: {self._name}/{path}")
+        return data
+
+
+class _Storage:
+    def __init__(self, store: LocalStore):
+        self._store = store
+
+    def from_(self, bucket: str) -> _Bucket:
+        return _Bucket(self._store, bucket)
+
+    def get_bucket(self, name: str) -> dict:
+        return {"id": name, "name": name, "public": False}
+
+
+class LocalStoreClient:
+    """Drop-in for the supabase Client used across the backend."""
+
+    def __init__(self, path: str):
+        self.store = LocalStore(path)
+        self.storage = _Storage(self.store)
+        self._functions = _Functions(self.store)
+
+    def table(self, name: str) -> _Query:
+        return _Query(self.store, name)
+
+    def rpc(self, name: str, params: Optional[dict] = None) -> _Rpc:
+        fn = getattr(self._functions, name, None)
+        if fn is None or name.startswith("_"):
+            raise LocalStoreError(f"RPC {name!r} is not available in the local store")
+        return _Rpc(lambda: fn(**(params or {})))
@@ -0,0 +1,540 @@
+"""Process-local search cache for hot partitions (STORAGE_BACKEND=supabase).
+
+Chunks change only on upload and principles only when the learning engine
+runs, yet every query searched them through a hybrid RPC. A partition is one
+project's chunks, all of a user's chunks, or the user's principles. Once a
+partition has missed SEARCH_CACHE_HOT_AFTER times, its rows are loaded in the
+background and searched with utils.search_kernel: exact cosine similarity
+over float32 shards, one per project, with the embedding-version, category
+and confidence filters applied as column masks. Keyword ranking is FTS5
+bm25 over the partition's rows, kept in a small SQLite file beside the
+shards. The two rankings are fused by reciprocal rank into the RPC's row shape,
+as on the local backend. Vector similarities are exact. Both lexical sides
+match any of the query's terms (or_tsquery, migration 006), but because this
+one is bm25 rather than Postgres' ts_rank_cd, the fused order can differ a
+little. While a partition is cold, loading, or larger than
+SEARCH_CACHE_MAX_ROWS, search() returns None and the caller goes to the
+database. SEARCH_CACHE_MAX_ROWS also bounds all partitions together; the
+least recently searched are evicted first. The cache needs NumPy and is off
+without it.
+
+Partitions are written under SEARCH_INDEX_DIR, keyed by database, user,
+scope and version counter, and their matrices are memory-mapped from there.
+A restarted server reopens a partition whose counter has not moved instead
+of reloading it from the database. Superseded versions are deleted.
+
+Freshness: migration 012 keeps a version counter per scope, which triggers
+bump on every write to chunks, documents, projects and principles. The
+counters of the partitions held are read at most every SEARCH_CACHE_CHECK_S,
+and a partition whose counter has moved is dropped. Writes made through
+utils.supabase_client drop the partitions they touch at once, so this
+process always reads its own writes.
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import contextvars
+import hashlib
+import importlib.util
+import logging
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional
+
+from utils import config
+from utils.tracing import register_collector, span
+
+if TYPE_CHECKING:
+    from utils.local_store import LocalStore
+    from utils.search_kernel import Shard
+
+logger = logging.getLogger("contextflow")
+
+PAGE_SIZE = 1000  # PostgREST's default cap on rows per response
+COMPACT_DIMS = 256  # embedding_compact (migration 007)
+
+_CHUNK_COLUMNS = (
+    "id, content, chunk_type, section_title, chunk_index, document_id, embedding, embedding_version, "
+    "documents!inner(id, filename, doc_category, analyzed, project_id, projects!inner(id, name, user_id))"
+)
+_PRINCIPLE_COLUMNS = (
+    "id, content, type, category, source, confidence_score, times_applied, when_to_use, "
+    "when_not_to_use, reasoning, tradeoffs, user_id, embedding, embedding_version"
+)
+
+# Hybrid RPC -> the table whose partitions answer it
+_TABLES = {
+    "hybrid_search_document_chunks": "document_chunks",
+    "hybrid_search_principles": "principles",
+}
+
+# Row shape of each hybrid RPC, before similarity, text_rank, score and compact_embedding
+_RESULT_COLUMNS = {
+    "document_chunks": (
+        "id", "content", "chunk_type", "section_title", "chunk_index", "document_id", "filename",
+        "doc_category", "project_id", "project_name",
+    ),
+    "principles": (
+        "id", "content", "type", "category", "source", "confidence_score", "times_applied",
+        "when_to_use", "when_not_to_use", "reasoning", "tradeoffs",
+    ),
+}
+
+# Shard columns the masks filter on
+_FILTER_COLUMNS = {
+    "document_chunks": ("embedding_version", "doc_category"),
+    "principles": ("embedding_version", "category", "confidence_score"),
+}
+
+
+@dataclass(frozen=True)
+class PartitionKey:
+    table: str
+    user_id: str
+    project_id: Optional[str] = None
+
+    @property
+    def scope(self) -> str:
+        """Version counter that covers this partition (migration 012)."""
+        if self.table == "principles":
+            return "principles"
+        return f"chunks:{self.project_id}" if self.project_id else "chunks"
+
+
+# A partition's rows, chunks flattened with their document and project
+# fields; None when it is over SEARCH_CACHE_MAX_ROWS
+Loader = Callable[[PartitionKey], Awaitable[Optional[list[dict]]]]
+VersionReader = Callable[[list[str]], Awaitable[dict[str, Any]]]
+
+
+@dataclass
+class _Partition:
+    version: Any
+    table: str
+    shards: list["Shard"]  # chunks: one per project; principles: one
+    store: "LocalStore"    # rows without vectors, and their FTS index
+    path: Optional[str] = None
+    _owners: dict[str, "Shard"] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self._owners = {id_: shard for shard in self.shards for id_ in shard.ids.tolist()}
+
+    @property
+    def rows(self) -> int:
+        return len(self._owners)
+
+    @classmethod
+    def build(cls, version: Any, table: str, rows: list[dict], path: Optional[str] = None) -> "_Partition":
+        """Index `rows`; with `path`, written there and memory-mapped back."""
+        from utils.local_store import LocalStore, _vector_from
+        from utils.search_kernel import Shard
+
+        groups: dict[str, list[dict]] = {}
+        for row in rows:
+            groups.setdefault(str(row.get("project_id") or ""), []).append(row)
+        staging = None
+        if path is not None:
+            staging = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{uuid.uuid4().hex}")
+            os.makedirs(staging)
+        try:
+            store = LocalStore(os.path.join(staging, "rows.db") if staging else ":memory:")
+            shards = []
+            for n, group in enumerate(groups.values()):
+                vectors = [row.pop("embedding", None) for row in group]
+                dims = next((len(_vector_from(v)) for v in vectors if v is not None), 0)
+                for row, vector in zip(group, vectors):
+                    if vector is None:  # never matches a version filter, like a NULL embedding
+                        row["embedding_version"] = None
+                shard = Shard.build(
+                    [row["id"] for row in group],
+                    [_vector_from(v) if v is not None else [0.0] * dims for v in vectors],
+                    {name: [row.get(name) for row in group] for name in _FILTER_COLUMNS[table]},
+                )
+                shards.append(shard.save(os.path.join(staging, "shards", str(n))) if staging else shard)
+                store.put_many(table, group)
+            if staging is None:
+                return cls(version, table, shards, store)
+            store.close()
+            try:
+                os.replace(staging, path)
+            except OSError:  # another process wrote this version first
+                shutil.rmtree(staging, ignore_errors=True)
+            staging = None
+        except BaseException:
+            if staging is not None:
+                shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return cls.open(version, table, path)
+
+    @classmethod
+    def open(cls, version: Any, table: str, path: str) -> "_Partition":
+        from utils.local_store import LocalStore
+        from utils.search_kernel import Shard
+
+        shard_dir = os.path.join(path, "shards")
+        shards = [Shard.open(os.path.join(shard_dir, name)) for name in sorted(os.listdir(shard_dir), key=int)] \
+            if os.path.isdir(shard_dir) else []
+        store = LocalStore(os.path.join(path, "rows.db"))
+        store.rows(table)  # read now rather than on the first search
+        return cls(version, table, shards, store, path)
+
+    def search_many(self, params_list: list[dict[str, Any]]) -> list[list[dict]]:
+        """The hybrid RPC's rows for each of `params_list`, as _Functions
+        computes them on the local backend. The vector side of all the
+        queries is one batched product per shard."""
+        import numpy as np
+
+        from utils.local_store import _vector_from
+        from utils.search_kernel import search_shards
+
+        queries = [_vector_from(params["query_embedding"]) for params in params_list]
+        lexical_masks, semantic_masks = [], []
+        for params in params_list:
+            if self.table == "principles":
+                filters = {"equal": {"category": params.get("category_filter")},
+                           "at_least": {"confidence_score": float(params.get("min_confidence", 0.5))}}
+            else:
+                filters = {"equal": {}, "at_least": {}}
+            lexical_masks.append({id(s): s.mask(**filters) for s in self.shards})
+            filters["equal"]["embedding_version"] = params.get("embedding_version_filter")
+            semantic_masks.append([s.mask(**filters) for s in self.shards])
+
+        # One (queries x rows) mask per shard; None where nothing is filtered
+        shard_masks = []
+        for n, shard in enumerate(self.shards):
+            masks = [m[n] for m in semantic_masks]
+            if all(m is None for m in masks):
+                shard_masks.append(None)
+            elif len(masks) == 1:
+                shard_masks.append(masks[0])
+            else:
+                shard_masks.append(np.stack([np.ones(len(shard), dtype=bool) if m is None else m for m in masks]))
+        k = max(int(params.get("match_count") or 10) for params in params_list) * 2
+        semantic = search_shards(self.shards, queries, k, shard_masks)
+        return [
+            self._fuse(params, query, hits, masks)
+            for params, query, hits, masks in zip(params_list, queries, semantic, lexical_masks)
+        ]
+
+    def _fuse(
+        self,
+        params: dict[str, Any],
+        query: list[float],
+        semantic: list[tuple[str, float]],
+        lexical_masks: dict[int, Any],
+    ) -> list[dict]:
+        from utils.local_store import _rrf
+
+        match_count = int(params.get("match_count") or 10)
+        version = params.get("embedding_version_filter")
+        semantic = semantic[:match_count * 2]
+
+        def eligible(id_: str) -> bool:
+            shard = self._owners.get(id_)
+            if shard is None:
+                return False
+            mask = lexical_masks[id(shard)]
+            return mask is None or bool(mask[shard.row(id_)])
+
+        lexical = self.store.text_ranking(self.table, params.get("query_text") or "", eligible, match_count * 2)
+        rows = self.store.rows(self.table)
+        similarity = dict(semantic)
+        out = []
+        for id_, text_rank, score in _rrf(semantic, lexical, int(params.get("rrf_k") or 60))[:match_count]:
+            row, shard = rows[id_], self._owners[id_]
+            if id_ not in similarity:
+                version_ok = version is None or row.get("embedding_version") == version
+                similarity[id_] = shard.similarity(id_, query) if version_ok else 0.0
+            out.append({
+                **{k: row.get(k) for k in _RESULT_COLUMNS[self.table]},
+                "similarity": similarity[id_],
+                "text_rank": text_rank,
+                "score": score,
+                "compact_embedding": shard.compact(id_, COMPACT_DIMS) if params.get("return_embeddings") else None,
+            })
+        return out
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    loads: int = 0
+    reopened: int = 0
+    invalidations: int = 0
+    evictions: int = 0
+
+
+def _index_path(key: PartitionKey, version: Any) -> Optional[str]:
+    """Where `key` at `version` is kept on disk; None when it is not (no
+    SEARCH_INDEX_DIR, or no counter yet, which does not identify the rows)."""
+    if not config.SEARCH_INDEX_DIR or version is None:
+        return None
+    database = hashlib.sha1(config.SUPABASE_URL.encode()).hexdigest()[:12]
+    return os.path.join(
+        os.path.expanduser(config.SEARCH_INDEX_DIR), database, key.user_id, key.scope.replace(":", "-"),
+        hashlib.sha1(str(version).encode()).hexdigest()[:16],
+    )
+
+
+def _remove_other_versions(path: str) -> None:
+    scope_dir = os.path.dirname(path)
+    for name in os.listdir(scope_dir):
+        if not name.startswith(".") and name != os.path.basename(path):
+            shutil.rmtree(os.path.join(scope_dir, name), ignore_errors=True)
+
+
+async def _load_from_db(key: PartitionKey) -> Optional[list[dict]]:
+    """Rows of one partition, page by page; None when it is over SEARCH_CACHE_MAX_ROWS."""
+    from utils.supabase_client import _run, get_client
+
+    client = get_client()
+
+    def query(count: Optional[str]):
+        if key.table == "principles":
+            return client.table("principles").select(_PRINCIPLE_COLUMNS, count=count).or_(
+                f"source.eq.generic,user_id.eq.{key.user_id}"
+            )
+        q = (
+            client.table("document_chunks").select(_CHUNK_COLUMNS, count=count)
+            .eq("documents.analyzed", True)
+            .eq("documents.projects.user_id", key.user_id)
+        )
+        return q.eq("documents.project_id", key.project_id) if key.project_id else q
+
+    rows: list[dict] = []
+    while True:
+        first = not rows
+        response = await _run(
+            query("exact" if first else None).order("id").range(len(rows), len(rows) + PAGE_SIZE - 1).execute
+        )
+        if first and (response.count or 0) > config.SEARCH_CACHE_MAX_ROWS:
+            return None
+        page = response.data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            break
+
+    if key.table == "document_chunks":
+        for row in rows:
+            document = row.pop("documents")
+            project = document.pop("projects")
+            row.update(
+                filename=document.get("filename"),
+                doc_category=document.get("doc_category"),
+                project_id=project["id"],
+                project_name=project.get("name"),
+            )
+    return rows
+
+
+async def _versions_from_db(scopes: list[str]) -> dict[str, str]:
+    from utils.supabase_client import _run, get_client
+
+    client = get_client()
+    response = await _run(
+        client.table("search_cache_versions").select("scope, version, updated_at").in_("scope", scopes).execute
+    )
+    # updated_at tells a counter apart from the same number after a database reset
+    return {row["scope"]: f"{row['version']}@{row['updated_at']}" for row in response.data or []}
+
+
+class SearchCache:
+    def __init__(self, loader: Loader = _load_from_db, versions: VersionReader = _versions_from_db) -> None:
+        self._loader = loader
+        self._versions = versions
+        self._partitions: collections.OrderedDict[PartitionKey, _Partition] = collections.OrderedDict()
+        self._misses: collections.Counter[PartitionKey] = collections.Counter()
+        self._loading: dict[PartitionKey, asyncio.Task] = {}
+        self._too_large: set[PartitionKey] = set()
+        self._checked_at = 0.0
+        self._unavailable = False
+        self.stats = CacheStats()
+
+    async def search(self, rpc: str, params: dict[str, Any]) -> Optional[list[dict]]:
+        """Rows of hybrid RPC `rpc` for `params`, or None to query the database."""
+        return (await self.search_many(rpc, [params]))[0]
+
+    async def search_many(self, rpc: str, params_list: list[dict[str, Any]]) -> list[Optional[list[dict]]]:
+        """search() for several parameter sets: the ones whose partition is
+        held are answered together, the others are None."""
+        out: list[Optional[list[dict]]] = [None] * len(params_list)
+        table = _TABLES.get(rpc)
+        if table is None or self._unavailable:
+            return out
+        groups: dict[PartitionKey, list[int]] = {}
+        for i, params in enumerate(params_list):
+            project_id = params.get("project_id_filter") if table == "document_chunks" else None
+            key = PartitionKey(table, str(params.get("user_id_filter")), str(project_id) if project_id else None)
+            groups.setdefault(key, []).append(i)
+
+        await self._check_versions()
+        loop = asyncio.get_running_loop()
+        for key, indexes in groups.items():
+            partition = self._partitions.get(key)
+            if partition is None:
+                for _ in indexes:
+                    self.stats.misses += 1
+                    self._maybe_load(key)
+                continue
+            self._partitions.move_to_end(key)
+            self.stats.hits += len(indexes)
+            with span("search_cache"):
+                rows = await loop.run_in_executor(None, partition.search_many, [params_list[i] for i in indexes])
+            for i, found in zip(indexes, rows):
+                out[i] = found
+        return out
+
+    def invalidate(self, prefix: str) -> None:
+        """Drop every partition whose scope starts with `prefix` ("chunks",
+        "chunks:<project id>" or "principles"), and any load in progress."""
+        for key in [k for k in self._partitions if k.scope.startswith(prefix)]:
+            del self._partitions[key]
+            self.stats.invalidations += 1
+        for key, task in list(self._loading.items()):
+            if key.scope.startswith(prefix):
+                task.cancel()
+                del self._loading[key]
+        self._too_large = {k for k in self._too_large if not k.scope.startswith(prefix)}
+
+    async def _check_versions(self) -> None:
+        if not self._partitions:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < config.SEARCH_CACHE_CHECK_S:
+            return
+        self._checked_at = now
+        try:
+            versions = await self._versions(sorted({k.scope for k in self._partitions}))
+        except Exception as exc:
+            logger.warning("search cache: version check failed, dropping %d partitions: %s",
+                           len(self._partitions), exc)
+            self.stats.invalidations += len(self._partitions)
+            self._partitions.clear()
+            return
+        for key, partition in list(self._partitions.items()):
+            if versions.get(key.scope) != partition.version:
+                del self._partitions[key]
+                self.stats.invalidations += 1
+
+    def _maybe_load(self, key: PartitionKey) -> None:
+        if key in self._too_large:
+            return
+        self._misses[key] += 1
+        if self._misses[key] < config.SEARCH_CACHE_HOT_AFTER:
+            return
+        loop = asyncio.get_running_loop()
+        task = self._loading.get(key)
+        if task is not None and not task.done() and task.get_loop() is loop:
+            return
+        # A fresh context, so the load is not billed to the query that triggered it
+        self._loading[key] = loop.create_task(self._load(key), context=contextvars.Context())
+
+    async def _load(self, key: PartitionKey) -> None:
+        try:
+            try:
+                # Read before the rows: a write during the load leaves the
+                # partition behind its counter, and the next check drops it
+                version = (await self._versions([key.scope])).get(key.scope)
+            except Exception as exc:
+                logger.warning("search cache disabled, version counters unavailable (migration 012?): %s", exc)
+                self._unavailable = True
+                return
+            loop = asyncio.get_running_loop()
+            path = _index_path(key, version)
+            if path is not None and os.path.isdir(path):
+                partition = await loop.run_in_executor(None, _Partition.open, version, key.table, path)
+                self.stats.reopened += 1
+            else:
+                rows = await self._loader(key)
+                if rows is None:
+                    logger.info("search cache: %s is over %d rows, not cached",
+                                key.scope, config.SEARCH_CACHE_MAX_ROWS)
+                    self._too_large.add(key)
+                    return
+                partition = await loop.run_in_executor(None, _Partition.build, version, key.table, rows, path)
+                if path is not None:
+                    _remove_other_versions(path)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("search cache: loading %s failed: %s", key.scope, exc)
+            self._misses.pop(key, None)  # retry once it is hot again
+            return
+        finally:
+            if self._loading.get(key) is asyncio.current_task():
+                del self._loading[key]
+
+        self._partitions[key] = partition
+        self._misses.pop(key, None)
+        self.stats.loads += 1
+        # Least recently searched partitions go first
+        while (len(self._partitions) > 1
+               and sum(p.rows for p in self._partitions.values()) > config.SEARCH_CACHE_MAX_ROWS):
+            self._partitions.popitem(last=False)
+            self.stats.evictions += 1
+        logger.info("search cache: loaded %s (%d rows)", key.scope, partition.rows)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "hits": self.stats.hits,
+            "misses": self.stats.misses,
+            "loads": self.stats.loads,
+            "reopened": self.stats.reopened,
+            "invalidations": self.stats.invalidations,
+            "evictions": self.stats.evictions,
+            "partitions": {
+                f"{k.table}:{k.project_id or '*'}": p.rows for k, p in self._partitions.items()
+            },
+        }
+
+
+_cache: Optional[SearchCache] = None
+_HAVE_NUMPY = importlib.util.find_spec("numpy") is not None
+
+
+def get_search_cache() -> Optional[SearchCache]:
+    """The process's cache, or None when it is off (SEARCH_CACHE=false, or
+    the local backend, which searches in memory already, or without NumPy)."""
+    global _cache
+    if not config.SEARCH_CACHE or config.STORAGE_BACKEND == "local" or not _HAVE_NUMPY:
+        return None
+    if _cache is None:
+        _cache = SearchCache()
+    return _cache
+
+
+async def search(rpc: str, params: dict[str, Any]) -> Optional[list[dict]]:
+    cache = get_search_cache()
+    return None if cache is None else await cache.search(rpc, params)
+
+
+async def search_many(rpc: str, params_list: list[dict[str, Any]]) -> list[Optional[list[dict]]]:
+    cache = get_search_cache()
+    return [None] * len(params_list) if cache is None else await cache.search_many(rpc, params_list)
+
+
+def invalidate(prefix: str) -> None:
+    if _cache is not None:
+        _cache.invalidate(prefix)
+
+
+def _render_cache() -> list[str]:
+    if _cache is None:
+        return []
+    snap = _cache.snapshot()
+    lines = []
+    for metric in ("hits", "misses", "loads", "reopened", "invalidations", "evictions"):
+        lines.append(f"# TYPE contextflow_search_cache_{metric}_total counter")
+        lines.append(f"contextflow_search_cache_{metric}_total {snap[metric]}")
+    lines.append("# TYPE contextflow_search_cache_rows gauge")
+    for partition, rows in sorted(snap["partitions"].items()):
+        lines.append(f'contextflow_search_cache_rows{{partition="{partition}"}} {rows}')
+    return lines
+
+
+register_collector(_render_cache)
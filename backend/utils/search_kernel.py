@@ -0,0 +1,244 @@
+"""Exact vector search over contiguous float32 matrices (NumPy).
+
+Below a few hundred thousand rows, scoring every row is cheap: one matrix
+product of unit vectors gives the cosine similarities, and argpartition picks
+the top k without sorting the rest. That is exact (recall 1.0) and faster
+than a round trip to the database's vector index.
+
+A Shard holds one set of rows (in practice one project's chunks, or a user's
+principles): ids, an N x D float32 matrix of unit rows, and filter columns
+(category, doc_category, confidence, embedding_version, ...) as 1-D arrays.
+Filters are boolean masks computed from the columns and applied before the
+top k, so a filtered search still returns k rows when k match. Saved shards
+are plain .npy files, and an opened shard memory-maps its matrix: opening is
+instant whatever the size, and only the pages searched are read.
+
+Several queries are scored in one product (a Q x D query matrix), with one
+mask for all of them or one mask per query. The matrix is scored BLOCK_ROWS
+rows at a time, so the score buffer stays Q x BLOCK_ROWS. When a shared mask
+leaves few rows of a block eligible, only those are read and scored.
+"""
+from __future__ import annotations
+
+import os
+import shutil
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Optional, Sequence
+
+import numpy as np
+
+BLOCK_ROWS = 65536
+SPARSE_MASK = 0.25  # below this share of eligible rows, gather them rather than score all
+_MATRIX_FILE = "embeddings.npy"
+_IDS_FILE = "ids.npy"
+_COLUMN_PREFIX = "col_"
+
+
+def normalize(vectors: Any) -> np.ndarray:
+    """float32 copy of `vectors` (one vector or a list of them) with unit
+    rows; all-zero rows stay zero."""
+    m = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+def top_k(
+    matrix: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    mask: Optional[np.ndarray] = None,
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    """Best `k` rows of `matrix` for each row of `queries`, both unit length.
+
+    Returns one (row indices, scores) pair per query, best first. `mask` is
+    None, a bool array over the rows (shared by all queries) or one row of it
+    per query; rows where it is False are never returned, so a query may get
+    fewer than `k` rows.
+    """
+    queries = np.array(queries, dtype=np.float32, ndmin=2)
+    n_queries, n_rows = queries.shape[0], matrix.shape[0]
+    empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+    if n_rows == 0 or k <= 0:
+        return [empty] * n_queries
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+
+    best_rows = np.empty((n_queries, 0), dtype=np.int64)
+    best_scores = np.empty((n_queries, 0), dtype=np.float32)
+    for start in range(0, n_rows, BLOCK_ROWS):
+        stop = min(start + BLOCK_ROWS, n_rows)
+        block_mask = None if mask is None else mask[..., start:stop]
+        if block_mask is not None and block_mask.ndim == 1 and block_mask.sum() < SPARSE_MASK * (stop - start):
+            # Few rows eligible: read and score only those
+            rows = start + np.flatnonzero(block_mask)
+            scores = queries @ np.asarray(matrix[rows], dtype=np.float32).T
+        else:
+            scores = queries @ np.asarray(matrix[start:stop], dtype=np.float32).T  # (Q, B)
+            if block_mask is not None:
+                scores[~np.broadcast_to(block_mask, scores.shape)] = -np.inf
+            rows = np.arange(start, stop)
+        rows = np.broadcast_to(rows, scores.shape)
+        # Keep this block's k best next to the k best so far, then cut to k
+        scores = np.concatenate([best_scores, scores], axis=1)
+        rows = np.concatenate([best_rows, rows], axis=1)
+        if scores.shape[1] > k:
+            keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(scores, keep, axis=1)
+            rows = np.take_along_axis(rows, keep, axis=1)
+        best_rows, best_scores = rows, scores
+
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    best_rows = np.take_along_axis(best_rows, order, axis=1)
+    best_scores = np.take_along_axis(best_scores, order, axis=1)
+    out = []
+    for rows, scores in zip(best_rows, best_scores):
+        found = np.isfinite(scores)
+        out.append((rows[found], scores[found]))
+    return out
+
+
+@dataclass
+class Shard:
+    ids: np.ndarray                                   # (N,) str
+    matrix: np.ndarray                                # (N, D) float32, unit rows
+    columns: dict[str, np.ndarray] = field(default_factory=dict)
+    path: Optional[str] = None                        # set when memory-mapped from disk
+
+    def __post_init__(self) -> None:
+        self._index: Optional[dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(
+        cls,
+        ids: Sequence[str],
+        vectors: Any,
+        columns: Optional[dict[str, Sequence[Any]]] = None,
+    ) -> "Shard":
+        """In-memory shard. Column values are strings (None becomes "") or
+        numbers (None becomes NaN, which no range filter matches)."""
+        ids = np.array([str(i) for i in ids], dtype=str)
+        if len(ids):
+            matrix = normalize(vectors)
+        else:
+            matrix = np.empty((0, 0), dtype=np.float32)
+        if matrix.shape[0] != len(ids):
+            raise ValueError(f"{len(ids)} ids but {matrix.shape[0]} vectors")
+        return cls(ids, matrix, {name: _column(values) for name, values in (columns or {}).items()})
+
+    def save(self, path: str) -> "Shard":
+        """Write the shard under directory `path` (replacing it) and return it
+        memory-mapped from there. Written to a sibling directory first and
+        renamed into place, so a reader never sees half a shard."""
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        staging = os.path.join(parent, f".{os.path.basename(path)}.{uuid.uuid4().hex}")
+        os.makedirs(staging)
+        try:
+            np.save(os.path.join(staging, _MATRIX_FILE), np.ascontiguousarray(self.matrix, dtype=np.float32))
+            np.save(os.path.join(staging, _IDS_FILE), self.ids)
+            for name, values in self.columns.items():
+                np.save(os.path.join(staging, f"{_COLUMN_PREFIX}{name}.npy"), values)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.replace(staging, path)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return Shard.open(path)
+
+    @classmethod
+    def open(cls, path: str) -> "Shard":
+        """A saved shard; the matrix is memory-mapped, ids and columns are read."""
+        matrix = np.load(os.path.join(path, _MATRIX_FILE), mmap_mode="r")
+        ids = np.load(os.path.join(path, _IDS_FILE))
+        columns = {
+            name[len(_COLUMN_PREFIX):-len(".npy")]: np.load(os.path.join(path, name))
+            for name in os.listdir(path)
+            if name.startswith(_COLUMN_PREFIX) and name.endswith(".npy")
+        }
+        return cls(ids, matrix, columns, path=path)
+
+    def row(self, id_: str) -> Optional[int]:
+        if self._index is None:
+            self._index = {str(i): n for n, i in enumerate(self.ids.tolist())}
+        return self._index.get(id_)
+
+    def mask(
+        self,
+        equal: Optional[dict[str, Any]] = None,
+        at_least: Optional[dict[str, float]] = None,
+    ) -> Optional[np.ndarray]:
+        """Rows whose column equals each value in `equal` (a list or set of
+        values matches any of them) and is >= each bound in `at_least`.
+        Conditions whose value is None are ignored; None if none is left."""
+        mask = None
+        for name, value in (equal or {}).items():
+            if value is None:
+                continue
+            column = self.columns[name]
+            if isinstance(value, (list, tuple, set, frozenset)):
+                hit = np.isin(column, [str(v) for v in value] if column.dtype.kind == "U" else list(value))
+            else:
+                hit = column == (str(value) if column.dtype.kind == "U" else value)
+            mask = hit if mask is None else mask & hit
+        for name, bound in (at_least or {}).items():
+            if bound is None:
+                continue
+            hit = self.columns[name] >= bound
+            mask = hit if mask is None else mask & hit
+        return mask
+
+    def search(
+        self,
+        queries: Any,
+        k: int,
+        mask: Optional[np.ndarray] = None,
+    ) -> list[list[tuple[str, float]]]:
+        """(id, cosine similarity) of the `k` best rows for each query."""
+        ranked = top_k(self.matrix, normalize(queries), k, mask)
+        ids = self.ids
+        return [[(str(ids[r]), float(s)) for r, s in zip(rows, scores)] for rows, scores in ranked]
+
+    def similarity(self, id_: str, query: Any) -> Optional[float]:
+        row = self.row(id_)
+        if row is None:
+            return None
+        return float(np.asarray(self.matrix[row], dtype=np.float32) @ normalize(query)[0])
+
+    def compact(self, id_: str, dims: int = 256) -> Optional[list[float]]:
+        """The first `dims` dimensions, renormalized (embedding_compact, migration 007)."""
+        row = self.row(id_)
+        if row is None:
+            return None
+        head = np.asarray(self.matrix[row][:dims], dtype=np.float64)
+        return (head / (np.linalg.norm(head) or 1.0)).tolist()
+
+
+def search_shards(
+    shards: Sequence[Shard],
+    queries: Any,
+    k: int,
+    masks: Optional[Sequence[Optional[np.ndarray]]] = None,
+) -> list[list[tuple[str, float]]]:
+    """Shard.search across several shards, merged: the `k` best (id,
+    similarity) per query over all of them. `masks` has one entry per shard."""
+    queries = normalize(queries)
+    merged: list[list[tuple[str, float]]] = [[] for _ in range(len(queries))]
+    for n, shard in enumerate(shards):
+        if not len(shard):
+            continue
+        for hits, found in zip(merged, shard.search(queries, k, masks[n] if masks else None)):
+            hits.extend(found)
+    return [sorted(hits, key=lambda hit: hit[1], reverse=True)[:k] for hits in merged]
+
+
+def _column(values: Sequence[Any]) -> np.ndarray:
+    values = list(values)
+    if values and all(v is None or isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float32)
+    return np.array(["" if v is None else str(v) for v in values], dtype=str)
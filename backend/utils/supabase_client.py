@@ -1,26 +1,49 @@
 from __future__ import annotations
 
 import asyncio
+import base64
+import copy
+import logging
+import os
 from datetime import datetime, timezone
 from functools import partial
-from typing import Optional
+from typing import TYPE_CHECKING, BinaryIO, Optional
 
-from supabase import create_client, Client
-from utils.config import SUPABASE_URL, SUPABASE_SERVICE_KEY
+from utils import search_cache
+from utils.config import LOCAL_STORE_PATH, STORAGE_BACKEND, SUPABASE_URL, SUPABASE_SERVICE_KEY
+from utils.tracing import record_round_trip
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+logger = logging.getLogger("contextflow")
 
 _client: Optional[Client] = None
 
+# Objects larger than one piece go up through the resumable (TUS) endpoint in
+# pieces of this size, the size Supabase Storage requires for every part but
+# the last, so no more than one piece is ever in memory.
+UPLOAD_CHUNK_SIZE = 6 * 1024 * 1024
+
 
 def get_client() -> Client:
     global _client
     if _client is None:
-        _client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+        if STORAGE_BACKEND == "local":
+            from utils.local_store import LocalStoreClient
+
+            _client = LocalStoreClient(os.path.expanduser(LOCAL_STORE_PATH))
+        else:
+            from supabase import create_client
+
+            _client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
     return _client
 
 
 async def _run(fn, *args, **kwargs):
     """Run a synchronous Supabase call in a thread pool so it doesn't block the event loop."""
     loop = asyncio.get_event_loop()
+    record_round_trip("db")
     return await loop.run_in_executor(None, partial(fn, *args, **kwargs))
 
 
@@ -55,12 +78,57 @@ async def create_document(data: dict) -> dict:
     return response.data[0]
 
 
+async def register_documents(rows: list[dict]) -> list[dict]:
+    """The documents rows for `rows`, in order.
+
+    A document already stored under the same project_id and storage_path is
+    reused and its fields updated, so uploading a file again (after a failure,
+    or a new version of it) carries on with the same document and its chunks
+    instead of starting a second copy. When its content_hash is unchanged the
+    document keeps its `analyzed` flag, so an identical re-upload is not
+    analyzed again. The rest go in with one insert.
+    """
+    client = get_client()
+    existing: dict[tuple[str, str], dict] = {}
+    for project_id in {row["project_id"] for row in rows}:
+        paths = [row["storage_path"] for row in rows if row["project_id"] == project_id]
+        response = await _run(
+            client.table("documents").select("*")
+            .eq("project_id", project_id)
+            .in_("storage_path", paths)
+            .order("upload_date")
+            .execute
+        )
+        # Older duplicates (from before documents were reused) lose to the newest
+        for doc in response.data or []:
+            existing[(project_id, doc["storage_path"])] = doc
+
+    documents: list[Optional[dict]] = [None] * len(rows)
+    new: list[int] = []
+    for i, row in enumerate(rows):
+        doc = existing.get((row["project_id"], row["storage_path"]))
+        if doc is None:
+            new.append(i)
+            continue
+        update = dict(row)
+        if row.get("content_hash") and row["content_hash"] == doc.get("content_hash"):
+            update.pop("analyzed", None)
+        await _run(client.table("documents").update(update).eq("id", doc["id"]).execute)
+        documents[i] = {**doc, **update}
+    if new:
+        response = await _run(client.table("documents").insert([rows[i] for i in new]).execute)
+        for i, doc in zip(new, response.data):
+            documents[i] = doc
+    return documents
+
+
 async def update_document_analyzed(doc_id: str, analyzed: bool) -> None:
     client = get_client()
     payload: dict = {"analyzed": analyzed}
     if analyzed:
         payload["analyzed_at"] = datetime.now(timezone.utc).isoformat()
     await _run(client.table("documents").update(payload).eq("id", doc_id).execute)
+    search_cache.invalidate("chunks")
 
 
 async def get_principles(
@@ -81,6 +149,7 @@ async def get_principles(
 async def create_principle(data: dict) -> dict:
     client = get_client()
     response = await _run(client.table("principles").insert(data).execute)
+    search_cache.invalidate("principles")
     return response.data[0]
 
 
@@ -97,10 +166,73 @@ async def update_principle_confidence(
         "times_failed": times_failed,
         "updated_at": datetime.now(timezone.utc).isoformat(),
     }).eq("id", principle_id).execute)
+    search_cache.invalidate("principles")
+
+
+async def bump_principle(
+    principle_id: str,
+    delta: float = 0.05,
+    cap: float = 0.95,
+    project_id: Optional[str] = None,
+) -> Optional[dict]:
+    """Atomically raise confidence (up to cap), count one more application
+    and add project_id to source_projects. Returns the updated counters."""
+    client = get_client()
+    response = await _run(client.rpc("bump_principle", {
+        "principle_id": principle_id,
+        "delta": delta,
+        "cap": cap,
+        "project_id": project_id,
+    }).execute)
+    search_cache.invalidate("principles")
+    return response.data[0] if response.data else None
+
+
+# A running job that has written nothing (status or checkpoint) for this long
+# is taken to have lost its worker, and may be queued again
+JOB_STALE_S = 30 * 60
+
+
+def _job_stale(job: dict) -> bool:
+    seen = job.get("updated_at") or job.get("started_at")
+    if not seen:
+        return True
+    age = datetime.now(timezone.utc) - datetime.fromisoformat(str(seen).replace("Z", "+00:00"))
+    return age.total_seconds() > JOB_STALE_S
 
 
 async def create_analysis_job(document_id: str) -> dict:
+    """The document's job to queue: its unfinished one if it has one, else a
+    new pending one.
+
+    A failed job is set back to pending, so it resumes from its checkpoint.
+    A pending or running job is returned as it is: a worker will pick it up
+    or already has, and resetting it would let a second worker run it too.
+    Only a stale running job (JOB_STALE_S) is queued again. The reset is
+    conditional on the status read, so two callers cannot both make it.
+    """
     client = get_client()
+    response = await _run(
+        client.table("analysis_jobs").select("*")
+        .eq("document_id", document_id)
+        .neq("status", "completed")
+        .order("created_at", desc=True)
+        .limit(1)
+        .execute
+    )
+    if response.data:
+        job = response.data[0]
+        status = job.get("status")
+        if status == "failed" or (status == "running" and _job_stale(job)):
+            reset = await _run(
+                client.table("analysis_jobs").update({"status": "pending"})
+                .eq("id", job["id"])
+                .eq("status", status)
+                .execute
+            )
+            if reset.data:
+                return reset.data[0]
+        return job
     response = await _run(client.table("analysis_jobs").insert({
         "document_id": document_id,
         "status": "pending",
@@ -108,18 +240,180 @@ async def create_analysis_job(document_id: str) -> dict:
     return response.data[0]
 
 
+async def claim_analysis_job(job_id: str) -> bool:
+    """Move a pending job to running. False when it is not pending, for
+    instance because another worker claimed it first."""
+    client = get_client()
+    now = datetime.now(timezone.utc).isoformat()
+    response = await _run(
+        client.table("analysis_jobs").update({"status": "running", "started_at": now, "updated_at": now})
+        .eq("id", job_id)
+        .eq("status", "pending")
+        .execute
+    )
+    return bool(response.data)
+
+
 async def update_analysis_job(
     job_id: str,
     status: str,
     principals_created: int = 0,
     error: Optional[str] = None,
+    attempts: Optional[int] = None,
 ) -> None:
     client = get_client()
-    payload: dict = {"status": status, "principles_created": principals_created}
+    payload: dict = {
+        "status": status,
+        "principles_created": principals_created,
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    }
     if status == "running":
         payload["started_at"] = datetime.now(timezone.utc).isoformat()
     if status in ("completed", "failed"):
         payload["completed_at"] = datetime.now(timezone.utc).isoformat()
     if error is not None:
         payload["error_message"] = error
+    if attempts is not None:
+        payload["attempts"] = attempts
     await _run(client.table("analysis_jobs").update(payload).eq("id", job_id).execute)
+
+
+# A document's processing stages, in order (analysis_jobs.stage, migration 014)
+JOB_STAGES = ("extracted", "agents", "synthesized")
+
+
+class JobCheckpoint:
+    """How far one analysis job got: the last completed stage and what the
+    stages so far produced (analysis_jobs.stage and .checkpoint).
+
+    A retry loads it and skips the work already paid for. Saving is best
+    effort: when the write fails (for instance before migration 014) the job
+    carries on, and a retry merely redoes more.
+    """
+
+    def __init__(
+        self,
+        job_id: str,
+        stage: Optional[str] = None,
+        data: Optional[dict] = None,
+        attempts: int = 0,
+    ) -> None:
+        self.job_id = job_id
+        self.stage = stage
+        self.data: dict = data or {}
+        self.attempts = attempts
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def load(cls, job_id: str) -> "JobCheckpoint":
+        client = get_client()
+        try:
+            response = await _run(
+                client.table("analysis_jobs").select("stage, checkpoint, attempts").eq("id", job_id).execute
+            )
+        except Exception as exc:
+            logger.warning("No checkpoint for job %s, starting over: %s", job_id, exc)
+            return cls(job_id)
+        row = response.data[0] if response.data else {}
+        return cls(job_id, row.get("stage"), row.get("checkpoint") or {}, int(row.get("attempts") or 0))
+
+    def reached(self, stage: str) -> bool:
+        return self.stage is not None and JOB_STAGES.index(self.stage) >= JOB_STAGES.index(stage)
+
+    async def save(self, stage: str, **data) -> None:
+        """Record `stage` as completed (a later stage stays) and merge `data`
+        into the checkpoint."""
+        self.data.update(data)
+        if not self.reached(stage):
+            self.stage = stage
+        client = get_client()
+        async with self._lock:
+            payload = {
+                "stage": self.stage,
+                "checkpoint": copy.deepcopy(self.data),
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            }
+            try:
+                await _run(client.table("analysis_jobs").update(payload).eq("id", self.job_id).execute)
+            except Exception as exc:
+                logger.warning("Could not checkpoint job %s at %s: %s", self.job_id, stage, exc)
+
+
+def _tus_upload(
+    bucket: str,
+    path: str,
+    stream: BinaryIO,
+    size: int,
+    content_type: str,
+) -> int:
+    """Resumable upload of `size` bytes from `stream`; returns the request count."""
+    import httpx
+
+    def meta(value: str) -> str:
+        return base64.b64encode(value.encode()).decode()
+
+    headers = {
+        "authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
+        "apikey": SUPABASE_SERVICE_KEY,
+        "tus-resumable": "1.0.0",
+    }
+    with httpx.Client(timeout=120.0) as http:
+        created = http.post(
+            f"{SUPABASE_URL.rstrip('/')}/storage/v1/upload/resumable",
+            headers={
+                **headers,
+                "x-upsert": "true",
+                "upload-length": str(size),
+                "upload-metadata": ",".join([
+                    f"bucketName {meta(bucket)}",
+                    f"objectName {meta(path)}",
+                    f"contentType {meta(content_type)}",
+                ]),
+            },
+        )
+        created.raise_for_status()
+        location = created.headers["location"]
+        requests = 1
+        offset = 0
+        while offset < size:
+            piece = stream.read(min(UPLOAD_CHUNK_SIZE, size - offset))
+            if not piece:
+                raise IOError(f"Stream ended after {offset} of {size} bytes")
+            response = http.patch(location, content=piece, headers={
+                **headers,
+                "upload-offset": str(offset),
+                "content-type": "application/offset+octet-stream",
+            })
+            response.raise_for_status()
+            offset = int(response.headers.get("upload-offset", offset + len(piece)))
+            requests += 1
+    return requests
+
+
+async def upload_stream(
+    bucket: str,
+    path: str,
+    stream: BinaryIO,
+    size: int,
+    content_type: str,
+) -> None:
+    """Upload `size` bytes read from `stream` (positioned at the start) to storage.
+
+    Small objects take one plain upload; larger ones are sent a piece at a
+    time, never holding the whole object in memory.
+    """
+    client = get_client()
+    store_bucket = client.storage.from_(bucket)
+    if hasattr(store_bucket, "upload_stream"):
+        await _run(store_bucket.upload_stream, path, stream, size, content_type)
+    elif size <= UPLOAD_CHUNK_SIZE:
+        await _run(
+            store_bucket.upload,
+            path=path,
+            file=stream.read(),
+            file_options={"content-type": content_type, "upsert": "true"},
+        )
+    else:
+        loop = asyncio.get_event_loop()
+        requests = await loop.run_in_executor(None, partial(_tus_upload, bucket, path, stream, size, content_type))
+        record_round_trip("storage", requests)
@@ -0,0 +1,228 @@
+"""Lightweight per-tool-call tracing for ContextFlow.
+
+A trace is opened for every MCP tool call (see mcp_server/server.dispatch)
+and carries the correlation_id that wrap_upstream_errors attaches to any
+failure, so a slow span and a failed call can be matched in the logs.
+Spans, token usage and upstream round-trips recorded anywhere below the
+call — including in tasks spawned with asyncio.gather/create_task, which
+inherit the context — land on the same trace.
+
+On finish the trace is written as one JSON line to stderr, folded into a
+process-wide registry that renders as Prometheus text, and summarized for
+the response's ``meta``.
+"""
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+_trace_logger = logging.getLogger("contextflow.trace")
+if not _trace_logger.handlers:
+    _trace_handler = logging.StreamHandler(sys.stderr)
+    _trace_handler.setFormatter(logging.Formatter("%(message)s"))
+    _trace_logger.addHandler(_trace_handler)
+    _trace_logger.setLevel(logging.INFO)
+    _trace_logger.propagate = False
+
+
+@dataclass
+class SpanStats:
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+
+    def add(self, duration_ms: float) -> None:
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+
+@dataclass
+class Trace:
+    name: str
+    correlation_id: str
+    started: float = field(default_factory=time.perf_counter)
+    spans: dict[str, SpanStats] = field(default_factory=dict)
+    tokens: dict[str, int] = field(default_factory=dict)
+    round_trips: dict[str, int] = field(default_factory=dict)
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "tool": self.name,
+            "correlation_id": self.correlation_id,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "spans": {
+                name: {
+                    "count": s.count,
+                    "total_ms": round(s.total_ms, 1),
+                    "max_ms": round(s.max_ms, 1),
+                }
+                for name, s in self.spans.items()
+            },
+            "tokens": dict(self.tokens),
+            "round_trips": dict(self.round_trips),
+        }
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar(
+    "contextflow_trace", default=None,
+)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def current_correlation_id() -> Optional[str]:
+    trace = _current.get()
+    return trace.correlation_id if trace is not None else None
+
+
+# ── Process-wide registry (Prometheus text) ───────────────────────────────────
+class _Registry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.calls: dict[str, SpanStats] = {}
+        self.spans: dict[str, SpanStats] = {}
+        self.tokens: dict[str, int] = {}
+        self.round_trips: dict[str, int] = {}
+        # Extra metric sources, rendered after the trace metrics
+        self.collectors: list[Callable[[], list[str]]] = []
+
+    def fold(self, trace: Trace, duration_ms: float) -> None:
+        with self._lock:
+            self.calls.setdefault(trace.name, SpanStats()).add(duration_ms)
+            for name, stats in trace.spans.items():
+                agg = self.spans.setdefault(name, SpanStats())
+                agg.count += stats.count
+                agg.total_ms += stats.total_ms
+                agg.max_ms = max(agg.max_ms, stats.max_ms)
+            for kind, n in trace.tokens.items():
+                self.tokens[kind] = self.tokens.get(kind, 0) + n
+            for kind, n in trace.round_trips.items():
+                self.round_trips[kind] = self.round_trips.get(kind, 0) + n
+
+    def render(self) -> str:
+        lines: list[str] = []
+        with self._lock:
+            lines.append("# TYPE contextflow_tool_call_seconds summary")
+            for name, s in sorted(self.calls.items()):
+                lines.append(f'contextflow_tool_call_seconds_sum{{tool="{name}"}} {s.total_ms / 1000:.6f}')
+                lines.append(f'contextflow_tool_call_seconds_count{{tool="{name}"}} {s.count}')
+            lines.append("# TYPE contextflow_span_seconds summary")
+            for name, s in sorted(self.spans.items()):
+                lines.append(f'contextflow_span_seconds_sum{{span="{name}"}} {s.total_ms / 1000:.6f}')
+                lines.append(f'contextflow_span_seconds_count{{span="{name}"}} {s.count}')
+            lines.append("# TYPE contextflow_span_max_seconds gauge")
+            for name, s in sorted(self.spans.items()):
+                lines.append(f'contextflow_span_max_seconds{{span="{name}"}} {s.max_ms / 1000:.6f}')
+            lines.append("# TYPE contextflow_tokens_total counter")
+            for kind, n in sorted(self.tokens.items()):
+                lines.append(f'contextflow_tokens_total{{kind="{kind}"}} {n}')
+            lines.append("# TYPE contextflow_round_trips_total counter")
+            for kind, n in sorted(self.round_trips.items()):
+                lines.append(f'contextflow_round_trips_total{{kind="{kind}"}} {n}')
+            collectors = list(self.collectors)
+        for collect in collectors:
+            lines.extend(collect())
+        return "\n".join(lines) + "\n"
+
+
+_registry = _Registry()
+
+
+def render_prometheus() -> str:
+    return _registry.render()
+
+
+def register_collector(collect: Callable[[], list[str]]) -> None:
+    """Add a function returning Prometheus text lines to render_prometheus()."""
+    with _registry._lock:
+        if collect not in _registry.collectors:
+            _registry.collectors.append(collect)
+
+
+def write_prometheus(path: str) -> None:
+    with open(path, "w") as f:
+        f.write(render_prometheus())
+
+
+# ── Recording API ─────────────────────────────────────────────────────────────
+@contextlib.contextmanager
+def start_trace(name: str) -> Iterator[Trace]:
+    """Open a trace for one tool call. Nested calls reuse the outer trace."""
+    existing = _current.get()
+    if existing is not None:
+        yield existing
+        return
+    trace = Trace(name=name, correlation_id=str(uuid.uuid4()))
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        summary = trace.summary()
+        _registry.fold(trace, summary["duration_ms"])
+        _trace_logger.info(json.dumps({"event": "trace", **summary}, separators=(",", ":")))
+
+
+@contextlib.contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time a block. A no-op outside a trace, so library code can always use it."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans.setdefault(name, SpanStats()).add((time.perf_counter() - start) * 1000)
+
+
+def traced(name: str) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """Decorator form of span() for async functions."""
+
+    def decorator(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_round_trip(kind: str, count: int = 1) -> None:
+    """Count an upstream request (kind: "embedding", "llm", "db", ...)."""
+    trace = _current.get()
+    if trace is not None:
+        trace.round_trips[kind] = trace.round_trips.get(kind, 0) + count
+
+
+def record_tokens(kind: str, count: int) -> None:
+    trace = _current.get()
+    if trace is not None and count:
+        trace.tokens[kind] = trace.tokens.get(kind, 0) + count
+
+
+def record_usage(kind: str, usage: Any) -> None:
+    """Record one round-trip plus the token usage of an OpenAI-compatible
+    response (`response.usage`); tolerates a missing usage block."""
+    record_round_trip(kind)
+    if usage is None:
+        return
+    record_tokens(f"{kind}_prompt", int(getattr(usage, "prompt_tokens", 0) or 0))
+    record_tokens(f"{kind}_completion", int(getattr(usage, "completion_tokens", 0) or 0))
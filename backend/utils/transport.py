@@ -0,0 +1,133 @@
+"""httpx transport shared by the API clients in utils.clients.
+
+MeteredTransport spreads requests over a few small httpcore pools (shards)
+and counts what they do: a request is in flight from send until its body is
+closed, and a connection counts as opened the first time it shows up in a
+shard, so every other request was served on a reused one. The connection
+counts read each shard's httpcore pool, which httpx keeps private; it is
+looked up once, and without it (an httpx release that moves it) only the
+request counts are kept.
+
+Sharding is for CPU, not sockets: httpcore re-scans every pooled connection
+for every queued request each time a request starts or finishes, so one pool
+of 64 keep-alive connections costs more client CPU under a 60-request burst
+than the requests themselves (benchmarks/pool.py). Shards of POOL_SHARD_SIZE
+keep that scan short while the provider still holds HTTP_MAX_CONNECTIONS
+warm connections in total. Imported only when a client is built.
+"""
+from __future__ import annotations
+
+import importlib.util
+import math
+import weakref
+from typing import AsyncIterator, Callable, Optional
+
+import httpx
+
+from utils import config
+from utils.clients import PoolStats
+
+POOL_SHARD_SIZE = 8
+
+
+class _MeteredStream(httpx.AsyncByteStream):
+    """Response body that reports when it is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: Callable[[], None]) -> None:
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for part in self._stream:
+            yield part
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            on_close, self._on_close = self._on_close, None
+            if on_close is not None:
+                on_close()
+
+
+def _connection_pools(shards: list[httpx.AsyncHTTPTransport]) -> list:
+    """Each shard's httpcore pool, or [] when any shard does not expose one."""
+    pools = [getattr(shard, "_pool", None) for shard in shards]
+    return pools if all(hasattr(pool, "connections") for pool in pools) else []
+
+
+class MeteredTransport(httpx.AsyncBaseTransport):
+    def __init__(self, stats: PoolStats, limits: httpx.Limits, http2: bool = False) -> None:
+        self.stats = stats
+        max_connections = limits.max_connections or POOL_SHARD_SIZE
+        keepalive = limits.max_keepalive_connections
+        n = max(1, math.ceil(max_connections / POOL_SHARD_SIZE))
+        shard_limits = httpx.Limits(
+            max_connections=math.ceil(max_connections / n),
+            max_keepalive_connections=math.ceil(keepalive / n) if keepalive is not None else None,
+            keepalive_expiry=limits.keepalive_expiry,
+        )
+        self._shards = [httpx.AsyncHTTPTransport(limits=shard_limits, http2=http2) for _ in range(n)]
+        self._pools = _connection_pools(self._shards)
+        if not self._pools:
+            stats.pool_metered = False
+        self._load = [0] * n
+        self._seen: weakref.WeakSet = weakref.WeakSet()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        # Least-loaded shard; ties go to the lowest index, so a quiet client
+        # keeps reusing the same few connections
+        i = min(range(len(self._shards)), key=self._load.__getitem__)
+        self._load[i] += 1
+        self.stats.begin()
+
+        def done() -> None:
+            self._load[i] -= 1
+            self.stats.end()
+            self._observe()
+
+        try:
+            response = await self._shards[i].handle_async_request(request)
+        except BaseException:
+            done()
+            raise
+        self._observe(response)
+        response.stream = _MeteredStream(response.stream, done)
+        return response
+
+    def _observe(self, response: Optional[httpx.Response] = None) -> None:
+        if response is not None and response.extensions.get("http_version") == b"HTTP/2":
+            with self.stats._lock:
+                self.stats.http2_requests += 1
+        if not self._pools:
+            return
+        connections = [c for pool in self._pools for c in pool.connections]
+        opened = 0
+        for connection in connections:
+            if connection not in self._seen:
+                self._seen.add(connection)
+                opened += 1
+        stats = self.stats
+        with stats._lock:
+            stats.connections_opened += opened
+            stats.open_connections = len(connections)
+            stats.idle_connections = sum(1 for c in connections if c.is_idle())
+
+    async def aclose(self) -> None:
+        for shard in self._shards:
+            await shard.aclose()
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def build_http_client(stats: PoolStats, timeout: httpx.Timeout) -> httpx.AsyncClient:
+    """AsyncClient on a MeteredTransport with the configured pool limits."""
+    limits = httpx.Limits(
+        max_connections=config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=config.HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY_S,
+    )
+    transport = MeteredTransport(stats, limits, http2=config.HTTP2 and http2_available())
+    return httpx.AsyncClient(transport=transport, timeout=timeout, follow_redirects=True)
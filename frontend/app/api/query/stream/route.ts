@@ -0,0 +1,119 @@
+import { NextRequest, NextResponse } from 'next/server'
+import { spawn } from 'child_process'
+
+// Server-Sent Events bridge for progressive contextflow_query results.
+// Each MCP notifications/progress line becomes an `event: <stage>` frame,
+// the final JSON-RPC response becomes `event: result` (or `event: error`).
+export async function POST(req: NextRequest) {
+  const body = await req.json()
+  if (!body.query) {
+    return NextResponse.json({ error: 'query is required' }, { status: 400 })
+  }
+
+  const payload = JSON.stringify({
+    jsonrpc: '2.0',
+    id: 1,
+    method: 'tools/call',
+    params: {
+      name: 'contextflow_query',
+      arguments: { query: body.query, project_id: body.project_id ?? null },
+      _meta: { progressToken: 'query' },
+    },
+  })
+
+  const encoder = new TextEncoder()
+
+  const stream = new ReadableStream({
+    start(controller) {
+      const proc = spawn(
+        '/Users/sssd/Documents/ContextFlow/backend/.venv/bin/python3',
+        ['-m', 'mcp_server.server'],
+        {
+          cwd: '/Users/sssd/Documents/ContextFlow/backend',
+          stdio: ['pipe', 'pipe', 'pipe'],
+        }
+      )
+
+      let buffer = ''
+      let stderr = ''
+      let closed = false
+
+      const send = (event: string, data: unknown) => {
+        if (closed) return
+        controller.enqueue(encoder.encode(`event: ${event}\ndata: ${JSON.stringify(data)}\n\n`))
+      }
+
+      const finish = () => {
+        if (closed) return
+        closed = true
+        clearTimeout(timer)
+        proc.kill()
+        controller.close()
+      }
+
+      const timer = setTimeout(() => {
+        send('error', { error: 'Query timed out after 30s' })
+        finish()
+      }, 30000)
+
+      const handleLine = (line: string) => {
+        if (!line.startsWith('{')) return
+        let message
+        try {
+          message = JSON.parse(line)
+        } catch {
+          return
+        }
+
+        if (message.method === 'notifications/progress') {
+          send(message.params?.message ?? 'partial', message.params?.partial ?? {})
+          return
+        }
+
+        const text = message.result?.content?.[0]?.text
+        if (!text) {
+          send('error', { error: 'Empty result from backend' })
+        } else {
+          const result = JSON.parse(text)
+          if (result.success) {
+            send('result', result.data)
+          } else {
+            send('error', { error: result.error ?? 'Query failed' })
+          }
+        }
+        finish()
+      }
+
+      proc.stdout.on('data', (chunk: Buffer) => {
+        buffer += chunk.toString()
+        const lines = buffer.split('\n')
+        buffer = lines.pop() ?? ''
+        lines.forEach(handleLine)
+      })
+      proc.stderr.on('data', (chunk: Buffer) => { stderr += chunk.toString() })
+
+      proc.on('close', (code) => {
+        if (stderr) console.error('[query/stream] stderr:', stderr)
+        if (buffer) handleLine(buffer)
+        send('error', { error: `Backend exited before responding (exit ${code})` })
+        finish()
+      })
+
+      proc.on('error', (e) => {
+        send('error', { error: e.message })
+        finish()
+      })
+
+      proc.stdin.write(payload + '\n')
+      proc.stdin.end()
+    },
+  })
+
+  return new Response(stream, {
+    headers: {
+      'Content-Type': 'text/event-stream',
+      'Cache-Control': 'no-cache',
+      Connection: 'keep-alive',
+    },
+  })
+}
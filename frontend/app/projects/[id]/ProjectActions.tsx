@@ -97,17 +97,41 @@ export default function ProjectActions({ projectId, documentCount }: Props) {
     setQueryResult(null)
     setQueryError(null)
     try {
-      const res = await fetch('/api/query', {
+      const res = await fetch('/api/query/stream', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ query: query.trim(), project_id: projectId }),
       })
-      const json = await res.json()
-      if (!res.ok || json.error) {
+      if (!res.ok || !res.body) {
+        const json = await res.json().catch(() => ({}))
         setQueryError(json.error ?? 'Query failed')
         return
       }
-      setQueryResult(json.data ?? {})
+
+      // Render each section as soon as the backend emits it
+      const reader = res.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+        const frames = buffer.split('\n\n')
+        buffer = frames.pop() ?? ''
+        for (const frame of frames) {
+          const event = frame.match(/^event: (.*)$/m)?.[1]
+          const data = frame.match(/^data: (.*)$/m)?.[1]
+          if (!event || !data) continue
+          const parsed = JSON.parse(data)
+          if (event === 'error') {
+            setQueryError(parsed.error ?? 'Query failed')
+            return
+          }
+          if (event === 'project_context' || event === 'principles' || event === 'result') {
+            setQueryResult((prev) => ({ ...(prev ?? {}), ...parsed }))
+          }
+        }
+      }
     } catch (e: unknown) {
       setQueryError(e instanceof Error ? e.message : 'Network error')
     } finally {
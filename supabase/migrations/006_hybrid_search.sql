@@ -0,0 +1,210 @@
+-- Full-text search columns (generated, so existing rows are backfilled on ALTER)
+ALTER TABLE document_chunks
+    ADD COLUMN IF NOT EXISTS content_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED;
+
+ALTER TABLE principles
+    ADD COLUMN IF NOT EXISTS content_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED;
+
+-- GIN indexes for full-text search
+CREATE INDEX IF NOT EXISTS idx_document_chunks_content_tsv ON document_chunks USING gin (content_tsv);
+CREATE INDEX IF NOT EXISTS idx_principles_content_tsv ON principles USING gin (content_tsv);
+
+-- Query text -> tsquery matching ANY of its terms. websearch_to_tsquery ANDs
+-- them, and a natural-language question ("how do we handle auth token
+-- refresh") rarely contains every one, so the full-text side of the fusion
+-- found next to nothing. ts_rank_cd still ranks rows matching more terms
+-- higher, and the local backend and search cache (FTS5, utils/local_store.py)
+-- OR the terms the same way. The lexemes are already stemmed, so they are
+-- quoted into the tsquery as they are (quotes and backslashes doubled, as
+-- tsquery input expects). NULL when every word is a stopword.
+CREATE OR REPLACE FUNCTION or_tsquery(query_text text)
+RETURNS tsquery
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT string_agg(
+        '''' || replace(replace(lexeme, '\', '\\'), '''', '''''') || '''',
+        ' | '
+    )::tsquery
+    FROM unnest(tsvector_to_array(to_tsvector('english', coalesce(query_text, '')))) AS lexeme
+$$;
+
+DROP FUNCTION IF EXISTS hybrid_search_document_chunks(text, vector, uuid, uuid, int, int);
+DROP FUNCTION IF EXISTS hybrid_search_principles(text, vector, uuid, double precision, text, int, int);
+
+-- Function: hybrid_search_document_chunks
+-- Runs the vector and full-text searches in one statement and fuses their
+-- rankings with reciprocal-rank fusion: score = sum(1 / (rrf_k + rank)).
+CREATE OR REPLACE FUNCTION hybrid_search_document_chunks(
+    query_text text,
+    query_embedding vector(1536),
+    user_id_filter uuid,
+    project_id_filter uuid DEFAULT NULL,
+    match_count int DEFAULT 10,
+    rrf_k int DEFAULT 60
+)
+RETURNS TABLE (
+    id uuid,
+    content text,
+    chunk_type text,
+    section_title text,
+    chunk_index int,
+    document_id uuid,
+    filename text,
+    doc_category text,
+    project_id uuid,
+    project_name text,
+    similarity float,
+    text_rank float,
+    score float
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH semantic AS (
+        SELECT
+            dc.id,
+            ROW_NUMBER() OVER (ORDER BY dc.embedding <=> query_embedding) AS rank_ix
+        FROM document_chunks dc
+        JOIN documents d ON dc.document_id = d.id
+        JOIN projects p ON d.project_id = p.id
+        WHERE d.analyzed = true
+          AND p.user_id = user_id_filter
+          AND (project_id_filter IS NULL OR p.id = project_id_filter)
+          AND dc.embedding IS NOT NULL
+        ORDER BY dc.embedding <=> query_embedding
+        LIMIT match_count * 2
+    ),
+    lexical AS (
+        SELECT
+            dc.id,
+            ts_rank_cd(dc.content_tsv, q) AS text_rank,
+            ROW_NUMBER() OVER (ORDER BY ts_rank_cd(dc.content_tsv, q) DESC) AS rank_ix
+        FROM document_chunks dc
+        JOIN documents d ON dc.document_id = d.id
+        JOIN projects p ON d.project_id = p.id,
+        or_tsquery(query_text) q
+        WHERE d.analyzed = true
+          AND p.user_id = user_id_filter
+          AND (project_id_filter IS NULL OR p.id = project_id_filter)
+          AND dc.content_tsv @@ q
+        ORDER BY ts_rank_cd(dc.content_tsv, q) DESC
+        LIMIT match_count * 2
+    ),
+    fused AS (
+        SELECT
+            COALESCE(s.id, l.id) AS id,
+            COALESCE(l.text_rank, 0.0) AS text_rank,
+            COALESCE(1.0 / (rrf_k + s.rank_ix), 0.0)
+                + COALESCE(1.0 / (rrf_k + l.rank_ix), 0.0) AS score
+        FROM semantic s
+        FULL OUTER JOIN lexical l ON s.id = l.id
+    )
+    SELECT
+        dc.id,
+        dc.content,
+        dc.chunk_type,
+        dc.section_title,
+        dc.chunk_index,
+        d.id AS document_id,
+        d.filename,
+        d.doc_category,
+        p.id AS project_id,
+        p.name AS project_name,
+        COALESCE(1 - (dc.embedding <=> query_embedding), 0.0) AS similarity,
+        f.text_rank::float AS text_rank,
+        f.score::float AS score
+    FROM fused f
+    JOIN document_chunks dc ON dc.id = f.id
+    JOIN documents d ON dc.document_id = d.id
+    JOIN projects p ON d.project_id = p.id
+    ORDER BY f.score DESC
+    LIMIT match_count;
+$$;
+
+-- Function: hybrid_search_principles
+CREATE OR REPLACE FUNCTION hybrid_search_principles(
+    query_text text,
+    query_embedding vector(1536),
+    user_id_filter uuid,
+    min_confidence float DEFAULT 0.5,
+    category_filter text DEFAULT NULL,
+    match_count int DEFAULT 5,
+    rrf_k int DEFAULT 60
+)
+RETURNS TABLE (
+    id uuid,
+    content text,
+    type text,
+    category text,
+    source text,
+    confidence_score decimal,
+    times_applied int,
+    when_to_use text,
+    when_not_to_use text,
+    reasoning text,
+    tradeoffs text,
+    similarity float,
+    text_rank float,
+    score float
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH semantic AS (
+        SELECT
+            p.id,
+            ROW_NUMBER() OVER (ORDER BY p.embedding <=> query_embedding) AS rank_ix
+        FROM principles p
+        WHERE (p.source = 'generic' OR p.user_id = user_id_filter)
+          AND p.confidence_score >= min_confidence
+          AND p.embedding IS NOT NULL
+          AND (category_filter IS NULL OR p.category = category_filter)
+        ORDER BY p.embedding <=> query_embedding
+        LIMIT match_count * 2
+    ),
+    lexical AS (
+        SELECT
+            p.id,
+            ts_rank_cd(p.content_tsv, q) AS text_rank,
+            ROW_NUMBER() OVER (ORDER BY ts_rank_cd(p.content_tsv, q) DESC) AS rank_ix
+        FROM principles p,
+        or_tsquery(query_text) q
+        WHERE (p.source = 'generic' OR p.user_id = user_id_filter)
+          AND p.confidence_score >= min_confidence
+          AND (category_filter IS NULL OR p.category = category_filter)
+          AND p.content_tsv @@ q
+        ORDER BY ts_rank_cd(p.content_tsv, q) DESC
+        LIMIT match_count * 2
+    ),
+    fused AS (
+        SELECT
+            COALESCE(s.id, l.id) AS id,
+            COALESCE(l.text_rank, 0.0) AS text_rank,
+            COALESCE(1.0 / (rrf_k + s.rank_ix), 0.0)
+                + COALESCE(1.0 / (rrf_k + l.rank_ix), 0.0) AS score
+        FROM semantic s
+        FULL OUTER JOIN lexical l ON s.id = l.id
+    )
+    SELECT
+        p.id,
+        p.content,
+        p.type,
+        p.category,
+        p.source,
+        p.confidence_score,
+        p.times_applied,
+        p.when_to_use,
+        p.when_not_to_use,
+        p.reasoning,
+        p.tradeoffs,
+        COALESCE(1 - (p.embedding <=> query_embedding), 0.0) AS similarity,
+        f.text_rank::float AS text_rank,
+        f.score::float AS score
+    FROM fused f
+    JOIN principles p ON p.id = f.id
+    ORDER BY f.score DESC
+    LIMIT match_count;
+$$;
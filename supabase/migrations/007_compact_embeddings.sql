@@ -0,0 +1,298 @@
+-- Compact embeddings: first 256 Matryoshka dimensions of text-embedding-3-small,
+-- re-normalized and stored as half precision (512 bytes vs 6 KB per row).
+-- Requires pgvector >= 0.7 (halfvec, subvector, l2_normalize).
+-- The dimension is fixed by the column type; a different compact size needs
+-- its own column and matching EMBEDDING_PROFILE in utils/embeddings.py.
+
+ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS embedding_compact halfvec(256);
+ALTER TABLE principles ADD COLUMN IF NOT EXISTS embedding_compact halfvec(256);
+
+-- Keep the compact column in sync with every write to the full embedding
+CREATE OR REPLACE FUNCTION set_compact_embedding()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF NEW.embedding IS NULL THEN
+        NEW.embedding_compact := NULL;
+    ELSE
+        NEW.embedding_compact := l2_normalize(subvector(NEW.embedding, 1, 256))::halfvec(256);
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_document_chunks_compact_embedding ON document_chunks;
+CREATE TRIGGER trg_document_chunks_compact_embedding
+    BEFORE INSERT OR UPDATE OF embedding ON document_chunks
+    FOR EACH ROW EXECUTE FUNCTION set_compact_embedding();
+
+DROP TRIGGER IF EXISTS trg_principles_compact_embedding ON principles;
+CREATE TRIGGER trg_principles_compact_embedding
+    BEFORE INSERT OR UPDATE OF embedding ON principles
+    FOR EACH ROW EXECUTE FUNCTION set_compact_embedding();
+
+-- HNSW indexes on the compact vectors
+CREATE INDEX IF NOT EXISTS idx_document_chunks_embedding_compact
+    ON document_chunks USING hnsw (embedding_compact halfvec_cosine_ops);
+CREATE INDEX IF NOT EXISTS idx_principles_embedding_compact
+    ON principles USING hnsw (embedding_compact halfvec_cosine_ops);
+
+-- Rows still waiting for the backfill; lets the search functions cover them exactly
+CREATE INDEX IF NOT EXISTS idx_document_chunks_compact_pending
+    ON document_chunks (id) WHERE embedding_compact IS NULL AND embedding IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_principles_compact_pending
+    ON principles (id) WHERE embedding_compact IS NULL AND embedding IS NOT NULL;
+
+-- Function: backfill_compact_embeddings
+-- Converts up to batch_size existing rows per call; returns the number converted.
+CREATE OR REPLACE FUNCTION backfill_compact_embeddings(
+    table_name text,
+    batch_size int DEFAULT 500
+)
+RETURNS int
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    converted int;
+BEGIN
+    IF table_name NOT IN ('document_chunks', 'principles') THEN
+        RAISE EXCEPTION 'backfill_compact_embeddings: unsupported table %', table_name;
+    END IF;
+    EXECUTE format(
+        'UPDATE %I SET embedding_compact = l2_normalize(subvector(embedding, 1, 256))::halfvec(256)
+         WHERE id IN (
+             SELECT id FROM %I
+             WHERE embedding_compact IS NULL AND embedding IS NOT NULL
+             LIMIT $1
+         )',
+        table_name, table_name
+    ) USING batch_size;
+    GET DIAGNOSTICS converted = ROW_COUNT;
+    RETURN converted;
+END;
+$$;
+
+DROP FUNCTION IF EXISTS hybrid_search_document_chunks_2stage(text, vector, uuid, uuid, int, int, int);
+DROP FUNCTION IF EXISTS hybrid_search_principles_2stage(text, vector, uuid, double precision, text, int, int, int);
+
+-- Function: hybrid_search_document_chunks_2stage
+-- Same contract as hybrid_search_document_chunks. The semantic side first
+-- takes match_count * oversample candidates from the compact HNSW index
+-- (plus any rows not yet backfilled), then re-ranks them with the full vectors.
+CREATE OR REPLACE FUNCTION hybrid_search_document_chunks_2stage(
+    query_text text,
+    query_embedding vector(1536),
+    user_id_filter uuid,
+    project_id_filter uuid DEFAULT NULL,
+    match_count int DEFAULT 10,
+    rrf_k int DEFAULT 60,
+    oversample int DEFAULT 4
+)
+RETURNS TABLE (
+    id uuid,
+    content text,
+    chunk_type text,
+    section_title text,
+    chunk_index int,
+    document_id uuid,
+    filename text,
+    doc_category text,
+    project_id uuid,
+    project_name text,
+    similarity float,
+    text_rank float,
+    score float
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH query_compact AS (
+        SELECT l2_normalize(subvector(query_embedding, 1, 256))::halfvec(256) AS qc
+    ),
+    coarse AS (
+        (
+            SELECT dc.id
+            FROM document_chunks dc
+            JOIN documents d ON dc.document_id = d.id
+            JOIN projects p ON d.project_id = p.id,
+            query_compact
+            WHERE d.analyzed = true
+              AND p.user_id = user_id_filter
+              AND (project_id_filter IS NULL OR p.id = project_id_filter)
+              AND dc.embedding_compact IS NOT NULL
+            ORDER BY dc.embedding_compact <=> query_compact.qc
+            LIMIT match_count * oversample
+        )
+        UNION
+        SELECT dc.id
+        FROM document_chunks dc
+        JOIN documents d ON dc.document_id = d.id
+        JOIN projects p ON d.project_id = p.id
+        WHERE d.analyzed = true
+          AND p.user_id = user_id_filter
+          AND (project_id_filter IS NULL OR p.id = project_id_filter)
+          AND dc.embedding_compact IS NULL
+          AND dc.embedding IS NOT NULL
+    ),
+    semantic AS (
+        SELECT
+            dc.id,
+            ROW_NUMBER() OVER (ORDER BY dc.embedding <=> query_embedding) AS rank_ix
+        FROM coarse c
+        JOIN document_chunks dc ON dc.id = c.id
+        ORDER BY dc.embedding <=> query_embedding
+        LIMIT match_count * 2
+    ),
+    lexical AS (
+        SELECT
+            dc.id,
+            ts_rank_cd(dc.content_tsv, q) AS text_rank,
+            ROW_NUMBER() OVER (ORDER BY ts_rank_cd(dc.content_tsv, q) DESC) AS rank_ix
+        FROM document_chunks dc
+        JOIN documents d ON dc.document_id = d.id
+        JOIN projects p ON d.project_id = p.id,
+        or_tsquery(query_text) q
+        WHERE d.analyzed = true
+          AND p.user_id = user_id_filter
+          AND (project_id_filter IS NULL OR p.id = project_id_filter)
+          AND dc.content_tsv @@ q
+        ORDER BY ts_rank_cd(dc.content_tsv, q) DESC
+        LIMIT match_count * 2
+    ),
+    fused AS (
+        SELECT
+            COALESCE(s.id, l.id) AS id,
+            COALESCE(l.text_rank, 0.0) AS text_rank,
+            COALESCE(1.0 / (rrf_k + s.rank_ix), 0.0)
+                + COALESCE(1.0 / (rrf_k + l.rank_ix), 0.0) AS score
+        FROM semantic s
+        FULL OUTER JOIN lexical l ON s.id = l.id
+    )
+    SELECT
+        dc.id,
+        dc.content,
+        dc.chunk_type,
+        dc.section_title,
+        dc.chunk_index,
+        d.id AS document_id,
+        d.filename,
+        d.doc_category,
+        p.id AS project_id,
+        p.name AS project_name,
+        COALESCE(1 - (dc.embedding <=> query_embedding), 0.0) AS similarity,
+        f.text_rank::float AS text_rank,
+        f.score::float AS score
+    FROM fused f
+    JOIN document_chunks dc ON dc.id = f.id
+    JOIN documents d ON dc.document_id = d.id
+    JOIN projects p ON d.project_id = p.id
+    ORDER BY f.score DESC
+    LIMIT match_count;
+$$;
+
+-- Function: hybrid_search_principles_2stage
+CREATE OR REPLACE FUNCTION hybrid_search_principles_2stage(
+    query_text text,
+    query_embedding vector(1536),
+    user_id_filter uuid,
+    min_confidence float DEFAULT 0.5,
+    category_filter text DEFAULT NULL,
+    match_count int DEFAULT 5,
+    rrf_k int DEFAULT 60,
+    oversample int DEFAULT 4
+)
+RETURNS TABLE (
+    id uuid,
+    content text,
+    type text,
+    category text,
+    source text,
+    confidence_score decimal,
+    times_applied int,
+    when_to_use text,
+    when_not_to_use text,
+    reasoning text,
+    tradeoffs text,
+    similarity float,
+    text_rank float,
+    score float
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH query_compact AS (
+        SELECT l2_normalize(subvector(query_embedding, 1, 256))::halfvec(256) AS qc
+    ),
+    coarse AS (
+        (
+            SELECT p.id
+            FROM principles p, query_compact
+            WHERE (p.source = 'generic' OR p.user_id = user_id_filter)
+              AND p.confidence_score >= min_confidence
+              AND p.embedding_compact IS NOT NULL
+              AND (category_filter IS NULL OR p.category = category_filter)
+            ORDER BY p.embedding_compact <=> query_compact.qc
+            LIMIT match_count * oversample
+        )
+        UNION
+        SELECT p.id
+        FROM principles p
+        WHERE (p.source = 'generic' OR p.user_id = user_id_filter)
+          AND p.confidence_score >= min_confidence
+          AND p.embedding_compact IS NULL
+          AND p.embedding IS NOT NULL
+          AND (category_filter IS NULL OR p.category = category_filter)
+    ),
+    semantic AS (
+        SELECT
+            p.id,
+            ROW_NUMBER() OVER (ORDER BY p.embedding <=> query_embedding) AS rank_ix
+        FROM coarse c
+        JOIN principles p ON p.id = c.id
+        ORDER BY p.embedding <=> query_embedding
+        LIMIT match_count * 2
+    ),
+    lexical AS (
+        SELECT
+            p.id,
+            ts_rank_cd(p.content_tsv, q) AS text_rank,
+            ROW_NUMBER() OVER (ORDER BY ts_rank_cd(p.content_tsv, q) DESC) AS rank_ix
+        FROM principles p,
+        or_tsquery(query_text) q
+        WHERE (p.source = 'generic' OR p.user_id = user_id_filter)
+          AND p.confidence_score >= min_confidence
+          AND (category_filter IS NULL OR p.category = category_filter)
+          AND p.content_tsv @@ q
+        ORDER BY ts_rank_cd(p.content_tsv, q) DESC
+        LIMIT match_count * 2
+    ),
+    fused AS (
+        SELECT
+            COALESCE(s.id, l.id) AS id,
+            COALESCE(l.text_rank, 0.0) AS text_rank,
+            COALESCE(1.0 / (rrf_k + s.rank_ix), 0.0)
+                + COALESCE(1.0 / (rrf_k + l.rank_ix), 0.0) AS score
+        FROM semantic s
+        FULL OUTER JOIN lexical l ON s.id = l.id
+    )
+    SELECT
+        p.id,
+        p.content,
+        p.type,
+        p.category,
+        p.source,
+        p.confidence_score,
+        p.times_applied,
+        p.when_to_use,
+        p.when_not_to_use,
+        p.reasoning,
+        p.tradeoffs,
+        COALESCE(1 - (p.embedding <=> query_embedding), 0.0) AS similarity,
+        f.text_rank::float AS text_rank,
+        f.score::float AS score
+    FROM fused f
+    JOIN principles p ON p.id = f.id
+    ORDER BY f.score DESC
+    LIMIT match_count;
+$$;
@@ -0,0 +1,65 @@
+-- Resumable bulk (re-)embedding: version tag per row, checkpoints per job,
+-- and a single-statement bulk write.
+
+ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS embedding_version text;
+ALTER TABLE principles ADD COLUMN IF NOT EXISTS embedding_version text;
+
+CREATE TABLE IF NOT EXISTS embedding_backfill_checkpoints (
+    job TEXT PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    last_id UUID,
+    processed INT NOT NULL DEFAULT 0,
+    completed_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Service-role only; no policies
+ALTER TABLE embedding_backfill_checkpoints ENABLE ROW LEVEL SECURITY;
+
+-- Function: bulk_update_embeddings
+-- Writes one page of embeddings in a single UPDATE ... FROM unnest(...).
+-- Embeddings arrive as pgvector text literals ('[0.1,0.2,...]') because
+-- PostgREST cannot map nested JSON arrays onto vector[]. When job is given
+-- the checkpoint is advanced in the same transaction, so a crash never
+-- leaves a written page unrecorded or a recorded page unwritten.
+CREATE OR REPLACE FUNCTION bulk_update_embeddings(
+    table_name text,
+    ids uuid[],
+    embeddings text[],
+    version text,
+    job text DEFAULT NULL,
+    last_id uuid DEFAULT NULL
+)
+RETURNS int
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    updated int;
+BEGIN
+    IF table_name NOT IN ('document_chunks', 'principles') THEN
+        RAISE EXCEPTION 'bulk_update_embeddings: unsupported table %', table_name;
+    END IF;
+
+    EXECUTE format(
+        'UPDATE %I AS t
+         SET embedding = u.embedding::vector(1536),
+             embedding_version = $3
+         FROM unnest($1::uuid[], $2::text[]) AS u(id, embedding)
+         WHERE t.id = u.id',
+        table_name
+    ) USING ids, embeddings, version;
+    GET DIAGNOSTICS updated = ROW_COUNT;
+
+    IF job IS NOT NULL THEN
+        INSERT INTO embedding_backfill_checkpoints (job, table_name, version, last_id, processed, updated_at)
+        VALUES (job, table_name, version, last_id, updated, NOW())
+        ON CONFLICT (job) DO UPDATE
+        SET last_id = EXCLUDED.last_id,
+            processed = embedding_backfill_checkpoints.processed + EXCLUDED.processed,
+            updated_at = NOW();
+    END IF;
+
+    RETURN updated;
+END;
+$$;
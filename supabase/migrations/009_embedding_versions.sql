@@ -0,0 +1,638 @@
+-- Embedding model versioning with dual-write migrations.
+--
+-- embedding_versions records which (model, version) produced each vector
+-- space. Exactly one version is 'active' and is what queries search; at most
+-- one is 'building'. While a version is building, writers fill both the
+-- serving slot (embedding) and the next slot (embedding_next), and the
+-- backfill job re-embeds existing rows into embedding_next. Once every
+-- embedded row has a next vector, cutover_embedding_version() swaps the
+-- slots and flips the active version in one transaction.
+-- The next slot shares the 1536-dim column type; a model with a different
+-- native size must be requested at 1536 dimensions.
+
+CREATE TABLE IF NOT EXISTS embedding_versions (
+    version TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'building' CHECK (status IN ('building', 'active', 'retired')),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    activated_at TIMESTAMPTZ
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_embedding_versions_one_active
+    ON embedding_versions (status) WHERE status = 'active';
+CREATE UNIQUE INDEX IF NOT EXISTS idx_embedding_versions_one_building
+    ON embedding_versions (status) WHERE status = 'building';
+
+ALTER TABLE embedding_versions ENABLE ROW LEVEL SECURITY;
+CREATE POLICY embedding_versions_select ON embedding_versions FOR SELECT USING (true);
+
+INSERT INTO embedding_versions (version, model, status, activated_at)
+VALUES ('1', 'text-embedding-3-small', 'active', NOW())
+ON CONFLICT (version) DO NOTHING;
+
+ALTER TABLE document_chunks
+    ADD COLUMN IF NOT EXISTS embedding_model text,
+    ADD COLUMN IF NOT EXISTS embedding_next vector(1536),
+    ADD COLUMN IF NOT EXISTS embedding_next_model text,
+    ADD COLUMN IF NOT EXISTS embedding_next_version text;
+
+ALTER TABLE principles
+    ADD COLUMN IF NOT EXISTS embedding_model text,
+    ADD COLUMN IF NOT EXISTS embedding_next vector(1536),
+    ADD COLUMN IF NOT EXISTS embedding_next_model text,
+    ADD COLUMN IF NOT EXISTS embedding_next_version text;
+
+-- Everything embedded so far came from the seeded version
+UPDATE document_chunks SET embedding_model = 'text-embedding-3-small', embedding_version = COALESCE(embedding_version, '1')
+WHERE embedding IS NOT NULL AND embedding_model IS NULL;
+UPDATE principles SET embedding_model = 'text-embedding-3-small', embedding_version = COALESCE(embedding_version, '1')
+WHERE embedding IS NOT NULL AND embedding_model IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_document_chunks_embedding_version ON document_chunks (embedding_version);
+CREATE INDEX IF NOT EXISTS idx_principles_embedding_version ON principles (embedding_version);
+
+-- Function: bulk_update_embeddings
+-- Replaces the 008 version: also records the model and can target the next slot.
+DROP FUNCTION IF EXISTS bulk_update_embeddings(text, uuid[], text[], text, text, uuid);
+
+CREATE OR REPLACE FUNCTION bulk_update_embeddings(
+    table_name text,
+    ids uuid[],
+    embeddings text[],
+    version text,
+    job text DEFAULT NULL,
+    last_id uuid DEFAULT NULL,
+    model text DEFAULT NULL,
+    slot text DEFAULT 'embedding'
+)
+RETURNS int
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    updated int;
+BEGIN
+    IF table_name NOT IN ('document_chunks', 'principles') THEN
+        RAISE EXCEPTION 'bulk_update_embeddings: unsupported table %', table_name;
+    END IF;
+    IF slot NOT IN ('embedding', 'embedding_next') THEN
+        RAISE EXCEPTION 'bulk_update_embeddings: unsupported slot %', slot;
+    END IF;
+
+    EXECUTE format(
+        'UPDATE %1$I AS t
+         SET %2$I = u.embedding::vector(1536),
+             %3$I = $3,
+             %4$I = COALESCE($4, t.%4$I)
+         FROM unnest($1::uuid[], $2::text[]) AS u(id, embedding)
+         WHERE t.id = u.id',
+        table_name, slot, slot || '_version',
+        CASE WHEN slot = 'embedding' THEN 'embedding_model' ELSE 'embedding_next_model' END
+    ) USING ids, embeddings, version, model;
+    GET DIAGNOSTICS updated = ROW_COUNT;
+
+    IF job IS NOT NULL THEN
+        INSERT INTO embedding_backfill_checkpoints (job, table_name, version, last_id, processed, updated_at)
+        VALUES (job, table_name, version, last_id, updated, NOW())
+        ON CONFLICT (job) DO UPDATE
+        SET last_id = EXCLUDED.last_id,
+            processed = embedding_backfill_checkpoints.processed + EXCLUDED.processed,
+            updated_at = NOW();
+    END IF;
+
+    RETURN updated;
+END;
+$$;
+
+-- Function: embedding_version_coverage
+-- Rows with a serving embedding vs rows that also carry target_version
+-- (in either slot). Cutover is allowed only when the two are equal.
+CREATE OR REPLACE FUNCTION embedding_version_coverage(target_version text)
+RETURNS TABLE (table_name text, total bigint, covered bigint)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT 'document_chunks', count(*),
+           count(*) FILTER (WHERE embedding_version = target_version OR embedding_next_version = target_version)
+    FROM document_chunks WHERE embedding IS NOT NULL
+    UNION ALL
+    SELECT 'principles', count(*),
+           count(*) FILTER (WHERE embedding_version = target_version OR embedding_next_version = target_version)
+    FROM principles WHERE embedding IS NOT NULL;
+$$;
+
+-- Function: cutover_embedding_version
+-- Promotes a fully covered building version. Writes to both tables are
+-- blocked for the duration, so no row can be written under the old version
+-- between the coverage check and the swap; readers keep using the old
+-- snapshot until commit and then see only the new version.
+CREATE OR REPLACE FUNCTION cutover_embedding_version(target_version text)
+RETURNS boolean
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM 1 FROM embedding_versions WHERE version = target_version AND status = 'building' FOR UPDATE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'cutover_embedding_version: % is not a building version', target_version;
+    END IF;
+
+    LOCK TABLE document_chunks, principles IN SHARE ROW EXCLUSIVE MODE;
+
+    IF EXISTS (SELECT 1 FROM embedding_version_coverage(target_version) c WHERE c.covered < c.total) THEN
+        RETURN false;
+    END IF;
+
+    UPDATE document_chunks
+    SET embedding = embedding_next,
+        embedding_model = embedding_next_model,
+        embedding_version = embedding_next_version,
+        embedding_next = NULL,
+        embedding_next_model = NULL,
+        embedding_next_version = NULL
+    WHERE embedding_next_version = target_version;
+
+    UPDATE principles
+    SET embedding = embedding_next,
+        embedding_model = embedding_next_model,
+        embedding_version = embedding_next_version,
+        embedding_next = NULL,
+        embedding_next_model = NULL,
+        embedding_next_version = NULL
+    WHERE embedding_next_version = target_version;
+
+    UPDATE embedding_versions SET status = 'retired' WHERE status = 'active';
+    UPDATE embedding_versions SET status = 'active', activated_at = NOW() WHERE version = target_version;
+    RETURN true;
+END;
+$$;
+
+-- Search functions gain embedding_version_filter: the version the query
+-- vector was produced with. Rows from any other version are excluded from
+-- the vector side (full-text matches are version-independent).
+DROP FUNCTION IF EXISTS search_principles(vector, uuid, double precision, text, integer);
+DROP FUNCTION IF EXISTS hybrid_search_document_chunks(text, vector, uuid, uuid, int, int);
+DROP FUNCTION IF EXISTS hybrid_search_principles(text, vector, uuid, double precision, text, int, int);
+DROP FUNCTION IF EXISTS hybrid_search_document_chunks_2stage(text, vector, uuid, uuid, int, int, int);
+DROP FUNCTION IF EXISTS hybrid_search_principles_2stage(text, vector, uuid, double precision, text, int, int, int);
+
+-- Function: search_principles
+CREATE OR REPLACE FUNCTION search_principles(
+    query_embedding vector(1536),
+    user_id_filter uuid,
+    min_confidence float DEFAULT 0.5,
+    category_filter text DEFAULT NULL,
+    match_count int DEFAULT 5,
+    embedding_version_filter text DEFAULT NULL
+)
+RETURNS TABLE (
+    id uuid,
+    content text,
+    type text,
+    category text,
+    source text,
+    confidence_score decimal,
+    times_applied int,
+    when_to_use text,
+    when_not_to_use text,
+    reasoning text,
+    tradeoffs text,
+    similarity float
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        p.id,
+        p.content,
+        p.type,
+        p.category,
+        p.source,
+        p.confidence_score,
+        p.times_applied,
+        p.when_to_use,
+        p.when_not_to_use,
+        p.reasoning,
+        p.tradeoffs,
+        1 - (p.embedding <=> query_embedding) AS similarity
+    FROM principles p
+    WHERE (p.source = 'generic' OR p.user_id = user_id_filter)
+      AND p.confidence_score >= min_confidence
+      AND p.embedding IS NOT NULL
+      AND (embedding_version_filter IS NULL OR p.embedding_version = embedding_version_filter)
+      AND (category_filter IS NULL OR p.category = category_filter)
+    ORDER BY p.embedding <=> query_embedding
+    LIMIT match_count;
+$$;
+
+-- Function: hybrid_search_document_chunks
+-- Runs the vector and full-text searches in one statement and fuses their
+-- rankings with reciprocal-rank fusion: score = sum(1 / (rrf_k + rank)).
+CREATE OR REPLACE FUNCTION hybrid_search_document_chunks(
+    query_text text,
+    query_embedding vector(1536),
+    user_id_filter uuid,
+    project_id_filter uuid DEFAULT NULL,
+    match_count int DEFAULT 10,
+    rrf_k int DEFAULT 60,
+    embedding_version_filter text DEFAULT NULL
+)
+RETURNS TABLE (
+    id uuid,
+    content text,
+    chunk_type text,
+    section_title text,
+    chunk_index int,
+    document_id uuid,
+    filename text,
+    doc_category text,
+    project_id uuid,
+    project_name text,
+    similarity float,
+    text_rank float,
+    score float
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH semantic AS (
+        SELECT
+            dc.id,
+            ROW_NUMBER() OVER (ORDER BY dc.embedding <=> query_embedding) AS rank_ix
+        FROM document_chunks dc
+        JOIN documents d ON dc.document_id = d.id
+        JOIN projects p ON d.project_id = p.id
+        WHERE d.analyzed = true
+          AND p.user_id = user_id_filter
+          AND (project_id_filter IS NULL OR p.id = project_id_filter)
+          AND dc.embedding IS NOT NULL
+          AND (embedding_version_filter IS NULL OR dc.embedding_version = embedding_version_filter)
+        ORDER BY dc.embedding <=> query_embedding
+        LIMIT match_count * 2
+    ),
+    lexical AS (
+        SELECT
+            dc.id,
+            ts_rank_cd(dc.content_tsv, q) AS text_rank,
+            ROW_NUMBER() OVER (ORDER BY ts_rank_cd(dc.content_tsv, q) DESC) AS rank_ix
+        FROM document_chunks dc
+        JOIN documents d ON dc.document_id = d.id
+        JOIN projects p ON d.project_id = p.id,
+        or_tsquery(query_text) q
+        WHERE d.analyzed = true
+          AND p.user_id = user_id_filter
+          AND (project_id_filter IS NULL OR p.id = project_id_filter)
+          AND dc.content_tsv @@ q
+        ORDER BY ts_rank_cd(dc.content_tsv, q) DESC
+        LIMIT match_count * 2
+    ),
+    fused AS (
+        SELECT
+            COALESCE(s.id, l.id) AS id,
+            COALESCE(l.text_rank, 0.0) AS text_rank,
+            COALESCE(1.0 / (rrf_k + s.rank_ix), 0.0)
+                + COALESCE(1.0 / (rrf_k + l.rank_ix), 0.0) AS score
+        FROM semantic s
+        FULL OUTER JOIN lexical l ON s.id = l.id
+    )
+    SELECT
+        dc.id,
+        dc.content,
+        dc.chunk_type,
+        dc.section_title,
+        dc.chunk_index,
+        d.id AS document_id,
+        d.filename,
+        d.doc_category,
+        p.id AS project_id,
+        p.name AS project_name,
+        CASE WHEN embedding_version_filter IS NULL OR dc.embedding_version = embedding_version_filter
+            THEN COALESCE(1 - (dc.embedding <=> query_embedding), 0.0)
+            ELSE 0.0 END AS similarity,
+        f.text_rank::float AS text_rank,
+        f.score::float AS score
+    FROM fused f
+    JOIN document_chunks dc ON dc.id = f.id
+    JOIN documents d ON dc.document_id = d.id
+    JOIN projects p ON d.project_id = p.id
+    ORDER BY f.score DESC
+    LIMIT match_count;
+$$;
+
+-- Function: hybrid_search_principles
+CREATE OR REPLACE FUNCTION hybrid_search_principles(
+    query_text text,
+    query_embedding vector(1536),
+    user_id_filter uuid,
+    min_confidence float DEFAULT 0.5,
+    category_filter text DEFAULT NULL,
+    match_count int DEFAULT 5,
+    rrf_k int DEFAULT 60,
+    embedding_version_filter text DEFAULT NULL
+)
+RETURNS TABLE (
+    id uuid,
+    content text,
+    type text,
+    category text,
+    source text,
+    confidence_score decimal,
+    times_applied int,
+    when_to_use text,
+    when_not_to_use text,
+    reasoning text,
+    tradeoffs text,
+    similarity float,
+    text_rank float,
+    score float
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH semantic AS (
+        SELECT
+            p.id,
+            ROW_NUMBER() OVER (ORDER BY p.embedding <=> query_embedding) AS rank_ix
+        FROM principles p
+        WHERE (p.source = 'generic' OR p.user_id = user_id_filter)
+          AND p.confidence_score >= min_confidence
+          AND p.embedding IS NOT NULL
+          AND (embedding_version_filter IS NULL OR p.embedding_version = embedding_version_filter)
+          AND (category_filter IS NULL OR p.category = category_filter)
+        ORDER BY p.embedding <=> query_embedding
+        LIMIT match_count * 2
+    ),
+    lexical AS (
+        SELECT
+            p.id,
+            ts_rank_cd(p.content_tsv, q) AS text_rank,
+            ROW_NUMBER() OVER (ORDER BY ts_rank_cd(p.content_tsv, q) DESC) AS rank_ix
+        FROM principles p,
+        or_tsquery(query_text) q
+        WHERE (p.source = 'generic' OR p.user_id = user_id_filter)
+          AND p.confidence_score >= min_confidence
+          AND (category_filter IS NULL OR p.category = category_filter)
+          AND p.content_tsv @@ q
+        ORDER BY ts_rank_cd(p.content_tsv, q) DESC
+        LIMIT match_count * 2
+    ),
+    fused AS (
+        SELECT
+            COALESCE(s.id, l.id) AS id,
+            COALESCE(l.text_rank, 0.0) AS text_rank,
+            COALESCE(1.0 / (rrf_k + s.rank_ix), 0.0)
+                + COALESCE(1.0 / (rrf_k + l.rank_ix), 0.0) AS score
+        FROM semantic s
+        FULL OUTER JOIN lexical l ON s.id = l.id
+    )
+    SELECT
+        p.id,
+        p.content,
+        p.type,
+        p.category,
+        p.source,
+        p.confidence_score,
+        p.times_applied,
+        p.when_to_use,
+        p.when_not_to_use,
+        p.reasoning,
+        p.tradeoffs,
+        CASE WHEN embedding_version_filter IS NULL OR p.embedding_version = embedding_version_filter
+            THEN COALESCE(1 - (p.embedding <=> query_embedding), 0.0)
+            ELSE 0.0 END AS similarity,
+        f.text_rank::float AS text_rank,
+        f.score::float AS score
+    FROM fused f
+    JOIN principles p ON p.id = f.id
+    ORDER BY f.score DESC
+    LIMIT match_count;
+$$;
+
+-- Function: hybrid_search_document_chunks_2stage
+-- Same contract as hybrid_search_document_chunks. The semantic side first
+-- takes match_count * oversample candidates from the compact HNSW index
+-- (plus any rows not yet backfilled), then re-ranks them with the full vectors.
+CREATE OR REPLACE FUNCTION hybrid_search_document_chunks_2stage(
+    query_text text,
+    query_embedding vector(1536),
+    user_id_filter uuid,
+    project_id_filter uuid DEFAULT NULL,
+    match_count int DEFAULT 10,
+    rrf_k int DEFAULT 60,
+    oversample int DEFAULT 4,
+    embedding_version_filter text DEFAULT NULL
+)
+RETURNS TABLE (
+    id uuid,
+    content text,
+    chunk_type text,
+    section_title text,
+    chunk_index int,
+    document_id uuid,
+    filename text,
+    doc_category text,
+    project_id uuid,
+    project_name text,
+    similarity float,
+    text_rank float,
+    score float
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH query_compact AS (
+        SELECT l2_normalize(subvector(query_embedding, 1, 256))::halfvec(256) AS qc
+    ),
+    coarse AS (
+        (
+            SELECT dc.id
+            FROM document_chunks dc
+            JOIN documents d ON dc.document_id = d.id
+            JOIN projects p ON d.project_id = p.id,
+            query_compact
+            WHERE d.analyzed = true
+              AND p.user_id = user_id_filter
+              AND (project_id_filter IS NULL OR p.id = project_id_filter)
+              AND dc.embedding_compact IS NOT NULL
+              AND (embedding_version_filter IS NULL OR dc.embedding_version = embedding_version_filter)
+            ORDER BY dc.embedding_compact <=> query_compact.qc
+            LIMIT match_count * oversample
+        )
+        UNION
+        SELECT dc.id
+        FROM document_chunks dc
+        JOIN documents d ON dc.document_id = d.id
+        JOIN projects p ON d.project_id = p.id
+        WHERE d.analyzed = true
+          AND p.user_id = user_id_filter
+          AND (project_id_filter IS NULL OR p.id = project_id_filter)
+          AND dc.embedding_compact IS NULL
+          AND dc.embedding IS NOT NULL
+          AND (embedding_version_filter IS NULL OR dc.embedding_version = embedding_version_filter)
+    ),
+    semantic AS (
+        SELECT
+            dc.id,
+            ROW_NUMBER() OVER (ORDER BY dc.embedding <=> query_embedding) AS rank_ix
+        FROM coarse c
+        JOIN document_chunks dc ON dc.id = c.id
+        ORDER BY dc.embedding <=> query_embedding
+        LIMIT match_count * 2
+    ),
+    lexical AS (
+        SELECT
+            dc.id,
+            ts_rank_cd(dc.content_tsv, q) AS text_rank,
+            ROW_NUMBER() OVER (ORDER BY ts_rank_cd(dc.content_tsv, q) DESC) AS rank_ix
+        FROM document_chunks dc
+        JOIN documents d ON dc.document_id = d.id
+        JOIN projects p ON d.project_id = p.id,
+        or_tsquery(query_text) q
+        WHERE d.analyzed = true
+          AND p.user_id = user_id_filter
+          AND (project_id_filter IS NULL OR p.id = project_id_filter)
+          AND dc.content_tsv @@ q
+        ORDER BY ts_rank_cd(dc.content_tsv, q) DESC
+        LIMIT match_count * 2
+    ),
+    fused AS (
+        SELECT
+            COALESCE(s.id, l.id) AS id,
+            COALESCE(l.text_rank, 0.0) AS text_rank,
+            COALESCE(1.0 / (rrf_k + s.rank_ix), 0.0)
+                + COALESCE(1.0 / (rrf_k + l.rank_ix), 0.0) AS score
+        FROM semantic s
+        FULL OUTER JOIN lexical l ON s.id = l.id
+    )
+    SELECT
+        dc.id,
+        dc.content,
+        dc.chunk_type,
+        dc.section_title,
+        dc.chunk_index,
+        d.id AS document_id,
+        d.filename,
+        d.doc_category,
+        p.id AS project_id,
+        p.name AS project_name,
+        CASE WHEN embedding_version_filter IS NULL OR dc.embedding_version = embedding_version_filter
+            THEN COALESCE(1 - (dc.embedding <=> query_embedding), 0.0)
+            ELSE 0.0 END AS similarity,
+        f.text_rank::float AS text_rank,
+        f.score::float AS score
+    FROM fused f
+    JOIN document_chunks dc ON dc.id = f.id
+    JOIN documents d ON dc.document_id = d.id
+    JOIN projects p ON d.project_id = p.id
+    ORDER BY f.score DESC
+    LIMIT match_count;
+$$;
+
+-- Function: hybrid_search_principles_2stage
+CREATE OR REPLACE FUNCTION hybrid_search_principles_2stage(
+    query_text text,
+    query_embedding vector(1536),
+    user_id_filter uuid,
+    min_confidence float DEFAULT 0.5,
+    category_filter text DEFAULT NULL,
+    match_count int DEFAULT 5,
+    rrf_k int DEFAULT 60,
+    oversample int DEFAULT 4,
+    embedding_version_filter text DEFAULT NULL
+)
+RETURNS TABLE (
+    id uuid,
+    content text,
+    type text,
+    category text,
+    source text,
+    confidence_score decimal,
+    times_applied int,
+    when_to_use text,
+    when_not_to_use text,
+    reasoning text,
+    tradeoffs text,
+    similarity float,
+    text_rank float,
+    score float
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH query_compact AS (
+        SELECT l2_normalize(subvector(query_embedding, 1, 256))::halfvec(256) AS qc
+    ),
+    coarse AS (
+        (
+            SELECT p.id
+            FROM principles p, query_compact
+            WHERE (p.source = 'generic' OR p.user_id = user_id_filter)
+              AND p.confidence_score >= min_confidence
+              AND p.embedding_compact IS NOT NULL
+              AND (embedding_version_filter IS NULL OR p.embedding_version = embedding_version_filter)
+              AND (category_filter IS NULL OR p.category = category_filter)
+            ORDER BY p.embedding_compact <=> query_compact.qc
+            LIMIT match_count * oversample
+        )
+        UNION
+        SELECT p.id
+        FROM principles p
+        WHERE (p.source = 'generic' OR p.user_id = user_id_filter)
+          AND p.confidence_score >= min_confidence
+          AND p.embedding_compact IS NULL
+          AND p.embedding IS NOT NULL
+          AND (embedding_version_filter IS NULL OR p.embedding_version = embedding_version_filter)
+          AND (category_filter IS NULL OR p.category = category_filter)
+    ),
+    semantic AS (
+        SELECT
+            p.id,
+            ROW_NUMBER() OVER (ORDER BY p.embedding <=> query_embedding) AS rank_ix
+        FROM coarse c
+        JOIN principles p ON p.id = c.id
+        ORDER BY p.embedding <=> query_embedding
+        LIMIT match_count * 2
+    ),
+    lexical AS (
+        SELECT
+            p.id,
+            ts_rank_cd(p.content_tsv, q) AS text_rank,
+            ROW_NUMBER() OVER (ORDER BY ts_rank_cd(p.content_tsv, q) DESC) AS rank_ix
+        FROM principles p,
+        or_tsquery(query_text) q
+        WHERE (p.source = 'generic' OR p.user_id = user_id_filter)
+          AND p.confidence_score >= min_confidence
+          AND (category_filter IS NULL OR p.category = category_filter)
+          AND p.content_tsv @@ q
+        ORDER BY ts_rank_cd(p.content_tsv, q) DESC
+        LIMIT match_count * 2
+    ),
+    fused AS (
+        SELECT
+            COALESCE(s.id, l.id) AS id,
+            COALESCE(l.text_rank, 0.0) AS text_rank,
+            COALESCE(1.0 / (rrf_k + s.rank_ix), 0.0)
+                + COALESCE(1.0 / (rrf_k + l.rank_ix), 0.0) AS score
+        FROM semantic s
+        FULL OUTER JOIN lexical l ON s.id = l.id
+    )
+    SELECT
+        p.id,
+        p.content,
+        p.type,
+        p.category,
+        p.source,
+        p.confidence_score,
+        p.times_applied,
+        p.when_to_use,
+        p.when_not_to_use,
+        p.reasoning,
+        p.tradeoffs,
+        CASE WHEN embedding_version_filter IS NULL OR p.embedding_version = embedding_version_filter
+            THEN COALESCE(1 - (p.embedding <=> query_embedding), 0.0)
+            ELSE 0.0 END AS similarity,
+        f.text_rank::float AS text_rank,
+        f.score::float AS score
+    FROM fused f
+    JOIN principles p ON p.id = f.id
+    ORDER BY f.score DESC
+    LIMIT match_count;
+$$;
@@ -0,0 +1,33 @@
+-- Function: bump_principle
+-- Records one more sighting of an existing principle in a single UPDATE:
+-- confidence grows by delta up to cap (never lowered), times_applied is
+-- incremented, and project_id is added to source_projects if missing. The
+-- row lock taken by the UPDATE serializes concurrent bumps of the same
+-- principle, so none are lost, and the caller needs no read first.
+CREATE OR REPLACE FUNCTION bump_principle(
+    principle_id uuid,
+    delta numeric DEFAULT 0.05,
+    cap numeric DEFAULT 0.95,
+    project_id uuid DEFAULT NULL
+)
+RETURNS TABLE (
+    id uuid,
+    confidence_score decimal,
+    times_applied int,
+    source_projects uuid[]
+)
+LANGUAGE sql
+AS $$
+    UPDATE principles p
+    SET confidence_score = GREATEST(p.confidence_score, LEAST(p.confidence_score + bump_principle.delta, bump_principle.cap)),
+        times_applied = COALESCE(p.times_applied, 0) + 1,
+        source_projects = CASE
+            WHEN bump_principle.project_id IS NULL
+              OR bump_principle.project_id = ANY(COALESCE(p.source_projects, '{}'))
+            THEN p.source_projects
+            ELSE array_append(COALESCE(p.source_projects, '{}'), bump_principle.project_id)
+        END,
+        updated_at = NOW()
+    WHERE p.id = bump_principle.principle_id
+    RETURNING p.id, p.confidence_score, p.times_applied, p.source_projects;
+$$;
@@ -0,0 +1,123 @@
+-- Version counters for the backend's in-process search cache
+-- (utils/search_cache.py). Every write that can change a search result bumps
+-- the counter of the scope it touches:
+--   'chunks:<project id>'  chunks, documents or the project itself
+--   'chunks'               any of the above, for the all-projects partition
+--   'principles'           any principle
+-- The cache polls the counters of the partitions it holds and reloads a
+-- partition whose counter has moved. Triggers are per statement, so a bulk
+-- chunk insert bumps each affected project once, not once per row.
+
+CREATE TABLE IF NOT EXISTS search_cache_versions (
+    scope TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+ALTER TABLE search_cache_versions ENABLE ROW LEVEL SECURITY;
+CREATE POLICY search_cache_versions_select ON search_cache_versions FOR SELECT USING (true);
+
+-- Function: bump_search_cache_versions
+CREATE OR REPLACE FUNCTION bump_search_cache_versions(scopes text[])
+RETURNS void
+LANGUAGE sql
+AS $$
+    INSERT INTO search_cache_versions (scope, version, updated_at)
+    SELECT DISTINCT s, 1, NOW() FROM unnest(scopes) AS s WHERE s IS NOT NULL
+    ON CONFLICT (scope) DO UPDATE
+    SET version = search_cache_versions.version + 1,
+        updated_at = NOW();
+$$;
+
+CREATE OR REPLACE FUNCTION bump_principle_cache_version()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM bump_search_cache_versions(ARRAY['principles']);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_principles_search_cache ON principles;
+CREATE TRIGGER trg_principles_search_cache
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON principles
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_principle_cache_version();
+
+-- The changed rows are read from transition tables, which a trigger may only
+-- declare for a single event: hence one trigger per event below.
+CREATE OR REPLACE FUNCTION bump_chunk_cache_versions()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    projects uuid[] := '{}';
+BEGIN
+    IF TG_TABLE_NAME = 'document_chunks' THEN
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            projects := projects || ARRAY(
+                SELECT d.project_id FROM new_rows n JOIN documents d ON d.id = n.document_id
+            );
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            projects := projects || ARRAY(
+                SELECT d.project_id FROM old_rows o JOIN documents d ON d.id = o.document_id
+            );
+        END IF;
+    ELSIF TG_TABLE_NAME = 'documents' THEN
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            projects := projects || ARRAY(SELECT project_id FROM new_rows);
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            projects := projects || ARRAY(SELECT project_id FROM old_rows);
+        END IF;
+    ELSE
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            projects := projects || ARRAY(SELECT id FROM old_rows);
+        END IF;
+    END IF;
+
+    IF cardinality(projects) > 0 THEN
+        PERFORM bump_search_cache_versions(
+            ARRAY['chunks'] || ARRAY(SELECT DISTINCT 'chunks:' || p FROM unnest(projects) AS p)
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_document_chunks_search_cache_insert ON document_chunks;
+CREATE TRIGGER trg_document_chunks_search_cache_insert
+    AFTER INSERT ON document_chunks REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_chunk_cache_versions();
+DROP TRIGGER IF EXISTS trg_document_chunks_search_cache_update ON document_chunks;
+CREATE TRIGGER trg_document_chunks_search_cache_update
+    AFTER UPDATE ON document_chunks REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_chunk_cache_versions();
+DROP TRIGGER IF EXISTS trg_document_chunks_search_cache_delete ON document_chunks;
+CREATE TRIGGER trg_document_chunks_search_cache_delete
+    AFTER DELETE ON document_chunks REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_chunk_cache_versions();
+
+DROP TRIGGER IF EXISTS trg_documents_search_cache_insert ON documents;
+CREATE TRIGGER trg_documents_search_cache_insert
+    AFTER INSERT ON documents REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_chunk_cache_versions();
+DROP TRIGGER IF EXISTS trg_documents_search_cache_update ON documents;
+CREATE TRIGGER trg_documents_search_cache_update
+    AFTER UPDATE ON documents REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_chunk_cache_versions();
+DROP TRIGGER IF EXISTS trg_documents_search_cache_delete ON documents;
+CREATE TRIGGER trg_documents_search_cache_delete
+    AFTER DELETE ON documents REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_chunk_cache_versions();
+
+-- Project renames change project_name in chunk results
+DROP TRIGGER IF EXISTS trg_projects_search_cache_update ON projects;
+CREATE TRIGGER trg_projects_search_cache_update
+    AFTER UPDATE ON projects REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_chunk_cache_versions();
+DROP TRIGGER IF EXISTS trg_projects_search_cache_delete ON projects;
+CREATE TRIGGER trg_projects_search_cache_delete
+    AFTER DELETE ON projects REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_chunk_cache_versions();
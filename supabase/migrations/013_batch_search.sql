@@ -0,0 +1,201 @@
+-- Batch variants of the hybrid search functions, for contextflow_query_batch:
+-- N queries in one round trip instead of N. Each query runs the single-query
+-- function (same ranking, same filters) through a LATERAL join, and its rows
+-- are tagged with query_index, the query's 0-based position in the arrays.
+-- Embeddings are passed as vector literals ('[0.1,...]'), one per query text.
+-- project_id_filters / category_filters hold one entry per query (NULL for
+-- no filter); a NULL array means no filter for any query.
+
+-- Function: hybrid_search_document_chunks_batch
+CREATE OR REPLACE FUNCTION hybrid_search_document_chunks_batch(
+    query_texts text[],
+    query_embeddings text[],
+    user_id_filter uuid,
+    project_id_filters uuid[] DEFAULT NULL,
+    match_count int DEFAULT 10,
+    rrf_k int DEFAULT 60,
+    embedding_version_filter text DEFAULT NULL,
+    return_embeddings boolean DEFAULT false
+)
+RETURNS TABLE (
+    query_index int,
+    id uuid,
+    content text,
+    chunk_type text,
+    section_title text,
+    chunk_index int,
+    document_id uuid,
+    filename text,
+    doc_category text,
+    project_id uuid,
+    project_name text,
+    similarity float,
+    text_rank float,
+    score float,
+    compact_embedding text
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT (q.ord - 1)::int, r.*
+    FROM unnest(query_texts, query_embeddings) WITH ORDINALITY AS q(query_text, query_embedding, ord)
+    CROSS JOIN LATERAL hybrid_search_document_chunks(
+        query_text => q.query_text,
+        query_embedding => q.query_embedding::vector(1536),
+        user_id_filter => user_id_filter,
+        project_id_filter => project_id_filters[q.ord::int],
+        match_count => match_count,
+        rrf_k => rrf_k,
+        embedding_version_filter => embedding_version_filter,
+        return_embeddings => return_embeddings
+    ) AS r
+    ORDER BY 1, r.score DESC;
+$$;
+
+-- Function: hybrid_search_document_chunks_batch_2stage
+CREATE OR REPLACE FUNCTION hybrid_search_document_chunks_batch_2stage(
+    query_texts text[],
+    query_embeddings text[],
+    user_id_filter uuid,
+    project_id_filters uuid[] DEFAULT NULL,
+    match_count int DEFAULT 10,
+    rrf_k int DEFAULT 60,
+    oversample int DEFAULT 4,
+    embedding_version_filter text DEFAULT NULL,
+    return_embeddings boolean DEFAULT false
+)
+RETURNS TABLE (
+    query_index int,
+    id uuid,
+    content text,
+    chunk_type text,
+    section_title text,
+    chunk_index int,
+    document_id uuid,
+    filename text,
+    doc_category text,
+    project_id uuid,
+    project_name text,
+    similarity float,
+    text_rank float,
+    score float,
+    compact_embedding text
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT (q.ord - 1)::int, r.*
+    FROM unnest(query_texts, query_embeddings) WITH ORDINALITY AS q(query_text, query_embedding, ord)
+    CROSS JOIN LATERAL hybrid_search_document_chunks_2stage(
+        query_text => q.query_text,
+        query_embedding => q.query_embedding::vector(1536),
+        user_id_filter => user_id_filter,
+        project_id_filter => project_id_filters[q.ord::int],
+        match_count => match_count,
+        rrf_k => rrf_k,
+        oversample => oversample,
+        embedding_version_filter => embedding_version_filter,
+        return_embeddings => return_embeddings
+    ) AS r
+    ORDER BY 1, r.score DESC;
+$$;
+
+-- Function: hybrid_search_principles_batch
+CREATE OR REPLACE FUNCTION hybrid_search_principles_batch(
+    query_texts text[],
+    query_embeddings text[],
+    user_id_filter uuid,
+    min_confidence float DEFAULT 0.5,
+    category_filters text[] DEFAULT NULL,
+    match_count int DEFAULT 5,
+    rrf_k int DEFAULT 60,
+    embedding_version_filter text DEFAULT NULL,
+    return_embeddings boolean DEFAULT false
+)
+RETURNS TABLE (
+    query_index int,
+    id uuid,
+    content text,
+    type text,
+    category text,
+    source text,
+    confidence_score decimal,
+    times_applied int,
+    when_to_use text,
+    when_not_to_use text,
+    reasoning text,
+    tradeoffs text,
+    similarity float,
+    text_rank float,
+    score float,
+    compact_embedding text
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT (q.ord - 1)::int, r.*
+    FROM unnest(query_texts, query_embeddings) WITH ORDINALITY AS q(query_text, query_embedding, ord)
+    CROSS JOIN LATERAL hybrid_search_principles(
+        query_text => q.query_text,
+        query_embedding => q.query_embedding::vector(1536),
+        user_id_filter => user_id_filter,
+        min_confidence => min_confidence,
+        category_filter => category_filters[q.ord::int],
+        match_count => match_count,
+        rrf_k => rrf_k,
+        embedding_version_filter => embedding_version_filter,
+        return_embeddings => return_embeddings
+    ) AS r
+    ORDER BY 1, r.score DESC;
+$$;
+
+-- Function: hybrid_search_principles_batch_2stage
+CREATE OR REPLACE FUNCTION hybrid_search_principles_batch_2stage(
+    query_texts text[],
+    query_embeddings text[],
+    user_id_filter uuid,
+    min_confidence float DEFAULT 0.5,
+    category_filters text[] DEFAULT NULL,
+    match_count int DEFAULT 5,
+    rrf_k int DEFAULT 60,
+    oversample int DEFAULT 4,
+    embedding_version_filter text DEFAULT NULL,
+    return_embeddings boolean DEFAULT false
+)
+RETURNS TABLE (
+    query_index int,
+    id uuid,
+    content text,
+    type text,
+    category text,
+    source text,
+    confidence_score decimal,
+    times_applied int,
+    when_to_use text,
+    when_not_to_use text,
+    reasoning text,
+    tradeoffs text,
+    similarity float,
+    text_rank float,
+    score float,
+    compact_embedding text
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT (q.ord - 1)::int, r.*
+    FROM unnest(query_texts, query_embeddings) WITH ORDINALITY AS q(query_text, query_embedding, ord)
+    CROSS JOIN LATERAL hybrid_search_principles_2stage(
+        query_text => q.query_text,
+        query_embedding => q.query_embedding::vector(1536),
+        user_id_filter => user_id_filter,
+        min_confidence => min_confidence,
+        category_filter => category_filters[q.ord::int],
+        match_count => match_count,
+        rrf_k => rrf_k,
+        oversample => oversample,
+        embedding_version_filter => embedding_version_filter,
+        return_embeddings => return_embeddings
+    ) AS r
+    ORDER BY 1, r.score DESC;
+$$;
@@ -0,0 +1,26 @@
+-- Resumable document processing (utils/supabase_client.py JobCheckpoint).
+-- An analysis job records the last stage it completed and what the stages so
+-- far produced, so a retry (the same job, set back to pending) skips them:
+--   extracted    doc_type, and each agent's output as it finishes
+--   agents       extractions: every agent's output
+--   synthesized  synthesized: '<agent>:<position>' -> 'updated' or principle id
+
+ALTER TABLE analysis_jobs
+    ADD COLUMN IF NOT EXISTS stage TEXT
+        CHECK (stage IN ('extracted', 'agents', 'synthesized')),
+    ADD COLUMN IF NOT EXISTS checkpoint JSONB NOT NULL DEFAULT '{}',
+    ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+
+-- Chunk writers upsert on (document_id, chunk_index), so a retried upload
+-- (which reuses its document row) replaces its rows instead of adding a
+-- second copy. Copies left by earlier retries are removed first, keeping
+-- the oldest.
+DELETE FROM document_chunks c
+USING document_chunks keep
+WHERE c.document_id = keep.document_id
+  AND c.chunk_index = keep.chunk_index
+  AND (keep.created_at, keep.id) < (c.created_at, c.id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_document_chunks_document_chunk
+    ON document_chunks(document_id, chunk_index);
@@ -0,0 +1,34 @@
+-- Vector indexes per EMBEDDING_PROFILE (utils/embeddings.py).
+-- halfvec-256 searches the compact HNSW indexes (migration 007) and re-ranks
+-- their candidates with the full vectors read from the heap, so the full
+-- ivfflat indexes (migration 003) are never used. They hold a float32 copy
+-- of every vector (~6 KB a row), more than the compact column and its index
+-- together, so under halfvec-256 they are dropped. The full column stays:
+-- the re-rank and the embedding backfills need it.
+--
+-- Switching to vector-1536 rebuilds them first:
+--     SELECT apply_embedding_profile('vector-1536');
+-- and switching back drops them again:
+--     SELECT apply_embedding_profile('halfvec-256');
+
+CREATE OR REPLACE FUNCTION apply_embedding_profile(profile text)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF profile = 'halfvec-256' THEN
+        DROP INDEX IF EXISTS idx_document_chunks_embedding;
+        DROP INDEX IF EXISTS idx_principles_embedding;
+    ELSIF profile = 'vector-1536' THEN
+        CREATE INDEX IF NOT EXISTS idx_document_chunks_embedding
+            ON document_chunks USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+        CREATE INDEX IF NOT EXISTS idx_principles_embedding
+            ON principles USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+    ELSE
+        RAISE EXCEPTION 'apply_embedding_profile: unknown profile %', profile;
+    END IF;
+END;
+$$;
+
+-- halfvec-256 is the default profile
+SELECT apply_embedding_profile('halfvec-256');
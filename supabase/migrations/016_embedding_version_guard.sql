@@ -0,0 +1,56 @@
+-- Writes that race a cutover (migration 009).
+-- Each backend process caches the active/building versions for a few
+-- seconds (utils/embeddings.py), so after cutover_embedding_version() a
+-- process that has not re-read them still writes rows the old way: the
+-- retired version in embedding and the new one in embedding_next. Nothing
+-- would swap those rows later, and searches under the new version would
+-- never see them. This trigger resolves the version on the server instead:
+--   - a retired serving vector with a next vector of the active version is
+--     swapped into place, as the cutover would have done;
+--   - a retired serving vector without one is cleared, so the row keeps its
+--     full-text match and the backfill's 'missing' mode re-embeds it.
+-- The cutover's own swap writes the building version, which passes through.
+-- Named to fire before the compact-embedding trigger (migration 007); the
+-- compact column is refreshed here since that trigger only follows writes
+-- that name the embedding column.
+
+CREATE OR REPLACE FUNCTION resolve_embedding_version()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF NEW.embedding_version IS NULL OR NOT EXISTS (
+        SELECT 1 FROM embedding_versions WHERE version = NEW.embedding_version AND status = 'retired'
+    ) THEN
+        RETURN NEW;
+    END IF;
+
+    IF NEW.embedding_next IS NOT NULL AND EXISTS (
+        SELECT 1 FROM embedding_versions WHERE version = NEW.embedding_next_version AND status = 'active'
+    ) THEN
+        NEW.embedding := NEW.embedding_next;
+        NEW.embedding_model := NEW.embedding_next_model;
+        NEW.embedding_version := NEW.embedding_next_version;
+        NEW.embedding_compact := l2_normalize(subvector(NEW.embedding, 1, 256))::halfvec(256);
+    ELSE
+        NEW.embedding := NULL;
+        NEW.embedding_model := NULL;
+        NEW.embedding_version := NULL;
+        NEW.embedding_compact := NULL;
+    END IF;
+    NEW.embedding_next := NULL;
+    NEW.embedding_next_model := NULL;
+    NEW.embedding_next_version := NULL;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_document_chunks_active_embedding ON document_chunks;
+CREATE TRIGGER trg_document_chunks_active_embedding
+    BEFORE INSERT OR UPDATE ON document_chunks
+    FOR EACH ROW EXECUTE FUNCTION resolve_embedding_version();
+
+DROP TRIGGER IF EXISTS trg_principles_active_embedding ON principles;
+CREATE TRIGGER trg_principles_active_embedding
+    BEFORE INSERT OR UPDATE ON principles
+    FOR EACH ROW EXECUTE FUNCTION resolve_embedding_version();
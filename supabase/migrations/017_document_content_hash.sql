@@ -0,0 +1,11 @@
+-- Re-uploads (utils/supabase_client.py register_documents).
+-- Uploading a file again under the same name reuses the project's document
+-- for that storage_path. content_hash (SHA-256 of the file's bytes) tells an
+-- unchanged file, such as a retry after a failed upload, from a new version:
+-- only a new version is marked for analysis again. The index serves the
+-- lookup by project and path.
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_documents_project_storage_path
+    ON documents(project_id, storage_path);